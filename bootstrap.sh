@@ -1,9 +1,8 @@
 #!/bin/sh
 set -e
 
-if [ "$BACKUP_ENABLE" = "TRUE"  ] || [ "$CONSUME_ENABLE" = "TRUE"  ]; then
-  python .venv/bin/supervisord -c supervisord.conf
-fi
+# the huey consumer is always needed, as new pdfs are processed in the background
+python .venv/bin/supervisord -c supervisord.conf
 
 cd pdfding
 
@@ -24,5 +23,8 @@ HOST_PORT="${HOST_PORT:-8000}"
 
 python manage.py migrate
 python manage.py clean_up
+# calculate the content hashes of pdfs added before they were introduced in the background, so that the startup is
+# not delayed by large libraries. Does nothing if all pdfs have a hash.
+python manage.py backfill_file_hashes --background
 
 exec python -m gunicorn --bind 0.0.0.0:$HOST_PORT --workers 3 core.wsgi:application
@@ -3,7 +3,7 @@ from base import base_views
 from django.conf import settings
 from django.contrib.auth.mixins import UserPassesTestMixin
 from django.contrib.auth.models import User
-from django.db.models import QuerySet
+from django.db.models import Count, QuerySet
 from django.db.models.functions import Lower
 from django.http import Http404, HttpRequest
 from django.shortcuts import redirect, render
@@ -48,7 +48,8 @@ class OverviewMixin(BaseAdminMixin):
         Filter the PDFs when performing a search in the overview.
         """
 
-        users = User.objects.all()
+        # the number of PDFs is annotated so that it doesn't need to be queried for each user
+        users = User.objects.annotate(pdf_count=Count('profile__pdf'))
 
         search = request.GET.get('search', '')
         tags = request.GET.get('tags', [])
@@ -1,10 +1,17 @@
 import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from datetime import datetime
 from pathlib import Path
 
-from backup.service import decrypt_file, get_encryption_key
+from backup.models import BackupManifestEntry
+from backup.service import decrypt_stream, get_encryption_key
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
 from minio import Minio
+from pdf.service import get_file_hash
 
 minio_client = Minio(
     endpoint=settings.BACKUP_ENDPOINT,
@@ -16,9 +23,45 @@ minio_client = Minio(
 logger = logging.getLogger('management')
 
 
+@dataclass
+class RecoveryStats:
+    """Statistics of a data recovery."""
+
+    recovered: int = 0
+    skipped: int = 0
+    verified: int = 0
+    unverified: int = 0
+    failed_files: list[str] = field(default_factory=list)
+
+    def __str__(self):
+        return (
+            f'recovered {self.recovered} files, skipped {self.skipped} already recovered files, verified '
+            f'{self.verified} files, {self.unverified} files could not be verified, {len(self.failed_files)} failed'
+        )
+
+
 class Command(BaseCommand):
     help = "Recover data from S3 backup"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.BACKUP_UPLOAD_WORKERS, help='Number of files recovered at once'
+        )
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Check the sizes and hashes of the recovered files against the backup manifest',
+        )
+        parser.add_argument(
+            '--user', type=int, help='Only recover the files of the user with this id, e.g. to recover them first'
+        )
+        parser.add_argument(
+            '--checkpoint',
+            type=Path,
+            default=settings.BASE_DIR / 'db' / 'recovery_checkpoint',
+            help='File of the recovered objects, an interrupted recovery is resumed from it',
+        )
+
     def handle(self, *args, **kwargs):
         logger.info('----------------------------------------------------')
         logger.info('Are you sure you want to proceed with the data recovery?')
@@ -30,30 +73,63 @@ class Command(BaseCommand):
             logger.info('')
             logger.info('Starting data recovery')
 
+            checkpoint_path = kwargs['checkpoint']
+            recovered_objects = self.read_checkpoint(checkpoint_path)
+
+            if recovered_objects:
+                logger.info(f'Resuming data recovery, skipping {len(recovered_objects)} already recovered files')
+
             # get the encryption key. if backup encryption is disabled, result will be None
             encryption_key = get_encryption_key(
                 settings.BACKUP_ENCRYPTION_ENABLED, settings.BACKUP_ENCRYPTION_PASSWORD, settings.BACKUP_ENCRYPTION_SALT
             )
 
             if settings.DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
-                logger.info('Recovering database')
-
                 db_backup_path = settings.DATABASES['default']['BACKUP_NAME']
+                db_object = minio_client.stat_object(settings.BACKUP_BUCKET_NAME, db_backup_path.name)
 
-                self.get_file_from_minio(
-                    db_backup_path.name,
-                    db_backup_path.parent,
-                    encryption_key,
-                )
+                if (db_object.object_name, db_object.etag) not in recovered_objects:
+                    logger.info('Recovering database')
+
+                    self.get_file_from_minio(
+                        db_backup_path.name,
+                        db_backup_path.parent,
+                        encryption_key,
+                    )
 
-                db_backup_path.rename(settings.DATABASES['default']['NAME'])
+                    self.restore_sqlite(db_backup_path, settings.DATABASES['default']['NAME'])
+                    db_backup_path.unlink(missing_ok=True)
+                    # make sure the recovered database is used from now on, e.g. for reading the manifest
+                    connection.close()
+                    self.write_checkpoint(checkpoint_path, db_object.object_name, db_object.etag)
 
             logger.info('Recovering PDF files and QR codes')
-            objects = minio_client.list_objects(settings.BACKUP_BUCKET_NAME, recursive=True)
-            for obj in objects:
-                obj_name = obj.object_name
-                if obj_name != settings.DATABASES['default']['BACKUP_NAME'].name:
-                    self.get_file_from_minio(obj_name, settings.MEDIA_ROOT, encryption_key)
+            prefix = f'{kwargs["user"]}/' if kwargs['user'] else None
+            objects = [
+                obj
+                for obj in minio_client.list_objects(settings.BACKUP_BUCKET_NAME, prefix=prefix, recursive=True)
+                if obj.object_name != settings.DATABASES['default']['BACKUP_NAME'].name
+            ]
+            manifest = self.get_manifest(prefix) if kwargs['verify'] else None
+
+            stats = self.recover_files(
+                objects, encryption_key, recovered_objects, checkpoint_path, manifest, kwargs['workers']
+            )
+
+            logger.info(f'Recovery statistics: {stats}')
+
+            if stats.failed_files:
+                # already recovered files that failed the verification are downloaded again when resuming
+                self.remove_from_checkpoint(checkpoint_path, set(stats.failed_files))
+
+                raise CommandError(
+                    f'{len(stats.failed_files)} files could not be recovered. Run the command again to resume the '
+                    'data recovery.'
+                )
+
+            # keep the checkpoint if only the files of a single user were recovered, so that they are skipped later
+            if not prefix:
+                checkpoint_path.unlink(missing_ok=True)
 
             logger.info('Data recovery completed successfully.')
             logger.info('----------------------------------------------------')
@@ -61,18 +137,203 @@ class Command(BaseCommand):
             logger.info('Aborting data recovery.')
             logger.info('----------------------------------------------------')
 
+    def recover_files(
+        self,
+        objects: list,
+        encryption_key: bytes,
+        recovered_objects: set[tuple[str, str]],
+        checkpoint_path: Path,
+        manifest: dict[str, tuple[int, str, datetime]] | None,
+        workers: int,
+    ) -> RecoveryStats:
+        """
+        Recover the files with a pool of worker threads. Files that were recovered already are skipped, but verified if
+        a manifest is provided. Each recovered and, if requested, verified file is added to the checkpoint.
+        """
+
+        stats = RecoveryStats()
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = dict()
+
+            for obj in objects:
+                skip_download = (obj.object_name, obj.etag) in recovered_objects
+
+                if skip_download:
+                    stats.skipped += 1
+
+                if not skip_download or manifest is not None:
+                    future = executor.submit(
+                        self.recover_file, obj.object_name, encryption_key, manifest is not None, skip_download
+                    )
+                    futures[future] = (obj, skip_download)
+
+            for i, future in enumerate(as_completed(futures)):
+                obj, skip_download = futures[future]
+
+                try:
+                    file_info = future.result()
+                except Exception as e:  # nosec # noqa
+                    logger.error(f'Recovering "{obj.object_name}" failed: {e}')
+                    stats.failed_files.append(obj.object_name)
+
+                    continue
+
+                if file_info and not self.verify_file(obj, *file_info, manifest, stats):
+                    stats.failed_files.append(obj.object_name)
+
+                    continue
+
+                if not skip_download:
+                    stats.recovered += 1
+                    self.write_checkpoint(checkpoint_path, obj.object_name, obj.etag)
+
+                if (i + 1) % 10 == 0:  # pragma: no cover
+                    logger.info(f'Processed {i + 1} / {len(futures)} files')
+
+        return stats
+
+    def recover_file(
+        self, obj_name: str, encryption_key: bytes, verify: bool, skip_download: bool
+    ) -> tuple[int, str] | None:
+        """Download the file unless it was recovered already. Returns its size and hash if it should be verified."""
+
+        if not skip_download:
+            self.get_file_from_minio(obj_name, settings.MEDIA_ROOT, encryption_key)
+
+        if verify:
+            file_path = settings.MEDIA_ROOT / obj_name
+
+            return file_path.stat().st_size, get_file_hash(file_path)
+
+        return None
+
+    @staticmethod
+    def verify_file(
+        obj, size: int, file_hash: str, manifest: dict[str, tuple[int, str, datetime]], stats: RecoveryStats
+    ) -> bool:
+        """
+        Verify the size and, if known, the hash of a recovered file against the manifest. Files that are not part of
+        the manifest or were uploaded after the database backup was created cannot be verified.
+        """
+
+        if obj.object_name not in manifest:
+            stats.unverified += 1
+
+            return True
+
+        expected_size, expected_hash, uploaded_at = manifest[obj.object_name]
+
+        if obj.last_modified and obj.last_modified > uploaded_at:
+            # the object was uploaded again after the backup of the database including the manifest was created
+            stats.unverified += 1
+
+            return True
+
+        if size != expected_size or (expected_hash and file_hash != expected_hash):
+            logger.error(f'"{obj.object_name}" does not match the backup manifest.')
+
+            return False
+
+        stats.verified += 1
+
+        return True
+
+    @staticmethod
+    def get_manifest(prefix: str | None) -> dict[str, tuple[int, str, datetime]]:
+        """Get the size, hash and upload date of the files in the backup manifest."""
+
+        manifest_entries = BackupManifestEntry.objects.all()
+
+        if prefix:
+            manifest_entries = manifest_entries.filter(object_key__startswith=prefix)
+
+        return {
+            object_key: (size, content_hash, uploaded_at)
+            for object_key, size, content_hash, uploaded_at in manifest_entries.values_list(
+                'object_key', 'size', 'content_hash', 'uploaded_at'
+            ).iterator()
+        }
+
+    @staticmethod
+    def read_checkpoint(checkpoint_path: Path) -> set[tuple[str, str]]:
+        """Read the names and etags of the objects that were already recovered."""
+
+        if not checkpoint_path.exists():
+            return set()
+
+        recovered_objects = set()
+
+        for line in checkpoint_path.read_text().splitlines():
+            etag, _, obj_name = line.partition('\t')
+            recovered_objects.add((obj_name, etag))
+
+        return recovered_objects
+
+    @staticmethod
+    def write_checkpoint(checkpoint_path: Path, obj_name: str, etag: str):
+        """Add a recovered object to the checkpoint."""
+
+        with checkpoint_path.open('a') as checkpoint_file:
+            checkpoint_file.write(f'{etag}\t{obj_name}\n')
+
+    @staticmethod
+    def remove_from_checkpoint(checkpoint_path: Path, obj_names: set[str]):
+        """Remove objects from the checkpoint, so that they are recovered again."""
+
+        if not checkpoint_path.exists():
+            return
+
+        lines = checkpoint_path.read_text().splitlines(keepends=True)
+        checkpoint_path.write_text(
+            ''.join(line for line in lines if line.rstrip('\n').partition('\t')[2] not in obj_names)
+        )
+
+    @staticmethod
+    def restore_sqlite(backup_path: Path, db_path: Path):
+        """
+        Restore the sqlite database from the backup with the backup api of sqlite. Unlike replacing the database file,
+        this does not leave the WAL file of the replaced database behind, whose changes would otherwise be applied to
+        the restored database. Connections of the running application see the restored database as well.
+        """
+
+        backup_conn = sqlite3.connect(backup_path)
+        conn = sqlite3.connect(db_path, timeout=30)
+
+        try:
+            with conn:
+                backup_conn.backup(conn)
+        finally:
+            conn.close()
+            backup_conn.close()
+
     @staticmethod
     def get_file_from_minio(obj_name: str, target_parent_path: Path, encryption_key: bytes):
         """
-        Get a file to minio. If an encryption key is provided the file will be decrypted beforehand using cryptography's
-        fernet algorithm.
+        Get a file from minio. If an encryption key is provided the file will be decrypted while it is downloaded.
+        Files encrypted with fernet by older versions are decrypted as well. The file is written to a temporary file
+        first, so that an interrupted download does not leave a partial file behind.
         """
 
         if encryption_key:
-            # get encrypted file from minio, decrypt it and delete the local tmp file
-            encrypted_file_path = Path(__file__).parent / 'tmp_encrypted'
-            minio_client.fget_object(settings.BACKUP_BUCKET_NAME, obj_name, str(encrypted_file_path))
-            decrypt_file(encryption_key, encrypted_file_path, target_parent_path / obj_name)
-            encrypted_file_path.unlink()
+            target_path = target_parent_path / obj_name
+            tmp_path = target_path.with_name(f'{target_path.name}.part')
+            target_path.parent.mkdir(exist_ok=True, parents=True)
+            response = minio_client.get_object(settings.BACKUP_BUCKET_NAME, obj_name)
+
+            try:
+                with tmp_path.open('wb') as file:
+                    decrypt_stream(encryption_key, response, file)
+            except BaseException:
+                # a corrupted or truncated object must not leave the partial file behind
+                tmp_path.unlink(missing_ok=True)
+
+                raise
+            finally:
+                response.close()
+                response.release_conn()
+
+            tmp_path.replace(target_path)
         else:
+            # minio downloads to a temporary file as well
             minio_client.fget_object(settings.BACKUP_BUCKET_NAME, obj_name, str(target_parent_path / obj_name))
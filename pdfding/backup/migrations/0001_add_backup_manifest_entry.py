@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name='BackupManifestEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_key', models.CharField(max_length=1000, unique=True)),
+                ('size', models.BigIntegerField()),
+                ('modification_time', models.BigIntegerField()),
+                ('content_hash', models.CharField(blank=True, max_length=64)),
+                ('uploaded_at', models.DateTimeField()),
+                ('verified_at', models.DateTimeField()),
+            ],
+        ),
+    ]
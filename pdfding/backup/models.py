@@ -0,0 +1,22 @@
+from django.db import models
+
+
+class BackupManifestEntry(models.Model):
+    """
+    Entry of a file that was uploaded to the backup bucket. Comparing the local files to the manifest instead of
+    listing the whole bucket detects new, modified and removed files. The manifest is reconciled with the bucket
+    periodically.
+    """
+
+    object_key = models.CharField(max_length=1000, unique=True)
+    size = models.BigIntegerField()
+    # modification time in nanoseconds
+    modification_time = models.BigIntegerField()
+    # sha-256 hash of the file content, empty if it is not known
+    content_hash = models.CharField(max_length=64, blank=True)
+    uploaded_at = models.DateTimeField()
+    # last time the object was confirmed to be in the bucket, either by uploading it or by a reconciliation
+    verified_at = models.DateTimeField()
+
+    def __str__(self):  # pragma: no cover
+        return self.object_key
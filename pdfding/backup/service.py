@@ -1,10 +1,21 @@
 import base64
+import os
 from pathlib import Path
+from typing import BinaryIO
 
+from cryptography.exceptions import InvalidTag
 from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives.hashes import SHA256
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 
+# magic bytes identifying files encrypted in chunks, files encrypted with fernet by older versions start with 'gAAAAA'
+MAGIC = b'PDFDING\x01'
+HEADER_SIZE = len(MAGIC) + 4 + 8
+TAG_SIZE = 16
+CHUNK_SIZE = 1024 * 1024
+
 
 def get_encryption_key(encryption_enabled: bool, password: str, salt: str):
     """
@@ -37,41 +48,133 @@ def generate_encryption_key(password: str, salt: str) -> bytes:
     return encryption_key
 
 
-def encrypt_file(encryption_key: bytes, source_path: Path, target_path: Path):
+class EncryptingReader:
     """
-    Encrypt the specified file using Fernet. Fernet is a symmetric encryption algorithm provided by the cryptography
-    library. The encryption key should be generated using PBKDF2.
+    File-like object that encrypts a file while it is read, e.g. by minio's put_object. The file is encrypted chunk
+    by chunk with AES-GCM, so that only a single chunk is held in memory. Each chunk is authenticated with its own
+    nonce, made of a random prefix and the chunk counter, and the header and a final chunk flag are authenticated as
+    additional data, so that reordered, modified or truncated chunks are detected.
+
+    Format: MAGIC | chunk size (4 bytes) | nonce prefix (8 bytes) | encrypted chunks each with a 16 byte tag. All chunks
+    but the last one contain chunk size bytes of the file, the last chunk contains less, possibly zero, bytes.
     """
 
-    with open(source_path, 'rb') as file:
-        unencrypted = file.read()
+    def __init__(self, encryption_key: bytes, file: BinaryIO, chunk_size: int = CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.aes_gcm = AESGCM(derive_chunk_key(encryption_key))
+        self.nonce_prefix = os.urandom(8)
+        self.header = MAGIC + chunk_size.to_bytes(4, 'big') + self.nonce_prefix
+        self.buffer = bytearray(self.header)
+        self.chunk_number = 0
+        self.finished = False
 
-    f = Fernet(encryption_key)
-    encrypted = f.encrypt(unencrypted)
+    def read(self, size: int = -1) -> bytes:
+        while (size < 0 or len(self.buffer) < size) and not self.finished:
+            self.encrypt_next_chunk()
 
-    with open(target_path, 'wb') as encrypted_file:
-        encrypted_file.write(encrypted)
+        size = len(self.buffer) if size < 0 else size
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
 
+        return data
 
-def decrypt_file(encryption_key: bytes, source_path: Path, target_path: Path):
+    def encrypt_next_chunk(self):
+        chunk = self.file.read(self.chunk_size)
+        self.finished = len(chunk) < self.chunk_size
+
+        nonce = self.nonce_prefix + self.chunk_number.to_bytes(4, 'big')
+        self.buffer += self.aes_gcm.encrypt(nonce, chunk, self.header + bytes([self.finished]))
+        self.chunk_number += 1
+
+    @staticmethod
+    def get_encrypted_size(size: int, chunk_size: int = CHUNK_SIZE) -> int:
+        """Get the size of an encrypted file. Every chunk adds a tag and there is always a last, non-full chunk."""
+
+        return HEADER_SIZE + size + TAG_SIZE * (size // chunk_size + 1)
+
+
+def derive_chunk_key(encryption_key: bytes) -> bytes:
+    """
+    Derive the AES-256 key of the chunked encryption from the PBKDF2 encryption key, so that the key is not shared with
+    the legacy Fernet encryption.
+    """
+
+    hkdf = HKDF(algorithm=SHA256(), length=32, salt=None, info=b'pdfding chunked backup encryption')
+
+    return hkdf.derive(base64.urlsafe_b64decode(encryption_key))
+
+
+def decrypt_stream(encryption_key: bytes, source: BinaryIO, target: BinaryIO):
+    """
+    Decrypt a stream that was encrypted with the EncryptingReader and write the result to the target chunk by chunk.
+    Streams that do not start with the magic bytes were encrypted with Fernet by older versions. As Fernet tokens
+    cannot be decrypted partially, these are decrypted in memory.
+    """
+
+    header = source.read(HEADER_SIZE)
+
+    if not header.startswith(MAGIC):
+        target.write(Fernet(encryption_key).decrypt(header + source.read()))
+
+        return
+
+    chunk_size = int.from_bytes(header[len(MAGIC) : len(MAGIC) + 4], 'big')  # noqa: E203
+    nonce_prefix = header[len(MAGIC) + 4 :]  # noqa: E203
+    aes_gcm = AESGCM(derive_chunk_key(encryption_key))
+    chunk_number = 0
+    finished = False
+
+    while not finished:
+        encrypted_chunk = read_exactly(source, chunk_size + TAG_SIZE)
+        finished = len(encrypted_chunk) < chunk_size + TAG_SIZE
+
+        # a missing last chunk results in an invalid tag, as the chunk was encrypted with the final chunk flag unset
+        nonce = nonce_prefix + chunk_number.to_bytes(4, 'big')
+        target.write(aes_gcm.decrypt(nonce, encrypted_chunk, header + bytes([finished])))
+        chunk_number += 1
+
+    if source.read(1):
+        raise InvalidTag('Encrypted data after the last chunk')
+
+
+def read_exactly(source: BinaryIO, size: int) -> bytes:
+    """Read size bytes from the source. Less bytes are only returned at the end of the source."""
+
+    data = bytearray()
+
+    while len(data) < size:
+        chunk = source.read(size - len(data))
+
+        if not chunk:
+            break
+
+        data += chunk
+
+    return bytes(data)
+
+
+def encrypt_file(encryption_key: bytes, source_path: Path, target_path: Path):
     """
-    Decrypt the specified file using Fernet. Fernet is a symmetric encryption algorithm provided by the cryptography
-    library. The encryption key should be generated using PBKDF2.
+    Encrypt the specified file with the chunked AES-GCM encryption of the EncryptingReader. The encryption key should
+    be generated using PBKDF2.
     """
 
-    f = Fernet(encryption_key)
+    with open(source_path, 'rb') as file, open(target_path, 'wb') as encrypted_file:
+        encrypting_reader = EncryptingReader(encryption_key, file)
 
-    # opening the encrypted file
-    with open(source_path, 'rb') as enc_file:
-        encrypted = enc_file.read()
+        while data := encrypting_reader.read(CHUNK_SIZE):
+            encrypted_file.write(data)
 
-    # decrypting the file
-    decrypted = f.decrypt(encrypted)
+
+def decrypt_file(encryption_key: bytes, source_path: Path, target_path: Path):
+    """
+    Decrypt the specified file. Files encrypted in chunks are decrypted chunk by chunk, files encrypted with Fernet by
+    older versions are decrypted in memory. The encryption key should be generated using PBKDF2.
+    """
 
     # create the directory if missing
     target_path.parent.mkdir(exist_ok=True, parents=True)
 
-    # opening the file in write mode and
-    # writing the decrypted data
-    with open(target_path, 'wb') as dec_file:
-        dec_file.write(decrypted)
+    with open(source_path, 'rb') as encrypted_file, open(target_path, 'wb') as decrypted_file:
+        decrypt_stream(encryption_key, encrypted_file, decrypted_file)
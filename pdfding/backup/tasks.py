@@ -1,17 +1,32 @@
 import logging
 import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from itertools import batched
 from pathlib import Path
 
-from backup.service import encrypt_file, get_encryption_key
+from backup.models import BackupManifestEntry
+from backup.service import EncryptingReader, get_encryption_key
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.db.models import Q
 from huey import crontab
 from huey.contrib.djhuey import periodic_task
 from minio import Minio
+from minio.deleteobjects import DeleteObject
 from pdf.models import Pdf, SharedPdf
+from pdf.service import get_file_hash
 
 logger = logging.getLogger('huey')
 
+# number of files that are looked up in and written to the manifest at once
+MANIFEST_BATCH_SIZE = 1000
+# seconds waited before the first retry of a failed upload, the delay doubles with every further retry
+UPLOAD_RETRY_DELAY = 1
+
 if settings.BACKUP_ENABLED:
     minio_client = Minio(
         endpoint=settings.BACKUP_ENDPOINT,
@@ -21,6 +36,57 @@ if settings.BACKUP_ENABLED:
     )
 
 
+@dataclass
+class BackupStats:
+    """Statistics of a backup run."""
+
+    files_added: int = 0
+    bytes_added: int = 0
+    files_removed: int = 0
+    retries: int = 0
+    failed_files: list[str] = field(default_factory=list)
+    upload_seconds: float = 0
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    @property
+    def files_per_second(self) -> float:
+        return self.files_added / self.upload_seconds if self.upload_seconds else 0
+
+    @property
+    def megabytes_per_second(self) -> float:
+        return self.bytes_added / 1_000_000 / self.upload_seconds if self.upload_seconds else 0
+
+    def __str__(self):
+        return (
+            f'added {self.files_added} files ({self.bytes_added / 1_000_000:.1f} MB) in {self.upload_seconds:.1f} s '
+            f'({self.files_per_second:.1f} files/s, {self.megabytes_per_second:.1f} MB/s), '
+            f'removed {self.files_removed} files, {self.retries} retries, {len(self.failed_files)} failed'
+        )
+
+
+@dataclass
+class SqliteBackupStats:
+    """Statistics of a backup of the sqlite database."""
+
+    pages: int = 0
+    steps: int = 0
+    restarts: int = 0
+    seconds: float = 0
+    # the longest time a step held the read lock of the database
+    longest_step_seconds: float = 0
+    sleep_seconds: float = 0
+
+    def __str__(self):
+        return (
+            f'copied {self.pages} pages in {self.steps} steps in {self.seconds:.2f} s, {self.restarts} restarts, '
+            f'longest step {1000 * self.longest_step_seconds:.1f} ms, slept {self.sleep_seconds:.2f} s'
+        )
+
+
+class SqliteBackupRestartLimitReached(Exception):
+    pass
+
+
 def parse_cron_schedule(cron_schedule: str) -> dict[str, str]:
     """
     Parse a cron schedule so that it can be used as an input for a huey periodic tasc.
@@ -80,79 +146,414 @@ def backup_function():
     if settings.DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
         logger.info('Backing up sqlite db')
         backup_path = settings.DATABASES['default']['BACKUP_NAME']
-        backup_sqlite(settings.DATABASES['default']['NAME'], backup_path)
-        add_file_to_minio(backup_path.name, backup_path.parent, encryption_key)
+        # the backup file is encrypted and uploaded while it is read, so the database is never held in memory
+        sqlite_stats = backup_sqlite(
+            settings.DATABASES['default']['NAME'],
+            backup_path,
+            settings.BACKUP_SQLITE_PAGES,
+            settings.BACKUP_SQLITE_SLEEP,
+        )
+        add_file_to_minio(backup_path.name, backup_path.parent, encryption_key, settings.BACKUP_PART_SIZE)
         backup_path.unlink()
 
-    # add new files to minio, delete deleted files from minio
-    to_be_added, to_be_deleted = difference_local_minio()
+        logger.info(f'Sqlite backup statistics: {sqlite_stats}')
+
+    if reconciliation_due(settings.BACKUP_RECONCILIATION_DAYS):
+        logger.info('Reconciling the backup manifest with the bucket')
+        reconcile_manifest()
+
+    # add new and modified files to minio, delete deleted files from minio
+    to_be_added, to_be_deleted = difference_local_manifest()
 
     logger.info(f'Need to backup {len(to_be_added)} files.')
     logger.info(f'Need to remove {len(to_be_deleted)} files from backup.')
 
-    for i, pdf_name in enumerate(to_be_added):
-        add_file_to_minio(pdf_name, settings.MEDIA_ROOT, encryption_key)
+    stats = BackupStats()
+    uploaded_files = upload_files(
+        sorted(entry.object_key for entry in to_be_added),
+        settings.MEDIA_ROOT,
+        encryption_key,
+        stats,
+        workers=settings.BACKUP_UPLOAD_WORKERS,
+        part_size=settings.BACKUP_PART_SIZE,
+        retries=settings.BACKUP_UPLOAD_RETRIES,
+    )
+    removed_files = remove_files_from_minio(sorted(to_be_deleted), stats)
+    update_manifest([entry for entry in to_be_added if entry.object_key in uploaded_files], removed_files)
 
-        if (i + 1) % 10 == 0:  # pragma: no cover
-            logger.info(f'Added {i + 1} / {len(to_be_added)} files')
+    logger.info(f'Backup statistics: {stats}')
 
-    for i, pdf_name in enumerate(to_be_deleted):
-        minio_client.remove_object(settings.BACKUP_BUCKET_NAME, pdf_name)
-        if (i + 1) % 10 == 0:  # pragma: no cover
-            logger.info(f'Removed {i + 1} / {len(to_be_deleted)} files')
+    if stats.failed_files:
+        # the next run only uploads the files that are still missing
+        raise RuntimeError(f'Backup failed, {len(stats.failed_files)} files could not be uploaded.')
 
     logger.info('Backup completed successfully.')
     logger.info('----------------------------------------------------')
 
+    return stats
+
+
+def upload_files(
+    file_names: list[str],
+    parent_path: Path,
+    encryption_key: bytes,
+    stats: BackupStats,
+    workers: int = 1,
+    part_size: int = 0,
+    retries: int = 0,
+) -> set[str]:
+    """
+    Upload the files to minio with a pool of worker threads. As the uploads mostly wait for the network, threads
+    are sufficient. Failed uploads are retried, files that could not be uploaded are added to the failed files of the
+    statistics instead of stopping the remaining uploads.
+
+    Returns the names of the uploaded files.
+    """
+
+    start = time.perf_counter()
+    uploaded_files = set()
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {
+            executor.submit(
+                upload_file_with_retries, file_name, parent_path, encryption_key, stats, part_size, retries
+            ): file_name
+            for file_name in file_names
+        }
+
+        for i, future in enumerate(as_completed(futures)):
+            if future.result():
+                uploaded_files.add(futures[future])
+
+            if (i + 1) % 10 == 0:  # pragma: no cover
+                elapsed = time.perf_counter() - start
+                logger.info(
+                    f'Uploaded {i + 1} / {len(file_names)} files, '
+                    f'{stats.bytes_added / 1_000_000 / elapsed:.1f} MB/s'
+                )
 
-def backup_sqlite(db_path: Path, backup_path: Path):
-    """Create a backup of a sqlite database"""
+    stats.upload_seconds += time.perf_counter() - start
+
+    return uploaded_files
+
+
+def upload_file_with_retries(
+    file_name: str, parent_path: Path, encryption_key: bytes, stats: BackupStats, part_size: int, retries: int
+) -> bool:
+    """
+    Upload a file to minio and retry the upload up to retries times if it fails. The delay between the attempts grows
+    exponentially, so that a briefly unavailable minio is not hammered by all upload workers. Returns whether it
+    succeeded.
+    """
+
+    for attempt in range(retries + 1):
+        try:
+            add_file_to_minio(file_name, parent_path, encryption_key, part_size)
+        except Exception as e:  # nosec # noqa
+            if attempt < retries:
+                logger.info(f'Uploading "{file_name}" failed ({e}), retrying.')
+
+                with stats.lock:
+                    stats.retries += 1
+
+                time.sleep(UPLOAD_RETRY_DELAY * 2**attempt)
+            else:
+                logger.error(f'Uploading "{file_name}" failed: {e}')
+
+                with stats.lock:
+                    stats.failed_files.append(file_name)
+        else:
+            with stats.lock:
+                stats.files_added += 1
+                stats.bytes_added += (parent_path / file_name).stat().st_size
+
+            return True
+
+    return False
+
+
+def remove_files_from_minio(file_names: list[str], stats: BackupStats) -> list[str]:
+    """
+    Remove the files from minio with multi-object deletes. Minio sends the deletes in batches of up to 1000 objects
+    per request. Returns the names of the removed files.
+    """
+
+    if not file_names:
+        return []
+
+    delete_errors = minio_client.remove_objects(
+        settings.BACKUP_BUCKET_NAME, (DeleteObject(file_name) for file_name in file_names)
+    )
+    # the deletes are only sent while the errors are iterated
+    failed_removals = {delete_error.name for delete_error in delete_errors}
+
+    for file_name in failed_removals:
+        logger.error(f'Removing "{file_name}" from the backup failed.')
+
+    removed_files = [file_name for file_name in file_names if file_name not in failed_removals]
+    stats.files_removed += len(removed_files)
+
+    return removed_files
+
+
+def backup_sqlite(
+    db_path: Path, backup_path: Path, pages: int = -1, sleep: float = 0, max_restarts: int = 3
+) -> SqliteBackupStats:
+    """
+    Create a backup of a sqlite database. In WAL mode, which the connections of PdfDing switch the database to, writers
+    are not blocked while a step of the backup reads the database.
+
+    The database is copied in steps of pages pages with a pause of sleep seconds between the steps, so that the read
+    lock is only held briefly and WAL checkpoints can run. If the database is modified by another connection the
+    backup restarts. After max_restarts restarts the rest is copied in a single step, so that the backup finishes on
+    busy databases as well. If pages is negative, the database is copied in a single step.
+    """
+
+    stats = SqliteBackupStats()
+    start = time.perf_counter()
+
+    conn = sqlite3.connect(db_path, detect_types=sqlite3.PARSE_DECLTYPES, uri=True, timeout=0.1)
 
-    conn = sqlite3.connect(db_path, detect_types=sqlite3.PARSE_DECLTYPES, uri=True)
     backup_conn = sqlite3.connect(backup_path, uri=True)
-    with backup_conn:
-        conn.backup(backup_conn)
-    backup_conn.close()
-    conn.close()
+    step_start = time.perf_counter()
+    remaining_pages = None
+
+    def progress(_, remaining, total):
+        nonlocal step_start, remaining_pages
+
+        stats.steps += 1
+        stats.pages = total
+        stats.longest_step_seconds = max(stats.longest_step_seconds, time.perf_counter() - step_start)
 
+        # without a restart every step reduces the remaining pages
+        if remaining_pages is not None and remaining >= remaining_pages:
+            stats.restarts += 1
 
-def difference_local_minio() -> tuple[set[str], set[str]]:
+            if stats.restarts > max_restarts:
+                raise SqliteBackupRestartLimitReached
+
+        remaining_pages = remaining
+
+        if remaining and sleep:
+            time.sleep(sleep)
+            stats.sleep_seconds += sleep
+
+        step_start = time.perf_counter()
+
+    try:
+        with backup_conn:
+            conn.backup(backup_conn, pages=pages, progress=progress, sleep=sleep)
+    except SqliteBackupRestartLimitReached:
+        logger.info('The sqlite database was modified too often during the backup, copying it in a single step.')
+        step_start = time.perf_counter()
+
+        with backup_conn:
+            conn.backup(backup_conn, progress=progress)
+    finally:
+        backup_conn.close()
+        conn.close()
+
+    stats.seconds = time.perf_counter() - start
+
+    return stats
+
+
+def get_local_files():
     """
-    Compare the local PDF and qr code files to the files in the minio bucket.
+    Stream the names and, if known, the content hashes of the local PDF and qr code files from the database. The qr
+    codes of deleted shared pdfs are skipped.
+    """
+
+    yield from Pdf.objects.exclude(file='').values_list('file', 'file_hash').iterator(chunk_size=MANIFEST_BATCH_SIZE)
+
+    not_deleted = Q(deletion_date__isnull=True) | Q(deletion_date__gt=datetime.now(timezone.utc))
+    shared_pdfs = SharedPdf.objects.filter(not_deleted).exclude(file='')
+
+    for file_name in shared_pdfs.values_list('file', flat=True).iterator(chunk_size=MANIFEST_BATCH_SIZE):
+        yield file_name, ''
+
 
-    Returns two sets: - one with the file names that need to be added to the minio bucket as they were recently uploaded
-                        by users.
-                    - and one with the names of the files that need to be removed from the bucket as they are no longer
-                      present on the local system, e.g. a user has deleted a file.
+def difference_local_manifest() -> tuple[list[BackupManifestEntry], list[str]]:
     """
+    Compare the local PDF and qr code files to the backup manifest. The files are streamed from the database and
+    looked up in the manifest in batches. A file is only hashed if its size or modification time changed and its hash
+    is not known already. Files whose content did not change, e.g. because they were only touched, are not uploaded
+    again.
+
+    Returns: - the unsaved manifest entries of the files that need to be added to the minio bucket as they were
+               recently uploaded or modified by users.
+             - the names of the files that need to be removed from the bucket as they are no longer present on the
+               local system, e.g. a user has deleted a file.
+    """
+
+    local_files = set()
+    to_be_added = []
+    touched_entries = []
+
+    for batch in batched(get_local_files(), MANIFEST_BATCH_SIZE):
+        manifest_entries = BackupManifestEntry.objects.in_bulk(
+            [file_name for file_name, _ in batch], field_name='object_key'
+        )
+
+        for file_name, file_hash in batch:
+            local_files.add(file_name)
+            file_path = settings.MEDIA_ROOT / file_name
+
+            try:
+                stat_result = file_path.stat()
+            except FileNotFoundError:
+                logger.error(f'"{file_name}" does not exist and cannot be backed up.')
+
+                continue
+
+            entry = manifest_entries.get(file_name)
 
-    set_of_local_pdf_files = {pdf.file.name for pdf in Pdf.objects.all()}
-    set_of_local_qr_codes = {shared_pdf.file.name for shared_pdf in SharedPdf.objects.all() if not shared_pdf.deleted}
-    set_of_local_files = set_of_local_pdf_files.union(set_of_local_qr_codes)
+            if entry and (entry.size, entry.modification_time) == (stat_result.st_size, stat_result.st_mtime_ns):
+                continue
+
+            file_hash = file_hash or get_file_hash(file_path)
+
+            if entry and entry.content_hash == file_hash:
+                entry.size, entry.modification_time = stat_result.st_size, stat_result.st_mtime_ns
+                touched_entries.append(entry)
+            else:
+                to_be_added.append(
+                    BackupManifestEntry(
+                        object_key=file_name,
+                        size=stat_result.st_size,
+                        modification_time=stat_result.st_mtime_ns,
+                        content_hash=file_hash,
+                    )
+                )
+
+    BackupManifestEntry.objects.bulk_update(
+        touched_entries, ['size', 'modification_time'], batch_size=MANIFEST_BATCH_SIZE
+    )
+
+    to_be_deleted = [
+        object_key
+        for object_key in BackupManifestEntry.objects.values_list('object_key', flat=True).iterator()
+        if object_key not in local_files
+    ]
+
+    return to_be_added, to_be_deleted
 
-    set_of_minio_files = {
-        minio_object.object_name
+
+def update_manifest(uploaded_entries: list[BackupManifestEntry], removed_files: list[str]):
+    """Save the manifest entries of the uploaded files and delete the entries of the removed files."""
+
+    now = datetime.now(timezone.utc)
+
+    for entry in uploaded_entries:
+        entry.uploaded_at = entry.verified_at = now
+
+    BackupManifestEntry.objects.bulk_create(
+        uploaded_entries,
+        batch_size=MANIFEST_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=['object_key'],
+        update_fields=['size', 'modification_time', 'content_hash', 'uploaded_at', 'verified_at'],
+    )
+
+    for batch in batched(removed_files, MANIFEST_BATCH_SIZE):
+        BackupManifestEntry.objects.filter(object_key__in=batch).delete()
+
+
+def reconciliation_due(reconciliation_days: int) -> bool:
+    """
+    Check if the manifest needs to be reconciled with the bucket. This is the case if the manifest is empty, e.g. after
+    upgrading from a version without manifest, or if entries were not verified for reconciliation_days.
+    """
+
+    cutoff = datetime.now(timezone.utc) - timedelta(days=reconciliation_days)
+
+    return (
+        not BackupManifestEntry.objects.exists() or BackupManifestEntry.objects.filter(verified_at__lt=cutoff).exists()
+    )
+
+
+def reconcile_manifest():
+    """
+    Reconcile the manifest with the objects of the minio bucket.
+
+    - Entries of objects that are missing in the bucket are deleted, so that the files are uploaded again.
+    - Objects that are missing in the manifest, e.g. as they were uploaded by an older version, are added to the
+      manifest if the local file was not modified after the upload. Otherwise, the files are uploaded again.
+    - Objects without a local file are added to the manifest as well, so that they are removed from the bucket.
+    """
+
+    now = datetime.now(timezone.utc)
+    minio_objects = {
+        minio_object.object_name: minio_object.last_modified
         for minio_object in minio_client.list_objects(settings.BACKUP_BUCKET_NAME, recursive=True)
         if minio_object.object_name != settings.DATABASES['default']['BACKUP_NAME'].name
     }
 
-    to_be_deleted = set_of_minio_files.difference(set_of_local_files)
-    to_be_added = set_of_local_files.difference(set_of_minio_files)
+    missing_objects = [
+        object_key
+        for object_key in BackupManifestEntry.objects.values_list('object_key', flat=True).iterator()
+        if object_key not in minio_objects
+    ]
 
-    return to_be_added, to_be_deleted
+    for batch in batched(missing_objects, MANIFEST_BATCH_SIZE):
+        BackupManifestEntry.objects.filter(object_key__in=batch).delete()
+
+    for batch in batched(minio_objects.items(), MANIFEST_BATCH_SIZE):
+        known_objects = set(
+            BackupManifestEntry.objects.filter(object_key__in=[object_key for object_key, _ in batch]).values_list(
+                'object_key', flat=True
+            )
+        )
+        new_entries = []
+
+        for object_key, last_modified in batch:
+            if object_key in known_objects:
+                continue
+
+            try:
+                stat_result = (settings.MEDIA_ROOT / object_key).stat()
+                size, modification_time = stat_result.st_size, stat_result.st_mtime_ns
+            except FileNotFoundError:
+                size, modification_time = 0, 0
+
+            if modification_time > last_modified.timestamp() * 1e9:
+                continue
+
+            new_entries.append(
+                BackupManifestEntry(
+                    object_key=object_key,
+                    size=size,
+                    modification_time=modification_time,
+                    uploaded_at=last_modified,
+                    verified_at=now,
+                )
+            )
+
+        BackupManifestEntry.objects.bulk_create(new_entries)
+
+    BackupManifestEntry.objects.update(verified_at=now)
 
 
-def add_file_to_minio(file_name: str, parent_path: Path, encryption_key: bytes):
+def add_file_to_minio(file_name: str, parent_path: Path, encryption_key: bytes, part_size: int = 0):
     """
-    Add a file to minio. If an encryption key is provided the file will be encrypted beforehand using cryptography's
-    fernet algorithm. Otherwise, the unchanged file will be added.
+    Add a file to minio. If an encryption key is provided the file will be encrypted while it is uploaded, so that
+    neither the whole file is held in memory nor a temporary file is needed. Otherwise, the unchanged file will be
+    added. Large files are uploaded in parts of part_size bytes, if it is 0 minio chooses the part size.
     """
 
     if encryption_key:
-        # encrypt the file, add it to minio, delete the local tmp file
-        encrypted_file_path = Path(__file__).parent / 'tmp_encrypted'
-        encrypt_file(encryption_key, parent_path / file_name, encrypted_file_path)
-        minio_client.fput_object(settings.BACKUP_BUCKET_NAME, file_name, str(encrypted_file_path))
-        encrypted_file_path.unlink()
+        file_path = parent_path / file_name
+        encrypted_size = EncryptingReader.get_encrypted_size(file_path.stat().st_size)
+
+        with file_path.open('rb') as file:
+            minio_client.put_object(
+                settings.BACKUP_BUCKET_NAME,
+                file_name,
+                EncryptingReader(encryption_key, file),
+                encrypted_size,
+                part_size=part_size,
+            )
     else:
-        minio_client.fput_object(settings.BACKUP_BUCKET_NAME, file_name, str(parent_path / file_name))
+        minio_client.fput_object(
+            settings.BACKUP_BUCKET_NAME, file_name, str(parent_path / file_name), part_size=part_size
+        )
@@ -1,57 +1,317 @@
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta, timezone
+from hashlib import sha256
+from io import BytesIO
 from pathlib import Path
 from unittest import mock
 
 from backup.management.commands.recover_data import Command
+from backup.models import BackupManifestEntry
+from backup.service import EncryptingReader
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet
 from django.conf import settings
-from django.core.management import call_command
-from django.test import TestCase
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
 
 
-class TestRecoverData(
-    TestCase,
-):
-    mock_object_1 = mock.Mock()
-    mock_object_1.object_name = 'pdf_1.pdf'
-    mock_object_2 = mock.Mock()
-    mock_object_2.object_name = 'backup.sqlite3'
+UPLOADED_AT = datetime(2025, 3, 1, tzinfo=timezone.utc)
 
-    mock_objects = [mock_object_1, mock_object_2]
 
-    @mock.patch('backup.management.commands.recover_data.Minio.list_objects', return_value=mock_objects)
-    @mock.patch('backup.management.commands.recover_data.Path.rename')
+def create_minio_object(object_name: str, etag: str = 'etag', last_modified: datetime = UPLOADED_AT):
+    return mock.Mock(object_name=object_name, etag=etag, last_modified=last_modified)
+
+
+@mock.patch('backup.management.commands.recover_data.connection')
+@mock.patch(
+    'backup.management.commands.recover_data.Minio.stat_object', return_value=create_minio_object('backup.sqlite3')
+)
+@mock.patch('backup.management.commands.recover_data.get_encryption_key', return_value=b'key')
+@mock.patch('builtins.input', return_value='y')
+class TestRecoverData(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.checkpoint_path = Path(self.tmp_dir.name) / 'checkpoint'
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    @mock.patch(
+        'backup.management.commands.recover_data.Minio.list_objects',
+        return_value=[create_minio_object('1/pdf_1.pdf'), create_minio_object('backup.sqlite3')],
+    )
+    @mock.patch('backup.management.commands.recover_data.Command.restore_sqlite')
     @mock.patch('backup.management.commands.recover_data.Command.get_file_from_minio')
-    @mock.patch('backup.management.commands.recover_data.get_encryption_key', return_value=b'key')
-    @mock.patch('builtins.input', return_value='y')
     def test_recover_data(
-        self, mock_input, mock_get_encryption_key, mock_get_file_from_minio, mock_rename, mock_list_objects
+        self,
+        mock_get_file_from_minio,
+        mock_restore_sqlite,
+        mock_list_objects,
+        mock_input,
+        mock_get_encryption_key,
+        mock_stat_object,
+        mock_connection,
     ):
-        call_command('recover_data')
+        call_command('recover_data', checkpoint=self.checkpoint_path)
 
         mock_get_encryption_key.assert_called_with(True, 'password', 'pdfding')
-        mock_rename.assert_called_with(settings.DATABASES['default']['NAME'])
+        mock_restore_sqlite.assert_called_with(
+            settings.DATABASES['default']['BACKUP_NAME'], settings.DATABASES['default']['NAME']
+        )
+        mock_connection.close.assert_called_with()
+        mock_list_objects.assert_called_with('pdfding', prefix=None, recursive=True)
 
         self.assertEqual(mock_get_file_from_minio.call_count, 2)
         mock_get_file_from_minio.assert_has_calls(
             [
                 mock.call('backup.sqlite3', Path(__file__).parents[2] / 'db', b'key'),
-                mock.call('pdf_1.pdf', Path(__file__).parents[2] / 'media', b'key'),
+                mock.call('1/pdf_1.pdf', Path(__file__).parents[2] / 'media', b'key'),
+            ],
+        )
+        # the checkpoint is removed after a complete recovery
+        self.assertFalse(self.checkpoint_path.exists())
+
+    @mock.patch(
+        'backup.management.commands.recover_data.Minio.list_objects',
+        return_value=[create_minio_object('1/pdf_1.pdf'), create_minio_object('1/pdf_2.pdf', etag='new_etag')],
+    )
+    @mock.patch('backup.management.commands.recover_data.Command.restore_sqlite')
+    @mock.patch('backup.management.commands.recover_data.Command.get_file_from_minio')
+    def test_recover_data_resume(
+        self,
+        mock_get_file_from_minio,
+        mock_restore_sqlite,
+        mock_list_objects,
+        mock_input,
+        mock_get_encryption_key,
+        mock_stat_object,
+        mock_connection,
+    ):
+        # pdf_2.pdf was uploaded again after it was recovered, so it needs to be recovered again
+        self.checkpoint_path.write_text('etag\tbackup.sqlite3\netag\t1/pdf_1.pdf\nold_etag\t1/pdf_2.pdf\n')
+
+        call_command('recover_data', checkpoint=self.checkpoint_path)
+
+        mock_restore_sqlite.assert_not_called()
+        mock_get_file_from_minio.assert_called_once_with('1/pdf_2.pdf', Path(__file__).parents[2] / 'media', b'key')
+
+    @mock.patch(
+        'backup.management.commands.recover_data.Minio.list_objects',
+        return_value=[create_minio_object('2/pdf_1.pdf'), create_minio_object('2/qr/qr_1.svg')],
+    )
+    @mock.patch('backup.management.commands.recover_data.Command.restore_sqlite')
+    @mock.patch('backup.management.commands.recover_data.Command.get_file_from_minio')
+    def test_recover_data_single_user(
+        self,
+        mock_get_file_from_minio,
+        mock_restore_sqlite,
+        mock_list_objects,
+        mock_input,
+        mock_get_encryption_key,
+        mock_stat_object,
+        mock_connection,
+    ):
+        call_command('recover_data', checkpoint=self.checkpoint_path, user=2, workers=2)
+
+        mock_list_objects.assert_called_with('pdfding', prefix='2/', recursive=True)
+        self.assertEqual(mock_get_file_from_minio.call_count, 3)
+        # the checkpoint is kept, so that the files are skipped when recovering the files of all users
+        self.assertEqual(
+            sorted(self.checkpoint_path.read_text().splitlines()),
+            ['etag\t2/pdf_1.pdf', 'etag\t2/qr/qr_1.svg', 'etag\tbackup.sqlite3'],
+        )
+
+    @mock.patch(
+        'backup.management.commands.recover_data.Minio.list_objects',
+        return_value=[create_minio_object('1/pdf_1.pdf'), create_minio_object('1/pdf_2.pdf')],
+    )
+    @mock.patch('backup.management.commands.recover_data.Command.restore_sqlite')
+    @mock.patch('backup.management.commands.recover_data.Command.get_file_from_minio')
+    def test_recover_data_failed_download(
+        self,
+        mock_get_file_from_minio,
+        mock_restore_sqlite,
+        mock_list_objects,
+        mock_input,
+        mock_get_encryption_key,
+        mock_stat_object,
+        mock_connection,
+    ):
+        def get_file_from_minio(obj_name, target_parent_path, encryption_key):
+            if obj_name == '1/pdf_2.pdf':
+                raise ConnectionError('connection reset')
+
+        mock_get_file_from_minio.side_effect = get_file_from_minio
+
+        with self.assertRaisesMessage(CommandError, '1 files could not be recovered.'):
+            call_command('recover_data', checkpoint=self.checkpoint_path)
+
+        self.assertEqual(
+            sorted(self.checkpoint_path.read_text().splitlines()), ['etag\t1/pdf_1.pdf', 'etag\tbackup.sqlite3']
+        )
+
+    @mock.patch('backup.management.commands.recover_data.Minio.list_objects')
+    @mock.patch('backup.management.commands.recover_data.Command.restore_sqlite')
+    @mock.patch('backup.management.commands.recover_data.Command.get_file_from_minio')
+    def test_recover_data_verify(
+        self,
+        mock_get_file_from_minio,
+        mock_restore_sqlite,
+        mock_list_objects,
+        mock_input,
+        mock_get_encryption_key,
+        mock_stat_object,
+        mock_connection,
+    ):
+        mock_list_objects.return_value = [
+            create_minio_object(f'1/{name}.pdf')
+            for name in ['valid', 'recovered', 'wrong_size', 'wrong_hash', 'not_in_manifest']
+        ] + [create_minio_object('1/uploaded_later.pdf', last_modified=UPLOADED_AT + timedelta(days=1))]
+
+        for name, size, content_hash in [
+            ('valid', 5, sha256(b'valid').hexdigest()),
+            ('recovered', 9, ''),
+            ('wrong_size', 1, ''),
+            ('wrong_hash', 10, 'hash'),
+            ('uploaded_later', 1, ''),
+        ]:
+            BackupManifestEntry.objects.create(
+                object_key=f'1/{name}.pdf',
+                size=size,
+                modification_time=0,
+                content_hash=content_hash,
+                uploaded_at=UPLOADED_AT,
+                verified_at=UPLOADED_AT,
+            )
+
+        media_root = Path(self.tmp_dir.name) / 'media'
+
+        def get_file_from_minio(obj_name, target_parent_path, encryption_key):
+            (target_parent_path / obj_name).parent.mkdir(parents=True, exist_ok=True)
+            (target_parent_path / obj_name).write_bytes(Path(obj_name).stem.encode())
+
+        mock_get_file_from_minio.side_effect = get_file_from_minio
+        # recovered.pdf was recovered by a previous run
+        get_file_from_minio('1/recovered.pdf', media_root, None)
+        self.checkpoint_path.write_text('etag\tbackup.sqlite3\netag\t1/recovered.pdf\n')
+
+        with (
+            override_settings(MEDIA_ROOT=media_root),
+            self.assertRaisesMessage(CommandError, '2 files could not be recovered.'),
+        ):
+            call_command('recover_data', checkpoint=self.checkpoint_path, verify=True)
+
+        self.assertEqual(mock_get_file_from_minio.call_count, 5)
+        # files that do not match the manifest are not added to the checkpoint
+        self.assertEqual(
+            sorted(self.checkpoint_path.read_text().splitlines()),
+            [
+                'etag\t1/not_in_manifest.pdf',
+                'etag\t1/recovered.pdf',
+                'etag\t1/uploaded_later.pdf',
+                'etag\t1/valid.pdf',
+                'etag\tbackup.sqlite3',
             ],
         )
 
+
+class TestGetFileFromMinio(TestCase):
     @mock.patch('backup.management.commands.recover_data.Minio.fget_object')
     def test_get_file_from_minio_no_encryption(self, mock_fget_object):
         Command.get_file_from_minio('file_name', Path('path'), None)
 
         mock_fget_object.assert_called_with('pdfding', 'file_name', 'path/file_name')
 
-    @mock.patch('backup.tasks.Path.unlink')
-    @mock.patch('backup.management.commands.recover_data.decrypt_file')
-    @mock.patch('backup.management.commands.recover_data.Minio.fget_object')
-    def test_get_file_from_minio_with_encryption(self, mock_fput_object, mock_decrypt_file, mock_unlink):
-        Command.get_file_from_minio('file_name', Path('path'), b'key')
+    @mock.patch('backup.management.commands.recover_data.Minio.get_object')
+    def test_get_file_from_minio_with_encryption(self, mock_get_object):
+        key = Fernet.generate_key()
+        source_path = Path(__file__).parent / '__init__.py'
+        encrypted_contents = EncryptingReader(key, BytesIO(source_path.read_bytes())).read()
+        response = mock.Mock()
+        response.read.side_effect = BytesIO(encrypted_contents).read
+        mock_get_object.return_value = response
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            Command.get_file_from_minio('1/file_name', Path(tmp_dir), key)
+            decrypted_contents = (Path(tmp_dir) / '1' / 'file_name').read_bytes()
+            # the temporary file was renamed to the target file
+            recovered_files = [path.name for path in (Path(tmp_dir) / '1').iterdir()]
+
+        mock_get_object.assert_called_with('pdfding', '1/file_name')
+        response.close.assert_called_with()
+        response.release_conn.assert_called_with()
+        self.assertEqual(decrypted_contents, source_path.read_bytes())
+        self.assertEqual(recovered_files, ['file_name'])
+
+    @mock.patch('backup.management.commands.recover_data.Minio.get_object')
+    def test_get_file_from_minio_truncated(self, mock_get_object):
+        key = Fernet.generate_key()
+        encrypted_contents = EncryptingReader(key, BytesIO(b'content' * 1000)).read()
+        response = mock.Mock()
+        response.read.side_effect = BytesIO(encrypted_contents[:-10]).read
+        mock_get_object.return_value = response
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with self.assertRaises(InvalidTag):
+                Command.get_file_from_minio('1/file_name', Path(tmp_dir), key)
+
+            recovered_files = list((Path(tmp_dir) / '1').iterdir())
+
+        response.close.assert_called_with()
+        self.assertEqual(recovered_files, [])
+
+
+class TestManifestAndCheckpoint(TestCase):
+    def test_get_manifest_prefix(self):
+        uploaded_at = datetime.now(timezone.utc)
+
+        for object_key in ['1/pdf_1.pdf', '2/pdf_2.pdf']:
+            BackupManifestEntry.objects.create(
+                object_key=object_key,
+                size=10,
+                modification_time=0,
+                content_hash='a',
+                uploaded_at=uploaded_at,
+                verified_at=uploaded_at,
+            )
+
+        self.assertEqual(Command.get_manifest('2/'), {'2/pdf_2.pdf': (10, 'a', uploaded_at)})
+
+    def test_remove_from_checkpoint_missing(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            checkpoint_path = Path(tmp_dir) / 'checkpoint'
+
+            Command.remove_from_checkpoint(checkpoint_path, {'1/pdf_1.pdf'})
+
+            self.assertFalse(checkpoint_path.exists())
+
+
+class TestRestoreSqlite(TestCase):
+    def test_restore_sqlite(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = Path(tmp_dir) / 'db.sqlite3'
+            backup_path = Path(tmp_dir) / 'backup.sqlite3'
+
+            backup_conn = sqlite3.connect(backup_path)
+            with backup_conn:
+                backup_conn.execute('CREATE TABLE data (content TEXT)')
+                backup_conn.execute("INSERT INTO data VALUES ('recovered')")
+            backup_conn.close()
+
+            # the changes of the running application are still in the WAL file of the database
+            app_conn = sqlite3.connect(db_path)
+            app_conn.execute('PRAGMA journal_mode=WAL')
+            app_conn.execute('PRAGMA wal_autocheckpoint=0')
+            with app_conn:
+                app_conn.execute('CREATE TABLE data (content TEXT)')
+                app_conn.execute("INSERT INTO data VALUES ('old')")
+
+            Command.restore_sqlite(backup_path, db_path)
 
-        tmp_file_path = Path(__file__).parents[1] / 'management' / 'commands' / 'tmp_encrypted'
+            self.assertEqual(app_conn.execute('SELECT content FROM data').fetchall(), [('recovered',)])
+            app_conn.close()
 
-        mock_fput_object.assert_called_with('pdfding', 'file_name', str(tmp_file_path))
-        mock_decrypt_file.assert_called_with(b'key', tmp_file_path, Path('path/file_name'))
-        mock_unlink.assert_called_with()
+            new_conn = sqlite3.connect(db_path)
+            self.assertEqual(new_conn.execute('SELECT content FROM data').fetchall(), [('recovered',)])
+            new_conn.close()
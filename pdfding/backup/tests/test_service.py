@@ -1,8 +1,11 @@
 import base64
+from io import BytesIO
 from pathlib import Path
 from unittest import mock
 
 from backup import service
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet
 from django.test import TestCase
 
 
@@ -35,20 +38,25 @@ class TestEncryption(TestCase):
 
         self.assertEqual(generated_key, base64.urlsafe_b64encode(b'generated_key'))
 
-    @mock.patch('backup.service.Fernet', return_value=mock_fernet_object)
-    def test_encrypt_file(self, mock_fernet):
+    def test_encrypt_decrypt_file(self):
         parent_path = Path(__file__).parent
-        tmp_file_path = parent_path / 'tmp'
+        encrypted_file_path = parent_path / 'tmp_encrypted'
+        decrypted_file_path = parent_path / 'tmp_decrypted'
+        key = Fernet.generate_key()
 
-        service.encrypt_file(b'key', parent_path / '__init__.py', tmp_file_path)
+        service.encrypt_file(key, parent_path / '__init__.py', encrypted_file_path)
+        service.decrypt_file(key, encrypted_file_path, decrypted_file_path)
 
-        with open(tmp_file_path, 'rb') as file:
-            tmp_file_contents = file.read()
+        encrypted_contents = encrypted_file_path.read_bytes()
+        decrypted_contents = decrypted_file_path.read_bytes()
 
-        # delete the tmp file
-        tmp_file_path.unlink()
+        # delete the tmp files
+        encrypted_file_path.unlink()
+        decrypted_file_path.unlink()
 
-        self.assertEqual(tmp_file_contents, b'"""some content for encryption test"""\nencrypted')
+        self.assertTrue(encrypted_contents.startswith(service.MAGIC))
+        self.assertNotIn(b'some content', encrypted_contents)
+        self.assertEqual(decrypted_contents, b'"""some content for encryption test"""\n')
 
     @mock.patch('backup.service.Fernet', return_value=mock_fernet_object)
     def test_decrypt_file(self, mock_fernet):
@@ -64,3 +72,95 @@ class TestEncryption(TestCase):
         tmp_file_path.unlink()
 
         self.assertEqual(tmp_file_contents, b'"""some content for encryption test"""\ndecrypted')
+
+
+class TestChunkedEncryption(TestCase):
+    key = Fernet.generate_key()
+
+    def encrypt(self, data: bytes, chunk_size: int = 16) -> bytes:
+        return service.EncryptingReader(self.key, BytesIO(data), chunk_size).read()
+
+    def decrypt(self, encrypted: bytes) -> bytes:
+        decrypted = BytesIO()
+        service.decrypt_stream(self.key, BytesIO(encrypted), decrypted)
+
+        return decrypted.getvalue()
+
+    def test_round_trip(self):
+        # the sizes cover empty files, partial and full last chunks
+        for size in [0, 1, 15, 16, 17, 32, 100]:
+            data = bytes(i % 256 for i in range(size))
+            encrypted = self.encrypt(data)
+
+            self.assertEqual(len(encrypted), service.EncryptingReader.get_encrypted_size(size, 16))
+            self.assertEqual(self.decrypt(encrypted), data)
+
+    def test_read_in_parts(self):
+        data = bytes(i % 256 for i in range(100))
+        encrypting_reader = service.EncryptingReader(self.key, BytesIO(data), 16)
+        parts = []
+
+        while part := encrypting_reader.read(7):
+            self.assertLessEqual(len(part), 7)
+            # only the chunks needed for the requested part are encrypted
+            self.assertLess(len(encrypting_reader.buffer), 16 + service.TAG_SIZE + 7)
+            parts.append(part)
+
+        self.assertEqual(self.decrypt(b''.join(parts)), data)
+
+    def test_modified_chunk(self):
+        encrypted = bytearray(self.encrypt(b'some data that is longer than a chunk'))
+        encrypted[service.HEADER_SIZE + 3] ^= 1
+
+        with self.assertRaises(InvalidTag):
+            self.decrypt(bytes(encrypted))
+
+    def test_truncated(self):
+        encrypted = self.encrypt(b'exactly 32 bytes of data here!!!')
+
+        # remove the empty last chunk, so that the data ends after a full chunk
+        with self.assertRaises(InvalidTag):
+            self.decrypt(encrypted[: -service.TAG_SIZE])
+
+        with self.assertRaises(InvalidTag):
+            self.decrypt(encrypted + b'appended')
+
+    def test_truncated_at_chunk_boundary(self):
+        encrypted = self.encrypt(bytes(48))
+
+        # the data ends after the second of three full chunks
+        with self.assertRaises(InvalidTag):
+            self.decrypt(encrypted[: service.HEADER_SIZE + 2 * (16 + service.TAG_SIZE)])
+
+    def test_appended_data(self):
+        encrypted = self.encrypt(b'some data that is longer than a chunk')
+
+        # the appended data is read as part of the last chunk, whose tag does not match anymore
+        for appended in [b'a', bytes(service.TAG_SIZE), bytes(16 + service.TAG_SIZE)]:
+            with self.assertRaises(InvalidTag):
+                self.decrypt(encrypted + appended)
+
+    def test_appended_data_after_end_of_stream(self):
+        encrypted = self.encrypt(b'')
+        # the source signals the end of the stream after the last chunk, but has more data afterwards
+        source = mock.Mock()
+        source.read.side_effect = [
+            encrypted[: service.HEADER_SIZE],
+            encrypted[service.HEADER_SIZE :],  # noqa: E203
+            b'',
+            b'appended',
+        ]
+
+        with self.assertRaisesRegex(InvalidTag, 'Encrypted data after the last chunk'):
+            service.decrypt_stream(self.key, source, BytesIO())
+
+    def test_wrong_key(self):
+        encrypted = self.encrypt(b'data')
+
+        with self.assertRaises(InvalidTag):
+            service.decrypt_stream(Fernet.generate_key(), BytesIO(encrypted), BytesIO())
+
+    def test_decrypt_legacy_fernet(self):
+        encrypted = Fernet(self.key).encrypt(b'encrypted by an older version')
+
+        self.assertEqual(self.decrypt(encrypted), b'encrypted by an older version')
@@ -1,35 +1,24 @@
+import os
 import sqlite3
+import tempfile
 from datetime import datetime, timedelta, timezone
+from hashlib import sha256
+from io import BytesIO
 from pathlib import Path
 from unittest import mock
 
 from allauth.account.models import EmailAddress
 from backup import tasks
+from backup.models import BackupManifestEntry
+from backup.service import decrypt_stream
+from cryptography.fernet import Fernet
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from pdf.models import Pdf, SharedPdf, Tag
 
 
 class TestPeriodicBackup(TestCase):
-    mock_objects = []
-    for i in range(4, 9):
-        mock_object = mock.Mock()
-        mock_object.object_name = f'1/pdf_{i}.pdf'
-        mock_objects.append(mock_object)
-    for i in range(3):
-        mock_object = mock.Mock()
-        mock_object.object_name = f'2/pdf_{i}{i}.pdf'
-        mock_objects.append(mock_object)
-
-    for i in range(1, 3):
-        mock_object = mock.Mock()
-        mock_object.object_name = f'{i}/qr/qr_{i}.svg'
-        mock_objects.append(mock_object)
-
-    mock_object = mock.Mock()
-    mock_object.object_name = 'backup.sqlite3'
-
     def test_check_backup_requirements_empty_db(self):
         self.assertFalse(tasks.check_backup_requirements())
 
@@ -44,8 +33,9 @@ class TestPeriodicBackup(TestCase):
 
         self.assertTrue(tasks.check_backup_requirements())
 
-    @mock.patch('backup.tasks.Minio.remove_object')
-    @mock.patch('backup.tasks.difference_local_minio', return_value=({'add_1.pdf', 'add_2.pdf'}, {'remove.pdf'}))
+    @mock.patch('backup.tasks.Minio.remove_objects', return_value=iter([]))
+    @mock.patch('backup.tasks.difference_local_manifest')
+    @mock.patch('backup.tasks.reconcile_manifest')
     @mock.patch('backup.tasks.add_file_to_minio')
     @mock.patch('backup.tasks.get_encryption_key', return_value=b'key')
     @mock.patch('backup.tasks.Minio.make_bucket')
@@ -56,10 +46,22 @@ class TestPeriodicBackup(TestCase):
         mock_make_bucket,
         mock_get_encryption_key,
         mock_add_file_to_minio,
-        mock_difference_local_minio,
-        mock_remove_object,
+        mock_reconcile_manifest,
+        mock_difference_local_manifest,
+        mock_remove_objects,
     ):
-        tasks.backup_function()
+        media_root = Path(__file__).parents[2] / 'media'
+        create_manifest_entry('remove.pdf', uploaded_at=datetime.now(timezone.utc) - timedelta(days=8))
+        mock_difference_local_manifest.return_value = (
+            [
+                BackupManifestEntry(object_key=f'add_{i}.pdf', size=100, modification_time=i, content_hash=f'hash_{i}')
+                for i in range(1, 3)
+            ],
+            ['remove.pdf'],
+        )
+
+        with mock.patch('backup.tasks.Path.stat', return_value=mock.Mock(st_size=100)):
+            stats = tasks.backup_function()
 
         mock_make_bucket.assert_called_with('pdfding')
         mock_bucket_exists.assert_called_with('pdfding')
@@ -67,15 +69,129 @@ class TestPeriodicBackup(TestCase):
         self.assertEqual(mock_add_file_to_minio.call_count, 3)
         mock_add_file_to_minio.assert_has_calls(
             [
-                mock.call('backup.sqlite3', Path(__file__).parents[2] / 'db', b'key'),
-                mock.call('add_1.pdf', Path(__file__).parents[2] / 'media', b'key'),
-                mock.call('add_2.pdf', Path(__file__).parents[2] / 'media', b'key'),
+                mock.call('backup.sqlite3', Path(__file__).parents[2] / 'db', b'key', 16 * 1024 * 1024),
+                mock.call('add_1.pdf', media_root, b'key', 16 * 1024 * 1024),
+                mock.call('add_2.pdf', media_root, b'key', 16 * 1024 * 1024),
             ],
             any_order=True,
         )
 
-        self.assertEqual(mock_remove_object.call_count, 1)
-        mock_remove_object.assert_called_with('pdfding', 'remove.pdf')
+        bucket_name, delete_objects = mock_remove_objects.call_args.args
+        self.assertEqual(bucket_name, 'pdfding')
+        self.assertEqual([delete_object.name for delete_object in delete_objects], ['remove.pdf'])
+
+        self.assertEqual(stats.files_added, 2)
+        self.assertEqual(stats.bytes_added, 200)
+        self.assertEqual(stats.files_removed, 1)
+        self.assertEqual(stats.retries, 0)
+
+        # the manifest was not verified for more than 7 days, so it was reconciled with the bucket first
+        mock_reconcile_manifest.assert_called_once_with()
+        self.assertEqual(
+            list(BackupManifestEntry.objects.order_by('object_key').values_list('object_key', 'content_hash')),
+            [('add_1.pdf', 'hash_1'), ('add_2.pdf', 'hash_2')],
+        )
+
+    @mock.patch('backup.tasks.remove_files_from_minio')
+    @mock.patch('backup.tasks.upload_files')
+    @mock.patch('backup.tasks.reconciliation_due', return_value=False)
+    @mock.patch('backup.tasks.difference_local_manifest')
+    @mock.patch('backup.tasks.add_file_to_minio')
+    @mock.patch('backup.tasks.get_encryption_key', return_value=None)
+    @mock.patch('backup.tasks.Minio.bucket_exists', return_value=True)
+    def test_backup_function_failed_upload(
+        self,
+        mock_bucket_exists,
+        mock_get_encryption_key,
+        mock_add_file_to_minio,
+        mock_difference_local_manifest,
+        mock_reconciliation_due,
+        mock_upload_files,
+        mock_remove_files_from_minio,
+    ):
+        def upload_files(file_names, parent_path, encryption_key, stats, **kwargs):
+            stats.failed_files.extend(file_names)
+
+            return set()
+
+        mock_upload_files.side_effect = upload_files
+        mock_remove_files_from_minio.return_value = []
+        mock_difference_local_manifest.return_value = (
+            [BackupManifestEntry(object_key='add_1.pdf', size=1, modification_time=1, content_hash='hash')],
+            [],
+        )
+
+        with self.assertRaisesMessage(RuntimeError, 'Backup failed, 1 files could not be uploaded.'):
+            tasks.backup_function()
+
+        # files are removed even if uploads failed
+        mock_remove_files_from_minio.assert_called_once()
+        # failed files are not added to the manifest, so they are uploaded by the next run
+        self.assertFalse(BackupManifestEntry.objects.exists())
+
+    @mock.patch('backup.tasks.time.sleep')
+    @mock.patch('backup.tasks.Path.stat', return_value=mock.Mock(st_size=10))
+    @mock.patch('backup.tasks.add_file_to_minio')
+    def test_upload_files(self, mock_add_file_to_minio, mock_stat, mock_sleep):
+        attempts = {'flaky.pdf': 0}
+
+        def add_file_to_minio(file_name, parent_path, encryption_key, part_size):
+            if file_name == 'broken.pdf':
+                raise ConnectionError('connection reset')
+            elif file_name == 'flaky.pdf' and attempts['flaky.pdf'] == 0:
+                attempts['flaky.pdf'] += 1
+                raise ConnectionError('connection reset')
+
+        mock_add_file_to_minio.side_effect = add_file_to_minio
+        stats = tasks.BackupStats()
+        file_names = ['broken.pdf', 'flaky.pdf'] + [f'{i}.pdf' for i in range(10)]
+
+        tasks.upload_files(file_names, Path('media'), b'key', stats, workers=4, part_size=5 * 1024 * 1024, retries=2)
+
+        # broken.pdf is tried three times, flaky.pdf twice and all other files once
+        self.assertEqual(mock_add_file_to_minio.call_count, 15)
+        mock_add_file_to_minio.assert_any_call('1.pdf', Path('media'), b'key', 5 * 1024 * 1024)
+        self.assertEqual(stats.files_added, 11)
+        self.assertEqual(stats.bytes_added, 110)
+        self.assertEqual(stats.retries, 3)
+        self.assertEqual(stats.failed_files, ['broken.pdf'])
+        # the delay between the attempts of a file doubles
+        self.assertEqual(sorted(call.args[0] for call in mock_sleep.call_args_list), [1, 1, 2])
+        self.assertGreater(stats.upload_seconds, 0)
+
+    @mock.patch('backup.tasks.Minio.remove_objects')
+    def test_remove_files_from_minio(self, mock_remove_objects):
+        failed_removal = mock.Mock()
+        failed_removal.name = '1/locked.pdf'
+        # the errors are returned lazily as the deletes are only sent while iterating
+        mock_remove_objects.return_value = iter([failed_removal])
+        stats = tasks.BackupStats()
+
+        tasks.remove_files_from_minio(['1/a.pdf', '1/locked.pdf', '2/b.pdf'], stats)
+
+        bucket_name, delete_objects = mock_remove_objects.call_args.args
+        self.assertEqual(bucket_name, 'pdfding')
+        self.assertEqual(
+            [delete_object.name for delete_object in delete_objects], ['1/a.pdf', '1/locked.pdf', '2/b.pdf']
+        )
+        self.assertEqual(stats.files_removed, 2)
+
+    @mock.patch('backup.tasks.Minio.remove_objects')
+    def test_remove_files_from_minio_nothing_to_remove(self, mock_remove_objects):
+        tasks.remove_files_from_minio([], tasks.BackupStats())
+
+        mock_remove_objects.assert_not_called()
+
+    def test_backup_stats(self):
+        stats = tasks.BackupStats(files_added=20, bytes_added=50_000_000, files_removed=3, retries=1, upload_seconds=4)
+
+        self.assertEqual(stats.files_per_second, 5)
+        self.assertEqual(stats.megabytes_per_second, 12.5)
+        self.assertEqual(
+            str(stats),
+            'added 20 files (50.0 MB) in 4.0 s (5.0 files/s, 12.5 MB/s), removed 3 files, 1 retries, 0 failed',
+        )
+        self.assertEqual(tasks.BackupStats().files_per_second, 0)
 
     def test_parse_cron_schedule(self):
         expected_dict = {'minute': '3', 'hour': '*/2', 'day': '6', 'month': '7', 'day_of_week': '*'}
@@ -83,37 +199,129 @@ class TestPeriodicBackup(TestCase):
 
         self.assertEqual(expected_dict, generated_dict)
 
-    @mock.patch('backup.tasks.Minio.list_objects', return_value=mock_objects)
-    def test_difference_local_minio(self, mock_list_objects):
-        user_1 = User.objects.create_user(username='user_1', password='password', email='a@a.com')
-        user_2 = User.objects.create_user(username='user_2', password='password', email='b@a.com')
-
-        for i in range(1, 7):
-            pdf = Pdf.objects.create(owner=user_1.profile, name=f'pdf_{i}.pdf')
-            pdf.file.name = f'{pdf.owner.id}/{pdf.name}'
-            pdf.save()
-        for i in range(2, 4):
-            pdf = Pdf.objects.create(owner=user_2.profile, name=f'pdf_{i}{i}.pdf')
-            pdf.file.name = f'{pdf.owner.id}/{pdf.name}'
-            pdf.save()
-        for i in range(1, 4):
-            pdf = user_1.profile.pdf_set.get(name='pdf_1.pdf')
-            shared_pdf = SharedPdf.objects.create(owner=user_1.profile, name=f'shared_pdf_{i}', pdf=pdf)
-            shared_pdf.file.name = f'{pdf.owner.id}/qr/qr_{i}.svg'
+    def test_difference_local_manifest(self):
+        user = User.objects.create_user(username='user_1', password='password', email='a@a.com')
+
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=Path(media_root)):
+            (Path(media_root) / '1' / 'qr').mkdir(parents=True)
+
+            for name in ['new', 'unchanged', 'touched', 'modified', 'missing']:
+                pdf = Pdf.objects.create(owner=user.profile, name=name, file_hash=f'hash_{name}')
+                pdf.file.name = f'1/{name}.pdf'
+                pdf.save()
+
+                if name != 'missing':
+                    (Path(media_root) / pdf.file.name).write_bytes(name.encode())
+
+            pdf = Pdf.objects.get(name='new')
+
+            for i in range(1, 3):
+                shared_pdf = SharedPdf.objects.create(owner=user.profile, name=f'shared_pdf_{i}', pdf=pdf)
+                shared_pdf.file.name = f'1/qr/qr_{i}.svg'
+                (Path(media_root) / shared_pdf.file.name).write_bytes(b'qr code')
+
+                # the qr code of a deleted shared pdf should not be added
+                if i == 2:
+                    shared_pdf.deletion_date = datetime.now(timezone.utc) - timedelta(days=3, hours=2)
+
+                shared_pdf.save()
+
+            create_manifest_entry('1/unchanged.pdf', Path(media_root), 'hash_unchanged')
+            create_manifest_entry('1/touched.pdf', Path(media_root), 'hash_touched', modification_time=1)
+            create_manifest_entry('1/modified.pdf', Path(media_root), 'hash_old', modification_time=1)
+            create_manifest_entry('1/removed.pdf')
+            create_manifest_entry('1/qr/qr_2.svg')
 
-            # also add shared pdf with deletion date in the past
-            # the qr code of this shared pdf should not be added
-            if i == 3:
-                shared_pdf.deletion_date = datetime.now(timezone.utc) - timedelta(days=3, hours=2)
+            to_be_added, to_be_deleted = tasks.difference_local_manifest()
 
-            shared_pdf.save()
+            touched_entry = BackupManifestEntry.objects.get(object_key='1/touched.pdf')
+            touched_modification_time = (Path(media_root) / '1' / 'touched.pdf').stat().st_mtime_ns
 
-        generated_to_be_added, generated_to_be_deleted = tasks.difference_local_minio()
-        expected_to_be_added = {'1/pdf_1.pdf', '1/pdf_2.pdf', '1/pdf_3.pdf', '2/pdf_33.pdf', '1/qr/qr_2.svg'}
-        expected_to_be_deleted = {'1/pdf_7.pdf', '1/pdf_8.pdf', '2/pdf_00.pdf', '2/pdf_11.pdf', '2/qr/qr_2.svg'}
+        self.assertEqual(
+            sorted((entry.object_key, entry.size, entry.content_hash) for entry in to_be_added),
+            [
+                ('1/modified.pdf', 8, 'hash_modified'),
+                ('1/new.pdf', 3, 'hash_new'),
+                ('1/qr/qr_1.svg', 7, sha256(b'qr code').hexdigest()),
+            ],
+        )
+        self.assertEqual(sorted(to_be_deleted), ['1/qr/qr_2.svg', '1/removed.pdf'])
+        # touched files are not uploaded again, only their modification time is updated
+        self.assertEqual(touched_entry.modification_time, touched_modification_time)
 
-        self.assertEqual(expected_to_be_added, generated_to_be_added)
-        self.assertEqual(expected_to_be_deleted, generated_to_be_deleted)
+    def test_update_manifest(self):
+        create_manifest_entry('modified.pdf')
+        create_manifest_entry('removed.pdf')
+        create_manifest_entry('kept.pdf')
+
+        tasks.update_manifest(
+            [
+                BackupManifestEntry(object_key='modified.pdf', size=10, modification_time=2, content_hash='new_hash'),
+                BackupManifestEntry(object_key='new.pdf', size=5, modification_time=3, content_hash='hash'),
+            ],
+            ['removed.pdf'],
+        )
+
+        self.assertEqual(
+            list(
+                BackupManifestEntry.objects.order_by('object_key').values_list(
+                    'object_key', 'size', 'modification_time', 'content_hash'
+                )
+            ),
+            [('kept.pdf', 0, 0, ''), ('modified.pdf', 10, 2, 'new_hash'), ('new.pdf', 5, 3, 'hash')],
+        )
+        modified_entry = BackupManifestEntry.objects.get(object_key='modified.pdf')
+        self.assertGreater(modified_entry.uploaded_at, datetime.now(timezone.utc) - timedelta(minutes=1))
+
+    def test_reconciliation_due(self):
+        self.assertTrue(tasks.reconciliation_due(7))
+
+        entry = create_manifest_entry('file.pdf')
+        self.assertFalse(tasks.reconciliation_due(7))
+
+        entry.verified_at = datetime.now(timezone.utc) - timedelta(days=8)
+        entry.save()
+        self.assertTrue(tasks.reconciliation_due(7))
+
+    @mock.patch('backup.tasks.Minio.list_objects')
+    def test_reconcile_manifest(self, mock_list_objects):
+        uploaded_at = datetime(2025, 3, 1, tzinfo=timezone.utc)
+        mock_list_objects.return_value = [
+            mock.Mock(object_name=object_name, last_modified=uploaded_at)
+            for object_name in ['1/in_bucket.pdf', '1/legacy.pdf', '1/edited.pdf', '1/orphan.pdf', 'backup.sqlite3']
+        ]
+
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=Path(media_root)):
+            (Path(media_root) / '1').mkdir()
+
+            for name, modification_time in [('legacy', uploaded_at - timedelta(days=1)), ('edited', uploaded_at)]:
+                file_path = Path(media_root) / '1' / f'{name}.pdf'
+                file_path.write_bytes(name.encode())
+                # the edited file was modified after it was uploaded
+                timestamp = modification_time.timestamp() + (1 if name == 'edited' else 0)
+                os.utime(file_path, (timestamp, timestamp))
+
+            create_manifest_entry('1/in_bucket.pdf', uploaded_at=uploaded_at)
+            create_manifest_entry('1/not_in_bucket.pdf', uploaded_at=uploaded_at)
+
+            tasks.reconcile_manifest()
+
+        mock_list_objects.assert_called_with('pdfding', recursive=True)
+        # the edited file and the file missing in the bucket are not in the manifest, so they are uploaded again.
+        # the orphan has no local file, so it is removed from the bucket.
+        self.assertEqual(
+            list(
+                BackupManifestEntry.objects.order_by('object_key').values_list(
+                    'object_key', 'size', 'modification_time', 'uploaded_at'
+                )
+            ),
+            [
+                ('1/in_bucket.pdf', 0, 0, uploaded_at),
+                ('1/legacy.pdf', 6, int((uploaded_at - timedelta(days=1)).timestamp()) * 10**9, uploaded_at),
+                ('1/orphan.pdf', 0, 0, uploaded_at),
+            ],
+        )
+        self.assertFalse(tasks.reconciliation_due(7))
 
 
 class TestSqliteBackup(TestCase):
@@ -137,7 +345,7 @@ class TestSqliteBackup(TestCase):
         test_db_path = settings.BASE_DIR / 'db' / 'test.sqlite3'
         backup_db_path = settings.BASE_DIR / 'db' / 'test_backup.sqlite3'
 
-        tasks.backup_sqlite(test_db_path, backup_db_path)
+        stats = tasks.backup_sqlite(test_db_path, backup_db_path, pages=5)
 
         # check if the important tables are the same
         for table in ['account_emailaddress', 'auth_user', 'pdf_pdf_tags', 'sqlite_sequence', 'users_profile']:
@@ -152,25 +360,121 @@ class TestSqliteBackup(TestCase):
             cursor2 = conn2.cursor()
             result1 = cursor1.execute(table_compare).fetchall()
             result2 = cursor2.execute(table_compare).fetchall()
+            # close the connections, so that the WAL files of the backup are removed
+            conn1.close()
+            conn2.close()
 
             self.assertEqual(result1, result2)
 
         backup_db_path.unlink()
 
+        # the database was copied in multiple steps
+        self.assertEqual(stats.steps, -(-stats.pages // 5))
+        self.assertEqual(stats.restarts, 0)
+        self.assertGreater(stats.longest_step_seconds, 0)
+
+    def test_backup_sqlite_sleep(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = create_sqlite_database(Path(tmp_dir))
+            backup_db_path = Path(tmp_dir) / 'backup.sqlite3'
+
+            stats = tasks.backup_sqlite(db_path, backup_db_path, pages=2, sleep=0.001)
+
+            backup_conn = sqlite3.connect(backup_db_path)
+            number_of_rows = backup_conn.execute('SELECT COUNT(*) FROM data').fetchone()[0]
+            backup_conn.close()
+
+        self.assertEqual(number_of_rows, 100)
+        self.assertGreater(stats.steps, 1)
+        self.assertAlmostEqual(stats.sleep_seconds, 0.001 * (stats.steps - 1))
+
+    def test_backup_sqlite_restarts(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = create_sqlite_database(Path(tmp_dir))
+            backup_db_path = Path(tmp_dir) / 'backup.sqlite3'
+            writer_conn = sqlite3.connect(db_path)
+
+            # another connection writes to the database between all steps, which restarts the backup
+            def write(_):
+                with writer_conn:
+                    writer_conn.execute('INSERT INTO data (content) VALUES (?)', ['written during backup'])
+
+            with mock.patch('backup.tasks.time.sleep', side_effect=write):
+                stats = tasks.backup_sqlite(db_path, backup_db_path, pages=2, sleep=0.01, max_restarts=2)
+
+            writer_conn.close()
+            backup_conn = sqlite3.connect(backup_db_path)
+            number_of_rows = backup_conn.execute('SELECT COUNT(*) FROM data').fetchone()[0]
+            backup_conn.close()
+
+        # after the third restart the rest of the database is copied in a single step
+        self.assertEqual(stats.restarts, 3)
+        self.assertGreater(number_of_rows, 100)
+
     @mock.patch('backup.tasks.Minio.fput_object')
     def test_add_file_to_minio_no_encryption(self, mock_fput_object):
-        tasks.add_file_to_minio('file_name', Path('path'), None)
+        tasks.add_file_to_minio('file_name', Path('path'), None, 16 * 1024 * 1024)
 
-        mock_fput_object.assert_called_with('pdfding', 'file_name', 'path/file_name')
+        mock_fput_object.assert_called_with('pdfding', 'file_name', 'path/file_name', part_size=16 * 1024 * 1024)
 
-    @mock.patch('backup.tasks.Path.unlink')
-    @mock.patch('backup.tasks.encrypt_file')
-    @mock.patch('backup.tasks.Minio.fput_object')
-    def test_add_file_to_minio_with_encryption(self, mock_fput_object, mock_encrypt_file, mock_unlink):
-        tasks.add_file_to_minio('file_name', Path('path'), b'key')
+    @mock.patch('backup.tasks.Minio.put_object')
+    def test_add_file_to_minio_with_encryption(self, mock_put_object):
+        key = Fernet.generate_key()
+        uploaded = BytesIO()
+
+        # the file is encrypted while minio reads it
+        def put_object(bucket_name, object_name, data, length, part_size):
+            uploaded.write(data.read())
+
+        mock_put_object.side_effect = put_object
+
+        tasks.add_file_to_minio('__init__.py', Path(__file__).parent, key)
+
+        self.assertEqual(mock_put_object.call_args.args[:2], ('pdfding', '__init__.py'))
+        self.assertEqual(mock_put_object.call_args.args[3], len(uploaded.getvalue()))
+
+        decrypted = BytesIO()
+        decrypt_stream(key, BytesIO(uploaded.getvalue()), decrypted)
+        self.assertEqual(decrypted.getvalue(), (Path(__file__).parent / '__init__.py').read_bytes())
+
+
+def create_manifest_entry(
+    object_key: str,
+    media_root: Path | None = None,
+    content_hash: str = '',
+    modification_time: int | None = None,
+    uploaded_at: datetime | None = None,
+) -> BackupManifestEntry:
+    """Create a manifest entry. If the media root is provided, the size and modification time of the file are used."""
+
+    size, file_modification_time = 0, 0
+
+    if media_root:
+        stat_result = (media_root / object_key).stat()
+        size, file_modification_time = stat_result.st_size, stat_result.st_mtime_ns
+
+    uploaded_at = uploaded_at or datetime.now(timezone.utc)
+
+    return BackupManifestEntry.objects.create(
+        object_key=object_key,
+        size=size,
+        modification_time=file_modification_time if modification_time is None else modification_time,
+        content_hash=content_hash,
+        uploaded_at=uploaded_at,
+        verified_at=uploaded_at,
+    )
+
+
+def create_sqlite_database(parent_path: Path) -> Path:
+    """Create a sqlite database with 100 rows of about 1 kB each."""
+
+    db_path = parent_path / 'db.sqlite3'
+    conn = sqlite3.connect(db_path)
+
+    with conn:
+        conn.execute('CREATE TABLE data (id INTEGER PRIMARY KEY, content TEXT)')
+        conn.executemany('INSERT INTO data (content) VALUES (?)', [[f'{i}' * 1000] for i in range(100)])
 
-        tmp_file_path = Path(__file__).parents[1] / 'tmp_encrypted'
+    conn.close()
 
-        mock_encrypt_file.assert_called_with(b'key', Path('path/file_name'), tmp_file_path)
-        mock_fput_object.assert_called_with('pdfding', 'file_name', str(tmp_file_path))
-        mock_unlink.assert_called_with()
+    return db_path
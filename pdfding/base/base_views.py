@@ -1,14 +1,35 @@
-from base.service import construct_query_overview_url
-from core.settings import ITEMS_PER_PAGE, MEDIA_ROOT
+import mimetypes
+import posixpath
+from pathlib import Path
+from urllib.parse import quote
+from uuid import uuid4
+
+from base.service import (
+    RangeFileWrapper,
+    construct_query_overview_url,
+    decode_cursor,
+    encode_cursor,
+    get_file_etag,
+    parse_range_header,
+)
+from core.settings import ITEMS_PER_PAGE, MEDIA_ROOT, SENDFILE_MODE, SENDFILE_URL
 from django.contrib import messages
-from django.core.paginator import Paginator
-from django.http import FileResponse, HttpRequest
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.db.models import F, Q, QuerySet
+from django.db.models.expressions import OrderBy
+from django.http import FileResponse, Http404, HttpRequest, HttpResponse, StreamingHttpResponse
+from django.http.response import HttpResponseBase
 from django.shortcuts import redirect, render
 from django.urls import reverse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import content_disposition_header, http_date
 from django.views import View
-from django.views.static import serve
 from django_htmx.http import HttpResponseClientRedirect, HttpResponseClientRefresh
 
+# a year, the maximum recommended value
+REVISIONED_FILE_MAX_AGE = 365 * 24 * 60 * 60
+
 
 class BaseAdd(View):
     """View for adding new objects."""
@@ -37,6 +58,10 @@ class BaseOverview(View):
     """
     Base view for the overview pages. This view performs the searching and sorting. It's also responsible for
     paginating the objects.
+
+    The pagination uses a keyset (cursor): each page ends with a cursor containing the sort key and id of its last
+    object and the next page is fetched by selecting the objects after this position. Unlike limit/offset pagination
+    the database does not need to skip the objects of all previous pages and no counting queries are needed.
     """
 
     def get(self, request: HttpRequest, page: int = 1, items_per_page: int = ITEMS_PER_PAGE, **kwargs):
@@ -51,6 +76,7 @@ class BaseOverview(View):
             'sorting': sorting,
             'items_per_page': items_per_page,
             'next_page_available': next_page_available,
+            'next_page_query': self.get_next_page_query(request, page_object, next_page_available),
             'current_page': page,
         }
 
@@ -64,18 +90,104 @@ class BaseOverview(View):
             return render(request, f'{self.obj_name}_overview.html', context)
 
     def get_page_objects(self, request: HttpRequest, sorting: str, page: int, items_per_page: int, **kwargs):
+        """
+        Get the objects of the requested page and whether there is a next page. One object more than needed is
+        fetched to determine if there is a next page.
+        """
+
+        items_per_page = int(items_per_page)
+
         # filter objects
         objects = self.filter_objects(request, **kwargs)
 
-        # sort objects
-        objects = objects.order_by(sorting)
+        # sort objects, the id is used as tiebreaker so that the order is unique
+        sort_expression, descending = self.get_sort_key(sorting)
+        objects = objects.annotate(overview_sort_key=sort_expression)
+
+        if descending:
+            objects = objects.order_by(F('overview_sort_key').desc(nulls_last=True), '-pk')
+        else:
+            objects = objects.order_by(F('overview_sort_key').asc(nulls_last=True), 'pk')
+
+        cursor_position = self.get_cursor_position(request, objects)
+
+        if cursor_position:
+            objects = objects.filter(self.get_keyset_filter(*cursor_position, descending))
+            page_objects = list(objects[: items_per_page + 1])
+        else:
+            # first page or no valid cursor, e.g. an old link, fall back to the offset
+            offset = max(int(page) - 1, 0) * items_per_page
+            page_objects = list(objects[offset : offset + items_per_page + 1])  # noqa
+
+        next_page_available = len(page_objects) > items_per_page
+
+        return page_objects[:items_per_page], next_page_available
+
+    @staticmethod
+    def get_sort_key(sorting) -> tuple:
+        """Split the sorting into the expression of the sort key and the sorting direction."""
 
-        paginator = Paginator(objects, per_page=items_per_page, allow_empty_first_page=True)
-        page_object = paginator.get_page(page)
+        if isinstance(sorting, OrderBy):
+            return sorting.expression, sorting.descending
+        elif isinstance(sorting, str):
+            return F(sorting.removeprefix('-')), sorting.startswith('-')
+        else:
+            return sorting, False
+
+    @staticmethod
+    def get_cursor_position(request: HttpRequest, objects: QuerySet) -> tuple | None:
+        """
+        Get the sort value and the id of the last object of the previous page from the cursor in the request. Returns
+        None if there is no valid cursor.
+        """
 
-        next_page_available = page_object.end_index() < objects.count()
+        decoded_cursor = decode_cursor(request.GET.get('cursor', ''))
 
-        return page_object, next_page_available
+        if decoded_cursor is None:
+            return None
+
+        sort_value, obj_id = decoded_cursor
+        sort_field = objects.query.annotations['overview_sort_key'].output_field
+
+        try:
+            if sort_value is not None:
+                sort_value = sort_field.to_python(sort_value)
+            obj_id = objects.model._meta.pk.to_python(obj_id)
+        except ValidationError:
+            return None
+
+        return sort_value, obj_id
+
+    @staticmethod
+    def get_keyset_filter(sort_value, obj_id, descending: bool) -> Q:
+        """
+        Get the filter selecting all objects positioned after the specified object. Objects without a sort value are
+        positioned at the end.
+        """
+
+        lookup = 'lt' if descending else 'gt'
+
+        if sort_value is None:
+            return Q(overview_sort_key__isnull=True, **{f'pk__{lookup}': obj_id})
+
+        return (
+            Q(**{f'overview_sort_key__{lookup}': sort_value})
+            | Q(overview_sort_key=sort_value, **{f'pk__{lookup}': obj_id})
+            | Q(overview_sort_key__isnull=True)
+        )
+
+    @staticmethod
+    def get_next_page_query(request: HttpRequest, page_objects: list, next_page_available: bool) -> str:
+        """Get the query string of the next page. It's the current query string with the cursor of the last object."""
+
+        query = request.GET.copy()
+        query.pop('cursor', None)
+
+        if next_page_available:
+            last_object = page_objects[-1]
+            query['cursor'] = encode_cursor(last_object.overview_sort_key, last_object.pk)
+
+        return query.urlencode()
 
     def do_extra_action(self, request: HttpRequest):
         """Do some action before rendering the overview"""
@@ -101,6 +213,130 @@ class BaseOverviewQuery(View):
         return redirect(redirect_url)
 
 
+def serve_file(request: HttpRequest, path: str, document_root: str) -> HttpResponseBase:
+    """
+    Serve a file below the document root. Like 'django.views.static.serve' this respects the 'If-Modified-Since'
+    header, additionally single and multiple byte ranges can be requested via the 'Range' header. This allows pdf.js to
+    only load the parts of the PDF needed for displaying the current pages instead of downloading the whole file first.
+    """
+
+    path = posixpath.normpath(path).lstrip('/')
+    full_path = Path(safe_join(document_root, path))
+
+    if not full_path.is_file():
+        raise Http404(f'"{path}" does not exist')
+
+    if SENDFILE_MODE:
+        return get_sendfile_response(full_path, document_root)
+
+    stat_result = full_path.stat()
+    file_size = stat_result.st_size
+    last_modified = http_date(stat_result.st_mtime)
+    etag = get_file_etag(full_path)
+
+    # handles If-None-Match, If-Modified-Since, If-Match and If-Unmodified-Since
+    conditional_response = get_conditional_response(request, etag=etag, last_modified=int(stat_result.st_mtime))
+
+    if conditional_response is not None:
+        conditional_response.headers['ETag'] = etag
+
+        return conditional_response
+
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+
+    # only send the requested ranges if the file was not changed in the meantime
+    if request.headers.get('If-Range', etag) in [etag, last_modified]:
+        ranges = parse_range_header(request.headers.get('Range'), file_size)
+    else:
+        ranges = None
+
+    if ranges is None:
+        response = FileResponse(full_path.open('rb'), content_type=content_type)
+    elif not ranges:
+        response = HttpResponse(status=416)
+        response.headers['Content-Range'] = f'bytes */{file_size}'
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        file = full_path.open('rb')
+        file.seek(start)
+
+        response = FileResponse(RangeFileWrapper(file, end - start + 1), status=206, content_type=content_type)
+        response.headers['Content-Length'] = end - start + 1
+        response.headers['Content-Range'] = f'bytes {start}-{end}/{file_size}'
+    else:
+        response = get_multipart_range_response(full_path, ranges, content_type)
+
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Last-Modified'] = last_modified
+    response.headers['ETag'] = etag
+
+    return response
+
+
+def get_sendfile_response(
+    full_path: Path, document_root: str, as_attachment: bool = False, filename: str = None
+) -> HttpResponse:
+    """
+    Get a response only containing the header pointing the reverse proxy to the file. The proxy then sends the file
+    including the handling of range and conditional requests.
+    """
+
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+    response = HttpResponse(content_type=content_type)
+
+    if SENDFILE_MODE == 'X-Accel-Redirect':
+        relative_path = full_path.relative_to(document_root).as_posix()
+        response.headers['X-Accel-Redirect'] = quote(f'{SENDFILE_URL.rstrip("/")}/{relative_path}')
+    elif SENDFILE_MODE == 'X-Sendfile':
+        response.headers['X-Sendfile'] = str(full_path)
+    else:
+        raise ImproperlyConfigured(f'SENDFILE_MODE "{SENDFILE_MODE}" is not supported.')
+
+    if as_attachment:
+        response.headers['Content-Disposition'] = content_disposition_header(True, filename or full_path.name)
+
+    return response
+
+
+def get_multipart_range_response(
+    full_path: Path, ranges: list[tuple[int, int]], content_type: str
+) -> StreamingHttpResponse:
+    """Get a 'multipart/byteranges' response containing the specified byte ranges of the file."""
+
+    file_size = full_path.stat().st_size
+    boundary = uuid4().hex
+    part_headers = [
+        (
+            f'--{boundary}\r\nContent-Type: {content_type}\r\nContent-Range: bytes {start}-{end}/{file_size}\r\n\r\n'
+        ).encode()
+        for start, end in ranges
+    ]
+    closing = f'\r\n--{boundary}--\r\n'.encode()
+
+    def stream_ranges():
+        with full_path.open('rb') as file:
+            for index, (start, end) in enumerate(ranges):
+                yield (b'\r\n' if index else b'') + part_headers[index]
+
+                file.seek(start)
+                range_file = RangeFileWrapper(file, end - start + 1)
+
+                while chunk := range_file.read(FileResponse.block_size):
+                    yield chunk
+
+        yield closing
+
+    content_length = sum(len(header) + end - start + 1 for header, (start, end) in zip(part_headers, ranges))
+    content_length += 2 * (len(ranges) - 1) + len(closing)
+
+    response = StreamingHttpResponse(
+        stream_ranges(), status=206, content_type=f'multipart/byteranges; boundary={boundary}'
+    )
+    response.headers['Content-Length'] = content_length
+
+    return response
+
+
 class BaseServe(View):
     """Base view used for serving PDF files specified by the PDF id."""
 
@@ -112,11 +348,20 @@ class BaseServe(View):
         in the viewer and saving them, sometimes the old version is still shown in the viewer even though the backend
         has the correct version. This is probably caused by the browser's caching. This commit fixes the problem by
         adding a revision to the serve views so that the browser is forced to refresh the pdf.
+
+        As the content behind a url with the current revision never changes, these responses can be cached by the
+        browser without revalidation. All other responses need to be revalidated via their ETag.
         """
 
         serve_object = self.get_object(request, identifier)
+        response = serve_file(request, document_root=MEDIA_ROOT, path=self.get_file_path(serve_object))
 
-        return serve(request, document_root=MEDIA_ROOT, path=self.get_file_path(serve_object))
+        if revision is not None and str(revision) == str(getattr(serve_object, 'revision', None)):
+            patch_cache_control(response, private=True, max_age=REVISIONED_FILE_MAX_AGE, immutable=True)
+        else:
+            patch_cache_control(response, private=True, no_cache=True)
+
+        return response
 
     @staticmethod
     def get_file_path(serve_object):
@@ -141,6 +386,11 @@ class BaseDownload(View):
         download_object = self.get_object(request, identifier)
         file_name = f'{download_object.name.replace(" ", "_").lower()}{self.get_suffix()}'
 
+        if SENDFILE_MODE:
+            return get_sendfile_response(
+                Path(download_object.file.path), MEDIA_ROOT, as_attachment=True, filename=file_name
+            )
+
         response = FileResponse(open(download_object.file.path, 'rb'), as_attachment=True, filename=file_name)
 
         return response
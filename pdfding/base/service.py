@@ -1,3 +1,8 @@
+import json
+import re
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from pathlib import Path
 from urllib.parse import parse_qs, urlparse
 
 from django.urls import reverse
@@ -74,7 +79,7 @@ def construct_query_overview_url(
     special_selection_query: str,
     remove_tag_query: str,
     obj_name: str,
-    folder_query: str = ''
+    folder_query: str = '',
 ) -> str:
     """Constructs the overview url after performing a search in the overview pages."""
 
@@ -105,3 +110,127 @@ def construct_query_overview_url(
         overview_url = f'{overview_url}?{query_string}'
 
     return overview_url
+
+
+def encode_cursor(sort_value, obj_id) -> str:
+    """
+    Encode the position of an object in a sorted overview, i.e. the value of its sort key and its id, as an url safe
+    cursor.
+    """
+
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+
+    raw_cursor = json.dumps([sort_value, str(obj_id)], separators=(',', ':'))
+
+    return urlsafe_b64encode(raw_cursor.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple | None:
+    """
+    Decode a cursor created by 'encode_cursor'. Returns the raw sort value and id. The values still need to be
+    converted by the caller. If the cursor is not valid, None is returned.
+    """
+
+    try:
+        sort_value, obj_id = json.loads(urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        return None
+
+    return sort_value, obj_id
+
+
+RANGE_PATTERN = re.compile(r'^\s*(\d*)\s*-\s*(\d*)\s*$')
+# protection against requests splitting the file into a huge number of tiny parts
+MAX_RANGES = 50
+
+
+def parse_range_header(range_header: str | None, file_size: int) -> list[tuple[int, int]] | None:
+    """
+    Parse the 'Range' header of a request. Returns the requested byte ranges as (start, end) tuples, both inclusive.
+    If the header is missing, malformed or requests too many ranges, None is returned and the whole file should be
+    sent. An empty list is returned if none of the ranges can be satisfied.
+
+    Example: 'bytes=0-99, -100' for a file with 1000 bytes returns [(0, 99), (900, 999)]
+    """
+
+    if not range_header:
+        return None
+
+    unit, _, raw_ranges = range_header.partition('=')
+
+    if unit.strip().lower() != 'bytes' or not raw_ranges:
+        return None
+
+    raw_ranges = raw_ranges.split(',')
+
+    if len(raw_ranges) > MAX_RANGES:
+        return None
+
+    ranges = []
+
+    for raw_range in raw_ranges:
+        match = RANGE_PATTERN.match(raw_range)
+
+        if not match or match.groups() == ('', ''):
+            return None
+
+        start, end = match.groups()
+
+        if not start:
+            # suffix range, e.g. the last 500 bytes: -500
+            start, end = max(file_size - int(end), 0), file_size - 1
+        else:
+            start = int(start)
+
+            if end and int(end) < start:
+                return None
+
+            end = min(int(end), file_size - 1) if end else file_size - 1
+
+        if start <= end:
+            ranges.append((start, end))
+
+    return ranges
+
+
+class RangeFileWrapper:
+    """
+    Wraps a file so that reading stops after the specified number of bytes. The file needs to be positioned at the
+    start of the range. As the file descriptor is exposed, WSGI servers supporting 'wsgi.file_wrapper', e.g.
+    gunicorn, can send the range with sendfile, i.e. without copying it through the python process.
+    """
+
+    def __init__(self, file, length: int):
+        self.file = file
+        self.name = file.name
+        self.remaining = length
+
+    def read(self, size: int = -1) -> bytes:
+        if self.remaining <= 0:
+            return b''
+
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+
+        data = self.file.read(size)
+        self.remaining -= len(data)
+
+        return data
+
+    def fileno(self) -> int:
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def get_file_etag(file_path: Path) -> str:
+    """
+    Get the strong ETag of a file built from its inode, modification time in nanoseconds and size, so that the file
+    does not need to be read. Replacing or changing the file changes its ETag.
+    """
+
+    stat_result = file_path.stat()
+
+    return f'"{stat_result.st_ino:x}-{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
@@ -1,12 +1,16 @@
 from pathlib import Path
 from unittest.mock import patch
 
+from base import base_views
+from base.service import encode_cursor, get_file_etag
 from base.tests import base_view_definitions
 from core.settings import MEDIA_ROOT
 from core.urls import urlpatterns as base_patterns
 from django.contrib.auth.models import User
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.http.response import HttpResponse
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import F
+from django.db.models.functions import Lower
 from django.test import Client, TestCase, TransactionTestCase, override_settings
 from django.urls import path, reverse
 from django_htmx.http import HttpResponseClientRedirect, HttpResponseClientRefresh
@@ -129,6 +133,98 @@ class TestViews(TestCase):
         self.assertTemplateUsed(response, 'includes/pdf_overview/overview_page.html')
         mock_do_extra_action.assert_not_called()
 
+    @override_settings(ROOT_URLCONF=__name__)
+    def test_overview_keyset_pagination(self):
+        self.user.profile.pdf_sorting = Profile.PdfSortingChoice.NAME_DESC
+        self.user.profile.save()
+        headers = {'HTTP_HX-Request': 'true'}
+
+        # duplicated names need to be ordered by the id
+        pdf_names = ['orange', 'banana', 'Apple', 'Raspberry', 'Banana', 'apple', 'cherry']
+        for pdf_name in pdf_names:
+            Pdf.objects.create(owner=self.user.profile, name=pdf_name)
+
+        expected_pdfs = list(Pdf.objects.order_by(Lower('name').desc(), '-id'))
+
+        response = self.client.get(f'{reverse('test_overview', kwargs={'items_per_page': 2})}?search=something')
+        received_pdfs = list(response.context['page_obj'])
+        page = 1
+
+        while response.context['next_page_available']:
+            next_page_query = response.context['next_page_query']
+            self.assertIn('search=something', next_page_query)
+
+            page += 1
+            response = self.client.get(
+                f'{reverse('test_get_next_page', kwargs={'items_per_page': 2, 'page': page})}?{next_page_query}',
+                **headers,
+            )
+            received_pdfs += list(response.context['page_obj'])
+
+        self.assertEqual(page, 4)
+        self.assertEqual(received_pdfs, expected_pdfs)
+        self.assertNotIn('cursor', response.context['next_page_query'])
+
+    @override_settings(ROOT_URLCONF=__name__)
+    def test_overview_keyset_pagination_datetime(self):
+        headers = {'HTTP_HX-Request': 'true'}
+
+        for i in range(5):
+            Pdf.objects.create(owner=self.user.profile, name=f'pdf_{i}')
+
+        response = self.client.get(reverse('test_overview', kwargs={'items_per_page': 3}))
+        response = self.client.get(
+            f'{reverse('test_get_next_page', kwargs={'items_per_page': 3, 'page': 2})}?'
+            f'{response.context['next_page_query']}',
+            **headers,
+        )
+
+        self.assertEqual([pdf.name for pdf in response.context['page_obj']], ['pdf_1', 'pdf_0'])
+        self.assertFalse(response.context['next_page_available'])
+
+    @override_settings(ROOT_URLCONF=__name__)
+    def test_overview_invalid_cursor(self):
+        headers = {'HTTP_HX-Request': 'true'}
+
+        for i in range(5):
+            Pdf.objects.create(owner=self.user.profile, name=f'pdf_{i}')
+
+        invalid_cursors = ['abc', encode_cursor('no date', 'no uuid'), encode_cursor(None, 'no uuid')]
+
+        for invalid_cursor in invalid_cursors:
+            # should fall back to the offset of the page
+            response = self.client.get(
+                f'{reverse('test_get_next_page', kwargs={'items_per_page': 3, 'page': 2})}?cursor={invalid_cursor}',
+                **headers,
+            )
+
+            self.assertEqual([pdf.name for pdf in response.context['page_obj']], ['pdf_1', 'pdf_0'])
+
+    def test_get_sort_key(self):
+        self.assertEqual(base_views.BaseOverview.get_sort_key('-views'), (F('views'), True))
+        self.assertEqual(base_views.BaseOverview.get_sort_key('name'), (F('name'), False))
+        self.assertEqual(base_views.BaseOverview.get_sort_key(Lower('name').desc()), (Lower('name'), True))
+        self.assertEqual(base_views.BaseOverview.get_sort_key(Lower('name')), (Lower('name'), False))
+
+    def test_get_keyset_filter_sort_value_none(self):
+        pdfs = [Pdf.objects.create(owner=self.user.profile, name=None) for _ in range(3)]
+        pdfs = sorted(pdfs, key=lambda pdf: pdf.id)
+        pdfs_with_key = Pdf.objects.annotate(overview_sort_key=F('name'))
+
+        keyset_filter = base_views.BaseOverview.get_keyset_filter(None, pdfs[1].id, False)
+
+        self.assertEqual(list(pdfs_with_key.filter(keyset_filter)), [pdfs[2]])
+
+    def test_get_keyset_filter_nulls_last(self):
+        pdf_a = Pdf.objects.create(owner=self.user.profile, name='a')
+        pdf_b = Pdf.objects.create(owner=self.user.profile, name='b')
+        pdf_none = Pdf.objects.create(owner=self.user.profile, name=None)
+        pdfs_with_key = Pdf.objects.annotate(overview_sort_key=F('name')).order_by(F('name').asc(nulls_last=True))
+
+        keyset_filter = base_views.BaseOverview.get_keyset_filter('b', pdf_b.id, True)
+
+        self.assertEqual(list(pdfs_with_key.filter(keyset_filter)), [pdf_a, pdf_none])
+
     @override_settings(ROOT_URLCONF=__name__)
     @patch('base.base_views.construct_query_overview_url')
     def test_overview_query_get(self, mock_construct_query_overview_url):
@@ -153,17 +249,151 @@ class TestViews(TestCase):
         mock_construct_query_overview_url.assert_called_once_with('pdf_overview', '', '', '', 'pdf')
         self.assertRedirects(response, mock_return_value, status_code=302)
 
+    def create_pdf_with_file(self, content: bytes) -> Pdf:
+        pdf = Pdf.objects.create(owner=self.user.profile, name='name', file=SimpleUploadedFile('simple.pdf', content))
+        self.addCleanup(Path(pdf.file.path).unlink)
+
+        return pdf
+
+    @override_settings(ROOT_URLCONF=__name__)
+    def test_serve_get(self):
+        pdf = self.create_pdf_with_file(b'0123456789')
+
+        response = self.client.get(reverse('test_serve', kwargs={'identifier': pdf.id}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response.headers['Content-Type'], 'application/pdf')
+        self.assertEqual(response.headers['Content-Length'], '10')
+        self.assertEqual(response.headers['Accept-Ranges'], 'bytes')
+        self.assertEqual(response.headers['ETag'], get_file_etag(Path(pdf.file.path)))
+        # there is no revision, so the file needs to be revalidated
+        self.assertEqual(response.headers['Cache-Control'], 'private, no-cache')
+
+        # not modified since the last request
+        for headers in [
+            {'HTTP_IF_MODIFIED_SINCE': response.headers['Last-Modified']},
+            {'HTTP_IF_NONE_MATCH': response.headers['ETag']},
+        ]:
+            not_modified_response = self.client.get(reverse('test_serve', kwargs={'identifier': pdf.id}), **headers)
+            self.assertEqual(not_modified_response.status_code, 304)
+            self.assertEqual(not_modified_response.headers['ETag'], response.headers['ETag'])
+
+        response = self.client.get(reverse('test_serve', kwargs={'identifier': pdf.id}), HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual(response.status_code, 200)
+
     @override_settings(ROOT_URLCONF=__name__)
-    @patch('base.base_views.serve')
-    def test_serve_get(self, mock_serve):
+    def test_serve_get_file_missing(self):
         pdf = Pdf.objects.create(owner=self.user.profile, name='pdf')
         pdf.file.name = f'{self.user}/pdf_name'
         pdf.save()
-        mock_serve.return_value = HttpResponse('some response')
 
         response = self.client.get(reverse('test_serve', kwargs={'identifier': pdf.id}))
 
-        mock_serve.assert_called_with(response.wsgi_request, document_root=MEDIA_ROOT, path=f'{self.user}/pdf_name')
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(ROOT_URLCONF=__name__)
+    def test_serve_get_single_range(self):
+        pdf = self.create_pdf_with_file(b'0123456789')
+
+        response = self.client.get(reverse('test_serve', kwargs={'identifier': pdf.id}), HTTP_RANGE='bytes=2-5')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        self.assertEqual(response.headers['Content-Length'], '4')
+        self.assertEqual(response.headers['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(response.headers['Content-Type'], 'application/pdf')
+
+    @override_settings(ROOT_URLCONF=__name__)
+    def test_serve_get_multiple_ranges(self):
+        pdf = self.create_pdf_with_file(b'0123456789')
+
+        response = self.client.get(reverse('test_serve', kwargs={'identifier': pdf.id}), HTTP_RANGE='bytes=0-1,-3')
+        content = b''.join(response.streaming_content)
+        boundary = response.headers['Content-Type'].split('boundary=')[1]
+
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response.headers['Content-Type'].startswith('multipart/byteranges'))
+        self.assertEqual(
+            content.decode(),
+            f'--{boundary}\r\nContent-Type: application/pdf\r\nContent-Range: bytes 0-1/10\r\n\r\n01\r\n'
+            f'--{boundary}\r\nContent-Type: application/pdf\r\nContent-Range: bytes 7-9/10\r\n\r\n789\r\n'
+            f'--{boundary}--\r\n',
+        )
+        self.assertEqual(response.headers['Content-Length'], str(len(content)))
+
+    @override_settings(ROOT_URLCONF=__name__)
+    def test_serve_get_range_not_satisfiable(self):
+        pdf = self.create_pdf_with_file(b'0123456789')
+
+        response = self.client.get(reverse('test_serve', kwargs={'identifier': pdf.id}), HTTP_RANGE='bytes=20-30')
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response.headers['Content-Range'], 'bytes */10')
+
+    @override_settings(ROOT_URLCONF=__name__)
+    def test_serve_get_if_range(self):
+        pdf = self.create_pdf_with_file(b'0123456789')
+        url = reverse('test_serve', kwargs={'identifier': pdf.id})
+        response = self.client.get(url)
+
+        for if_range in [response.headers['Last-Modified'], response.headers['ETag']]:
+            response = self.client.get(url, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE=if_range)
+            self.assertEqual(response.status_code, 206)
+
+        # the file changed, so the whole file is sent
+        response = self.client.get(url, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='Wed, 21 Oct 2015 07:28:00 GMT')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+
+    @override_settings(ROOT_URLCONF=__name__)
+    @patch('base.base_views.SENDFILE_MODE', 'X-Accel-Redirect')
+    def test_serve_get_x_accel_redirect(self):
+        pdf = self.create_pdf_with_file(b'0123456789')
+
+        response = self.client.get(reverse('test_serve', kwargs={'identifier': pdf.id}), HTTP_RANGE='bytes=2-5')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response.headers['X-Accel-Redirect'], f'/protected_media/{pdf.file.name}')
+        self.assertEqual(response.headers['Content-Type'], 'application/pdf')
+
+    @override_settings(ROOT_URLCONF=__name__)
+    @patch('base.base_views.SENDFILE_MODE', 'X-Sendfile')
+    def test_serve_get_x_sendfile(self):
+        pdf = self.create_pdf_with_file(b'0123456789')
+
+        response = self.client.get(reverse('test_serve', kwargs={'identifier': pdf.id}))
+
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response.headers['X-Sendfile'], pdf.file.path)
+
+    @override_settings(ROOT_URLCONF=__name__)
+    @patch('base.base_views.SENDFILE_MODE', 'X-Accel-Redirect')
+    def test_serve_get_x_accel_redirect_file_missing(self):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf')
+        pdf.file.name = f'{self.user}/pdf_name'
+        pdf.save()
+
+        response = self.client.get(reverse('test_serve', kwargs={'identifier': pdf.id}))
+
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(ROOT_URLCONF=__name__)
+    @patch('base.base_views.SENDFILE_MODE', 'X-Accel-Redirect')
+    def test_download_get_x_accel_redirect(self):
+        pdf = self.create_pdf_with_file(b'0123456789')
+
+        response = self.client.get(reverse('test_download', kwargs={'identifier': pdf.id}))
+
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response.headers['X-Accel-Redirect'], f'/protected_media/{pdf.file.name}')
+        self.assertEqual(response.headers['Content-Disposition'], 'attachment; filename="name.pdf"')
+
+    @patch('base.base_views.SENDFILE_MODE', 'X-Unknown')
+    def test_get_sendfile_response_unsupported_mode(self):
+        with self.assertRaises(ImproperlyConfigured):
+            base_views.get_sendfile_response(Path(MEDIA_ROOT) / 'file.pdf', MEDIA_ROOT)
 
     @override_settings(ROOT_URLCONF=__name__)
     def test_download_get(self):
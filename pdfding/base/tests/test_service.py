@@ -1,6 +1,21 @@
+import os
+from io import BytesIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
 from unittest.mock import patch
 
-from base.service import construct_query_overview_url, construct_search_and_tag_queries, process_raw_search_query
+from datetime import datetime, timezone
+
+from base.service import (
+    construct_query_overview_url,
+    construct_search_and_tag_queries,
+    RangeFileWrapper,
+    decode_cursor,
+    encode_cursor,
+    get_file_etag,
+    parse_range_header,
+    process_raw_search_query,
+)
 from django.test import TestCase
 from django.urls import reverse
 
@@ -62,3 +77,74 @@ class TestService(TestCase):
         generated_url = construct_query_overview_url(referer_url, '', 'starred', '', 'pdf')
 
         self.assertEqual(generated_url, f'{reverse('pdf_overview')}?search=searching&tags=asd&selection=starred')
+
+    def test_encode_decode_cursor(self):
+        date = datetime(2025, 3, 4, 10, 11, 12, 123, tzinfo=timezone.utc)
+
+        for sort_value, obj_id, expected_sort_value in [
+            (date, 'some-id', '2025-03-04T10:11:12.000123+00:00'),
+            ('Some name', 'some-id', 'Some name'),
+            (12, 3, 12),
+            (None, 'some-id', None),
+        ]:
+            cursor = encode_cursor(sort_value, obj_id)
+
+            self.assertNotIn('=', cursor)
+            self.assertEqual(decode_cursor(cursor), (expected_sort_value, str(obj_id)))
+
+    def test_decode_cursor_invalid(self):
+        for cursor in ['', 'abc', encode_cursor(1, 2)[:-2], 'W10', 'MTI']:
+            self.assertIsNone(decode_cursor(cursor))
+
+    def test_parse_range_header(self):
+        for range_header, expected_ranges in [
+            ('bytes=0-99', [(0, 99)]),
+            ('bytes=100-', [(100, 999)]),
+            ('bytes=-100', [(900, 999)]),
+            ('bytes=-2000', [(0, 999)]),
+            ('bytes=900-2000', [(900, 999)]),
+            ('bytes=0-0, 10-19 ,-1', [(0, 0), (10, 19), (999, 999)]),
+            ('bytes=1000-1100, 0-9', [(0, 9)]),
+        ]:
+            self.assertEqual(parse_range_header(range_header, 1000), expected_ranges, range_header)
+
+    def test_parse_range_header_unsatisfiable(self):
+        for range_header in ['bytes=1000-', 'bytes=1000-1100', 'bytes=-0']:
+            self.assertEqual(parse_range_header(range_header, 1000), [], range_header)
+
+        self.assertEqual(parse_range_header('bytes=0-10', 0), [])
+
+    def test_parse_range_header_invalid(self):
+        too_many_ranges = 'bytes=' + ','.join(f'{i}-{i}' for i in range(100))
+
+        for range_header in [None, '', 'bytes=', 'items=0-10', 'bytes=-', 'bytes=10-5', 'bytes=a-b', too_many_ranges]:
+            self.assertIsNone(parse_range_header(range_header, 1000), range_header)
+
+    def test_range_file_wrapper(self):
+        file = BytesIO(b'0123456789')
+        file.name = 'file.pdf'
+        file.seek(2)
+
+        range_file = RangeFileWrapper(file, 5)
+
+        self.assertEqual(range_file.read(3), b'234')
+        self.assertEqual(range_file.read(), b'56')
+        self.assertEqual(range_file.read(), b'')
+
+    def test_get_file_etag(self):
+        with TemporaryDirectory() as temp_dir:
+            file_path = Path(temp_dir) / 'file.pdf'
+            file_path.write_bytes(b'some content')
+            os.utime(file_path, ns=(1_000_000_000, 1_000_000_000))
+
+            # the file is not read
+            with patch('pathlib.Path.open') as mock_open:
+                etag = get_file_etag(file_path)
+                mock_open.assert_not_called()
+
+            self.assertEqual(etag, f'"{file_path.stat().st_ino:x}-3b9aca00-c"')
+            self.assertEqual(get_file_etag(file_path), etag)
+
+            file_path.write_bytes(b'other content')
+
+            self.assertNotEqual(get_file_etag(file_path), etag)
@@ -0,0 +1,180 @@
+"""
+Compare the extraction of the highlights and comments as it was implemented before (pypdf + pdfium, a text page per
+highlighted line and a query per annotation) with the single pass pdfium extraction using bulk inserts. The fixture
+has 1,000 pages with 5 highlights each.
+
+    python -m benchmarks.annotation_extraction
+"""
+
+import re
+import tempfile
+from datetime import datetime
+
+from benchmarks.helpers import benchmark_database, measure, print_table, setup_django
+
+setup_django()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.files import File  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import override_settings  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+from pdf.models import Pdf, PdfComment, PdfHighlight  # noqa: E402
+from pdf.service import PdfProcessingServices  # noqa: E402
+from pypdf import PdfReader  # noqa: E402
+from pypdfium2 import PdfDocument  # noqa: E402
+
+NUMBER_OF_PAGES = 1_000
+HIGHLIGHTS_PER_PAGE = 5
+
+
+def write_annotated_pdf(file, number_of_pages: int, highlights_per_page: int):
+    """Write a pdf where every page has some lines of text and each line is highlighted."""
+
+    objects_per_page = 2 + highlights_per_page
+    offsets = dict()
+
+    def write_object(object_id: int, content: bytes):
+        offsets[object_id] = file.tell()
+        file.write(f'{object_id} 0 obj\n'.encode() + content + b'\nendobj\n')
+
+    def page_id(page: int) -> int:
+        return 4 + objects_per_page * page + 1
+
+    file.write(b'%PDF-1.7\n')
+    write_object(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+    kids = ' '.join(f'{page_id(i)} 0 R' for i in range(number_of_pages))
+    write_object(2, f'<< /Type /Pages /Kids [{kids}] /Count {number_of_pages} >>'.encode())
+    write_object(3, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>')
+
+    for i in range(number_of_pages):
+        content_id = 4 + objects_per_page * i
+        annotation_ids = [content_id + 2 + j for j in range(highlights_per_page)]
+        baselines = [700 - 40 * j for j in range(highlights_per_page)]
+
+        stream = b''.join(
+            f'BT /F1 12 Tf 72 {baseline} Td (Highlighted line {j} of page {i + 1}) Tj ET\n'.encode()
+            for j, baseline in enumerate(baselines)
+        )
+        write_object(content_id, f'<< /Length {len(stream)} >>\nstream\n'.encode() + stream + b'\nendstream')
+
+        annotations = ' '.join(f'{annotation_id} 0 R' for annotation_id in annotation_ids)
+        write_object(
+            page_id(i),
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {content_id} 0 R '
+            f'/Resources << /Font << /F1 3 0 R >> >> /Annots [{annotations}] >>'.encode(),
+        )
+
+        for annotation_id, baseline in zip(annotation_ids, baselines):
+            bottom, top = baseline - 3, baseline + 12
+            write_object(
+                annotation_id,
+                f'<< /Type /Annot /Subtype /Highlight /Rect [72 {bottom} 300 {top}] '
+                f'/QuadPoints [72 {top} 300 {top} 72 {bottom} 300 {bottom}] '
+                f'/CreationDate (D:20250311081649) /C [1 1 0] >>'.encode(),
+            )
+
+    xref_offset = file.tell()
+    size = max(offsets) + 1
+    file.write(f'xref\n0 {size}\n0000000000 65535 f \n'.encode())
+    file.write(b''.join(f'{offsets[object_id]:010d} 00000 n \n'.encode() for object_id in range(1, size)))
+    file.write(f'trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n'.encode())
+
+
+def legacy_extract_pdf_highlight_text(annotation, pdfium_page):
+    """The highlight text extraction as it was implemented before: a new text page for every highlighted line."""
+
+    quad_points = annotation["/QuadPoints"]
+    rectangles = [quad_points[8 * i : 8 * (i + 1)] for i in range(len(quad_points) // 8)]  # noqa
+
+    highlight_lines = []
+
+    for rectangle in rectangles:
+        text_page = pdfium_page.get_textpage()
+        text = text_page.get_text_bounded(left=rectangle[0], bottom=rectangle[5], right=rectangle[2], top=rectangle[1])
+
+        if not highlight_lines or text != highlight_lines[-1]:
+            highlight_lines.append(text)
+
+    return re.sub(r'\s+', ' ', ' '.join(highlight_lines).strip())
+
+
+def legacy_set_highlights_and_comments(pdf: Pdf):
+    """The extraction as it was implemented before: pypdf and pdfium parse the file and each annotation is created."""
+
+    pdf.pdfhighlight_set.all().delete()
+    pdf.pdfcomment_set.all().delete()
+
+    pypdf_pdf = PdfReader(pdf.file)
+    pyreadium_pdf = PdfDocument(pdf.file, autoclose=True)
+
+    for i, pypdf_page in enumerate(pypdf_pdf.pages):
+        pdfium_page = pyreadium_pdf[i]
+
+        if "/Annots" in pypdf_page:
+            for annotation in pypdf_page["/Annots"]:
+                annotation_object = annotation.get_object()
+                annotation_type = annotation_object["/Subtype"]
+
+                if annotation_type in ["/FreeText", "/Highlight"]:
+                    date_time_string = f'{annotation_object["/CreationDate"].split(':')[-1]}-+00:00'
+                    creation_date = datetime.strptime(date_time_string, '%Y%m%d%H%M%S-%z')
+
+                    if annotation_type == "/FreeText":
+                        PdfComment.objects.create(
+                            text=annotation_object["/Contents"], page=i + 1, creation_date=creation_date, pdf=pdf
+                        )
+                    elif annotation_type == "/Highlight":
+                        highlight_text = legacy_extract_pdf_highlight_text(annotation_object, pdfium_page)
+                        PdfHighlight.objects.create(
+                            text=highlight_text, page=i + 1, creation_date=creation_date, pdf=pdf
+                        )
+
+    pyreadium_pdf.close()
+
+
+def run_extraction(function, pdf_id: str) -> tuple[float, int, list[str]]:
+    """Run the extraction and return the time in seconds, the number of queries and the extracted highlights."""
+
+    PdfHighlight.objects.all().delete()
+    # use a fresh instance, as pdfium closes the file of the pdf
+    pdf = Pdf.objects.get(id=pdf_id)
+
+    with CaptureQueriesContext(connection) as context:
+        duration = measure(lambda: function(pdf), repeat=1) / 1000
+
+    highlights = list(pdf.pdfhighlight_set.order_by('page', 'text').values_list('text', flat=True))
+
+    return duration, len(context.captured_queries), highlights
+
+
+def run():
+    with benchmark_database(), tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+        user = User.objects.create_user(username='benchmark', password='password', email='benchmark@a.com')
+
+        with tempfile.TemporaryFile() as fixture:
+            write_annotated_pdf(fixture, NUMBER_OF_PAGES, HIGHLIGHTS_PER_PAGE)
+            fixture.seek(0)
+            pdf = Pdf.objects.create(owner=user.profile, name='annotated', file=File(fixture, name='annotated.pdf'))
+
+        legacy_time, legacy_queries, legacy_highlights = run_extraction(legacy_set_highlights_and_comments, pdf.id)
+        single_pass_time, single_pass_queries, single_pass_highlights = run_extraction(
+            PdfProcessingServices.set_highlights_and_comments, pdf.id
+        )
+
+        assert len(single_pass_highlights) == NUMBER_OF_PAGES * HIGHLIGHTS_PER_PAGE
+        assert single_pass_highlights == legacy_highlights
+
+    print(f'Extracting {NUMBER_OF_PAGES * HIGHLIGHTS_PER_PAGE} highlights of a pdf with {NUMBER_OF_PAGES} pages\n')
+    print_table(
+        ['extraction', 'time [s]', 'queries'],
+        [
+            ['pypdf + pdfium, create', f'{legacy_time:.2f}', legacy_queries],
+            ['single pass pdfium, bulk_create', f'{single_pass_time:.2f}', single_pass_queries],
+        ],
+    )
+    print(f'\nspeedup: {legacy_time / single_pass_time:.1f}x')
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,182 @@
+"""
+Compare the backup uploads and removals as they were implemented before (one file after the other and a delete
+request per removed file) with the thread pool uploader and multi-object deletes. The real minio client talks to a
+local stand-in of a minio server, which simulates the latency and bandwidth of a remote object storage.
+
+    python -m benchmarks.backup_upload
+"""
+
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks.helpers import print_table, setup_django
+
+setup_django()
+
+from backup import tasks  # noqa: E402
+from cryptography.fernet import Fernet  # noqa: E402
+from django.conf import settings  # noqa: E402
+from minio import Minio  # noqa: E402
+
+NUMBER_OF_FILES = 100
+FILE_SIZE = 1_000_000
+NUMBER_OF_REMOVALS = 500
+# latency of each request and bandwidth of each connection of the simulated remote object storage
+LATENCY = 0.03
+BANDWIDTH = 20_000_000
+WORKERS = [1, 4, 8]
+
+
+class MinioStandInHandler(BaseHTTPRequestHandler):
+    """Minimal S3 api supporting single part uploads and single and multi-object deletes."""
+
+    protocol_version = 'HTTP/1.1'
+    objects = set()
+    lock = threading.Lock()
+
+    def do_PUT(self):
+        received = 0
+        length = int(self.headers['Content-Length'])
+
+        while received < length:
+            received += len(self.rfile.read(min(64 * 1024, length - received)))
+
+        time.sleep(LATENCY + length / BANDWIDTH)
+
+        with self.lock:
+            self.objects.add(urlparse(self.path).path)
+
+        self.send_empty_response(200, {'ETag': '"etag"'})
+
+    def do_DELETE(self):
+        time.sleep(LATENCY)
+
+        with self.lock:
+            self.objects.discard(urlparse(self.path).path)
+
+        self.send_empty_response(204)
+
+    def do_POST(self):
+        if 'delete' not in parse_qs(urlparse(self.path).query, keep_blank_values=True):
+            self.send_empty_response(501)
+
+            return
+
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        time.sleep(LATENCY + len(body) / BANDWIDTH)
+
+        response = b'<?xml version="1.0" encoding="UTF-8"?><DeleteResult></DeleteResult>'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/xml')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def send_empty_response(self, status: int, headers: dict | None = None):
+        self.send_response(status)
+
+        for key, value in (headers or dict()).items():
+            self.send_header(key, value)
+
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def legacy_upload(file_names: list[str], media_root: Path, encryption_key: bytes):
+    """The uploads as they were implemented before: one file after the other."""
+
+    for file_name in file_names:
+        tasks.add_file_to_minio(file_name, media_root, encryption_key)
+
+
+def legacy_remove(file_names: list[str]):
+    """The removals as they were implemented before: a delete request per file."""
+
+    for file_name in file_names:
+        tasks.minio_client.remove_object(settings.BACKUP_BUCKET_NAME, file_name)
+
+
+def timed(function) -> float:
+    """Run the function and return the wall clock time in seconds."""
+
+    start = time.perf_counter()
+    function()
+
+    return time.perf_counter() - start
+
+
+def run():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MinioStandInHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    client = Minio(
+        f'127.0.0.1:{server.server_address[1]}',
+        access_key='access_key',
+        secret_key='secret_key',  # nosec
+        secure=False,
+        region='us-east-1',
+    )
+    encryption_key = Fernet.generate_key()
+    file_names = [f'1/pdf_{i}.pdf' for i in range(NUMBER_OF_FILES)]
+    removed_names = [f'2/pdf_{i}.pdf' for i in range(NUMBER_OF_REMOVALS)]
+    rows = []
+
+    with tempfile.TemporaryDirectory() as media_root, mock.patch.object(tasks, 'minio_client', client, create=True):
+        (Path(media_root) / '1').mkdir()
+
+        for file_name in file_names:
+            (Path(media_root) / file_name).write_bytes(bytes(FILE_SIZE))
+
+        legacy_upload_seconds = timed(lambda: legacy_upload(file_names, Path(media_root), encryption_key))
+        legacy_remove_seconds = timed(lambda: legacy_remove(removed_names))
+        legacy_seconds = legacy_upload_seconds + legacy_remove_seconds
+        rows.append(
+            [
+                'sequential, remove_object',
+                f'{legacy_upload_seconds:.2f}',
+                f'{NUMBER_OF_FILES * FILE_SIZE / 1_000_000 / legacy_upload_seconds:.1f}',
+                f'{legacy_remove_seconds:.2f}',
+                '1.00x',
+            ]
+        )
+
+        for workers in WORKERS:
+            stats = tasks.BackupStats()
+            tasks.upload_files(
+                file_names, Path(media_root), encryption_key, stats, workers=workers, part_size=5 * 1024 * 1024
+            )
+            remove_seconds = timed(lambda: tasks.remove_files_from_minio(removed_names, stats))
+
+            assert stats.files_added == NUMBER_OF_FILES and stats.files_removed == NUMBER_OF_REMOVALS
+
+            rows.append(
+                [
+                    f'{workers} workers, remove_objects',
+                    f'{stats.upload_seconds:.2f}',
+                    f'{stats.megabytes_per_second:.1f}',
+                    f'{remove_seconds:.2f}',
+                    f'{legacy_seconds / (stats.upload_seconds + remove_seconds):.2f}x',
+                ]
+            )
+
+    server.shutdown()
+
+    print(
+        f'Uploading {NUMBER_OF_FILES} encrypted files of {FILE_SIZE / 1_000_000:.0f} MB and removing '
+        f'{NUMBER_OF_REMOVALS} files, {1000 * LATENCY:.0f} ms latency and {BANDWIDTH / 1_000_000:.0f} MB/s per '
+        'connection\n'
+    )
+    print_table(['backup', 'upload [s]', 'upload MB/s', 'remove [s]', 'speedup'], rows)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,79 @@
+"""
+Compare the time needed for processing 500 newly added PDFs, i.e. rendering the thumbnails and previews, extracting the
+page texts and parsing the annotations, with different numbers of worker processes of the bulk ingest.
+
+    python -m benchmarks.bulk_ingest
+
+The speedup is limited by the number of available CPU cores.
+"""
+
+import os
+import tempfile
+import time
+
+from benchmarks.helpers import benchmark_database, print_table, random_names, setup_django
+
+setup_django()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.test import override_settings  # noqa: E402
+from pdf.models import Pdf, PdfComment, PdfHighlight, PdfPageText  # noqa: E402
+from pdf.service import BulkIngestServices  # noqa: E402
+from users.service import get_demo_pdf  # noqa: E402
+
+NUMBER_OF_PDFS = 500
+WORKERS = [1, 2, 4, 8]
+
+
+def create_pdfs(number: int) -> list[Pdf]:
+    """Create pdfs that still need to be processed. The files are copies of the demo pdf."""
+
+    user = User.objects.create_user(username='benchmark', password='password', email='benchmark@a.com')
+    pdfs = []
+
+    for name in random_names(number):
+        pdf = Pdf.objects.create(owner=user.profile, name=name, file=get_demo_pdf())
+        pdfs.append(pdf)
+
+    return pdfs
+
+
+def reset_pdfs(pdfs: list[Pdf]):
+    """Reset the pdfs to the state before the processing."""
+
+    for model in [PdfPageText, PdfComment, PdfHighlight]:
+        model.objects.all().delete()
+
+    for pdf in pdfs:
+        pdf.thumbnail.delete(save=False)
+        pdf.preview.delete(save=False)
+
+    Pdf.objects.update(number_of_pages=-1, thumbnail='', preview='', processing_state=Pdf.ProcessingState.PENDING)
+
+
+def run():
+    rows = []
+
+    with benchmark_database(), tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+        pdfs = create_pdfs(NUMBER_OF_PDFS)
+
+        for workers in WORKERS:
+            reset_pdfs(pdfs)
+
+            start = time.perf_counter()
+            BulkIngestServices.process_pdfs(pdfs, workers=workers, progress_callback=lambda processed, total: None)
+            duration = time.perf_counter() - start
+
+            assert not Pdf.objects.exclude(processing_state=Pdf.ProcessingState.READY).exists()
+            rows.append([workers, f'{duration:.1f}', f'{NUMBER_OF_PDFS / duration:.1f}'])
+
+    single_worker_duration = float(rows[0][1])
+    for row in rows:
+        row.append(f'{single_worker_duration / float(row[1]):.2f}x')
+
+    print(f'Processing {NUMBER_OF_PDFS} pdfs on {os.cpu_count()} CPU cores\n')
+    print_table(['workers', 'time [s]', 'pdfs/s', 'speedup'], rows)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,77 @@
+"""
+Compare the fuzzy search of the PDF overview before and after introducing the in-process name index.
+
+    python -m benchmarks.fuzzy_search
+"""
+
+from benchmarks.helpers import benchmark_database, measure, print_table, random_names, setup_django
+
+setup_django()
+
+from django.contrib.auth.models import User  # noqa: E402
+from pdf.models import Pdf  # noqa: E402
+from pdf.search import PdfNameIndex  # noqa: E402
+from rapidfuzz import fuzz, utils  # noqa: E402
+
+SIZES = [1_000, 10_000, 100_000]
+SEARCH = 'self hosted guide'
+
+
+def legacy_fuzzy_filter_pdfs(pdfs, search):
+    """The fuzzy search as it was implemented before: every pdf is loaded and scored one by one."""
+
+    fuzzy_result = []
+
+    for pdf in pdfs:
+        w_ratio = fuzz.WRatio(search, pdf.name, processor=utils.default_process)
+        partial_ratio = fuzz.partial_ratio(search, pdf.name, processor=utils.default_process)
+
+        if (w_ratio + partial_ratio) / 2 > 85 or partial_ratio > 95:
+            fuzzy_result.append(pdf.id)
+
+    return list(pdfs.filter(id__in=fuzzy_result).values_list('id', flat=True))
+
+
+def indexed_fuzzy_filter_pdfs(pdfs, search, profile):
+    """The fuzzy search using the name index."""
+
+    ids = [pdf_id for pdf_id, _ in PdfNameIndex.search(profile, search)]
+
+    return list(pdfs.filter(id__in=ids).values_list('id', flat=True))
+
+
+def run():
+    rows = []
+
+    with benchmark_database():
+        for size in SIZES:
+            user = User.objects.create_user(username=f'user_{size}', password='12345')
+            profile = user.profile
+            Pdf.objects.bulk_create(
+                [Pdf(owner=profile, name=name, file=f'{name}.pdf') for name in random_names(size)], batch_size=5000
+            )
+            pdfs = profile.pdf_set.filter(archived=False)
+
+            legacy_result = legacy_fuzzy_filter_pdfs(pdfs, SEARCH)
+            indexed_result = indexed_fuzzy_filter_pdfs(pdfs, SEARCH, profile)
+            assert sorted(legacy_result) == sorted(indexed_result)
+
+            legacy = measure(lambda: legacy_fuzzy_filter_pdfs(pdfs, SEARCH), repeat=1 if size > 10_000 else 3)
+
+            def cold_search():
+                PdfNameIndex.invalidate(profile.id)
+                indexed_fuzzy_filter_pdfs(pdfs, SEARCH, profile)
+
+            cold = measure(cold_search)
+            warm = measure(lambda: indexed_fuzzy_filter_pdfs(pdfs, SEARCH, profile))
+
+            rows.append(
+                [size, len(legacy_result), f'{legacy:.1f}', f'{cold:.1f}', f'{warm:.1f}', f'{legacy / warm:.1f}x']
+            )
+
+    print(f'Fuzzy search for "{SEARCH}", times in ms')
+    print_table(['names', 'matches', 'legacy loop', 'index (cold)', 'index (warm)', 'speedup'], rows)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,76 @@
+"""
+Helpers shared by the benchmarks. Benchmarks are run from the pdfding directory, e.g.:
+
+    python -m benchmarks.fuzzy_search
+
+They run against a throwaway test database, the development database is never touched.
+"""
+
+import os
+import random
+import time
+from contextlib import contextmanager
+
+WORDS = [
+    'python', 'django', 'guide', 'manual', 'introduction', 'advanced', 'self', 'hosted', 'hosting', 'server',
+    'linux', 'network', 'security', 'database', 'design', 'patterns', 'history', 'europe', 'physics', 'quantum',
+    'statistics', 'learning', 'machine', 'deep', 'cooking', 'garden', 'travel', 'finance', 'tax', 'invoice',
+    'report', 'annual', 'paper', 'thesis', 'chapter', 'volume', 'edition', 'notes', 'lecture', 'exam',
+]  # fmt: skip
+
+
+def setup_django():
+    """Set up django so that the benchmarks can use the models and views of PdfDing."""
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+
+    import django
+
+    django.setup()
+
+
+@contextmanager
+def benchmark_database():
+    """Create a fresh test database for the duration of the benchmark and destroy it afterwards."""
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def random_names(number: int, seed: int = 42) -> list[str]:
+    """Generate reproducible random PDF names."""
+
+    rng = random.Random(seed)
+
+    return [f'{" ".join(rng.choices(WORDS, k=rng.randint(2, 6)))} {i}' for i in range(number)]
+
+
+def measure(function, repeat: int = 3) -> float:
+    """Run the function multiple times and return the best wall clock time in milliseconds."""
+
+    timings = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+
+    return 1000 * min(timings)
+
+
+def print_table(header: list[str], rows: list[list]):
+    """Print the benchmark results as a simple table."""
+
+    widths = [max(len(str(value)) for value in column) for column in zip(header, *rows)]
+
+    for row in [header, *rows]:
+        print('  '.join(str(value).rjust(width) for value, width in zip(row, widths)))
@@ -0,0 +1,106 @@
+"""
+Compare the latency of a deep page (page 200) of the PDF overview with the limit/offset pagination that was used before
+and the keyset pagination.
+
+    python -m benchmarks.overview_pagination
+"""
+
+from benchmarks.helpers import benchmark_database, measure, print_table, random_names, setup_django
+
+setup_django()
+
+from base.service import encode_cursor  # noqa: E402
+from core.settings import ITEMS_PER_PAGE  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.paginator import Paginator  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.db.models.functions import Lower  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+from pdf.models import Pdf  # noqa: E402
+from pdf.views.pdf_views import Overview  # noqa: E402
+
+SIZES = [10_000, 50_000]
+PAGE = 200
+SORTINGS = {'Newest': '-creation_date', 'Name_asc': Lower('name')}
+
+
+def legacy_get_page_objects(view, request, sorting, page, items_per_page):
+    """The pagination as it was implemented before: count, offset query and a second count."""
+
+    objects = view.filter_objects(request).order_by(sorting)
+
+    paginator = Paginator(objects, per_page=items_per_page, allow_empty_first_page=True)
+    page_object = paginator.get_page(page)
+
+    next_page_available = page_object.end_index() < objects.count()
+
+    return list(page_object), next_page_available
+
+
+def get_cursor_request(view, user, sorting, page, items_per_page):
+    """Get the request for the page as it would be sent by the 'Load More' button, i.e. with the cursor."""
+
+    request = RequestFactory().get('/')
+    request.user = user
+    previous_page, _ = view.get_page_objects(request, sorting, page - 1, items_per_page)
+    last_object = previous_page[-1]
+
+    request = RequestFactory().get('/', {'cursor': encode_cursor(last_object.overview_sort_key, last_object.pk)})
+    request.user = user
+
+    return request
+
+
+def count_queries(function) -> int:
+    with CaptureQueriesContext(connection) as context:
+        function()
+
+    return len(context.captured_queries)
+
+
+def run():
+    rows = []
+    view = Overview()
+
+    with benchmark_database():
+        for size in SIZES:
+            user = User.objects.create_user(username=f'user_{size}', password='12345')
+            Pdf.objects.bulk_create(
+                [Pdf(owner=user.profile, name=name, file=f'{name}.pdf') for name in random_names(size)],
+                batch_size=5000,
+            )
+
+            for sorting_name, sorting in SORTINGS.items():
+                request = get_cursor_request(view, user, sorting, PAGE, ITEMS_PER_PAGE)
+
+                legacy_result = legacy_get_page_objects(view, request, sorting, PAGE, ITEMS_PER_PAGE)
+                keyset_result = view.get_page_objects(request, sorting, PAGE, ITEMS_PER_PAGE)
+                assert [pdf.id for pdf in legacy_result[0]] == [pdf.id for pdf in keyset_result[0]]
+
+                legacy_queries = count_queries(
+                    lambda: legacy_get_page_objects(view, request, sorting, PAGE, ITEMS_PER_PAGE)
+                )
+                keyset_queries = count_queries(lambda: view.get_page_objects(request, sorting, PAGE, ITEMS_PER_PAGE))
+
+                legacy = measure(lambda: legacy_get_page_objects(view, request, sorting, PAGE, ITEMS_PER_PAGE), 5)
+                keyset = measure(lambda: view.get_page_objects(request, sorting, PAGE, ITEMS_PER_PAGE), 5)
+
+                rows.append(
+                    [
+                        size,
+                        sorting_name,
+                        legacy_queries,
+                        f'{legacy:.1f}',
+                        keyset_queries,
+                        f'{keyset:.1f}',
+                        f'{legacy / keyset:.1f}x',
+                    ]
+                )
+
+    print(f'PDF overview page {PAGE} with {ITEMS_PER_PAGE} items per page, times in ms')
+    print_table(['pdfs', 'sorting', 'offset queries', 'offset', 'keyset queries', 'keyset', 'speedup'], rows)
+
+
+if __name__ == '__main__':
+    run()
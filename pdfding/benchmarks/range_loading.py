@@ -0,0 +1,91 @@
+"""
+Compare the time to the first page of a large pdf when it is loaded with range requests, like pdf.js does, and when
+the whole file is downloaded first. The pdf is served by the serve view of PdfDing. As the test client does not send
+the data over a network, the time is also estimated for a connection with a limited bandwidth.
+
+    python -m benchmarks.range_loading
+"""
+
+from pathlib import Path
+
+from benchmarks.helpers import benchmark_database, measure, print_table, setup_django
+
+setup_django()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.urls import reverse  # noqa: E402
+from pdf.models import Pdf  # noqa: E402
+from pdf.tests.test_views.test_range_loading import RangeReader, write_large_pdf  # noqa: E402
+from pypdfium2 import PdfDocument  # noqa: E402
+
+NUMBER_OF_PAGES = 300
+PAGE_PADDING = 250_000
+# bandwidth in Mbit/s used for estimating the time to the first page over a network
+BANDWIDTH = 100
+
+
+def render_first_page(pdf_input):
+    pdf_document = PdfDocument(pdf_input)
+    pdf_document[0].render(scale=0.5)
+    pdf_document.close()
+
+
+def run():
+    rows = []
+
+    with benchmark_database():
+        user = User.objects.create_user(username='user', password='12345')
+        client = Client()
+        client.force_login(user)
+
+        pdf = Pdf.objects.create(owner=user.profile, name='large_pdf')
+        pdf.file.name = f'{user.id}/benchmark_large_pdf.pdf'
+        pdf.save()
+
+        file_path = Path(pdf.file.path)
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+
+        with file_path.open('wb') as file:
+            write_large_pdf(file, NUMBER_OF_PAGES, PAGE_PADDING)
+
+        file_size = file_path.stat().st_size
+        url = reverse('serve_pdf', kwargs={'identifier': pdf.id, 'revision': pdf.revision})
+
+        try:
+            range_readers = []
+
+            def load_with_ranges():
+                range_readers.append(RangeReader(client, url))
+                render_first_page(range_readers[-1])
+
+            def load_full_file():
+                render_first_page(b''.join(client.get(url).streaming_content))
+
+            ranged = measure(load_with_ranges)
+            full = measure(load_full_file)
+        finally:
+            file_path.unlink()
+
+        # the head request of the range reader is counted as well
+        for name, milliseconds, requests, transferred_bytes in [
+            ('full download', full, 1, file_size),
+            ('range requests', ranged, range_readers[-1].number_of_requests + 1, range_readers[-1].transferred_bytes),
+        ]:
+            transfer_milliseconds = 1000 * transferred_bytes * 8 / (BANDWIDTH * 1_000_000)
+            rows.append(
+                [
+                    name,
+                    requests,
+                    f'{transferred_bytes / 1_000_000:.2f}',
+                    f'{milliseconds:.1f}',
+                    f'{milliseconds + transfer_milliseconds:.1f}',
+                ]
+            )
+
+    print(f'Time to the first page of a pdf with {NUMBER_OF_PAGES} pages, times in ms\n')
+    print_table(['loading', 'requests', 'transferred MB', 'local', f'at {BANDWIDTH} Mbit/s'], rows)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,129 @@
+"""
+Compare how long writers are stalled by the backup of the sqlite database as it was implemented before (a single
+backup step in rollback journal mode) with the paged backup in WAL mode. A writer thread commits a small write every
+few milliseconds during the backup, like the view counters and page updates of PdfDing. Writing the backup to a
+file flushes it to disk at the end, which slows down the commits of the writer as well.
+
+    python -m benchmarks.sqlite_backup
+"""
+
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from benchmarks.helpers import print_table, setup_django
+
+setup_django()
+
+from backup.tasks import backup_sqlite  # noqa: E402
+
+NUMBER_OF_ROWS = 200_000
+ROW_SIZE = 1_000
+WRITE_INTERVAL = 0.005
+
+
+def create_database(db_path: Path, journal_mode: str):
+    """Create a database of about 200 MB."""
+
+    conn = sqlite3.connect(db_path)
+    conn.execute(f'PRAGMA journal_mode={journal_mode}')
+
+    with conn:
+        conn.execute('CREATE TABLE data (id INTEGER PRIMARY KEY, content TEXT)')
+        conn.executemany(
+            'INSERT INTO data (content) VALUES (?)', ([f'{i:08d}' * (ROW_SIZE // 8)] for i in range(NUMBER_OF_ROWS))
+        )
+        conn.execute('CREATE TABLE counter (id INTEGER PRIMARY KEY, views INTEGER)')
+        conn.execute('INSERT INTO counter (views) VALUES (0)')
+
+    conn.close()
+
+
+def legacy_backup_sqlite(db_path: Path, backup_path: Path):
+    """The backup as it was implemented before: the whole database is copied in a single step."""
+
+    conn = sqlite3.connect(db_path, detect_types=sqlite3.PARSE_DECLTYPES, uri=True)
+    backup_conn = sqlite3.connect(backup_path, uri=True)
+    with backup_conn:
+        conn.backup(backup_conn)
+    backup_conn.close()
+    conn.close()
+
+
+def measure_write_latencies(db_path: Path, backup_function) -> tuple[float, list[float], str]:
+    """Run the backup while a writer thread commits writes. Returns the backup time and the write latencies."""
+
+    stop = threading.Event()
+    latencies = []
+
+    def write():
+        conn = sqlite3.connect(db_path, timeout=60)
+
+        while not stop.is_set():
+            start = time.perf_counter()
+
+            with conn:
+                conn.execute('UPDATE counter SET views = views + 1 WHERE id = 1')
+
+            latencies.append(time.perf_counter() - start)
+            time.sleep(WRITE_INTERVAL)
+
+        conn.close()
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    # let the writer warm up
+    time.sleep(0.2)
+
+    start = time.perf_counter()
+    result = backup_function()
+    backup_seconds = time.perf_counter() - start
+
+    stop.set()
+    writer.join()
+
+    return backup_seconds, latencies, str(result or '')
+
+
+def run():
+    rows = []
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # the database is created in the journal mode the connections of PdfDing used before and use now
+        for name, journal_mode, backup_function in [
+            ('single step, rollback journal', 'DELETE', legacy_backup_sqlite),
+            (
+                'paged, WAL',
+                'WAL',
+                lambda db_path, backup_path: backup_sqlite(db_path, backup_path, pages=1024, sleep=0.05),
+            ),
+        ]:
+            db_path = Path(tmp_dir) / f'{len(rows)}.sqlite3'
+            backup_path = Path(tmp_dir) / f'{len(rows)}_backup.sqlite3'
+            create_database(db_path, journal_mode)
+
+            backup_seconds, latencies, stats = measure_write_latencies(
+                db_path, lambda: backup_function(db_path, backup_path)
+            )
+            rows.append(
+                [
+                    name,
+                    f'{backup_seconds:.2f}',
+                    len(latencies),
+                    f'{1000 * statistics.median(latencies):.1f}',
+                    f'{1000 * max(latencies):.1f}',
+                ]
+            )
+
+            if stats:
+                print(f'{name}: {stats}')
+
+    print(f'\nBacking up a database with {NUMBER_OF_ROWS} rows of {ROW_SIZE} bytes during writes\n')
+    print_table(['backup', 'backup [s]', 'writes', 'median write [ms]', 'longest write [ms]'], rows)
+
+
+if __name__ == '__main__':
+    run()
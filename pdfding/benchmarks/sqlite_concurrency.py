@@ -0,0 +1,127 @@
+"""
+Compare the throughput of concurrent processes, like the gunicorn workers and the huey consumer, using the sqlite
+database with the stock settings of sqlite and with the pragmas and transaction mode of the database settings. Each
+process mostly reads pages of rows and sometimes runs a transaction that reads before it writes, like updating the
+view counter of a pdf.
+
+    python -m benchmarks.sqlite_concurrency
+"""
+
+import multiprocessing
+import random
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.helpers import print_table, setup_django
+
+setup_django()
+
+from django.conf import settings  # noqa: E402
+
+NUMBER_OF_ROWS = 20_000
+PROCESSES = 4
+DURATION = 5
+WRITE_RATIO = 0.1
+
+
+def create_database(db_path: Path):
+    """Create a database of pdfs with view counters."""
+
+    conn = sqlite3.connect(db_path)
+
+    with conn:
+        conn.execute('CREATE TABLE pdf (id INTEGER PRIMARY KEY, name TEXT, views INTEGER)')
+        conn.execute('CREATE TABLE view (id INTEGER PRIMARY KEY, pdf_id INTEGER, date REAL)')
+        conn.executemany(
+            'INSERT INTO pdf (name, views) VALUES (?, 0)', ([f'pdf {i:08d}' * 10] for i in range(NUMBER_OF_ROWS))
+        )
+
+    conn.close()
+
+
+def work(db_path: Path, init_command: str, transaction_mode: str | None, seed: int) -> tuple[int, int, int, float]:
+    """Run reads and writes for a fixed duration. Returns the reads, writes, failed writes and longest write."""
+
+    rng = random.Random(seed)
+    # the connection is created like django does it, which uses a busy timeout of 5 seconds by default
+    conn = sqlite3.connect(db_path, isolation_level=None)
+
+    for command in init_command.split(';'):
+        if command := command.strip():
+            conn.execute(command)
+
+    begin = f'BEGIN {transaction_mode}' if transaction_mode else 'BEGIN'
+    reads, writes, failed_writes, longest_write = 0, 0, 0, 0.0
+    end = time.perf_counter() + DURATION
+
+    while time.perf_counter() < end:
+        pdf_id = rng.randint(1, NUMBER_OF_ROWS)
+
+        if rng.random() >= WRITE_RATIO:
+            conn.execute('SELECT id, name, views FROM pdf WHERE id >= ? ORDER BY id LIMIT 20', (pdf_id,)).fetchall()
+            reads += 1
+
+            continue
+
+        start = time.perf_counter()
+
+        try:
+            conn.execute(begin)
+            (views,) = conn.execute('SELECT views FROM pdf WHERE id = ?', (pdf_id,)).fetchone()
+            conn.execute('UPDATE pdf SET views = ? WHERE id = ?', (views + 1, pdf_id))
+            conn.execute('INSERT INTO view (pdf_id, date) VALUES (?, ?)', (pdf_id, time.time()))
+            conn.execute('COMMIT')
+            writes += 1
+        except sqlite3.OperationalError:
+            conn.execute('ROLLBACK')
+            failed_writes += 1
+
+        longest_write = max(longest_write, time.perf_counter() - start)
+
+    conn.close()
+
+    return reads, writes, failed_writes, longest_write
+
+
+def run():
+    options = settings.DATABASES['default']['OPTIONS']
+    rows = []
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, init_command, transaction_mode in [
+            ('stock sqlite', '', None),
+            ('pragmas, deferred', options['init_command'], 'DEFERRED'),
+            ('pragmas, immediate', options['init_command'], 'IMMEDIATE'),
+        ]:
+            # the journal mode is persistent, so every configuration gets its own database
+            db_path = Path(tmp_dir) / f'{len(rows)}.sqlite3'
+            create_database(db_path)
+
+            with multiprocessing.Pool(PROCESSES) as pool:
+                results = pool.starmap(
+                    work, [(db_path, init_command, transaction_mode, seed) for seed in range(PROCESSES)]
+                )
+
+            reads, writes, failed_writes = (sum(result[i] for result in results) for i in range(3))
+            rows.append(
+                [
+                    name,
+                    f'{reads / DURATION:.0f}',
+                    f'{writes / DURATION:.0f}',
+                    failed_writes,
+                    f'{1000 * max(result[3] for result in results):.1f}',
+                ]
+            )
+
+    print(
+        f'{PROCESSES} processes reading and writing a database with {NUMBER_OF_ROWS} rows for {DURATION} s, '
+        f'{100 * WRITE_RATIO:.0f}% writes\n'
+    )
+    print(f'pragmas: {options["init_command"]}\n')
+    print_table(['settings', 'reads/s', 'writes/s', 'locked writes', 'longest write [ms]'], rows)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,104 @@
+"""
+Compare the tag filter of the PDF overview before and after resolving the tags to ids and matching them in a single
+grouped subquery.
+
+    python -m benchmarks.tag_filter
+"""
+
+import random
+
+from benchmarks.helpers import WORDS, benchmark_database, measure, print_table, random_names, setup_django
+
+setup_django()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.db.models import Q  # noqa: E402
+from pdf.models import Pdf, Tag  # noqa: E402
+from pdf.views.pdf_views import OverviewMixin  # noqa: E402
+
+NUMBER_OF_PDFS = 20_000
+NUMBER_OF_TAGS = 5_000
+TAGS_PER_PDF = 8
+TAG_QUERIES = [
+    ['python'],
+    ['python', 'guide'],
+    ['python', 'guide', 'linux'],
+    ['python', 'guide', 'linux', 'server'],
+    ['python', 'guide', 'linux', 'server', 'notes'],
+]
+
+
+def create_tag_names(number: int, rng: random.Random) -> list[str]:
+    """Create nested tag names, e.g. 'python', 'python/guide', 'python/guide/linux'."""
+
+    tag_names = set(WORDS)
+
+    while len(tag_names) < number:
+        tag_names.add('/'.join(rng.choices(WORDS, k=rng.randint(2, 3))) + f'-{len(tag_names)}')
+
+    # make sure that the parents of all tags exist
+    for tag_name in list(tag_names):
+        parts = tag_name.split('/')
+        tag_names.update('/'.join(parts[:i]) for i in range(1, len(parts)))
+
+    return sorted(tag_names)
+
+
+def legacy_tag_filter_pdfs(pdfs, tag_names):
+    """The tag filter as it was implemented before: one join per tag."""
+
+    for tag in tag_names:
+        pdfs = pdfs.filter(Q(tags__name=tag) | Q(tags__name__startswith=f'{tag}/')).distinct()
+
+    return list(pdfs.values_list('id', flat=True))
+
+
+def grouped_tag_filter_pdfs(pdfs, tag_names, profile):
+    """The tag filter resolving the tags to ids and matching them in one grouped subquery."""
+
+    return list(OverviewMixin.tag_filter_pdfs(pdfs, tag_names, profile).values_list('id', flat=True))
+
+
+def run():
+    rows = []
+    rng = random.Random(42)
+
+    with benchmark_database():
+        user = User.objects.create_user(username='user', password='12345')
+        profile = user.profile
+
+        tags = Tag.objects.bulk_create(
+            [Tag(owner=profile, name=name) for name in create_tag_names(NUMBER_OF_TAGS, rng)], batch_size=5000
+        )
+        pdfs = Pdf.objects.bulk_create(
+            [Pdf(owner=profile, name=name, file=f'{name}.pdf') for name in random_names(NUMBER_OF_PDFS)],
+            batch_size=5000,
+        )
+        Pdf.tags.through.objects.bulk_create(
+            [Pdf.tags.through(pdf_id=pdf.id, tag_id=tag.id) for pdf in pdfs for tag in rng.sample(tags, TAGS_PER_PDF)],
+            batch_size=5000,
+        )
+
+        pdfs = profile.pdf_set.filter(archived=False)
+
+        for tag_names in TAG_QUERIES:
+            legacy_result = legacy_tag_filter_pdfs(pdfs, tag_names)
+            grouped_result = grouped_tag_filter_pdfs(pdfs, tag_names, profile)
+            assert sorted(legacy_result) == sorted(grouped_result)
+
+            legacy = measure(lambda: legacy_tag_filter_pdfs(pdfs, tag_names))
+            grouped = measure(lambda: grouped_tag_filter_pdfs(pdfs, tag_names, profile))
+
+            rows.append(
+                [len(tag_names), len(legacy_result), f'{legacy:.1f}', f'{grouped:.1f}', f'{legacy / grouped:.1f}x']
+            )
+
+    print(
+        f'Tag filter over {NUMBER_OF_PDFS} pdfs with {len(tags)} nested tags and {TAGS_PER_PDF} tags per pdf, '
+        'times in ms'
+    )
+    print_table(['tags', 'matches', 'join per tag', 'grouped subquery', 'speedup'], rows)
+
+
+if __name__ == '__main__':
+    run()
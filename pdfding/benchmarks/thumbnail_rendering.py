@@ -0,0 +1,106 @@
+"""
+Compare the CPU time and the size of the thumbnails and previews per PDF of the previous implementation (the first
+page is rendered twice and both images are encoded as PNG) with the render-once derivative pipeline in the supported
+image formats.
+
+    python -m benchmarks.thumbnail_rendering
+"""
+
+import time
+from io import BytesIO
+from math import floor
+from pathlib import Path
+
+from benchmarks.helpers import print_table
+from pdf.ingest import render_thumbnail_and_preview
+from pypdfium2 import PdfDocument
+
+PDF_PATHS = [
+    Path(__file__).parents[1] / 'users' / 'demo_data' / 'demo.pdf',
+    Path(__file__).parents[1] / 'pdf' / 'tests' / 'data' / 'dummy.pdf',
+]
+REPEAT = 20
+IMAGE_FORMATS = ['PNG', 'WEBP', 'AVIF']
+
+
+def legacy_render_thumbnail_and_preview(
+    pdf_document: PdfDocument,
+    desired_thumbnail_width: int = 135,
+    desired_thumbnail_width_height_ratio: float = 0.77,
+    desired_preview_width: int = 450,
+) -> dict[str, BytesIO]:
+    """The rendering as it was implemented before: the page is rendered for each image and encoded as PNG."""
+
+    page = pdf_document[0]
+    preview_width_height_ratio = page.get_width() / page.get_height()
+
+    image_files = dict()
+    for image_name, desired_width, desired_ratio in zip(
+        ['thumbnail', 'preview'],
+        [desired_thumbnail_width, desired_preview_width],
+        [desired_thumbnail_width_height_ratio, preview_width_height_ratio],
+    ):
+        scale_factor = desired_width / page.get_width()
+
+        bitmap = page.render(scale=scale_factor)
+        pil_image = bitmap.to_pil()
+
+        desired_height = round(desired_width / desired_ratio)
+        width, height = pil_image.size
+
+        height_diff = height - desired_height
+        if image_name == 'thumbnail' and height_diff > 0:
+            offset = floor(0.15 * height_diff)
+            pil_image = pil_image.crop((0, offset, desired_width, desired_height + offset))
+
+        image_io = BytesIO()
+        pil_image.save(image_io, format='PNG')
+        image_files[image_name] = image_io
+
+    return image_files
+
+
+def measure_rendering(render_function) -> tuple[float, float]:
+    """Render all pdfs multiple times and return the CPU time in milliseconds and the bytes per pdf."""
+
+    pdf_documents = [PdfDocument(path) for path in PDF_PATHS]
+    number_of_bytes = 0
+
+    start = time.process_time()
+    for _ in range(REPEAT):
+        for pdf_document in pdf_documents:
+            images = render_function(pdf_document)
+            number_of_bytes += sum(image_file.getbuffer().nbytes for image_file in images.values())
+    cpu_time = time.process_time() - start
+
+    for pdf_document in pdf_documents:
+        pdf_document.close()
+
+    renderings = REPEAT * len(PDF_PATHS)
+
+    return 1000 * cpu_time / renderings, number_of_bytes / renderings
+
+
+def run():
+    legacy_cpu_time, legacy_bytes = measure_rendering(legacy_render_thumbnail_and_preview)
+    rows = [['render twice, PNG', f'{legacy_cpu_time:.1f}', f'{legacy_bytes:.0f}', '1.00x']]
+
+    for image_format in IMAGE_FORMATS:
+        cpu_time, number_of_bytes = measure_rendering(
+            lambda pdf_document: render_thumbnail_and_preview(pdf_document, image_format=image_format)
+        )
+        rows.append(
+            [
+                f'render once, {image_format}',
+                f'{cpu_time:.1f}',
+                f'{number_of_bytes:.0f}',
+                f'{legacy_cpu_time / cpu_time:.2f}x',
+            ]
+        )
+
+    print(f'Rendering the thumbnail and preview of {len(PDF_PATHS)} pdfs {REPEAT} times\n')
+    print_table(['pipeline', 'CPU time per pdf [ms]', 'bytes per pdf', 'speedup'], rows)
+
+
+if __name__ == '__main__':
+    run()
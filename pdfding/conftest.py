@@ -12,3 +12,33 @@ def whitenoise_autorefresh(settings):
         - https://github.com/evansd/whitenoise/commit/4204494d44213f7a51229de8bc224cf6d84c01eb
     """
     settings.WHITENOISE_AUTOREFRESH = True
+
+
+@pytest.fixture(autouse=True)
+def clear_pdf_name_index():
+    """
+    The fuzzy search name index lives in the process. As the test database is rolled back after each test, profile
+    ids get reused and indexes of previous tests need to be dropped.
+    """
+
+    from pdf.search import PdfNameIndex
+
+    PdfNameIndex.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """The cached library data is keyed on profile ids, which get reused as the test database is rolled back."""
+
+    from django.core.cache import cache
+
+    cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def huey_immediate():
+    """Run huey tasks synchronously, so that the tests do not depend on a running consumer."""
+
+    from huey.contrib.djhuey import HUEY
+
+    HUEY.immediate = True
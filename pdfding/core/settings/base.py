@@ -10,7 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
-from os import environ
+from os import cpu_count, environ
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -108,11 +108,33 @@ if environ.get('DATABASE_TYPE') == 'POSTGRES':  # pragma: no cover
         }
     }
 else:
+    # pragmas applied to every new connection, so that the gunicorn workers and the huey consumer do not lock each
+    # other out and commits do not wait for an fsync. WAL mode does not work on network file systems, use
+    # SQLITE_JOURNAL_MODE=DELETE there.
+    SQLITE_PRAGMAS = {
+        'journal_mode': environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        # in WAL mode a power loss may roll back the last commits, but never corrupts the database
+        'synchronous': environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        # milliseconds a connection waits for a lock before raising "database is locked"
+        'busy_timeout': int(environ.get('SQLITE_BUSY_TIMEOUT', 5000)),
+        # negative values are in KiB
+        'cache_size': int(environ.get('SQLITE_CACHE_SIZE', -20000)),
+        'mmap_size': int(environ.get('SQLITE_MMAP_SIZE', 128 * 1024 * 1024)),
+        'temp_store': environ.get('SQLITE_TEMP_STORE', 'MEMORY'),
+    }
+
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db' / 'db.sqlite3',
             'BACKUP_NAME': BASE_DIR / 'db' / 'backup.sqlite3',
+            'OPTIONS': {
+                'init_command': ';'.join(f'PRAGMA {pragma}={value}' for pragma, value in SQLITE_PRAGMAS.items()),
+                # with IMMEDIATE transactions take the write lock right away, so that they wait for the busy timeout
+                # instead of failing with "database is locked" when they write after reading. DEFERRED lets read-only
+                # transactions run in parallel to a writer, at the cost of these errors.
+                'transaction_mode': environ.get('SQLITE_TRANSACTION_MODE', 'IMMEDIATE'),
+            },
             'TEST': {
                 'NAME': BASE_DIR / 'db' / 'test.sqlite3',
             },
@@ -161,12 +183,38 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# let a reverse proxy send the media files. the serve and download views then only perform the access checks and
+# point the proxy to the file via a header. 'X-Accel-Redirect' (nginx) redirects to the internal location specified by
+# SENDFILE_URL, which needs to be mapped to the media root by the proxy. 'X-Sendfile' (apache, lighttpd) uses the
+# absolute path of the file.
+SENDFILE_MODE = environ.get('SENDFILE_MODE', '')
+SENDFILE_URL = environ.get('SENDFILE_URL', '/protected_media/')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
 # number of items of overview paginations
 ITEMS_PER_PAGE = 12
 
+# cache used for derived library data, e.g. the sidebar of the pdf overview. the cache entries are keyed on the library
+# version of the user, so outdated entries are never used. by default each process has its own local memory cache. a
+# file based cache shared by all processes can be used by setting CACHE_DIR.
+if environ.get('CACHE_DIR'):  # pragma: no cover
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': environ.get('CACHE_DIR'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+LIBRARY_CACHE_TIMEOUT = int(environ.get('LIBRARY_CACHE_TIMEOUT', 24 * 60 * 60))
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
@@ -206,6 +254,32 @@ HUEY = {
 }
 
 CONSUME_DIR = BASE_DIR / 'consume'
+# files of the consume folder that could not be consumed are moved to this folder instead of being deleted
+CONSUME_QUARANTINE_DIR = CONSUME_DIR / 'quarantine'
+# number of files that are consumed and processed at once, which bounds the memory needed for large consume folders
+CONSUME_BATCH_SIZE = int(environ.get('CONSUME_BATCH_SIZE', 100))
+# files in the consume folder are only consumed by the watcher after their size and modification time did not change
+# for this number of seconds, so that files are not consumed while they are still written
+CONSUME_STABLE_SECONDS = float(environ.get('CONSUME_STABLE_SECONDS', 3))
+# interval in seconds of the snapshot based watching of the consume folder
+CONSUME_POLL_INTERVAL = float(environ.get('CONSUME_POLL_INTERVAL', 5))
+# number of worker processes used for processing the files when adding multiple pdfs at once
+INGEST_WORKERS = int(environ.get('INGEST_WORKERS', min(4, cpu_count() or 1)))
+# image format of the thumbnails and previews: PNG, WEBP or AVIF
+THUMBNAIL_FORMAT = environ.get('THUMBNAIL_FORMAT', 'PNG').upper()
+# number of files that are uploaded to minio at the same time during a backup
+BACKUP_UPLOAD_WORKERS = int(environ.get('BACKUP_UPLOAD_WORKERS', 4))
+# size of the parts of multipart uploads in MiB, at least 5 MiB
+BACKUP_PART_SIZE = int(environ.get('BACKUP_PART_SIZE', 16)) * 1024 * 1024
+# number of times the upload of a file is retried before the backup fails
+BACKUP_UPLOAD_RETRIES = int(environ.get('BACKUP_UPLOAD_RETRIES', 2))
+# the sqlite database is backed up in steps of this number of pages with a pause of this number of seconds in between,
+# so that writes are not stalled by the backup
+BACKUP_SQLITE_PAGES = int(environ.get('BACKUP_SQLITE_PAGES', 1024))
+BACKUP_SQLITE_SLEEP = float(environ.get('BACKUP_SQLITE_SLEEP', 0.05))
+# upload the backup of the sqlite database from memory instead of writing it to a temporary file first
+# backups compare the local files to a manifest of the uploaded files, which is reconciled with the bucket periodically
+BACKUP_RECONCILIATION_DAYS = int(environ.get('BACKUP_RECONCILIATION_DAYS', 7))
 
 log_level = environ.get('LOG_LEVEL', 'ERROR')
 
@@ -53,6 +53,7 @@ BACKUP_ENCRYPTION_SALT = 'pdfding'
 CONSUME_ENABLED = True
 CONSUME_TAG_STRING = 'consumed file'
 CONSUME_SKIP_EXISTING = True
+CONSUME_WATCH_MODE = ''
 
 ALLOW_PDF_SUB_DIRECTORIES = True
 
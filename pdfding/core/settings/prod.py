@@ -82,6 +82,8 @@ else:
 if environ.get('CONSUME_ENABLE') == 'TRUE':
     CONSUME_ENABLED = True
     CONSUME_TAG_STRING = environ.get('CONSUME_TAGS', '')
+    # watch the consume folder with 'INOTIFY' or 'SNAPSHOT' instead of scanning it every 5 minutes
+    CONSUME_WATCH_MODE = environ.get('CONSUME_WATCH_MODE', '').upper()
     if environ.get('CONSUME_SKIP_EXISTING') == 'FALSE':
         CONSUME_SKIP_EXISTING = False
     else:
@@ -89,6 +91,7 @@ if environ.get('CONSUME_ENABLE') == 'TRUE':
 else:
     CONSUME_ENABLED = False
     CONSUME_SKIP_EXISTING = False
+    CONSUME_WATCH_MODE = ''
 
 # mail settings
 if environ.get('EMAIL_BACKEND') == 'SMTP':
@@ -3,6 +3,7 @@ from pathlib import Path
 from unittest.mock import patch
 
 from django.contrib.auth.models import User
+from django.db.models import Value
 from django.test import override_settings
 from django.urls import reverse
 from helpers import PdfDingE2ETestCase
@@ -399,12 +400,12 @@ class PdfOverviewE2ETestCase(PdfDingE2ETestCase):
             expect(self.page.locator("#star-1")).to_contain_text("Star")
 
     @staticmethod
-    def new_fuzzy_filter_pdfs(pdfs, search):
-        filtered_pdfs = pdfs.filter(name__icontains=search)
+    def new_search_pdfs(pdfs, search, profile):
+        filtered_pdfs = pdfs.filter(name__icontains=search).annotate(search_rank=Value(0))
 
         return filtered_pdfs
 
-    @patch('pdf.views.pdf_views.OverviewMixin.fuzzy_filter_pdfs', new=new_fuzzy_filter_pdfs)
+    @patch('pdf.views.pdf_views.OverviewMixin.search_pdfs', new=new_search_pdfs)
     def test_archive(self):
         with sync_playwright() as p:
             self.open(f"{reverse('pdf_overview')}?search=pdf_4_14", p)
@@ -448,7 +449,7 @@ class PdfOverviewE2ETestCase(PdfDingE2ETestCase):
             expect(self.page.locator("#pdf-link-2")).to_contain_text("pdf_1_6")
             expect(self.page.locator("#pdf-link-3")).to_contain_text("pdf_1_1")
 
-    @patch('pdf.views.pdf_views.OverviewMixin.fuzzy_filter_pdfs', new=new_fuzzy_filter_pdfs)
+    @patch('pdf.views.pdf_views.OverviewMixin.search_pdfs', new=new_search_pdfs)
     def test_search_names(self):
         with sync_playwright() as p:
             # display the three pdfs with the tag 'tag'
@@ -461,7 +462,7 @@ class PdfOverviewE2ETestCase(PdfDingE2ETestCase):
             expect(self.page.locator("#pdf-link-3")).to_contain_text("pdf_2_2")
             expect(self.page.locator("#pdf-link-4")).not_to_be_visible()
 
-    @patch('pdf.views.pdf_views.OverviewMixin.fuzzy_filter_pdfs', new=new_fuzzy_filter_pdfs)
+    @patch('pdf.views.pdf_views.OverviewMixin.search_pdfs', new=new_search_pdfs)
     def test_search_names_and_tags(self):
         with sync_playwright() as p:
             # display the three pdfs with the tag 'tag'
@@ -534,7 +535,7 @@ class PdfOverviewE2ETestCase(PdfDingE2ETestCase):
 
         self.assertEqual(changed_user.profile.layout, Profile.LayoutChoice.GRID)
 
-    @patch('pdf.views.pdf_views.OverviewMixin.fuzzy_filter_pdfs', new=new_fuzzy_filter_pdfs)
+    @patch('pdf.views.pdf_views.OverviewMixin.search_pdfs', new=new_search_pdfs)
     def test_delete(self):
         with sync_playwright() as p:
             # only display one pdf
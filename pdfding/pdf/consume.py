@@ -0,0 +1,252 @@
+"""
+Watching of the consume folder. Instead of scanning the whole consume folder every 5 minutes, the watcher detects
+changed directories via inotify or, if inotify is not available, e.g. on network shares, by comparing snapshots of the
+modification times of the directories. Only changed directories are listed again. New files are consumed by a huey task
+as soon as they are completely written.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+logger = logging.getLogger('management')
+
+
+class InotifyChangeDetector:
+    """
+    Detect changed directories of the consume folder via inotify. Only available on linux. Only adding and removing
+    files are events, writing to a file is not, as the files that are still written are checked by the watcher anyway.
+    """
+
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    WATCH_MASK = IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self, consume_dir: Path):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+
+        if self.fd < 0:  # pragma: no cover
+            raise OSError(ctypes.get_errno(), 'Could not initialize inotify')
+
+        self.consume_dir = consume_dir
+        self.watched_dirs = dict()
+        self.watch(consume_dir)
+
+    def watch(self, directory: Path):
+        """Watch the directory if it is not watched already."""
+
+        if directory in self.watched_dirs.values():
+            return
+
+        watch_descriptor = self.libc.inotify_add_watch(self.fd, str(directory).encode(), self.WATCH_MASK)
+
+        if watch_descriptor < 0:  # pragma: no cover
+            raise OSError(ctypes.get_errno(), f'Could not watch {directory}')
+
+        self.watched_dirs[watch_descriptor] = directory
+
+    def get_changed_directories(self, timeout: float) -> set[Path]:
+        """Wait at most timeout seconds for changes and return the directories whose content changed."""
+
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+
+        if not readable:
+            return set()
+
+        changed_dirs = set()
+        buffer = os.read(self.fd, 64 * 1024)
+        offset = 0
+
+        while offset < len(buffer):
+            watch_descriptor, mask, _, name_length = self.EVENT_HEADER.unpack_from(buffer, offset)
+            offset += self.EVENT_HEADER.size + name_length
+
+            if mask & self.IN_Q_OVERFLOW:
+                # events were lost, therefore all directories need to be checked
+                changed_dirs.update(self.watched_dirs.values())
+            elif mask & self.IN_IGNORED:
+                self.watched_dirs.pop(watch_descriptor, None)
+            elif watch_descriptor in self.watched_dirs:
+                changed_dirs.add(self.watched_dirs[watch_descriptor])
+
+        return changed_dirs
+
+    def close(self):
+        os.close(self.fd)
+
+
+class SnapshotChangeDetector:
+    """
+    Detect changed directories of the consume folder by comparing the modification times of the directories. Adding
+    or removing a file changes the modification time of its directory, so only the directories need to be checked.
+    """
+
+    def __init__(self, consume_dir: Path, poll_interval: float):
+        self.consume_dir = consume_dir
+        self.poll_interval = poll_interval
+        self.snapshot = dict()
+        self.last_check = time.monotonic()
+
+    def watch(self, directory: Path):
+        """Add the directory to the snapshot if it is not part of it already."""
+
+        if directory not in self.snapshot:
+            self.snapshot[directory] = directory.stat().st_mtime_ns
+
+    def get_changed_directories(self, timeout: float) -> set[Path]:
+        """
+        Wait timeout seconds and return the directories whose content changed. The directories are only checked once
+        per poll interval.
+        """
+
+        time.sleep(timeout)
+
+        if time.monotonic() - self.last_check < self.poll_interval:
+            return set()
+
+        self.last_check = time.monotonic()
+        changed_dirs = set()
+
+        for directory, modification_time in list(self.snapshot.items()):
+            try:
+                new_modification_time = directory.stat().st_mtime_ns
+            except FileNotFoundError:
+                new_modification_time = None
+                self.snapshot.pop(directory)
+
+            if new_modification_time != modification_time:
+                changed_dirs.add(directory)
+
+                if new_modification_time is not None:
+                    self.snapshot[directory] = new_modification_time
+
+        return changed_dirs
+
+    def close(self):
+        pass
+
+
+@dataclass
+class ConsumeFile:
+    size: int
+    modification_time: int
+    stable_since: float = field(default_factory=time.monotonic)
+    enqueued: bool = False
+
+
+class ConsumeWatcher:
+    """
+    Watcher of the consume folder. The files of changed user directories are tracked and enqueued for consumption as
+    soon as their size and modification time did not change for stable_seconds.
+    """
+
+    def __init__(self, consume_dir: Path, change_detector, stable_seconds: float, enqueue):
+        self.consume_dir = consume_dir
+        self.change_detector = change_detector
+        self.stable_seconds = stable_seconds
+        self.enqueue = enqueue
+        self.files: dict[Path, ConsumeFile] = dict()
+
+    def start(self):
+        """Watch the consume folder and all user directories and pick up files already present."""
+
+        self.consume_dir.mkdir(exist_ok=True)
+        self.change_detector.watch(self.consume_dir)
+        self.update_directories({self.consume_dir})
+
+    def run_once(self, timeout: float = 1):
+        """Wait for changes, update the tracked files and enqueue the files that are completely written."""
+
+        changed_dirs = self.change_detector.get_changed_directories(timeout)
+        self.update_directories(changed_dirs)
+        self.enqueue_stable_files()
+
+    def run(self, should_stop=lambda: False):  # pragma: no cover
+        """Run the watcher until should_stop returns True."""
+
+        self.start()
+
+        try:
+            while not should_stop():
+                self.run_once()
+        finally:
+            self.change_detector.close()
+
+    def update_directories(self, changed_dirs: set[Path]):
+        """List the changed directories again. New user directories are watched as well."""
+
+        if self.consume_dir in changed_dirs:
+            # user directories might have been removed as well
+            changed_dirs.update(file_path.parent for file_path in self.files)
+
+            for user_dir in self.consume_dir.iterdir():
+                if user_dir.is_dir() and user_dir.name.isdigit():
+                    self.change_detector.watch(user_dir)
+                    changed_dirs.add(user_dir)
+
+        for user_dir in changed_dirs - {self.consume_dir}:
+            file_paths = {path for path in user_dir.iterdir() if path.is_file()} if user_dir.is_dir() else set()
+
+            # forget files that were consumed or removed
+            for file_path in [path for path in self.files if path.parent == user_dir and path not in file_paths]:
+                self.files.pop(file_path)
+
+            for file_path in file_paths - self.files.keys():
+                self.update_file(file_path)
+
+    def update_file(self, file_path: Path):
+        """Track the size and modification time of the file. If they changed the file is not stable anymore."""
+
+        try:
+            stat_result = file_path.stat()
+        except FileNotFoundError:
+            self.files.pop(file_path, None)
+
+            return
+
+        consume_file = self.files.get(file_path)
+
+        if consume_file is None or (consume_file.size, consume_file.modification_time) != (
+            stat_result.st_size,
+            stat_result.st_mtime_ns,
+        ):
+            self.files[file_path] = ConsumeFile(stat_result.st_size, stat_result.st_mtime_ns)
+
+    def enqueue_stable_files(self):
+        """Enqueue the files whose size and modification time did not change for stable_seconds."""
+
+        for file_path, consume_file in list(self.files.items()):
+            if consume_file.enqueued:
+                continue
+
+            self.update_file(file_path)
+            consume_file = self.files.get(file_path)
+
+            if consume_file and time.monotonic() - consume_file.stable_since >= self.stable_seconds:
+                consume_file.enqueued = True
+                self.enqueue(int(file_path.parent.name), str(file_path))
+                logger.info(f'Enqueued "{file_path.name}" of user "{file_path.parent.name}" for consumption')
+
+
+def get_change_detector(consume_dir: Path, watch_mode: str, poll_interval: float):
+    """Get the change detector of the watch mode. If inotify is not available, snapshots are used instead."""
+
+    if watch_mode == 'INOTIFY':
+        try:
+            return InotifyChangeDetector(consume_dir)
+        except (AttributeError, OSError):  # pragma: no cover
+            logger.info('Inotify is not available, falling back to snapshots for watching the consume folder')
+
+    return SnapshotChangeDetector(consume_dir, poll_interval)
@@ -0,0 +1,348 @@
+"""
+Processing of pdf files that does not need the database. The functions of this module are executed in the worker
+processes of the bulk ingest, therefore they must not use django. The results are written to the database by the
+parent process.
+"""
+
+import ctypes
+import re
+import traceback
+from dataclasses import dataclass, field
+from datetime import datetime
+from hashlib import sha256
+from io import BytesIO
+from math import floor
+
+import pypdfium2.raw as pdfium_c
+from PIL import Image, ImageChops
+from pypdfium2 import PdfDocument
+
+# options for encoding the thumbnails and previews in the supported image formats
+IMAGE_SAVE_OPTIONS = {
+    'PNG': {},
+    'WEBP': {'quality': 80, 'method': 4},
+    'AVIF': {'quality': 60, 'speed': 8},
+}
+
+
+@dataclass
+class Annotation:
+    kind: str  # 'comment' or 'highlight'
+    text: str
+    page: int
+    creation_date: datetime
+
+
+@dataclass
+class ProcessingResult:
+    pdf_id: str
+    success: bool = False
+    number_of_pages: int = -1
+    thumbnail: bytes | None = None
+    preview: bytes | None = None
+    image_format: str = 'PNG'
+    page_texts: list[str] | None = None
+    annotations: list[Annotation] | None = None
+    annotation_fingerprints: dict[str, str] | None = None
+    errors: list[str] = field(default_factory=list)
+
+
+def process_pdf_file(pdf_id: str, file_path: str, image_format: str = 'PNG') -> ProcessingResult:
+    """
+    Process a pdf file: get the number of pages, render the thumbnail and preview in the provided image format, extract
+    the page texts and parse the highlights and comments. Failing steps do not stop the processing, their tracebacks
+    are added to the errors.
+    """
+
+    result = ProcessingResult(pdf_id=pdf_id, image_format=image_format)
+
+    try:
+        pdf_document = PdfDocument(file_path, autoclose=True)
+    except Exception:  # nosec # noqa
+        result.errors.append(traceback.format_exc())
+
+        return result
+
+    result.success = True
+    result.number_of_pages = len(pdf_document)
+
+    try:
+        images = render_thumbnail_and_preview(pdf_document, image_format=image_format)
+        result.thumbnail, result.preview = images['thumbnail'].getvalue(), images['preview'].getvalue()
+    except Exception:  # nosec # noqa
+        result.errors.append(traceback.format_exc())
+
+    try:
+        result.page_texts = extract_page_texts(pdf_document)
+    except Exception:  # nosec # noqa
+        result.errors.append(traceback.format_exc())
+
+    pdf_document.close()
+
+    try:
+        annotations_by_page, result.annotation_fingerprints = extract_changed_annotations(file_path)
+        result.annotations = [annotation for annotations in annotations_by_page.values() for annotation in annotations]
+    except Exception:  # nosec # noqa
+        result.errors.append(traceback.format_exc())
+
+    return result
+
+
+def render_thumbnail_and_preview(
+    pdf_document: PdfDocument,
+    desired_thumbnail_width: int = 135,
+    desired_thumbnail_width_height_ratio: float = 0.77,
+    desired_preview_width: int = 450,
+    image_format: str = 'PNG',
+) -> dict[str, BytesIO]:
+    """
+    Render the thumbnail and the preview image of the first page. The page is rendered only once at the larger of the
+    two widths and the smaller image is downsampled from it. Annotations and forms are not rendered and pages without
+    colour are encoded as grayscale images.
+    """
+
+    page = pdf_document[0]
+    preview_width_height_ratio = page.get_width() / page.get_height()
+
+    render_width = max(desired_thumbnail_width, desired_preview_width)
+    bitmap = page.render(
+        scale=render_width / page.get_width(),
+        may_draw_forms=False,
+        draw_annots=False,
+        limit_image_cache=True,
+        rev_byteorder=True,
+    )
+    rendered_image = convert_to_grayscale_if_colourless(bitmap.to_pil())
+
+    image_files = dict()
+    for image_name, desired_width, desired_ratio in zip(
+        ['thumbnail', 'preview'],
+        [desired_thumbnail_width, desired_preview_width],
+        [desired_thumbnail_width_height_ratio, preview_width_height_ratio],
+    ):
+        pil_image = rendered_image
+
+        if desired_width != rendered_image.width:
+            scaled_height = max(1, round(rendered_image.height * desired_width / rendered_image.width))
+            pil_image = rendered_image.resize((desired_width, scaled_height), Image.Resampling.LANCZOS)
+
+        desired_height = round(desired_width / desired_ratio)
+        width, height = pil_image.size
+
+        # we crop the image as we want a thumbnail with a ratio of 1.9 x 1. If the image is large enough we also
+        # want the thumbnail not to start at the top but instead with a little offset
+        height_diff = height - desired_height
+        if image_name == 'thumbnail' and height_diff > 0:
+            offset = floor(0.15 * height_diff)
+            pil_image = pil_image.crop((0, offset, desired_width, desired_height + offset))
+
+        image_files[image_name] = encode_image(pil_image, image_format)
+
+    return image_files
+
+
+def convert_to_grayscale_if_colourless(pil_image: Image.Image) -> Image.Image:
+    """Convert an rgb image to a grayscale image if it has no colour, as grayscale images are encoded smaller."""
+
+    if pil_image.mode != 'RGB':
+        return pil_image
+
+    red, green, blue = pil_image.split()
+
+    if ImageChops.difference(red, green).getbbox() or ImageChops.difference(green, blue).getbbox():
+        return pil_image
+
+    return pil_image.convert('L')
+
+
+def encode_image(pil_image: Image.Image, image_format: str) -> BytesIO:
+    """Encode the image in one of the supported image formats: PNG, WEBP or AVIF."""
+
+    image_io = BytesIO()
+    pil_image.save(image_io, format=image_format, **IMAGE_SAVE_OPTIONS[image_format])
+
+    return image_io
+
+
+def extract_page_texts(pdf_document: PdfDocument) -> list[str]:
+    """Extract the text of each page."""
+
+    page_texts = []
+
+    for page in pdf_document:
+        text_page = page.get_textpage()
+        text = text_page.get_text_bounded()
+        text_page.close()
+        page.close()
+
+        # null characters cannot be stored in postgres text fields
+        page_texts.append(text.replace('\x00', ''))
+
+    return page_texts
+
+
+def extract_annotations(file) -> list[Annotation]:
+    """Extract the highlights and comments of a pdf file. The file can either be a path or a file object."""
+
+    annotations_by_page, _ = extract_changed_annotations(file)
+
+    return [annotation for page_annotations in annotations_by_page.values() for annotation in page_annotations]
+
+
+def extract_changed_annotations(
+    file, fingerprints: dict[str, str] | None = None
+) -> tuple[dict[int, list[Annotation]], dict[str, str]]:
+    """
+    Extract the highlights and comments of the pages whose annotations changed. The file is parsed once with the
+    annotation api of pdfium. A page is only extracted if the fingerprint of its annotations differs from the provided
+    fingerprint of the last extraction, as the fingerprint is much cheaper to calculate than the highlighted texts. If
+    no fingerprints are provided, all pages are extracted.
+
+    Returns the annotations of the extracted pages, pages whose annotations were removed map to an empty list, and the
+    fingerprints of all pages with annotations.
+    """
+
+    annotations_by_page = dict()
+    new_fingerprints = dict()
+    pdf_document = PdfDocument(file, autoclose=True)
+
+    for i, page in enumerate(pdf_document):
+        page_annotations = get_page_annotations(page)
+
+        try:
+            fingerprint = get_annotations_fingerprint(page_annotations)
+
+            if fingerprint:
+                new_fingerprints[str(i + 1)] = fingerprint
+
+            if fingerprints is None or fingerprints.get(str(i + 1), '') != fingerprint:
+                annotations_by_page[i + 1] = extract_page_annotations(page, i + 1, page_annotations)
+        finally:
+            for annotation, _ in page_annotations:
+                pdfium_c.FPDFPage_CloseAnnot(annotation)
+
+        page.close()
+
+    pdf_document.close()
+
+    # the annotations of removed pages need to be removed as well
+    for page_key in (fingerprints or dict()).keys() - new_fingerprints.keys():
+        annotations_by_page.setdefault(int(page_key), [])
+
+    return annotations_by_page, new_fingerprints
+
+
+def get_page_annotations(page) -> list[tuple]:
+    """
+    Get the pdfium handles and types of the highlights and comments of a page. The handles need to be closed by the
+    caller.
+    """
+
+    page_annotations = []
+
+    for i in range(pdfium_c.FPDFPage_GetAnnotCount(page)):
+        annotation = pdfium_c.FPDFPage_GetAnnot(page, i)
+        annotation_type = pdfium_c.FPDFAnnot_GetSubtype(annotation)
+
+        if annotation_type in [pdfium_c.FPDF_ANNOT_FREETEXT, pdfium_c.FPDF_ANNOT_HIGHLIGHT]:
+            page_annotations.append((annotation, annotation_type))
+        else:
+            pdfium_c.FPDFPage_CloseAnnot(annotation)
+
+    return page_annotations
+
+
+def get_annotations_fingerprint(page_annotations: list[tuple]) -> str:
+    """
+    Get the fingerprint of the highlights and comments of a page. The fingerprint is a hash of the values of the
+    annotation dictionaries the extraction depends on. Pages without highlights and comments have an empty fingerprint.
+    """
+
+    if not page_annotations:
+        return ''
+
+    fingerprint = sha256()
+
+    for annotation, annotation_type in page_annotations:
+        values = [str(annotation_type)] + [
+            get_annotation_string(annotation, key) for key in ['CreationDate', 'M', 'Contents']
+        ]
+        values += [repr(quad_points) for quad_points in get_quad_points(annotation)]
+        fingerprint.update('\x1f'.join(values).encode() + b'\x1e')
+
+    return fingerprint.hexdigest()
+
+
+def extract_page_annotations(page, page_number: int, page_annotations: list[tuple]) -> list[Annotation]:
+    """Extract the highlights and comments of a page. The text page is only loaded if the page has highlights."""
+
+    annotations = []
+    text_page = None
+
+    for annotation, annotation_type in page_annotations:
+        date_time_string = f'{get_annotation_string(annotation, 'CreationDate').split(':')[-1]}-+00:00'
+        creation_date = datetime.strptime(date_time_string, '%Y%m%d%H%M%S-%z')
+
+        if annotation_type == pdfium_c.FPDF_ANNOT_FREETEXT:
+            comment_text = get_annotation_string(annotation, 'Contents')
+            annotations.append(Annotation('comment', comment_text, page_number, creation_date))
+        else:
+            text_page = text_page or page.get_textpage()
+            highlight_text = extract_highlight_text(annotation, text_page)
+            annotations.append(Annotation('highlight', highlight_text, page_number, creation_date))
+
+    if text_page:
+        text_page.close()
+
+    return annotations
+
+
+def get_annotation_string(annotation, key: str) -> str:
+    """Get a string value, e.g. the contents, of a pdfium annotation."""
+
+    # the length is in bytes and includes the utf-16 null terminator
+    length = pdfium_c.FPDFAnnot_GetStringValue(annotation, key.encode(), None, 0)
+
+    if length <= 2:
+        return ''
+
+    buffer = ctypes.create_string_buffer(length)
+    pdfium_c.FPDFAnnot_GetStringValue(
+        annotation, key.encode(), ctypes.cast(buffer, ctypes.POINTER(ctypes.c_ushort)), length
+    )
+
+    return buffer.raw[: length - 2].decode('utf-16-le')
+
+
+def get_quad_points(annotation) -> list[tuple[float, ...]]:
+    """
+    Get the quad points of a pdfium annotation. Every highlighted line is represented by a quadrilateral, its points
+    are ordered top left, top right, bottom left and bottom right.
+    """
+
+    quad_points = []
+    points = pdfium_c.FS_QUADPOINTSF()
+
+    for i in range(pdfium_c.FPDFAnnot_CountAttachmentPoints(annotation)):
+        pdfium_c.FPDFAnnot_GetAttachmentPoints(annotation, i, points)
+        quad_points.append((points.x1, points.y1, points.x2, points.y2, points.x3, points.y3, points.x4, points.y4))
+
+    return quad_points
+
+
+def extract_highlight_text(annotation, text_page) -> str:
+    """Extract the text from a pdfium highlight annotation"""
+
+    highlight_lines = []
+
+    for x1, y1, x2, _, _, y3, _, _ in get_quad_points(annotation):
+        text = text_page.get_text_bounded(left=x1, bottom=y3, right=x2, top=y1)
+
+        # sometimes the same line is present multiple times, we only want one
+        if not highlight_lines or text != highlight_lines[-1]:
+            highlight_lines.append(text)
+
+    highlight_text = ' '.join(highlight_lines).strip()
+    highlight_text = re.sub(r'\s+', ' ', highlight_text)
+
+    return highlight_text
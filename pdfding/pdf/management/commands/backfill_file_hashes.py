@@ -0,0 +1,36 @@
+import logging
+
+from django.core.management.base import BaseCommand
+from pdf import tasks
+
+logger = logging.getLogger('management')
+
+
+class Command(BaseCommand):
+    help = "Calculate the content hashes of existing PDFs used for detecting duplicates"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Number of PDFs updated at once')
+        parser.add_argument(
+            '--background', action='store_true', help='Calculate the hashes in the background with the huey consumer'
+        )
+
+    def handle(self, *args, **kwargs):
+        batch_size = kwargs['batch_size']
+
+        if kwargs.get('background'):
+            tasks.backfill_file_hashes_task(batch_size)
+            logger.info('Enqueued calculating the content hashes of PDFs.')
+
+            return
+
+        last_id = None
+        processed = 0
+
+        logger.info('Calculating the content hashes of PDFs')
+
+        while (last_id := tasks.backfill_file_hashes(batch_size, last_id)) is not None:
+            processed += batch_size
+            logger.info(f'Processed up to {processed} PDFs')
+
+        logger.info('Calculating content hashes completed.')
@@ -0,0 +1,36 @@
+import logging
+
+from django.core.management.base import BaseCommand
+from pdf.models import Pdf
+from pdf.service import PdfProcessingServices
+from pypdfium2 import PdfDocument
+
+logger = logging.getLogger('management')
+
+
+class Command(BaseCommand):
+    help = "Extract the page texts of existing PDFs for the full-text search"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Also re-extract PDFs that already have page texts')
+
+    def handle(self, *args, **kwargs):
+        pdfs = Pdf.objects.select_related('owner__user').order_by('creation_date')
+
+        if not kwargs.get('all'):
+            pdfs = pdfs.filter(pdfpagetext__isnull=True)
+
+        logger.info('Extracting the page texts of PDFs')
+
+        for i, pdf in enumerate(pdfs.iterator(chunk_size=100)):
+            try:
+                pdf_document = PdfDocument(pdf.file.path, autoclose=True)
+                PdfProcessingServices.set_page_texts(pdf, pdf_document)
+                pdf_document.close()
+            except Exception:  # nosec # noqa
+                logger.info(f'Could not open "{pdf.name}" of user "{pdf.owner.user.email}"')
+
+            if (i + 1) % 100 == 0:  # pragma: no cover
+                logger.info(f'Processed {i + 1} PDFs')
+
+        logger.info('Extracting page texts completed.')
@@ -0,0 +1,34 @@
+import logging
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from pdf import consume, tasks
+
+logger = logging.getLogger('management')
+
+
+class Command(BaseCommand):
+    help = "Watch the consume folder and consume new files as soon as they are completely written"
+
+    def handle(self, *args, **kwargs):
+        if not settings.CONSUME_ENABLED or not settings.CONSUME_WATCH_MODE:
+            logger.info('Watching the consume folder is not enabled.')
+
+            return
+
+        change_detector = consume.get_change_detector(
+            settings.CONSUME_DIR, settings.CONSUME_WATCH_MODE, settings.CONSUME_POLL_INTERVAL
+        )
+        watcher = consume.ConsumeWatcher(
+            settings.CONSUME_DIR, change_detector, settings.CONSUME_STABLE_SECONDS, tasks.consume_file_task
+        )
+
+        # the periodic consume task is skipped in watch mode, so an interrupted consume run is resumed here
+        tasks.resume_consume()
+
+        stop_requested = []
+        signal.signal(signal.SIGTERM, lambda *_: stop_requested.append(True))
+
+        logger.info(f'Watching the consume folder with {type(change_detector).__name__}.')
+        watcher.run(should_stop=lambda: bool(stop_requested))
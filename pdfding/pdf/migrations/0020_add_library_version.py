@@ -0,0 +1,28 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pdf', '0019_add_folder_model'),
+        ('users', '0022_add_signatures'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LibraryVersion',
+            fields=[
+                (
+                    'owner',
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        serialize=False,
+                        to='users.profile',
+                    ),
+                ),
+                ('version', models.IntegerField(default=0)),
+            ],
+        ),
+    ]
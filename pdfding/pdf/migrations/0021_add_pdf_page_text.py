@@ -0,0 +1,77 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+SQLITE_CREATE = [
+    """
+    CREATE VIRTUAL TABLE pdf_pdfpagetext_fts USING fts5(
+        text, content='pdf_pdfpagetext', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER pdf_pdfpagetext_fts_insert AFTER INSERT ON pdf_pdfpagetext BEGIN
+        INSERT INTO pdf_pdfpagetext_fts(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER pdf_pdfpagetext_fts_delete AFTER DELETE ON pdf_pdfpagetext BEGIN
+        INSERT INTO pdf_pdfpagetext_fts(pdf_pdfpagetext_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    END
+    """,
+    """
+    CREATE TRIGGER pdf_pdfpagetext_fts_update AFTER UPDATE ON pdf_pdfpagetext BEGIN
+        INSERT INTO pdf_pdfpagetext_fts(pdf_pdfpagetext_fts, rowid, text) VALUES ('delete', old.id, old.text);
+        INSERT INTO pdf_pdfpagetext_fts(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+]
+
+SQLITE_DROP = [
+    'DROP TRIGGER IF EXISTS pdf_pdfpagetext_fts_update',
+    'DROP TRIGGER IF EXISTS pdf_pdfpagetext_fts_delete',
+    'DROP TRIGGER IF EXISTS pdf_pdfpagetext_fts_insert',
+    'DROP TABLE IF EXISTS pdf_pdfpagetext_fts',
+]
+
+POSTGRES_CREATE = [
+    "CREATE INDEX pdf_pdfpagetext_text_gin ON pdf_pdfpagetext USING GIN (to_tsvector('simple', text))",
+]
+
+POSTGRES_DROP = [
+    'DROP INDEX IF EXISTS pdf_pdfpagetext_text_gin',
+]
+
+
+def create_full_text_index(apps, schema_editor):
+    """Create the full-text index of the page texts. The index depends on the used database."""
+
+    statements = {'sqlite': SQLITE_CREATE, 'postgresql': POSTGRES_CREATE}.get(schema_editor.connection.vendor, [])
+
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_full_text_index(apps, schema_editor):  # pragma: no cover
+    statements = {'sqlite': SQLITE_DROP, 'postgresql': POSTGRES_DROP}.get(schema_editor.connection.vendor, [])
+
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pdf', '0020_add_library_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PdfPageText',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page', models.IntegerField()),
+                ('text', models.TextField(blank=True)),
+                ('pdf', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='pdf.pdf')),
+            ],
+        ),
+        migrations.RunPython(create_full_text_index, drop_full_text_index),
+    ]
@@ -0,0 +1,64 @@
+from django.db import migrations, models
+
+
+def set_folder_paths_and_pdf_counts(apps, schema_editor):
+    """Set the materialized paths and the pdf counts of the existing folders."""
+
+    Folder = apps.get_model('pdf', 'Folder')
+    Pdf = apps.get_model('pdf', 'Pdf')
+
+    folders = {folder.id: folder for folder in Folder.objects.all()}
+    direct_pdf_counts = {
+        pdf_count['folder_id']: pdf_count['count']
+        for pdf_count in Pdf.objects.filter(folder__isnull=False)
+        .order_by()
+        .values('folder_id')
+        .annotate(count=models.Count('id'))
+    }
+
+    def get_path(folder) -> str:
+        if not folder.path:
+            parent = folders.get(folder.parent_id)
+            parent_path = get_path(parent) if parent else '/'
+            folder.path = f'{parent_path}{folder.id.hex}/'
+
+        return folder.path
+
+    for folder in folders.values():
+        get_path(folder)
+        folder.direct_pdf_count = direct_pdf_counts.get(folder.id, 0)
+
+    folders_by_hex = {folder.id.hex: folder for folder in folders.values()}
+
+    for folder in folders.values():
+        # every folder contributes its pdfs to itself and all its ancestors
+        for ancestor_id in folder.path.strip('/').split('/'):
+            folders_by_hex[ancestor_id].pdf_count += folder.direct_pdf_count
+
+    Folder.objects.bulk_update(folders.values(), ['path', 'direct_pdf_count', 'pdf_count'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pdf', '0021_add_pdf_page_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='folder',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=2000),
+        ),
+        migrations.AddField(
+            model_name='folder',
+            name='direct_pdf_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='folder',
+            name='pdf_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(set_folder_paths_and_pdf_counts, migrations.RunPython.noop),
+    ]
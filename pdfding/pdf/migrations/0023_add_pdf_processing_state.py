@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pdf', '0022_add_folder_path_and_pdf_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pdf',
+            name='processing_state',
+            field=models.CharField(
+                choices=[('Pending', 'Pending'), ('Ready', 'Ready'), ('Failed', 'Failed')],
+                default='Ready',
+                editable=False,
+                max_length=7,
+            ),
+        ),
+    ]
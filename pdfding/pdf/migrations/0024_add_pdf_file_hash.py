@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pdf', '0023_add_pdf_processing_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pdf',
+            name='file_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='pdf',
+            index=models.Index(fields=['owner', 'file_hash'], name='pdf_owner_file_hash_idx'),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pdf', '0024_add_pdf_file_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pdf',
+            name='annotation_fingerprints',
+            field=models.JSONField(default=None, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pdf', '0025_add_pdf_annotation_fingerprints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsumeJournalEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_path', models.CharField(max_length=1000, unique=True)),
+                ('file_hash', models.CharField(max_length=64)),
+                (
+                    'state',
+                    models.CharField(
+                        choices=[('Created', 'Created'), ('Removed', 'Removed')], default='Created', max_length=7
+                    ),
+                ),
+                ('pdf', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='pdf.pdf')),
+            ],
+        ),
+    ]
@@ -1,14 +1,15 @@
 import re
 from datetime import datetime, timezone
 from pathlib import Path
-from uuid import uuid4
+from uuid import UUID, uuid4
 
 import markdown
 import nh3
 from core.settings import MEDIA_ROOT
 from django.contrib.humanize.templatetags.humanize import naturaltime
 from django.db import models
-from django.db.models import DateTimeField
+from django.db.models import DateTimeField, F, Value
+from django.db.models.functions import Concat, Substr
 from django.utils.safestring import mark_safe
 from users.models import Profile
 
@@ -41,7 +42,14 @@ class Tag(models.Model):
 
 
 class Folder(models.Model):
-    """The model for folders used for organizing PDF files."""
+    """
+    The model for folders used for organizing PDF files.
+
+    Each folder stores its materialized path, i.e. the ids of its ancestors and itself, e.g. '/<root id>/<own id>/'. The
+    subtree of a folder can therefore be selected with a single prefix match. The number of PDFs directly inside the
+    folder and inside its whole subtree are stored as well. They are kept up to date by the PDF signals and when folders
+    are moved or deleted.
+    """
 
     id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
     name = models.CharField(max_length=100, null=False, blank=False)
@@ -49,6 +57,9 @@ class Folder(models.Model):
     owner = models.ForeignKey(Profile, on_delete=models.CASCADE)
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='subfolders')
     creation_date = models.DateTimeField(blank=False, editable=False, auto_now_add=True)
+    path = models.CharField(max_length=2000, default='', editable=False, db_index=True)
+    direct_pdf_count = models.IntegerField(default=0, editable=False)
+    pdf_count = models.IntegerField(default=0, editable=False)
 
     class Meta:
         unique_together = ['name', 'owner', 'parent']
@@ -57,12 +68,42 @@ class Folder(models.Model):
     def __str__(self):  # pragma: no cover
         return str(self.name)
 
+    def save(self, *args, **kwargs):
+        """
+        Save the folder and update its materialized path. If the folder was moved, the paths of its subfolders and the
+        PDF counts of the old and new ancestors are updated as well.
+        """
+
+        old_path = None
+        stored_values = Folder.objects.filter(id=self.id).values_list('path', 'direct_pdf_count', 'pdf_count').first()
+
+        if stored_values:
+            # the pdf counts are maintained in the db, the values of this instance might be outdated
+            old_path, self.direct_pdf_count, self.pdf_count = stored_values
+
+        if self.parent_id:
+            parent_path = Folder.objects.filter(id=self.parent_id).values_list('path', flat=True).get()
+        else:
+            parent_path = '/'
+
+        self.path = f'{parent_path}{self.id.hex}/'
+
+        super().save(*args, **kwargs)
+
+        if old_path and old_path != self.path:
+            Folder.objects.filter(path__startswith=old_path).exclude(id=self.id).update(
+                path=Concat(Value(self.path), Substr('path', len(old_path) + 1), output_field=models.CharField())
+            )
+            Folder.update_pdf_counts(self.get_ancestor_ids(old_path) + self.get_ancestor_ids(self.path))
+
     @property
     def full_path(self):
         """Get the full path of the folder including parent folders."""
-        if self.parent:
-            return f"{self.parent.full_path}/{self.name}"
-        return self.name
+
+        ancestor_ids = self.get_ancestor_ids(self.path)
+        ancestor_names = dict(Folder.objects.filter(id__in=ancestor_ids).values_list('id', 'name'))
+
+        return '/'.join([ancestor_names[ancestor_id] for ancestor_id in ancestor_ids] + [self.name])
 
     @property
     def natural_age(self) -> str:  # pragma: no cover
@@ -74,10 +115,40 @@ class Folder(models.Model):
 
     def get_pdf_count(self):
         """Get the number of PDFs in this folder and all subfolders."""
-        count = self.pdfs.count()
-        for subfolder in self.subfolders.all():
-            count += subfolder.get_pdf_count()
-        return count
+
+        return self.pdf_count
+
+    @staticmethod
+    def get_ancestor_ids(path: str) -> list[UUID]:
+        """Get the ids of the ancestors of a folder from its materialized path. The root folder comes first."""
+
+        return [UUID(folder_id) for folder_id in path.strip('/').split('/')[:-1] if folder_id]
+
+    @classmethod
+    def change_pdf_count(cls, folder_id: UUID, difference: int):
+        """Change the PDF counts of a folder and its ancestors, e.g. after a PDF was added to the folder."""
+
+        path = cls.objects.filter(id=folder_id).values_list('path', flat=True).first()
+
+        if path is None:
+            return
+
+        cls.objects.filter(id=folder_id).update(direct_pdf_count=F('direct_pdf_count') + difference)
+        cls.objects.filter(id__in=cls.get_ancestor_ids(path) + [folder_id]).update(
+            pdf_count=F('pdf_count') + difference
+        )
+
+    @classmethod
+    def update_pdf_counts(cls, folder_ids: list[UUID]):
+        """Recalculate the PDF counts of the specified folders, e.g. after a subfolder was moved or deleted."""
+
+        folders = list(cls.objects.filter(id__in=set(folder_ids)))
+
+        for folder in folders:
+            folder.direct_pdf_count = Pdf.objects.filter(folder_id=folder.id).count()
+            folder.pdf_count = Pdf.objects.filter(folder__path__startswith=folder.path).count()
+
+        cls.objects.bulk_update(folders, ['direct_pdf_count', 'pdf_count'])
 
 
 def get_file_path(instance, filename):
@@ -165,19 +236,19 @@ def delete_empty_dirs_after_rename_or_delete(pdf_current_file_name: str, user_id
             break
 
 
-def get_thumbnail_path(instance, _):
-    """Get the file path for the thumbnail of a PDF."""
+def get_thumbnail_path(instance, file_name: str):
+    """Get the file path for the thumbnail of a PDF. The suffix depends on the image format of the thumbnail."""
 
-    file_name = f'thumbnails/{instance.id}.png'
+    file_name = f'thumbnails/{instance.id}{Path(file_name).suffix or '.png'}'
     file_path = '/'.join([str(instance.owner.user.id), file_name])
 
     return str(file_path)
 
 
-def get_preview_path(instance, _):
-    """Get the file path for the preview of a PDF."""
+def get_preview_path(instance, file_name: str):
+    """Get the file path for the preview of a PDF. The suffix depends on the image format of the preview."""
 
-    file_name = f'previews/{instance.id}.png'
+    file_name = f'previews/{instance.id}{Path(file_name).suffix or '.png'}'
     file_path = '/'.join([str(instance.owner.user.id), file_name])
 
     return str(file_path)
@@ -210,6 +281,15 @@ def convert_to_natural_age(creation_date: DateTimeField):
 class Pdf(models.Model):
     """Model for the pdf files."""
 
+    class ProcessingState(models.TextChoices):
+        """The state of the background processing creating the derived data, e.g. thumbnail, of a new pdf."""
+
+        PENDING = 'Pending'
+        READY = 'Ready'
+        FAILED = 'Failed'
+
+    # fingerprints of the annotations per page at the last extraction, None if the annotations were never extracted
+    annotation_fingerprints = models.JSONField(null=True, default=None, editable=False)
     archived = models.BooleanField(default=False)
     creation_date = models.DateTimeField(blank=False, editable=False, auto_now_add=True)
     current_page = models.IntegerField(default=1)
@@ -221,6 +301,8 @@ class Pdf(models.Model):
         help_text='Optional, save file in a sub directory of the pdf directory, e.g: important/pdfs',
     )
     file = models.FileField(upload_to=get_file_path, max_length=1000, blank=False)
+    # sha-256 hash of the file content used for detecting duplicates
+    file_hash = models.CharField(max_length=64, default='', blank=True, editable=False)
     id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
     last_viewed_date = models.DateTimeField(
         blank=False, editable=False, default=datetime(2000, 1, 1, tzinfo=timezone.utc)
@@ -230,6 +312,9 @@ class Pdf(models.Model):
     number_of_pages = models.IntegerField(default=-1)
     owner = models.ForeignKey(Profile, on_delete=models.CASCADE, blank=False)
     preview = models.FileField(upload_to=get_preview_path, null=True, blank=False)
+    processing_state = models.CharField(
+        choices=ProcessingState.choices, max_length=7, default=ProcessingState.READY, editable=False
+    )
     revision = models.IntegerField(default=0)
     starred = models.BooleanField(default=False)
     tags = models.ManyToManyField(Tag, blank=True)
@@ -237,6 +322,9 @@ class Pdf(models.Model):
     views = models.IntegerField(default=0)
     folder = models.ForeignKey(Folder, on_delete=models.SET_NULL, null=True, blank=True, related_name='pdfs')
 
+    class Meta:
+        indexes = [models.Index(fields=['owner', 'file_hash'], name='pdf_owner_file_hash_idx')]
+
     def __str__(self):
         return self.name  # pragma: no cover
 
@@ -331,6 +419,20 @@ class PdfHighlight(PdfAnnotation):
     """Model for the pdf highlights."""
 
 
+class PdfPageText(models.Model):
+    """
+    Model for the extracted text of a single pdf page. The text is indexed for the full-text search: via a FTS5 virtual
+    table on SQLite and a GIN index on Postgres. Both are created in the migrations.
+    """
+
+    page = models.IntegerField()
+    pdf = models.ForeignKey(Pdf, on_delete=models.CASCADE, blank=False)
+    text = models.TextField(blank=True)
+
+    def __str__(self):  # pragma: no cover
+        return f'{self.pdf_id} - {self.page}'
+
+
 class SharedPdf(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
     owner = models.ForeignKey(Profile, on_delete=models.CASCADE, blank=False)
@@ -419,6 +521,60 @@ class SharedPdf(models.Model):
             return f'{self.views} Views'
 
 
+class LibraryVersion(models.Model):
+    """
+    Per-user counter that is bumped whenever the PDF library of the user changes. It is used for detecting outdated
+    in-process data, e.g. the name index of the fuzzy search, across gunicorn workers and the huey consumer.
+    """
+
+    owner = models.OneToOneField(Profile, on_delete=models.CASCADE, primary_key=True)
+    version = models.IntegerField(default=0)
+
+    def __str__(self):  # pragma: no cover
+        return str(self.version)
+
+    @classmethod
+    def get_version(cls, profile_id: int) -> int:
+        """
+        Get the current library version of a user. The version entry is created on first usage, so that later changes
+        can be tracked by bumping it.
+        """
+
+        library_version, _ = cls.objects.get_or_create(owner_id=profile_id)
+
+        return library_version.version
+
+    @classmethod
+    def bump(cls, profile_id: int):
+        """
+        Increment the library version of a user. If there is no version entry yet, nothing depends on the version and
+        there is nothing to do.
+        """
+
+        cls.objects.filter(owner_id=profile_id).update(version=models.F('version') + 1)
+
+
+class ConsumeJournalEntry(models.Model):
+    """
+    Journal entry of a file of the consume folder for which a pdf was created. Entries are removed once the file was
+    deleted and the pdf was processed, so that an interrupted consume run can be resumed without losing or duplicating
+    files.
+    """
+
+    class State(models.TextChoices):
+        CREATED = 'Created'  # the pdf was created, the file might still exist
+        REMOVED = 'Removed'  # the file was removed, the pdf might still need to be processed
+
+    file_path = models.CharField(max_length=1000, unique=True)
+    # sha-256 hash of the file content, so that a new file with the same path is not mistaken for the journaled one
+    file_hash = models.CharField(max_length=64)
+    pdf = models.ForeignKey(Pdf, on_delete=models.CASCADE)
+    state = models.CharField(choices=State.choices, max_length=7, default=State.CREATED)
+
+    def __str__(self):  # pragma: no cover
+        return self.file_path
+
+
 class MarkdownHelper:  # pragma: no cover
     @staticmethod
     def get_allowed_markdown_tags() -> set[str]:
@@ -0,0 +1,209 @@
+import re
+from collections import defaultdict
+from dataclasses import dataclass
+from threading import Lock
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from pdf.models import LibraryVersion, Pdf
+from rapidfuzz import fuzz, process, utils
+from users.models import Profile
+
+# number of the best matching names used by the overview search, so that the query of the overview stays bounded
+MAX_NAME_MATCHES = 500
+
+
+@dataclass
+class _NameIndex:
+    version: int
+    ids: list[str]
+    names: list[str]
+
+
+class PdfNameIndex:
+    """
+    In-process index of the PDF names of each user used for the fuzzy search in the PDF overview. The names are
+    preprocessed once when the index is built, a search is then scored in a single batched rapidfuzz call instead of
+    calling the scorers once per PDF.
+
+    The index of a user is kept in sync by the PDF signals: they drop the entry of the current process and bump the
+    user's library version. As every gunicorn worker and the huey consumer have their own index, the version is checked
+    on every search so that changes made in other processes are picked up as well.
+    """
+
+    _indexes: dict[int, _NameIndex] = dict()
+    _lock = Lock()
+
+    @classmethod
+    def search(cls, profile: Profile, search: str, limit: int = None) -> list[tuple[str, float]]:
+        """
+        Get the ids of the user's PDFs matching the search together with their score. The result is sorted by score in
+        descending order. If a limit is set, only this number of the best matches is returned.
+        """
+
+        processed_search = utils.default_process(search)
+
+        if not processed_search:
+            return []
+
+        index = cls.get_index(profile)
+
+        # the combined score can only pass the threshold if the partial ratio is above 70. we therefore only calculate
+        # the more expensive WRatio for the names passing this cutoff.
+        partial_results = process.extract(
+            processed_search, index.names, scorer=fuzz.partial_ratio, limit=None, score_cutoff=70
+        )
+
+        if not partial_results:
+            return []
+
+        candidate_positions = [position for _, _, position in partial_results]
+        w_ratios = process.extract(
+            processed_search,
+            [index.names[position] for position in candidate_positions],
+            scorer=fuzz.WRatio,
+            limit=None,
+        )
+        w_ratio_dict = {candidate_positions[i]: w_ratio for _, w_ratio, i in w_ratios}
+
+        matches = []
+
+        for _, partial_ratio, position in partial_results:
+            score = (w_ratio_dict.get(position, 0) + partial_ratio) / 2
+
+            # better to be a bit more strict regarding this so we avoid false positives
+            if score > 85 or partial_ratio > 95:
+                matches.append((index.ids[position], score))
+
+        return sorted(matches, key=lambda match: match[1], reverse=True)[:limit]
+
+    @classmethod
+    def get_index(cls, profile: Profile) -> _NameIndex:
+        """Get the name index of the user. The index is (re)built if it is missing or outdated."""
+
+        current_version = LibraryVersion.get_version(profile.id)
+        index = cls._indexes.get(profile.id)
+
+        if index is None or index.version != current_version:
+            index = cls.build_index(profile.id, current_version)
+
+            with cls._lock:
+                cls._indexes[profile.id] = index
+
+        return index
+
+    @staticmethod
+    def build_index(profile_id: int, version: int) -> _NameIndex:
+        """Build the name index of a user. Only the ids and names are fetched, no model instances are created."""
+
+        ids = []
+        names = []
+
+        for pdf_id, name in Pdf.objects.filter(owner_id=profile_id).values_list('id', 'name').iterator():
+            ids.append(str(pdf_id))
+            names.append(utils.default_process(name or ''))
+
+        return _NameIndex(version=version, ids=ids, names=names)
+
+    @classmethod
+    def invalidate(cls, profile_id: int):
+        """Drop the index of the user in the current process."""
+
+        with cls._lock:
+            cls._indexes.pop(profile_id, None)
+
+    @classmethod
+    def clear(cls):
+        """Drop all indexes of the current process."""
+
+        with cls._lock:
+            cls._indexes.clear()
+
+
+class PdfContentIndex:
+    """
+    Full-text search over the extracted page texts of the PDFs. On SQLite the FTS5 table 'pdf_pdfpagetext_fts' is used,
+    on Postgres the GIN index on the tsvector of the page text. Both are created by the migrations. Other databases fall
+    back to a case-insensitive substring match.
+    """
+
+    @staticmethod
+    def get_search_terms(search: str) -> list[str]:
+        """Split the search into terms. Only word characters are kept, so the terms are safe to use in the queries."""
+
+        return re.findall(r'\w+', search.lower())
+
+    @classmethod
+    def get_match_sql(cls, search: str) -> tuple[str, list[str]] | None:
+        """
+        Get the sql selecting the pdf id and page of all pages matching the search together with its parameters. All
+        terms need to be present in the page. They are matched as prefixes, e.g. 'host' matches 'hosting'.
+        """
+
+        terms = cls.get_search_terms(search)
+
+        if not terms:
+            return None
+
+        if connection.vendor == 'sqlite':
+            sql = (
+                'SELECT page_text.pdf_id, page_text.page FROM pdf_pdfpagetext_fts '
+                'JOIN pdf_pdfpagetext AS page_text ON page_text.id = pdf_pdfpagetext_fts.rowid '
+                'WHERE pdf_pdfpagetext_fts MATCH %s'
+            )
+            params = [' '.join(f'"{term}"*' for term in terms)]
+        elif connection.vendor == 'postgresql':  # pragma: no cover
+            sql = (
+                'SELECT page_text.pdf_id, page_text.page FROM pdf_pdfpagetext AS page_text '
+                "WHERE to_tsvector('simple', page_text.text) @@ to_tsquery('simple', %s)"
+            )
+            params = [' & '.join(f'{term}:*' for term in terms)]
+        else:  # pragma: no cover
+            sql = 'SELECT page_text.pdf_id, page_text.page FROM pdf_pdfpagetext AS page_text WHERE ' + ' AND '.join(
+                ['LOWER(page_text.text) LIKE %s'] * len(terms)
+            )
+            params = [f'%{term}%' for term in terms]
+
+        return sql, params
+
+    @classmethod
+    def matching_pdf_ids(cls, search: str) -> RawSQL | None:
+        """
+        Get a subquery returning the ids of the PDFs with at least one page matching the search. It can be used in a
+        filter, e.g. pdfs.filter(id__in=...), so the matching is done in the same query as the rest of the filtering.
+        """
+
+        match_sql = cls.get_match_sql(search)
+
+        if match_sql is None:
+            return None
+
+        sql, params = match_sql
+
+        return RawSQL(f'SELECT DISTINCT matches.pdf_id FROM ({sql}) AS matches', params)
+
+    @classmethod
+    def get_hit_pages(cls, search: str, pdf_ids: list[str]) -> dict[str, list[int]]:
+        """Get the pages matching the search for the specified PDFs. Key: pdf id, value: sorted list of page numbers"""
+
+        match_sql = cls.get_match_sql(search)
+        hit_pages = defaultdict(list)
+
+        if match_sql is None or not pdf_ids:
+            return hit_pages
+
+        sql, params = match_sql
+        pdf_id_params = [Pdf._meta.pk.get_db_prep_value(pdf_id, connection) for pdf_id in pdf_ids]
+        placeholders = ', '.join(['%s'] * len(pdf_id_params))
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT matches.pdf_id, matches.page FROM ({sql}) AS matches '
+                f'WHERE matches.pdf_id IN ({placeholders}) ORDER BY matches.page',
+                params + pdf_id_params,
+            )
+
+            for pdf_id, page in cursor.fetchall():
+                hit_pages[str(Pdf._meta.pk.to_python(pdf_id))].append(page)
+
+        return hit_pages
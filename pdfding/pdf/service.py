@@ -1,33 +1,39 @@
-import re
 import traceback
 from collections import OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime, timedelta, timezone
+from hashlib import sha256
 from io import BytesIO
 from logging import getLogger
-from math import floor
+from multiprocessing import get_context
 from pathlib import Path
 from shutil import copy
 from urllib.parse import parse_qs, urlparse
 from uuid import uuid4
 
-from core.settings import MEDIA_ROOT
+from core.settings import INGEST_WORKERS, LIBRARY_CACHE_TIMEOUT, MEDIA_ROOT, THUMBNAIL_FORMAT
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.files import File
-from django.db.models import QuerySet
+from django.db import transaction
+from django.db.models import Q, QuerySet
 from django.db.models.functions import Lower
 from django.forms import ValidationError
 from django.http import Http404, HttpRequest
 from django.urls import reverse
+from pdf import ingest
 from pdf.models import (
+    Folder,
+    LibraryVersion,
     Pdf,
     PdfAnnotation,
     PdfComment,
     PdfHighlight,
+    PdfPageText,
     Tag,
     delete_empty_dirs_after_rename_or_delete,
     get_file_path,
 )
-from pypdf import PdfReader
 from pypdfium2 import PdfDocument
 from ruamel.yaml import YAML
 from users.models import Profile
@@ -126,6 +132,40 @@ class TagServices:
 
         return tag_info_dict
 
+    @staticmethod
+    def get_tag_id_groups(profile: Profile, tag_names: list[str]) -> list[set]:
+        """
+        Resolve the tag names of a tag filter to groups of tag ids. The group of a tag name contains the id of the tag
+        and the ids of all its children, e.g. for 'programming' the ids of 'programming', 'programming/python', etc. A
+        PDF matches the filter if it has at least one tag of each group. All tags are fetched in a single query.
+
+        Tag names that are parents of other tag names in the filter are dropped, as they are implied by their children.
+        This way the groups are disjoint.
+        """
+
+        tag_names = {tag_name for tag_name in tag_names if tag_name}
+        tag_names = [
+            tag_name
+            for tag_name in sorted(tag_names)
+            if not any(other.startswith(f'{tag_name}/') for other in tag_names)
+        ]
+
+        if not tag_names:
+            return []
+
+        tag_query = Q(name__in=tag_names)
+        for tag_name in tag_names:
+            tag_query |= Q(name__startswith=f'{tag_name}/')
+
+        tag_id_groups = {tag_name: set() for tag_name in tag_names}
+
+        for tag_id, name in profile.tag_set.filter(tag_query).values_list('id', 'name'):
+            for tag_name in tag_names:
+                if name == tag_name or name.startswith(f'{tag_name}/'):
+                    tag_id_groups[tag_name].add(tag_id)
+
+        return list(tag_id_groups.values())
+
     def adjust_referer_for_tag_view(referer_url: str, replace: str, replace_with: str) -> str:
         """
         Adjust the referer url for tag views. If a tag is renamed or deleted, the query part of the tag string will be
@@ -158,6 +198,62 @@ class TagServices:
         return overview_url
 
 
+class SidebarServices:
+    @classmethod
+    def get_sidebar_data(cls, profile: Profile) -> dict:
+        """
+        Get the data displayed in the sidebar of the pdf overview: the tag info dict, the folder tree and the number
+        of PDFs without a folder. The data is cached under the library version of the user, which is bumped whenever
+        a PDF, tag or folder of the user changes. Outdated entries are therefore never used.
+        """
+
+        version = LibraryVersion.get_version(profile.id)
+        # the tag info dict depends on the tree mode, which is not part of the library version
+        cache_key = f'sidebar_{profile.id}_{version}_{profile.tag_tree_mode}'
+        sidebar_data = cache.get(cache_key)
+
+        if sidebar_data is None:
+            folder_tree, root_pdf_count = cls.get_folder_tree(profile)
+            sidebar_data = {
+                'tag_info_dict': TagServices.get_tag_info_dict(profile),
+                'folders': folder_tree,
+                'root_pdf_count': root_pdf_count,
+            }
+            cache.set(cache_key, sidebar_data, LIBRARY_CACHE_TIMEOUT)
+
+        return sidebar_data
+
+    @staticmethod
+    def get_folder_tree(profile: Profile) -> tuple[list[dict], int]:
+        """
+        Get the folder tree of the user and the number of PDFs without a folder. Each folder is a dict containing its
+        id, name, number of PDFs (including the ones of its subfolders) and its subfolders. Only the root folders are
+        returned. As the PDF counts are stored in the folders, the tree is built from two queries independent of the
+        number of folders.
+        """
+
+        folders = {
+            folder['id']: folder | {'subfolders': []}
+            for folder in Folder.objects.filter(owner=profile)
+            .order_by('name')
+            .values('id', 'name', 'parent_id', 'pdf_count')
+        }
+
+        root_folders = []
+
+        for folder in folders.values():
+            parent = folders.get(folder['parent_id'])
+
+            if parent is None:
+                root_folders.append(folder)
+            else:
+                parent['subfolders'].append(folder)
+
+        root_pdf_count = profile.pdf_set.filter(folder__isnull=True).count()
+
+        return root_folders, root_pdf_count
+
+
 class PdfProcessingServices:
     @classmethod
     def create_pdf(
@@ -169,30 +265,57 @@ class PdfProcessingServices:
         notes: str = '',
         tag_string: str = '',
         file_directory: str = '',
+        process_in_background: bool = True,
+        file_hash: str = '',
     ):
+        """
+        Create a new pdf. Only the file and the database entry are created here. The derived data, i.e. number of pages,
+        thumbnail, preview, page texts, highlights and comments, is created by huey tasks in the background, so that
+        uploading many or large files does not block the request. If process_in_background is False, the caller is
+        responsible for processing the pdf, e.g. via the bulk ingest. The hash of the file content is calculated unless
+        it is provided.
+        """
+
         pdf = Pdf.objects.create(
-            name=name, description=description, notes=notes, file=pdf_file, file_directory=file_directory, owner=owner
+            name=name,
+            description=description,
+            notes=notes,
+            file=pdf_file,
+            file_hash=file_hash or get_file_hash(pdf_file),
+            file_directory=file_directory,
+            owner=owner,
+            processing_state=Pdf.ProcessingState.PENDING,
         )
 
-        # process with pdf libraries: add number of pages, thumbnail, preview, highlights and comments
-        cls.process_with_pypdfium(pdf)
-        cls.set_highlights_and_comments(pdf)
-
         # get unique tag names
         tag_names = Tag.parse_tag_string(tag_string)
         tags = TagServices.process_tag_names(tag_names, pdf.owner)
 
         pdf.tags.set(tags)
 
+        if not process_in_background:
+            return pdf
+
+        # import here to avoid a circular import, the tasks use the services
+        from pdf import tasks
+
+        tasks.render_pdf_task(pdf.id)
+        tasks.extract_pdf_text_task(pdf.id)
+        tasks.extract_pdf_annotations_task(pdf.id)
+
         return pdf
 
     @classmethod
     def process_with_pypdfium(
-        cls, pdf: Pdf, extract_thumbnail_and_preview: bool = True, delete_existing_thumbnail_and_preview: bool = False
+        cls,
+        pdf: Pdf,
+        extract_thumbnail_and_preview: bool = True,
+        delete_existing_thumbnail_and_preview: bool = False,
+        extract_text: bool = False,
     ):
         """
-        Process the pdf with pypdfium. This will extract the number of pages and optionally the thumbnail + preview of
-        the Pdf.
+        Process the pdf with pypdfium. This will extract the number of pages and optionally the thumbnail + preview and
+        the text of the pages of the Pdf. Returns whether the processing was successful.
         """
 
         try:
@@ -205,12 +328,23 @@ class PdfProcessingServices:
             pdf.number_of_pages = len(pdf_document)
             if extract_thumbnail_and_preview:
                 pdf = cls.set_thumbnail_and_preview(pdf, pdf_document)
+            if extract_text:
+                cls.set_page_texts(pdf, pdf_document)
             pdf_document.close()
-            pdf.save()
+
+            # only save the processed fields, so that changes made in the meantime, e.g. renaming, are not overwritten
+            update_fields = ['number_of_pages']
+            if extract_thumbnail_and_preview:
+                update_fields += ['thumbnail', 'preview']
+            pdf.save(update_fields=update_fields)
+
+            return True
         except Exception as e:  # nosec # noqa
             logger.info(f'Could not process "{pdf.name}" of user "{pdf.owner.user.email}" with Pypdfium')
             logger.info(traceback.format_exc())
 
+            return False
+
     @staticmethod
     def set_thumbnail_and_preview(
         pdf: Pdf,
@@ -219,41 +353,19 @@ class PdfProcessingServices:
         desired_thumbnail_width_height_ratio: float = 0.77,
         desired_preview_width: int = 450,
     ):
-        """Extract and set the thumbnail and the preview image of the pdf file."""
+        """Extract and set the thumbnail and the preview image of the pdf file in the configured image format."""
 
         try:
-            page = pdf_document[0]
-            preview_width_height_ratio = page.get_width() / page.get_height()
-
-            image_files = dict()
-            for image_name, desired_width, desired_ratio in zip(
-                ['thumbnail', 'preview'],
-                [desired_thumbnail_width, desired_preview_width],
-                [desired_thumbnail_width_height_ratio, preview_width_height_ratio],
-            ):
-                # extract image with predefined width
-                scale_factor = desired_width / page.get_width()
-
-                bitmap = page.render(scale=scale_factor)
-                pil_image = bitmap.to_pil()
-
-                desired_height = round(desired_width / desired_ratio)
-                width, height = pil_image.size
-
-                # we crop the image as we want a thumbnail with a ratio of 1.9 x 1. If the image is large enough we also
-                # want the thumbnail not to start at the top but instead with a little offset
-                height_diff = height - desired_height
-                if image_name == 'thumbnail' and height_diff > 0:
-                    offset = floor(0.15 * height_diff)
-                    pil_image = pil_image.crop((0, offset, desired_width, desired_height + offset))
-
-                # convert pillow image to django file
-                image_io = BytesIO()
-                pil_image.save(image_io, format='PNG')
-                image_files[image_name] = image_io
-
-            pdf.thumbnail = File(file=image_files['thumbnail'], name='thumbnail')
-            pdf.preview = File(file=image_files['preview'], name='preview')
+            image_files = ingest.render_thumbnail_and_preview(
+                pdf_document,
+                desired_thumbnail_width,
+                desired_thumbnail_width_height_ratio,
+                desired_preview_width,
+                THUMBNAIL_FORMAT,
+            )
+
+            pdf.thumbnail = File(file=image_files['thumbnail'], name=f'thumbnail.{THUMBNAIL_FORMAT.lower()}')
+            pdf.preview = File(file=image_files['preview'], name=f'preview.{THUMBNAIL_FORMAT.lower()}')
 
         except Exception as e:  # nosec # noqa
             logger.info(f'Could not extract thumbnail for "{pdf.name}" of user "{pdf.owner.user.email}"')
@@ -261,6 +373,29 @@ class PdfProcessingServices:
 
         return pdf
 
+    @classmethod
+    def set_page_texts(cls, pdf: Pdf, pdf_document: PdfDocument):
+        """
+        Extract the text of each page and save it, so it can be used by the full-text search. Existing page texts of
+        the pdf are replaced.
+        """
+
+        try:
+            cls.save_page_texts(pdf, ingest.extract_page_texts(pdf_document))
+        except Exception as e:  # nosec # noqa
+            logger.info(f'Could not extract text for "{pdf.name}" of user "{pdf.owner.user.email}"')
+            logger.info(traceback.format_exc())
+
+    @staticmethod
+    def save_page_texts(pdf: Pdf, page_texts: list[str]):
+        """Replace the page texts of the pdf with the provided ones."""
+
+        with transaction.atomic():
+            pdf.pdfpagetext_set.all().delete()
+            PdfPageText.objects.bulk_create(
+                [PdfPageText(pdf=pdf, page=i + 1, text=text) for i, text in enumerate(page_texts)], batch_size=500
+            )
+
     @classmethod
     def set_highlights_and_comments(cls, pdf: Pdf, pdf_highlight_class=PdfHighlight, pdf_comment_class=PdfComment):
         """
@@ -272,71 +407,139 @@ class PdfProcessingServices:
         """
 
         try:
-            # delete old comments and highlights
-            pdf.pdfhighlight_set.all().delete()
-            pdf.pdfcomment_set.all().delete()
-
-            pypdf_pdf = PdfReader(pdf.file)
-            pyreadium_pdf = PdfDocument(pdf.file, autoclose=True)
-
-            for i, pypdf_page in enumerate(pypdf_pdf.pages):
-                pdfium_page = pyreadium_pdf[i]
+            annotations = ingest.extract_annotations(pdf.file)
+            cls.save_highlights_and_comments(pdf, annotations, pdf_highlight_class, pdf_comment_class)
 
-                if "/Annots" in pypdf_page:
-                    for annotation in pypdf_page["/Annots"]:
-                        annotation_object = annotation.get_object()
-
-                        annotation_type = annotation_object["/Subtype"]
+        except Exception as e:  # nosec # noqa
+            logger.info(f'Could not extract highlights and comments for "{pdf.name}" of user "{pdf.owner.user.email}"')
+            logger.info(traceback.format_exc())
 
-                        if annotation_type in ["/FreeText", "/Highlight"]:
-                            date_time_string = f'{annotation_object["/CreationDate"].split(':')[-1]}-+00:00'
-                            creation_date = datetime.strptime(date_time_string, '%Y%m%d%H%M%S-%z')
+    @classmethod
+    def sync_highlights_and_comments(cls, pdf: Pdf):
+        """
+        Sync the highlights and comments of a pdf with its file after the file was changed, e.g. by the viewer. Only
+        pages whose annotation fingerprints changed since the last extraction are extracted and only the highlights
+        and comments that differ are deleted or created. If the annotations were never extracted, all of them are
+        replaced.
+        """
 
-                            if annotation_type == "/FreeText":
-                                comment_text = annotation_object["/Contents"]
-                                pdf_comment_class.objects.create(
-                                    text=comment_text, page=i + 1, creation_date=creation_date, pdf=pdf
-                                )
+        try:
+            annotations_by_page, fingerprints = ingest.extract_changed_annotations(
+                pdf.file.path, pdf.annotation_fingerprints
+            )
 
-                            elif annotation_type == "/Highlight":
-                                highlight_text = cls.extract_pdf_highlight_text(annotation_object, pdfium_page)
-                                pdf_highlight_class.objects.create(
-                                    text=highlight_text, page=i + 1, creation_date=creation_date, pdf=pdf
-                                )
+            with transaction.atomic():
+                if pdf.annotation_fingerprints is None:
+                    annotations = [annotation for page in annotations_by_page.values() for annotation in page]
+                    cls.save_highlights_and_comments(pdf, annotations)
+                else:
+                    cls.update_highlights_and_comments(pdf, annotations_by_page)
 
-            pyreadium_pdf.close()
+                # update via the queryset so that the library version is not bumped
+                Pdf.objects.filter(id=pdf.id).update(annotation_fingerprints=fingerprints)
 
+            pdf.annotation_fingerprints = fingerprints
         except Exception as e:  # nosec # noqa
-            logger.info(f'Could not extract highlights and comments for "{pdf.name}" of user "{pdf.owner.user.email}"')
+            logger.info(f'Could not sync highlights and comments for "{pdf.name}" of user "{pdf.owner.user.email}"')
             logger.info(traceback.format_exc())
 
     @staticmethod
-    def extract_pdf_highlight_text(annotation, pdfium_page):
-        """Extract the text from a highlight annotation"""
+    def update_highlights_and_comments(pdf: Pdf, annotations_by_page: dict[int, list[ingest.Annotation]]):
+        """
+        Update the highlights and comments of the provided pages so that they match the provided annotations. Existing
+        highlights and comments that are still present are kept, the others are deleted and missing ones are created.
+        """
+
+        with transaction.atomic():
+            for annotation_class, kind in [(PdfComment, 'comment'), (PdfHighlight, 'highlight')]:
+                # there can be multiple identical annotations, therefore each key maps to a list
+                missing_annotations = defaultdict(list)
+                for page_annotations in annotations_by_page.values():
+                    for annotation in page_annotations:
+                        if annotation.kind == kind:
+                            key = (annotation.page, annotation.text, annotation.creation_date)
+                            missing_annotations[key].append(annotation)
+
+                outdated_ids = []
+                existing_annotations = annotation_class.objects.filter(pdf=pdf, page__in=annotations_by_page.keys())
+
+                for annotation_id, *key in existing_annotations.values_list('id', 'page', 'text', 'creation_date'):
+                    if missing_annotations.get(tuple(key)):
+                        missing_annotations[tuple(key)].pop()
+                    else:
+                        outdated_ids.append(annotation_id)
+
+                annotation_class.objects.filter(id__in=outdated_ids).delete()
+                annotation_class.objects.bulk_create(
+                    [
+                        annotation_class(
+                            text=annotation.text, page=annotation.page, creation_date=annotation.creation_date, pdf=pdf
+                        )
+                        for annotations in missing_annotations.values()
+                        for annotation in annotations
+                    ],
+                    batch_size=500,
+                )
+
+    @staticmethod
+    def save_highlights_and_comments(
+        pdf: Pdf,
+        annotations: list[ingest.Annotation],
+        pdf_highlight_class=PdfHighlight,
+        pdf_comment_class=PdfComment,
+    ):
+        """Replace the highlights and comments of the pdf with the provided annotations."""
+
+        with transaction.atomic():
+            pdf_highlight_class.objects.filter(pdf=pdf).delete()
+            pdf_comment_class.objects.filter(pdf=pdf).delete()
+
+            for annotation_class, kind in [(pdf_comment_class, 'comment'), (pdf_highlight_class, 'highlight')]:
+                annotation_class.objects.bulk_create(
+                    [
+                        annotation_class(
+                            text=annotation.text, page=annotation.page, creation_date=annotation.creation_date, pdf=pdf
+                        )
+                        for annotation in annotations
+                        if annotation.kind == kind
+                    ],
+                    batch_size=500,
+                )
 
-        # every highlighted lines is represented by a rectangle which consists of 4 quad points
-        # the 4 quad points are stored in a list in the following way:
-        # [bot_left_x, bot_left_y, bot_right_x, bot_right_y, top_left_x, top_left_y, top_right_x, top_right_y]
+    @classmethod
+    def apply_processing_result(cls, pdf: Pdf, result: ingest.ProcessingResult):
+        """
+        Write the result of processing the pdf file in a worker process of the bulk ingest to the database and mark
+        the pdf as processed.
+        """
 
-        quad_points = annotation["/QuadPoints"]
-        rectangles = [quad_points[8 * i : 8 * (i + 1)] for i in range(len(quad_points) // 8)]  # noqa
+        for error in result.errors:
+            logger.info(f'Error while processing "{pdf.name}" of user "{pdf.owner.user.email}"')
+            logger.info(error)
 
-        highlight_lines = []
+        update_fields = ['number_of_pages', 'processing_state']
+        pdf.number_of_pages = result.number_of_pages
 
-        for rectangle in rectangles:
-            text_page = pdfium_page.get_textpage()
-            text = text_page.get_text_bounded(
-                left=rectangle[0], bottom=rectangle[5], right=rectangle[2], top=rectangle[1]
-            )
+        if result.thumbnail and result.preview:
+            pdf.thumbnail = File(file=BytesIO(result.thumbnail), name=f'thumbnail.{result.image_format.lower()}')
+            pdf.preview = File(file=BytesIO(result.preview), name=f'preview.{result.image_format.lower()}')
+            update_fields += ['thumbnail', 'preview']
 
-            # sometimes the same line is present multiple times, we only want one
-            if not highlight_lines or text != highlight_lines[-1]:
-                highlight_lines.append(text)
+        if result.success:
+            pdf.processing_state = Pdf.ProcessingState.READY
+        else:
+            pdf.processing_state = Pdf.ProcessingState.FAILED
 
-        highlight_text = ' '.join(highlight_lines).strip()
-        highlight_text = re.sub(r'\s+', ' ', highlight_text)
+        with transaction.atomic():
+            if result.page_texts is not None:
+                cls.save_page_texts(pdf, result.page_texts)
+            if result.annotations is not None:
+                cls.save_highlights_and_comments(pdf, result.annotations)
+                pdf.annotation_fingerprints = result.annotation_fingerprints
+                update_fields += ['annotation_fingerprints']
 
-        return highlight_text
+            # only save the processed fields, so that changes made in the meantime, e.g. renaming, are not overwritten
+            pdf.save(update_fields=update_fields)
 
     @classmethod
     def export_annotations(cls, profile: Profile, kind: str, pdf: Pdf = None):
@@ -414,6 +617,64 @@ class PdfProcessingServices:
             delete_empty_dirs_after_rename_or_delete(pdf_current_file_name, pdf.owner.user.id)
 
 
+class BulkIngestServices:
+    @staticmethod
+    def log_progress(processed: int, total: int):
+        """Default progress callback of the bulk ingest."""
+
+        logger.info(f'Bulk ingest: processed {processed} of {total} pdfs')
+
+    @classmethod
+    def process_pdfs(cls, pdfs: list[Pdf], workers: int = None, progress_callback=None):
+        """
+        Process the files of the provided pdfs. Rendering the thumbnails and previews, extracting the page texts and
+        parsing the annotations is spread over a pool of worker processes, the results are written to the database by
+        this process as soon as they are available. After each processed pdf the progress callback is called with the
+        number of processed pdfs and the total number of pdfs.
+
+        The number of workers defaults to the INGEST_WORKERS setting. With a single worker the pdfs are processed in
+        this process.
+        """
+
+        workers = min(workers or INGEST_WORKERS, len(pdfs))
+        progress_callback = progress_callback or cls.log_progress
+        pdfs_by_id = {str(pdf.id): pdf for pdf in pdfs}
+        jobs = [(str(pdf.id), pdf.file.path, THUMBNAIL_FORMAT) for pdf in pdfs]
+
+        if workers <= 1:
+            results = (ingest.process_pdf_file(*job) for job in jobs)
+            cls.write_results(pdfs_by_id, results, progress_callback)
+        else:
+            # spawn the workers instead of forking, as forking the django process with its open database connections
+            # and threads, e.g. of the huey consumer, is not safe
+            with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn')) as executor:
+                futures = {executor.submit(ingest.process_pdf_file, *job): job[0] for job in jobs}
+                results = (cls.get_result(future, futures[future]) for future in as_completed(futures))
+                cls.write_results(pdfs_by_id, results, progress_callback)
+
+    @staticmethod
+    def get_result(future, pdf_id: str) -> ingest.ProcessingResult:
+        """Get the result of a worker. If the worker crashed, a failed result is returned."""
+
+        try:
+            return future.result()
+        except Exception:  # pragma: no cover # nosec # noqa
+            return ingest.ProcessingResult(pdf_id=pdf_id, errors=[traceback.format_exc()])
+
+    @staticmethod
+    def write_results(pdfs_by_id: dict[str, Pdf], results, progress_callback):
+        """Write the processing results to the database and report the progress."""
+
+        for processed, result in enumerate(results, start=1):
+            pdf = pdfs_by_id[result.pdf_id]
+
+            # the pdf might have been deleted in the meantime
+            if Pdf.objects.filter(id=pdf.id).exists():
+                PdfProcessingServices.apply_processing_result(pdf, result)
+
+            progress_callback(processed, len(pdfs_by_id))
+
+
 def check_object_access_allowed(get_object):
     """
     Return a Http404 exception when getting an object (e.g a pdf or shared pdf) that does not exist
@@ -485,16 +746,40 @@ def create_unique_name_from_file(file: File, owner: Profile) -> str:
     return name
 
 
-def get_pdf_info_list(profile: Profile) -> list[tuple]:
+def get_file_hash(file: File | Path) -> str:
     """
-    Get the pdf info list of a profile. It contains information (name + file size) of each pdf of the profile. Each
-    element is a tuple with (pdf name, pdf size).
+    Get the sha-256 hash of the file content. The file is read in chunks, so that large files do not need to be loaded
+    into memory.
     """
 
-    pdf_info_list = []
+    file_hash = sha256()
+
+    if isinstance(file, Path):
+        with file.open(mode='rb') as f:
+            for chunk in iter(lambda: f.read(File.DEFAULT_CHUNK_SIZE), b''):
+                file_hash.update(chunk)
+    else:
+        for chunk in file.chunks():
+            file_hash.update(chunk)
+        file.seek(0)
+
+    return file_hash.hexdigest()
 
-    for pdf in profile.pdf_set.all():
-        pdf_size = Path(pdf.file.path).stat().st_size
-        pdf_info_list.append((pdf.name, pdf_size))
 
-    return pdf_info_list
+def pdf_with_same_content_exists(owner: Profile, file_hash: str, name: str, size: int) -> bool:
+    """
+    Check if the profile already has a pdf with the same file content. Pdfs added before the content hashes were
+    introduced have no hash until it was calculated in the background. They are matched by name and file size instead.
+    """
+
+    if Pdf.objects.filter(owner=owner, file_hash=file_hash).exists():
+        return True
+
+    for pdf in Pdf.objects.filter(owner=owner, file_hash='', name=name).only('file'):
+        try:
+            if pdf.file.size == size:
+                return True
+        except OSError:  # pragma: no cover
+            continue
+
+    return False
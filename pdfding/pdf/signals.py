@@ -1,6 +1,10 @@
-from django.db.models.signals import pre_delete
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
-from pdf.models import Pdf
+from pdf.models import Folder, LibraryVersion, Pdf, Tag
+from pdf.search import PdfNameIndex
+
+# fields that change when reading a pdf. changing them does not change the library of the user.
+READING_STATE_FIELDS = {'current_page', 'last_viewed_date', 'views'}
 
 
 @receiver(pre_delete, sender=Pdf)
@@ -17,3 +21,68 @@ def delete_orphan_tag(sender, instance, **kwargs):
         # in that case the tag should be deleted
         if tag.pdf_set.count() == 1:
             tag.delete()
+
+
+@receiver(post_save, sender=Pdf)
+@receiver(post_delete, sender=Pdf)
+def pdf_library_changed(sender, instance, update_fields=None, **kwargs):
+    """
+    Bump the library version of the pdf's owner and drop the name index of the current process, so that the fuzzy
+    search picks up the change. Saves that only update the reading state of a pdf are ignored.
+    """
+
+    if update_fields and set(update_fields) <= READING_STATE_FIELDS:
+        return
+
+    LibraryVersion.bump(instance.owner_id)
+    PdfNameIndex.invalidate(instance.owner_id)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Folder)
+@receiver(post_delete, sender=Folder)
+def tag_or_folder_changed(sender, instance, **kwargs):
+    """Bump the library version of the owner, so that cached data depending on the tags and folders is refreshed."""
+
+    LibraryVersion.bump(instance.owner_id)
+
+
+@receiver(pre_save, sender=Pdf)
+def remember_pdf_folder(sender, instance, update_fields=None, **kwargs):
+    """Remember the folder the pdf was in before saving it, so that the folder pdf counts can be updated."""
+
+    if update_fields and 'folder' not in update_fields:
+        instance._previous_folder_id = instance.folder_id
+    elif instance._state.adding:
+        instance._previous_folder_id = None
+    else:
+        instance._previous_folder_id = Pdf.objects.filter(id=instance.id).values_list('folder_id', flat=True).first()
+
+
+@receiver(post_save, sender=Pdf)
+def update_folder_pdf_counts_after_save(sender, instance, **kwargs):
+    """Update the pdf counts of the folders if the pdf was added to or moved between folders."""
+
+    previous_folder_id = getattr(instance, '_previous_folder_id', None)
+
+    if previous_folder_id != instance.folder_id:
+        if previous_folder_id:
+            Folder.change_pdf_count(previous_folder_id, -1)
+        if instance.folder_id:
+            Folder.change_pdf_count(instance.folder_id, 1)
+
+
+@receiver(post_delete, sender=Pdf)
+def update_folder_pdf_counts_after_delete(sender, instance, **kwargs):
+    """Update the pdf counts of the folder of a deleted pdf."""
+
+    if instance.folder_id:
+        Folder.change_pdf_count(instance.folder_id, -1)
+
+
+@receiver(post_delete, sender=Folder)
+def update_ancestor_pdf_counts(sender, instance, **kwargs):
+    """Recalculate the pdf counts of the ancestors of a deleted folder."""
+
+    Folder.update_pdf_counts(Folder.get_ancestor_ids(instance.path))
@@ -1,72 +1,317 @@
 import logging
+import os
 import traceback
+from itertools import islice
 from pathlib import Path
+from shutil import move
+from uuid import uuid4
 
 import magic
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.files import File
+from django.db import transaction
 from huey import crontab
-from huey.contrib.djhuey import periodic_task
+from huey.contrib.djhuey import db_task, periodic_task
 from pdf import service
+from pdf.models import ConsumeJournalEntry, Pdf
+from pypdfium2 import PdfDocument
+from users.models import Profile
 
 logger = logging.getLogger('huey')
 
 
+@db_task(retries=0)
+def render_pdf_task(pdf_id: str):
+    """
+    Huey task for setting the number of pages and rendering the thumbnail and preview of a newly added pdf. Afterwards
+    the pdf is marked as processed, so that the thumbnail is shown in the overview.
+    """
+
+    pdf = Pdf.objects.filter(id=pdf_id).first()
+
+    # the pdf might have been deleted in the meantime
+    if pdf is None:
+        return
+
+    if service.PdfProcessingServices.process_with_pypdfium(pdf):
+        pdf.processing_state = Pdf.ProcessingState.READY
+    else:
+        pdf.processing_state = Pdf.ProcessingState.FAILED
+
+    pdf.save(update_fields=['processing_state'])
+
+
+@db_task(retries=0)
+def extract_pdf_text_task(pdf_id: str):
+    """Huey task for extracting the page texts of a newly added pdf used by the full-text search."""
+
+    pdf = Pdf.objects.filter(id=pdf_id).first()
+
+    if pdf is None:
+        return
+
+    try:
+        pdf_document = PdfDocument(pdf.file.path, autoclose=True)
+        service.PdfProcessingServices.set_page_texts(pdf, pdf_document)
+        pdf_document.close()
+    except Exception as e:  # nosec # noqa
+        logger.info(f'Could not extract the text of "{pdf.name}" of user "{pdf.owner.user.email}"')
+        logger.info(traceback.format_exc())
+
+
+@db_task(retries=0)
+def extract_pdf_annotations_task(pdf_id: str):
+    """
+    Huey task for extracting the highlights and comments of a newly added or changed pdf. For changed pdfs only the
+    pages with changed annotations are extracted.
+    """
+
+    pdf = Pdf.objects.filter(id=pdf_id).first()
+
+    if pdf is None:
+        return
+
+    service.PdfProcessingServices.sync_highlights_and_comments(pdf)
+
+
+@db_task(retries=0)
+def bulk_ingest_task(pdf_ids: list[str]):
+    """Huey task for processing multiple newly added pdfs at once with the bulk ingest."""
+
+    pdfs = list(Pdf.objects.filter(id__in=pdf_ids).select_related('owner__user'))
+
+    if pdfs:
+        service.BulkIngestServices.process_pdfs(pdfs)
+
+
+@db_task(retries=0)
+def backfill_file_hashes_task(batch_size: int = 500, last_id: str = None):
+    """
+    Huey task for calculating the content hashes of pdfs added before they were introduced. Only one batch is processed
+    per run and the next batch is enqueued afterwards, so that the processing of newly added pdfs is not blocked.
+    """
+
+    last_id = backfill_file_hashes(batch_size, last_id)
+
+    if last_id is not None:
+        backfill_file_hashes_task(batch_size, last_id)
+
+
+def backfill_file_hashes(batch_size: int, last_id: str = None) -> str | None:
+    """
+    Calculate the content hashes of a batch of pdfs without a hash. Returns the id of the last pdf of the batch or None
+    if there are no pdfs without a hash left.
+    """
+
+    pdfs = Pdf.objects.filter(file_hash='').select_related('owner__user').order_by('id')
+    # keyset pagination, so that pdfs whose file could not be hashed are not fetched again
+    batch = list((pdfs.filter(id__gt=last_id) if last_id else pdfs)[:batch_size])
+
+    if not batch:
+        return None
+
+    for pdf in batch:
+        try:
+            pdf.file_hash = service.get_file_hash(pdf.file)
+        except Exception:  # nosec # noqa
+            logger.info(f'Could not hash "{pdf.name}" of user "{pdf.owner.user.email}"')
+        finally:
+            pdf.file.close()
+
+    Pdf.objects.bulk_update([pdf for pdf in batch if pdf.file_hash], ['file_hash'])
+
+    return batch[-1].id
+
+
 @periodic_task(crontab(minute='*/5'), retries=0)
 def consume_task():  # pragma: no cover
     """
     Periodic huey task for creating pdf instances from pdf files put into the consume folder.
     """
 
-    if settings.CONSUME_ENABLED:
+    # if the consume folder is watched, new files are consumed by the watcher as soon as they are written
+    if settings.CONSUME_ENABLED and not settings.CONSUME_WATCH_MODE:
         consume_function(settings.CONSUME_SKIP_EXISTING)
 
 
 def consume_function(skip_existing: bool):
-    """Create pdf instances for pdf files present in the consume folder."""
+    """
+    Create pdf instances for pdf files present in the consume folder. The directories are read lazily and the files are
+    consumed and processed in batches, so that the memory usage is bounded even for very large consume folders. Created
+    pdfs are journaled until their files are deleted and they are processed, so that the next run resumes an
+    interrupted one.
+    """
 
     if not settings.CONSUME_DIR.exists():  # pragma: no cover
         settings.CONSUME_DIR.mkdir(exist_ok=True)
 
-    user_consume_paths = [path for path in settings.CONSUME_DIR.iterdir() if path.is_dir()]
+    resume_consume()
 
-    for user_consume_path in user_consume_paths:
-        user = User.objects.get(id=user_consume_path.name)
-        user_consume_file_paths = [path for path in user_consume_path.iterdir() if path.is_file()]
+    consume_files = get_consume_files()
 
-        if skip_existing:
-            pdf_info_list = service.get_pdf_info_list(user.profile)
-        else:
-            pdf_info_list = []
+    while batch := list(islice(consume_files, settings.CONSUME_BATCH_SIZE)):
+        pdfs = [consume_file(file_path, user, skip_existing) for user, file_path in batch]
+        process_consumed_pdfs([pdf for pdf in pdfs if pdf])
 
-        for file_path in user_consume_file_paths:
-            try:
-                if passes_consume_condition(file_path, skip_existing, pdf_info_list):
-                    pdf_name = service.create_unique_name_from_file(file_path, user.profile)
 
-                    with file_path.open(mode="rb") as f:
-                        pdf_file = File(f, name=file_path.name)
+def get_consume_files():
+    """Lazily yield the files in the consume folder together with their users."""
 
-                        service.PdfProcessingServices.create_pdf(
-                            name=pdf_name, owner=user.profile, pdf_file=pdf_file, tag_string=settings.CONSUME_TAG_STRING
-                        )
+    with os.scandir(settings.CONSUME_DIR) as user_consume_dirs:
+        for user_consume_dir in user_consume_dirs:
+            # skip other directories, e.g. the quarantine folder
+            if not user_consume_dir.is_dir() or not user_consume_dir.name.isdigit():
+                continue
 
-            except Exception as e:  # pragma: no cover # nosec # noqa
-                logger.info(f'Could not create pdf from "{file_path.name}" of user "{user.id}"')
-                logger.info(traceback.format_exc())
+            user = User.objects.filter(id=int(user_consume_dir.name)).first()
+
+            if user is None:  # pragma: no cover
+                continue
+
+            with os.scandir(user_consume_dir.path) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        yield user, Path(entry.path)
 
-            file_path.unlink()
 
+def resume_consume():
+    """Finish consuming the files journaled by an interrupted consume run."""
 
-def passes_consume_condition(file_path: Path, skip_existing: bool, pdf_info_list: list[tuple]):
+    journal_entries = list(ConsumeJournalEntry.objects.select_related('pdf'))
+
+    for journal_entry in journal_entries:
+        remove_consumed_file(journal_entry)
+
+    process_consumed_pdfs([journal_entry.pdf for journal_entry in journal_entries])
+
+
+@db_task(retries=0)
+def consume_file_task(user_id: int, file_path: str):
+    """
+    Huey task for consuming a single file of the consume folder. It is enqueued by the consume folder watcher as soon
+    as the file is completely written.
+    """
+
+    file_path = Path(file_path)
+    user = User.objects.filter(id=user_id).first()
+
+    # the file might have been consumed in the meantime
+    if user is None or not file_path.is_file():
+        return
+
+    pdf = consume_file(file_path, user, settings.CONSUME_SKIP_EXISTING)
+
+    if pdf:
+        process_consumed_pdfs([pdf], workers=1)
+
+
+def consume_file(file_path: Path, user: User, skip_existing: bool) -> Pdf | None:
     """
-    Check if the file is a pdf file. If existing files should be skipped also checks if a pdf with the same name and
-    file size does already exist.
+    Create a pdf instance from a file of the consume folder and journal it. Afterwards the file is deleted. Files that
+    are no pdf files or could not be consumed are moved to the quarantine folder. The created pdf still needs to be
+    processed.
     """
 
-    file_type = magic.from_file(file_path, mime=True).lower()
+    try:
+        file_hash = service.get_file_hash(file_path)
+        journal_entry = ConsumeJournalEntry.objects.filter(file_path=str(file_path), file_hash=file_hash).first()
+
+        # if there is a journal entry, the pdf was already created by an interrupted consume run
+        if journal_entry is None:
+            if not is_pdf_file(file_path):
+                logger.info(f'"{file_path.name}" of user "{user.id}" is not a pdf file')
+                quarantine_file(file_path, user)
+
+                return None
+
+            if not passes_consume_condition(file_path, skip_existing, user.profile, file_hash):
+                file_path.unlink(missing_ok=True)
+
+                return None
+
+            pdf_name = service.create_unique_name_from_file(file_path, user.profile)
+
+            with file_path.open(mode="rb") as f, transaction.atomic():
+                pdf = service.PdfProcessingServices.create_pdf(
+                    name=pdf_name,
+                    owner=user.profile,
+                    pdf_file=File(f, name=file_path.name),
+                    tag_string=settings.CONSUME_TAG_STRING,
+                    process_in_background=False,
+                    file_hash=file_hash,
+                )
+                journal_entry, _ = ConsumeJournalEntry.objects.update_or_create(
+                    file_path=str(file_path),
+                    defaults={'file_hash': file_hash, 'pdf': pdf, 'state': ConsumeJournalEntry.State.CREATED},
+                )
+
+    except Exception as e:  # nosec # noqa
+        logger.info(f'Could not create pdf from "{file_path.name}" of user "{user.id}"')
+        logger.info(traceback.format_exc())
+
+        # a failing move must not abort the consumption of the other files
+        try:
+            quarantine_file(file_path, user)
+        except Exception as e:  # nosec # noqa
+            logger.info(f'Could not move "{file_path.name}" of user "{user.id}" to the quarantine folder: {e}')
+
+        return None
+
+    remove_consumed_file(journal_entry)
+
+    return journal_entry.pdf
+
+
+def remove_consumed_file(journal_entry: ConsumeJournalEntry):
+    """Delete the file of a journaled pdf, unless it was replaced by a different file in the meantime."""
+
+    if journal_entry.state == ConsumeJournalEntry.State.CREATED:
+        file_path = Path(journal_entry.file_path)
+
+        if file_path.is_file() and service.get_file_hash(file_path) == journal_entry.file_hash:
+            file_path.unlink()
+
+        journal_entry.state = ConsumeJournalEntry.State.REMOVED
+        journal_entry.save(update_fields=['state'])
+
+
+def process_consumed_pdfs(pdfs: list[Pdf], workers: int = None):
+    """Process the consumed pdfs with the bulk ingest and remove them from the journal."""
+
+    pending_pdfs = [pdf for pdf in pdfs if pdf.processing_state == Pdf.ProcessingState.PENDING]
+
+    if pending_pdfs:
+        service.BulkIngestServices.process_pdfs(pending_pdfs, workers=workers)
+
+    ConsumeJournalEntry.objects.filter(pdf__in=pdfs).delete()
+
+
+def quarantine_file(file_path: Path, user: User):
+    """Move a file that could not be consumed to the quarantine folder of its user instead of deleting it."""
+
+    quarantine_dir = settings.CONSUME_QUARANTINE_DIR / str(user.id)
+    quarantine_dir.mkdir(parents=True, exist_ok=True)
+    target_path = quarantine_dir / file_path.name
+
+    if target_path.exists():
+        target_path = quarantine_dir / f'{file_path.stem}_{uuid4().hex[:8]}{file_path.suffix}'
+
+    move(file_path, target_path)
+
+
+def is_pdf_file(file_path: Path) -> bool:
+    """Check if the file is a pdf file."""
+
+    return magic.from_file(file_path, mime=True).lower() == 'application/pdf'
+
+
+def passes_consume_condition(file_path: Path, skip_existing: bool, owner: Profile, file_hash: str):
+    """If existing files should be skipped, check if the owner already has a pdf with the same content."""
 
-    return file_type == 'application/pdf' and not (
-        skip_existing and (service.create_name_from_file(file_path), file_path.stat().st_size) in pdf_info_list
+    return not (
+        skip_existing
+        and service.pdf_with_same_content_exists(
+            owner, file_hash, service.create_name_from_file(file_path), file_path.stat().st_size
+        )
     )
@@ -0,0 +1,170 @@
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from django.test import SimpleTestCase
+from pdf import consume
+
+
+class TestConsumeWatcher(SimpleTestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+
+        self.consume_dir = Path(temp_dir.name) / 'consume'
+        self.user_dir = self.consume_dir / '1'
+        self.user_dir.mkdir(parents=True)
+        self.mock_enqueue = mock.Mock()
+
+    def get_watcher(self, change_detector=None, stable_seconds: float = 0) -> consume.ConsumeWatcher:
+        change_detector = change_detector or consume.SnapshotChangeDetector(self.consume_dir, 0)
+
+        return consume.ConsumeWatcher(self.consume_dir, change_detector, stable_seconds, self.mock_enqueue)
+
+    def test_existing_files_enqueued_once(self):
+        (self.user_dir / 'existing.pdf').write_bytes(b'content')
+        # files outside of user directories are ignored
+        (self.consume_dir / 'no_user.pdf').write_bytes(b'content')
+
+        watcher = self.get_watcher()
+        watcher.start()
+        watcher.run_once(timeout=0)
+        watcher.run_once(timeout=0)
+
+        self.mock_enqueue.assert_called_once_with(1, str(self.user_dir / 'existing.pdf'))
+
+    def test_new_files_and_directories(self):
+        watcher = self.get_watcher()
+        watcher.start()
+
+        (self.user_dir / 'new.pdf').write_bytes(b'content')
+        new_user_dir = self.consume_dir / '2'
+        new_user_dir.mkdir()
+        (new_user_dir / 'other.pdf').write_bytes(b'content')
+
+        watcher.run_once(timeout=0)
+
+        self.assertEqual(
+            sorted(call.args for call in self.mock_enqueue.call_args_list),
+            [(1, str(self.user_dir / 'new.pdf')), (2, str(new_user_dir / 'other.pdf'))],
+        )
+
+    def test_files_enqueued_when_stable(self):
+        watcher = self.get_watcher(stable_seconds=60)
+        watcher.start()
+
+        file_path = self.user_dir / 'written.pdf'
+        file_path.write_bytes(b'content')
+        watcher.run_once(timeout=0)
+
+        self.mock_enqueue.assert_not_called()
+
+        # the file is still written, so it is not stable yet
+        watcher.files[file_path].stable_since -= 60
+        file_path.write_bytes(b'more content')
+        watcher.run_once(timeout=0)
+
+        self.mock_enqueue.assert_not_called()
+
+        watcher.files[file_path].stable_since -= 60
+        watcher.run_once(timeout=0)
+
+        self.mock_enqueue.assert_called_once_with(1, str(file_path))
+
+    def test_removed_files_forgotten(self):
+        file_path = self.user_dir / 'removed.pdf'
+        file_path.write_bytes(b'content')
+
+        watcher = self.get_watcher(stable_seconds=60)
+        watcher.start()
+        self.assertIn(file_path, watcher.files)
+
+        file_path.unlink()
+        watcher.run_once(timeout=0)
+
+        self.assertEqual(watcher.files, {})
+        self.mock_enqueue.assert_not_called()
+
+    def test_update_file_vanished(self):
+        file_path = self.user_dir / 'vanished.pdf'
+        watcher = self.get_watcher()
+        watcher.files[file_path] = consume.ConsumeFile(1, 1)
+
+        watcher.update_file(file_path)
+
+        self.assertEqual(watcher.files, {})
+
+    def test_snapshot_change_detector_poll_interval(self):
+        change_detector = consume.SnapshotChangeDetector(self.consume_dir, 60)
+        change_detector.watch(self.user_dir)
+
+        (self.user_dir / 'new.pdf').write_bytes(b'content')
+
+        # the directories are only checked once per poll interval
+        self.assertEqual(change_detector.get_changed_directories(0), set())
+
+        change_detector.last_check -= 60
+        self.assertEqual(change_detector.get_changed_directories(0), {self.user_dir})
+        self.assertEqual(change_detector.get_changed_directories(0), set())
+
+    def test_snapshot_change_detector_removed_directory(self):
+        change_detector = consume.SnapshotChangeDetector(self.consume_dir, 0)
+        change_detector.watch(self.user_dir)
+
+        self.user_dir.rmdir()
+
+        self.assertEqual(change_detector.get_changed_directories(0), {self.user_dir})
+        self.assertEqual(change_detector.snapshot, {})
+        change_detector.close()
+
+    def test_inotify_change_detector(self):
+        change_detector = consume.get_change_detector(self.consume_dir, 'INOTIFY', 0)
+        self.addCleanup(change_detector.close)
+
+        self.assertIsInstance(change_detector, consume.InotifyChangeDetector)
+
+        change_detector.watch(self.user_dir)
+        self.assertEqual(change_detector.get_changed_directories(0), set())
+
+        (self.user_dir / 'new.pdf').write_bytes(b'content')
+        self.assertEqual(change_detector.get_changed_directories(1), {self.user_dir})
+
+        # writing to an existing file does not change the directory
+        (self.user_dir / 'new.pdf').write_bytes(b'more content')
+        self.assertEqual(change_detector.get_changed_directories(0), set())
+
+    def test_inotify_change_detector_removed_directory(self):
+        change_detector = consume.InotifyChangeDetector(self.consume_dir)
+        self.addCleanup(change_detector.close)
+
+        change_detector.watch(self.user_dir)
+        # directories are only watched once
+        change_detector.watch(self.user_dir)
+        self.assertEqual(len(change_detector.watched_dirs), 2)
+
+        self.user_dir.rmdir()
+
+        self.assertEqual(change_detector.get_changed_directories(1), {self.consume_dir})
+        self.assertEqual(list(change_detector.watched_dirs.values()), [self.consume_dir])
+
+    def test_inotify_change_detector_queue_overflow(self):
+        change_detector = consume.InotifyChangeDetector(self.consume_dir)
+        self.addCleanup(change_detector.close)
+        change_detector.watch(self.user_dir)
+
+        overflow_event = change_detector.EVENT_HEADER.pack(-1, change_detector.IN_Q_OVERFLOW, 0, 0)
+
+        with (
+            mock.patch('pdf.consume.select.select', return_value=([change_detector.fd], [], [])),
+            mock.patch('pdf.consume.os.read', return_value=overflow_event),
+        ):
+            changed_dirs = change_detector.get_changed_directories(0)
+
+        # events were lost, so all directories are checked
+        self.assertEqual(changed_dirs, {self.consume_dir, self.user_dir})
+
+    def test_get_change_detector_snapshot(self):
+        change_detector = consume.get_change_detector(self.consume_dir, 'SNAPSHOT', 5)
+
+        self.assertIsInstance(change_detector, consume.SnapshotChangeDetector)
+        self.assertEqual(change_detector.poll_interval, 5)
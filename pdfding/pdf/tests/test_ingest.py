@@ -0,0 +1,169 @@
+from datetime import datetime, timezone
+from io import BytesIO
+from pathlib import Path
+from unittest import mock
+
+import pypdfium2.raw as pdfium_c
+from django.conf import settings
+from django.test import SimpleTestCase
+from pdf import ingest
+from PIL import Image
+from pypdfium2 import PdfDocument, PdfPage
+
+DEMO_PDF_PATH = str(settings.BASE_DIR / 'users' / 'demo_data' / 'demo.pdf')
+
+
+class TestIngest(SimpleTestCase):
+    def test_process_pdf_file(self):
+        result = ingest.process_pdf_file('some_id', DEMO_PDF_PATH)
+
+        self.assertEqual(result.pdf_id, 'some_id')
+        self.assertTrue(result.success)
+        self.assertEqual(result.errors, [])
+        self.assertEqual(result.number_of_pages, 5)
+        self.assertTrue(result.thumbnail.startswith(b'\x89PNG'))
+        self.assertTrue(result.preview.startswith(b'\x89PNG'))
+        self.assertEqual(len(result.page_texts), 5)
+        self.assertTrue(result.page_texts[0].startswith('Lorem Ipsum'))
+        self.assertEqual(
+            sorted((annotation.kind, annotation.page) for annotation in result.annotations),
+            [('comment', 2), ('comment', 5), ('highlight', 2), ('highlight', 3)],
+        )
+
+    def test_process_pdf_file_not_a_pdf(self):
+        result = ingest.process_pdf_file('some_id', __file__)
+
+        self.assertFalse(result.success)
+        self.assertEqual(result.number_of_pages, -1)
+        self.assertIsNone(result.thumbnail)
+        self.assertIsNone(result.page_texts)
+        self.assertEqual(len(result.errors), 1)
+
+    @mock.patch('pdf.ingest.render_thumbnail_and_preview', side_effect=ValueError)
+    def test_process_pdf_file_failing_step(self, mock_render_thumbnail_and_preview):
+        dummy_path = str(Path(__file__).parent / 'data' / 'dummy.pdf')
+
+        result = ingest.process_pdf_file('some_id', dummy_path)
+
+        # a failing step does not stop the other steps
+        self.assertTrue(result.success)
+        self.assertIsNone(result.thumbnail)
+        self.assertEqual(len(result.page_texts), 2)
+        self.assertEqual(result.annotations, [])
+        self.assertEqual(len(result.errors), 1)
+
+    @mock.patch('pdf.ingest.extract_changed_annotations', side_effect=ValueError)
+    @mock.patch('pdf.ingest.extract_page_texts', side_effect=ValueError)
+    def test_process_pdf_file_failing_text_and_annotations(self, mock_extract_page_texts, mock_extract_annotations):
+        result = ingest.process_pdf_file('some_id', DEMO_PDF_PATH)
+
+        self.assertTrue(result.success)
+        self.assertTrue(result.thumbnail.startswith(b'\x89PNG'))
+        self.assertIsNone(result.page_texts)
+        self.assertIsNone(result.annotations)
+        self.assertEqual(len(result.errors), 2)
+
+    def test_process_pdf_file_image_format(self):
+        result = ingest.process_pdf_file('some_id', DEMO_PDF_PATH, 'WEBP')
+
+        self.assertEqual(result.image_format, 'WEBP')
+        self.assertEqual(Image.open(BytesIO(result.thumbnail)).format, 'WEBP')
+        self.assertEqual(Image.open(BytesIO(result.preview)).format, 'WEBP')
+
+    def test_render_thumbnail_and_preview(self):
+        pdf_document = PdfDocument(DEMO_PDF_PATH)
+
+        with mock.patch.object(PdfPage, 'render', autospec=True, side_effect=PdfPage.render) as mock_render:
+            images = ingest.render_thumbnail_and_preview(pdf_document, 120, 2, 400)
+
+        pdf_document.close()
+
+        # the page is rendered once, the thumbnail is downsampled from the preview
+        mock_render.assert_called_once()
+        self.assertFalse(mock_render.call_args.kwargs['draw_annots'])
+        self.assertEqual(Image.open(images['thumbnail']).size, (120, 60))
+        self.assertEqual(Image.open(images['preview']).width, 400)
+
+    def test_render_thumbnail_and_preview_image_formats(self):
+        pdf_document = PdfDocument(DEMO_PDF_PATH)
+
+        for image_format in ['PNG', 'WEBP', 'AVIF']:
+            images = ingest.render_thumbnail_and_preview(pdf_document, image_format=image_format)
+
+            for image_file in images.values():
+                self.assertEqual(Image.open(image_file).format, image_format)
+
+        pdf_document.close()
+
+    def test_convert_to_grayscale_if_colourless(self):
+        gray_image = Image.new('RGB', (10, 10), (120, 120, 120))
+        coloured_image = gray_image.copy()
+        coloured_image.putpixel((5, 5), (255, 0, 0))
+
+        self.assertEqual(ingest.convert_to_grayscale_if_colourless(gray_image).mode, 'L')
+        self.assertEqual(ingest.convert_to_grayscale_if_colourless(coloured_image).mode, 'RGB')
+        self.assertEqual(ingest.convert_to_grayscale_if_colourless(Image.new('RGBA', (10, 10))).mode, 'RGBA')
+
+    def test_extract_annotations(self):
+        annotations = ingest.extract_annotations(DEMO_PDF_PATH)
+
+        self.assertEqual(
+            [(annotation.kind, annotation.text, annotation.page) for annotation in annotations],
+            [
+                ('highlight', 'Semper curabitur est maecenas orci dis accumsan sem dictum commodo?', 2),
+                ('comment', 'demo comment page 2', 2),
+                (
+                    'highlight',
+                    'Massa ullamcorper aenean molestie laoreet aenean sed laoreet. '
+                    'Ante non cursus proin mauris dictumst magnis',
+                    3,
+                ),
+                ('comment', 'last page', 5),
+            ],
+        )
+        self.assertEqual(annotations[0].creation_date, datetime(2025, 3, 11, 8, 16, 49, tzinfo=timezone.utc))
+
+    def test_extract_annotations_other_types_skipped(self):
+        pdf_document = PdfDocument.new()
+        page = pdf_document.new_page(200, 200)
+        pdfium_c.FPDFPage_CloseAnnot(pdfium_c.FPDFPage_CreateAnnot(page, pdfium_c.FPDF_ANNOT_SQUARE))
+        pdf_file = BytesIO()
+        pdf_document.save(pdf_file)
+        pdf_document.close()
+
+        self.assertEqual(ingest.extract_annotations(pdf_file), [])
+
+    def test_extract_annotations_text_page_per_page(self):
+        with mock.patch.object(PdfPage, 'get_textpage', autospec=True, side_effect=PdfPage.get_textpage) as mock_get:
+            ingest.extract_annotations(DEMO_PDF_PATH)
+
+        # only the pages 2 and 3 have highlights, the text page is loaded once for each of them
+        self.assertEqual(mock_get.call_count, 2)
+
+    def test_extract_changed_annotations(self):
+        annotations_by_page, fingerprints = ingest.extract_changed_annotations(DEMO_PDF_PATH)
+
+        # without fingerprints all pages are extracted, pages without annotations have no fingerprint
+        self.assertEqual(list(annotations_by_page.keys()), [1, 2, 3, 4, 5])
+        self.assertEqual(annotations_by_page[1], [])
+        self.assertEqual(set(fingerprints.keys()), {'2', '3', '5'})
+
+        # nothing changed
+        self.assertEqual(ingest.extract_changed_annotations(DEMO_PDF_PATH, fingerprints), ({}, fingerprints))
+
+        # the annotations of page 3 changed and page 9 was removed
+        changed_annotations_by_page, new_fingerprints = ingest.extract_changed_annotations(
+            DEMO_PDF_PATH, fingerprints | {'3': 'outdated', '9': 'removed'}
+        )
+
+        self.assertEqual(changed_annotations_by_page, {3: annotations_by_page[3], 9: []})
+        self.assertEqual(new_fingerprints, fingerprints)
+
+    def test_extract_changed_annotations_text_page_of_changed_pages(self):
+        _, fingerprints = ingest.extract_changed_annotations(DEMO_PDF_PATH)
+
+        with mock.patch.object(PdfPage, 'get_textpage', autospec=True, side_effect=PdfPage.get_textpage) as mock_get:
+            ingest.extract_changed_annotations(DEMO_PDF_PATH, fingerprints | {'3': 'outdated'})
+
+        # only the highlights of the changed page 3 are extracted
+        self.assertEqual(mock_get.call_count, 1)
@@ -0,0 +1,124 @@
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files import File
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from pdf.models import ConsumeJournalEntry, Pdf, PdfPageText
+from pdf.service import PdfProcessingServices, get_file_hash
+from users.service import get_demo_pdf
+
+
+class TestExtractPdfText(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user', password='12345')
+
+    def test_extract_pdf_text(self):
+        pdf_without_text = Pdf.objects.create(owner=self.user.profile, name='pdf_1', file=get_demo_pdf())
+        pdf_with_text = Pdf.objects.create(owner=self.user.profile, name='pdf_2', file=get_demo_pdf())
+        PdfPageText.objects.create(pdf=pdf_with_text, page=1, text='existing')
+
+        call_command('extract_pdf_text')
+
+        self.assertEqual(pdf_without_text.pdfpagetext_set.count(), 5)
+        self.assertEqual(list(pdf_with_text.pdfpagetext_set.values_list('text', flat=True)), ['existing'])
+
+    def test_extract_pdf_text_all(self):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf_1', file=get_demo_pdf())
+        PdfPageText.objects.create(pdf=pdf, page=1, text='existing')
+
+        call_command('extract_pdf_text', all=True)
+
+        self.assertEqual(pdf.pdfpagetext_set.count(), 5)
+
+    def test_extract_pdf_text_missing_file(self):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf_1', file='missing.pdf')
+
+        call_command('extract_pdf_text')
+
+        self.assertFalse(pdf.pdfpagetext_set.exists())
+
+
+class TestBackfillFileHashes(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user', password='12345')
+
+    def test_backfill_file_hashes(self):
+        pdfs = [Pdf.objects.create(owner=self.user.profile, name=f'pdf_{i}', file=get_demo_pdf()) for i in range(3)]
+        pdf_with_hash = Pdf.objects.create(owner=self.user.profile, name='pdf_3', file=get_demo_pdf(), file_hash='a')
+
+        with self.assertNumQueries(5):
+            # 2 batches with a select and an update each and a final empty select
+            call_command('backfill_file_hashes', batch_size=2)
+
+        expected_hash = get_file_hash(settings.BASE_DIR / 'users' / 'demo_data' / 'demo.pdf')
+
+        for pdf in pdfs:
+            pdf.refresh_from_db()
+            self.assertEqual(pdf.file_hash, expected_hash)
+
+        pdf_with_hash.refresh_from_db()
+        self.assertEqual(pdf_with_hash.file_hash, 'a')
+
+    def test_backfill_file_hashes_missing_file(self):
+        missing_pdf = Pdf.objects.create(owner=self.user.profile, name='pdf_1', file='missing.pdf')
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf_2', file=get_demo_pdf())
+
+        call_command('backfill_file_hashes', batch_size=1)
+
+        missing_pdf.refresh_from_db()
+        pdf.refresh_from_db()
+        self.assertEqual(missing_pdf.file_hash, '')
+        self.assertEqual(len(pdf.file_hash), 64)
+
+    @mock.patch('pdf.tasks.backfill_file_hashes_task')
+    def test_backfill_file_hashes_background(self, mock_backfill_file_hashes_task):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf_1', file=get_demo_pdf())
+
+        call_command('backfill_file_hashes', batch_size=10, background=True)
+
+        mock_backfill_file_hashes_task.assert_called_once_with(10)
+        pdf.refresh_from_db()
+        self.assertEqual(pdf.file_hash, '')
+
+
+class TestWatchConsume(TestCase):
+    @override_settings(CONSUME_ENABLED=True, CONSUME_WATCH_MODE='')
+    @mock.patch('pdf.consume.ConsumeWatcher.run')
+    def test_watch_consume_disabled(self, mock_run):
+        call_command('watch_consume')
+
+        mock_run.assert_not_called()
+
+    @override_settings(CONSUME_ENABLED=True, CONSUME_WATCH_MODE='SNAPSHOT')
+    @mock.patch('pdf.consume.ConsumeWatcher.run')
+    def test_watch_consume(self, mock_run):
+        call_command('watch_consume')
+
+        mock_run.assert_called_once()
+
+    @override_settings(CONSUME_ENABLED=True, CONSUME_WATCH_MODE='SNAPSHOT')
+    @mock.patch('pdf.consume.ConsumeWatcher.run')
+    def test_watch_consume_resume(self, mock_run):
+        user = User.objects.create_user(username='user', password='12345')
+        pdf_path = settings.BASE_DIR / 'users' / 'demo_data' / 'demo.pdf'
+
+        # simulate a consume run that was interrupted after the consumed file was removed
+        with pdf_path.open('rb') as f:
+            pdf = PdfProcessingServices.create_pdf(
+                name='demo', owner=user.profile, pdf_file=File(f, name='demo.pdf'), process_in_background=False
+            )
+        ConsumeJournalEntry.objects.create(
+            file_path='/consume/1/demo.pdf',
+            file_hash=pdf.file_hash,
+            pdf=pdf,
+            state=ConsumeJournalEntry.State.REMOVED,
+        )
+
+        call_command('watch_consume')
+
+        pdf.refresh_from_db()
+        self.assertEqual(pdf.processing_state, Pdf.ProcessingState.READY)
+        self.assertFalse(ConsumeJournalEntry.objects.exists())
+        mock_run.assert_called_once()
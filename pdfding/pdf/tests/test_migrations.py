@@ -7,13 +7,14 @@ from django.contrib.auth.models import User
 from django.core.files import File
 from django.db import connection
 from django.test import TestCase
-from pdf.models import Pdf
+from pdf.models import Folder, Pdf
 from users.service import get_demo_pdf
 
 add_number_of_pdf_pages = importlib.import_module('pdf.migrations.0009_readd_number_of_pages_with_new_default')
 add_pdf_previews = importlib.import_module('pdf.migrations.0013_add_pdf_previews')
 add_comments_highlights = importlib.import_module('pdf.migrations.0015_add_comments_highlights')
 rename_pdfs_and_add_file_directory = importlib.import_module('pdf.migrations.0016_rename_pdfs_and_add_file_directory')
+add_folder_path_and_pdf_counts = importlib.import_module('pdf.migrations.0022_add_folder_path_and_pdf_counts')
 
 
 class TestMigrations(TestCase):
@@ -108,3 +109,24 @@ class TestMigrations(TestCase):
 
         # undo monkey patching
         rename_pdfs_and_add_file_directory.PdfProcessingServices.process_renaming_pdf = orignal_process_renaming_pdf
+
+    def test_set_folder_paths_and_pdf_counts(self):
+        folder_a = Folder.objects.create(name='a', owner=self.user.profile)
+        folder_b = Folder.objects.create(name='b', owner=self.user.profile, parent=folder_a)
+        folder_c = Folder.objects.create(name='c', owner=self.user.profile, parent=folder_b)
+        Pdf.objects.create(owner=self.user.profile, name='pdf_a', folder=folder_a)
+        Pdf.objects.create(owner=self.user.profile, name='pdf_c_1', folder=folder_c)
+        Pdf.objects.create(owner=self.user.profile, name='pdf_c_2', folder=folder_c)
+
+        # reset the fields so that the state is the same as before the migration
+        Folder.objects.update(path='', direct_pdf_count=0, pdf_count=0)
+
+        add_folder_path_and_pdf_counts.set_folder_paths_and_pdf_counts(apps, connection.schema_editor())
+
+        folder_a, folder_b, folder_c = [Folder.objects.get(name=name) for name in ['a', 'b', 'c']]
+        self.assertEqual(folder_a.path, f'/{folder_a.id.hex}/')
+        self.assertEqual(folder_c.path, f'/{folder_a.id.hex}/{folder_b.id.hex}/{folder_c.id.hex}/')
+        self.assertEqual(
+            [(folder.direct_pdf_count, folder.pdf_count) for folder in [folder_a, folder_b, folder_c]],
+            [(1, 3), (0, 2), (2, 2)],
+        )
@@ -174,6 +174,14 @@ class TestPdf(TestCase):
         generated_filepath = models.get_file_path(pdf, '')
         self.assertEqual(generated_filepath, '1/pdf/exist_ing.pdf')
 
+    def test_get_thumbnail_and_preview_path(self):
+        pdf = models.Pdf(owner=self.user.profile, name='pdf')
+
+        self.assertEqual(models.get_thumbnail_path(pdf, 'thumbnail.webp'), f'1/thumbnails/{pdf.id}.webp')
+        self.assertEqual(models.get_preview_path(pdf, 'preview.avif'), f'1/previews/{pdf.id}.avif')
+        # images without a suffix are png images
+        self.assertEqual(models.get_thumbnail_path(pdf, 'thumbnail'), f'1/thumbnails/{pdf.id}.png')
+
     def test_get_qrcode_file_path(self):
         generated_filepath = models.get_qrcode_file_path(self.pdf, '')
 
@@ -287,3 +295,122 @@ class TestSharedPdf(TestCase):
 
         shared_pdf = SharedPdf.objects.create(owner=self.user.profile, pdf=self.pdf, name='share', views=2)
         self.assertEqual(shared_pdf.views_string, '2 Views')
+
+
+class TestLibraryVersion(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='12345')
+
+    def test_get_version_no_entry(self):
+        self.assertFalse(models.LibraryVersion.objects.filter(owner=self.user.profile).exists())
+        self.assertEqual(models.LibraryVersion.get_version(self.user.profile.id), 0)
+        self.assertTrue(models.LibraryVersion.objects.filter(owner=self.user.profile).exists())
+
+    def test_bump(self):
+        models.LibraryVersion.get_version(self.user.profile.id)
+        models.LibraryVersion.bump(self.user.profile.id)
+        models.LibraryVersion.bump(self.user.profile.id)
+
+        self.assertEqual(models.LibraryVersion.get_version(self.user.profile.id), 2)
+
+    def test_bump_no_entry(self):
+        models.LibraryVersion.bump(self.user.profile.id)
+
+        self.assertFalse(models.LibraryVersion.objects.filter(owner=self.user.profile).exists())
+
+
+class TestFolder(TestCase):
+    def setUp(self):
+        self.profile = User.objects.create_user(username='testuser', password='12345').profile
+        self.folder_a = models.Folder.objects.create(name='a', owner=self.profile)
+        self.folder_b = models.Folder.objects.create(name='b', owner=self.profile, parent=self.folder_a)
+        self.folder_c = models.Folder.objects.create(name='c', owner=self.profile, parent=self.folder_b)
+
+    def get_counts(self, *folders) -> list[tuple[int, int]]:
+        """Get the direct and recursive pdf counts of the folders as stored in the db."""
+
+        folders = [models.Folder.objects.get(id=folder.id) for folder in folders]
+
+        return [(folder.direct_pdf_count, folder.pdf_count) for folder in folders]
+
+    def test_path(self):
+        self.assertEqual(self.folder_a.path, f'/{self.folder_a.id.hex}/')
+        self.assertEqual(self.folder_c.path, f'/{self.folder_a.id.hex}/{self.folder_b.id.hex}/{self.folder_c.id.hex}/')
+
+    def test_full_path(self):
+        self.assertEqual(self.folder_a.full_path, 'a')
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.folder_c.full_path, 'a/b/c')
+
+    def test_get_ancestor_ids(self):
+        self.assertEqual(models.Folder.get_ancestor_ids(self.folder_a.path), [])
+        self.assertEqual(models.Folder.get_ancestor_ids(self.folder_c.path), [self.folder_a.id, self.folder_b.id])
+
+    def test_move_folder(self):
+        models.Pdf.objects.create(owner=self.profile, name='pdf_c', folder=self.folder_c)
+        folder_d = models.Folder.objects.create(name='d', owner=self.profile, parent=self.folder_c)
+        folder_x = models.Folder.objects.create(name='x', owner=self.profile)
+
+        self.folder_b.parent = folder_x
+        self.folder_b.save()
+
+        folder_d = models.Folder.objects.get(id=folder_d.id)
+        self.assertEqual(
+            folder_d.path, f'/{folder_x.id.hex}/{self.folder_b.id.hex}/{self.folder_c.id.hex}/{folder_d.id.hex}/'
+        )
+        self.assertEqual(folder_d.full_path, 'x/b/c/d')
+        self.assertEqual(self.get_counts(self.folder_a, folder_x, self.folder_b), [(0, 0), (0, 1), (0, 1)])
+
+        # move to root
+        self.folder_b.parent = None
+        self.folder_b.save()
+
+        folder_d = models.Folder.objects.get(id=folder_d.id)
+        self.assertEqual(folder_d.path, f'/{self.folder_b.id.hex}/{self.folder_c.id.hex}/{folder_d.id.hex}/')
+        self.assertEqual(self.get_counts(folder_x, self.folder_b), [(0, 0), (0, 1)])
+
+    def test_pdf_counts(self):
+        pdf = models.Pdf.objects.create(owner=self.profile, name='pdf', folder=self.folder_c)
+        models.Pdf.objects.create(owner=self.profile, name='pdf_b', folder=self.folder_b)
+        models.Pdf.objects.create(owner=self.profile, name='pdf_root')
+
+        self.assertEqual(self.get_counts(self.folder_a, self.folder_b, self.folder_c), [(0, 2), (1, 2), (1, 1)])
+        self.assertEqual(models.Folder.objects.get(id=self.folder_a.id).get_pdf_count(), 2)
+
+        # move pdf
+        pdf.folder = self.folder_a
+        pdf.save()
+        self.assertEqual(self.get_counts(self.folder_a, self.folder_b, self.folder_c), [(1, 2), (1, 1), (0, 0)])
+
+        # move pdf to root
+        pdf.folder = None
+        pdf.save()
+        self.assertEqual(self.get_counts(self.folder_a, self.folder_b, self.folder_c), [(0, 1), (1, 1), (0, 0)])
+
+        # saving only other fields does not change the counts
+        pdf.folder = self.folder_c
+        pdf.save(update_fields=['name'])
+        self.assertEqual(self.get_counts(self.folder_a, self.folder_c), [(0, 1), (0, 0)])
+
+        models.Pdf.objects.get(name='pdf_b').delete()
+        self.assertEqual(self.get_counts(self.folder_a, self.folder_b), [(0, 0), (0, 0)])
+
+    def test_change_pdf_count_missing_folder(self):
+        folder_id = self.folder_c.id
+        self.folder_c.delete()
+
+        # e.g. the folder was deleted together with its pdfs
+        with self.assertNumQueries(1):
+            models.Folder.change_pdf_count(folder_id, -1)
+
+        self.assertEqual(self.get_counts(self.folder_a, self.folder_b), [(0, 0), (0, 0)])
+
+    def test_delete_folder(self):
+        models.Pdf.objects.create(owner=self.profile, name='pdf_a', folder=self.folder_a)
+        models.Pdf.objects.create(owner=self.profile, name='pdf_c', folder=self.folder_c)
+
+        self.folder_b.delete()
+
+        self.assertEqual(self.get_counts(self.folder_a), [(1, 1)])
+        self.assertFalse(models.Folder.objects.filter(id=self.folder_c.id).exists())
@@ -0,0 +1,137 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from pdf.models import LibraryVersion, Pdf, PdfPageText
+from pdf.search import PdfContentIndex, PdfNameIndex
+
+
+class TestPdfNameIndex(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user', password='12345')
+        self.profile = self.user.profile
+
+    def test_search(self):
+        Pdf.objects.create(owner=self.profile, name='pdf_not_to_be_found')
+        pdf_self_hosted = Pdf.objects.create(owner=self.profile, name='The best self-hosted applications ')
+        pdf_self_hosting = Pdf.objects.create(owner=self.profile, name='Self-hosting Guide')
+        Pdf.objects.create(owner=self.profile, name='self sufficiency')
+
+        result = PdfNameIndex.search(self.profile, 'self hosted')
+
+        self.assertEqual([pdf_id for pdf_id, _ in result], [str(pdf_self_hosted.id), str(pdf_self_hosting.id)])
+        # results are ranked by score
+        self.assertGreater(result[0][1], result[1][1])
+        # only the best matches are returned
+        self.assertEqual(PdfNameIndex.search(self.profile, 'self hosted', limit=1), result[:1])
+
+    def test_search_only_own_pdfs(self):
+        other_user = User.objects.create_user(username='other_user', password='12345')
+        Pdf.objects.create(owner=other_user.profile, name='Self-hosting Guide')
+        pdf = Pdf.objects.create(owner=self.profile, name='Self-hosting Guide')
+
+        result = PdfNameIndex.search(self.profile, 'self hosting')
+
+        self.assertEqual([pdf_id for pdf_id, _ in result], [str(pdf.id)])
+
+    def test_search_empty(self):
+        Pdf.objects.create(owner=self.profile, name='Self-hosting Guide')
+
+        self.assertEqual(PdfNameIndex.search(self.profile, ' !? '), [])
+        self.assertEqual(PdfNameIndex.search(self.profile, 'xyz'), [])
+
+    def test_get_index_reused(self):
+        Pdf.objects.create(owner=self.profile, name='pdf')
+
+        index = PdfNameIndex.get_index(self.profile)
+
+        with self.assertNumQueries(1):
+            self.assertIs(PdfNameIndex.get_index(self.profile), index)
+
+    def test_get_index_outdated(self):
+        pdf = Pdf.objects.create(owner=self.profile, name='Some PDF')
+        index = PdfNameIndex.get_index(self.profile)
+
+        # simulate a change in another process: the version is bumped but the local index is not dropped
+        Pdf.objects.filter(id=pdf.id).update(name='Renamed PDF')
+        LibraryVersion.bump(self.profile.id)
+
+        new_index = PdfNameIndex.get_index(self.profile)
+
+        self.assertIsNot(new_index, index)
+        self.assertEqual(new_index.names, ['renamed pdf'])
+        self.assertEqual(new_index.version, index.version + 1)
+
+    def test_index_updated_by_signals(self):
+        self.assertEqual(PdfNameIndex.search(self.profile, 'guide'), [])
+
+        pdf = Pdf.objects.create(owner=self.profile, name='Guide')
+        self.assertEqual([pdf_id for pdf_id, _ in PdfNameIndex.search(self.profile, 'guide')], [str(pdf.id)])
+
+        pdf.delete()
+        self.assertEqual(PdfNameIndex.search(self.profile, 'guide'), [])
+
+    def test_build_index(self):
+        pdf = Pdf.objects.create(owner=self.profile, name='Some-PDF')
+
+        index = PdfNameIndex.build_index(self.profile.id, 3)
+
+        self.assertEqual(index.version, 3)
+        self.assertEqual(index.ids, [str(pdf.id)])
+        self.assertEqual(index.names, ['some pdf'])
+
+    def test_invalidate(self):
+        PdfNameIndex.get_index(self.profile)
+        PdfNameIndex.invalidate(self.profile.id)
+
+        self.assertNotIn(self.profile.id, PdfNameIndex._indexes)
+
+
+class TestPdfContentIndex(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user', password='12345')
+        self.pdf_1 = Pdf.objects.create(owner=self.user.profile, name='pdf_1')
+        self.pdf_2 = Pdf.objects.create(owner=self.user.profile, name='pdf_2')
+
+        PdfPageText.objects.create(pdf=self.pdf_1, page=1, text='An introduction to self-hosting.')
+        PdfPageText.objects.create(pdf=self.pdf_1, page=2, text='Nothing to see here.')
+        PdfPageText.objects.create(pdf=self.pdf_1, page=7, text='Self-hosted applications are great.')
+        PdfPageText.objects.create(pdf=self.pdf_2, page=3, text='Hosting a café server is fun')
+
+    def test_get_search_terms(self):
+        self.assertEqual(PdfContentIndex.get_search_terms('Self-"hosting"* OR café'), ['self', 'hosting', 'or', 'café'])
+
+    def test_get_match_sql_empty(self):
+        self.assertIsNone(PdfContentIndex.get_match_sql(' "*" '))
+        self.assertIsNone(PdfContentIndex.matching_pdf_ids('-'))
+
+    def test_matching_pdf_ids(self):
+        self.assertEqual(list(Pdf.objects.filter(id__in=PdfContentIndex.matching_pdf_ids('self host'))), [self.pdf_1])
+        self.assertEqual(
+            set(Pdf.objects.filter(id__in=PdfContentIndex.matching_pdf_ids('HOST'))), {self.pdf_1, self.pdf_2}
+        )
+        self.assertEqual(list(Pdf.objects.filter(id__in=PdfContentIndex.matching_pdf_ids('cafe'))), [self.pdf_2])
+        self.assertFalse(Pdf.objects.filter(id__in=PdfContentIndex.matching_pdf_ids('python')).exists())
+
+    def test_get_hit_pages(self):
+        hit_pages = PdfContentIndex.get_hit_pages('hosting', [self.pdf_1.id, self.pdf_2.id])
+
+        self.assertEqual(hit_pages, {str(self.pdf_1.id): [1], str(self.pdf_2.id): [3]})
+
+    def test_get_hit_pages_restricted(self):
+        hit_pages = PdfContentIndex.get_hit_pages('host', [self.pdf_1.id])
+
+        self.assertEqual(hit_pages, {str(self.pdf_1.id): [1, 7]})
+
+    def test_get_hit_pages_empty(self):
+        self.assertEqual(PdfContentIndex.get_hit_pages('', [self.pdf_1.id]), {})
+        self.assertEqual(PdfContentIndex.get_hit_pages('host', []), {})
+
+    def test_index_updated(self):
+        page_text = self.pdf_2.pdfpagetext_set.get()
+        page_text.text = 'python'
+        page_text.save()
+
+        self.assertEqual(list(Pdf.objects.filter(id__in=PdfContentIndex.matching_pdf_ids('python'))), [self.pdf_2])
+
+        self.pdf_2.delete()
+
+        self.assertFalse(Pdf.objects.filter(id__in=PdfContentIndex.matching_pdf_ids('python')).exists())
@@ -1,19 +1,22 @@
 import filecmp
 from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
+from hashlib import sha256
 from pathlib import Path
 from unittest import mock
 from uuid import uuid4
 
 import pdf.service as service
 from core.settings import MEDIA_ROOT
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.files import File
 from django.db.models.functions import Lower
 from django.http.response import Http404
 from django.test import TestCase
 from django.urls import reverse
-from pdf.models import Pdf, PdfComment, PdfHighlight, Tag
+from pdf import ingest
+from pdf.models import Folder, Pdf, PdfComment, PdfHighlight, PdfPageText, Tag
 from PIL import Image
 from pypdfium2 import PdfDocument
 from users.service import get_demo_pdf
@@ -40,6 +43,27 @@ class TestTagServices(TestCase):
 
         self.assertEqual(tags, [])
 
+    def test_get_tag_id_groups(self):
+        tags = {
+            name: Tag.objects.create(name=name, owner=self.user.profile)
+            for name in ['programming', 'programming/python', 'programming/python/django', 'programming-go', 'news']
+        }
+        other_user = User.objects.create_user(username='other', password='password', email='b@a.com')
+        Tag.objects.create(name='news', owner=other_user.profile)
+
+        tag_id_groups = service.TagServices.get_tag_id_groups(
+            self.user.profile, ['programming', 'news', 'programming/python', '', 'news', 'missing']
+        )
+
+        # 'programming' is dropped as it is implied by 'programming/python'
+        self.assertEqual(
+            tag_id_groups,
+            [set(), {tags['news'].id}, {tags['programming/python'].id, tags['programming/python/django'].id}],
+        )
+
+    def test_get_tag_id_groups_empty(self):
+        self.assertEqual(service.TagServices.get_tag_id_groups(self.user.profile, ['']), [])
+
     @mock.patch('pdf.service.TagServices.get_tag_info_dict_tree_mode')
     def test_get_tag_info_dict_tree_mode_enabled(self, mock_get_tag_info_dict_tree_mode):
         profile = self.user.profile
@@ -232,6 +256,133 @@ class TestTagServices(TestCase):
         self.assertEqual(expected_tag_dict, generated_tag_dict)
 
 
+class TestSidebarServices(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='username', password='password', email='a@a.com')
+        self.profile = self.user.profile
+
+    def test_get_folder_tree(self):
+        folder_b = Folder.objects.create(name='b', owner=self.profile)
+        folder_a = Folder.objects.create(name='a', owner=self.profile)
+        folder_a_2 = Folder.objects.create(name='a_2', owner=self.profile, parent=folder_a)
+        folder_a_1 = Folder.objects.create(name='a_1', owner=self.profile, parent=folder_a)
+        folder_a_1_x = Folder.objects.create(name='x', owner=self.profile, parent=folder_a_1)
+
+        for folder, number in [(folder_a, 1), (folder_a_1, 2), (folder_a_1_x, 3), (None, 4)]:
+            for i in range(number):
+                Pdf.objects.create(owner=self.profile, name=f'pdf_{i}', folder=folder)
+
+        # pdfs of other users should not be counted
+        other_user = User.objects.create_user(username='other', password='password', email='b@a.com')
+        Pdf.objects.create(owner=other_user.profile, name='other')
+
+        folder_tree, root_pdf_count = service.SidebarServices.get_folder_tree(self.profile)
+
+        expected_folder_tree = [
+            {
+                'id': folder_a.id,
+                'name': 'a',
+                'parent_id': None,
+                'pdf_count': 6,
+                'subfolders': [
+                    {
+                        'id': folder_a_1.id,
+                        'name': 'a_1',
+                        'parent_id': folder_a.id,
+                        'pdf_count': 5,
+                        'subfolders': [
+                            {
+                                'id': folder_a_1_x.id,
+                                'name': 'x',
+                                'parent_id': folder_a_1.id,
+                                'pdf_count': 3,
+                                'subfolders': [],
+                            }
+                        ],
+                    },
+                    {'id': folder_a_2.id, 'name': 'a_2', 'parent_id': folder_a.id, 'pdf_count': 0, 'subfolders': []},
+                ],
+            },
+            {'id': folder_b.id, 'name': 'b', 'parent_id': None, 'pdf_count': 0, 'subfolders': []},
+        ]
+
+        self.assertEqual(folder_tree, expected_folder_tree)
+        self.assertEqual(root_pdf_count, 4)
+
+    def test_get_folder_tree_number_of_queries(self):
+        parent = None
+
+        for i in range(1000):
+            # folders with a depth of up to 10
+            parent = Folder.objects.create(
+                name=f'folder_{i}', owner=self.profile, parent=None if i % 10 == 0 else parent
+            )
+            Pdf.objects.create(owner=self.profile, name=f'pdf_{i}', folder=parent)
+
+        with self.assertNumQueries(2):
+            folder_tree, _ = service.SidebarServices.get_folder_tree(self.profile)
+
+        self.assertEqual(len(folder_tree), 100)
+        self.assertEqual(folder_tree[0]['pdf_count'], 10)
+
+    def test_get_sidebar_data(self):
+        Tag.objects.create(name='tag', owner=self.profile)
+        folder = Folder.objects.create(name='folder', owner=self.profile)
+        Pdf.objects.create(owner=self.profile, name='pdf', folder=folder)
+
+        sidebar_data = service.SidebarServices.get_sidebar_data(self.profile)
+
+        self.assertEqual(list(sidebar_data['tag_info_dict']), ['tag'])
+        self.assertEqual(sidebar_data['folders'][0]['pdf_count'], 1)
+        self.assertEqual(sidebar_data['root_pdf_count'], 0)
+
+        # only the library version is queried when the data is cached
+        with self.assertNumQueries(1):
+            self.assertEqual(service.SidebarServices.get_sidebar_data(self.profile), sidebar_data)
+
+    def test_get_sidebar_data_invalidated(self):
+        sidebar_data = service.SidebarServices.get_sidebar_data(self.profile)
+        self.assertEqual(sidebar_data['tag_info_dict'], {})
+
+        tag = Tag.objects.create(name='tag', owner=self.profile)
+        sidebar_data = service.SidebarServices.get_sidebar_data(self.profile)
+        self.assertEqual(list(sidebar_data['tag_info_dict']), ['tag'])
+
+        folder = Folder.objects.create(name='folder', owner=self.profile)
+        sidebar_data = service.SidebarServices.get_sidebar_data(self.profile)
+        self.assertEqual(sidebar_data['folders'][0]['pdf_count'], 0)
+
+        pdf = Pdf.objects.create(owner=self.profile, name='pdf', folder=folder)
+        sidebar_data = service.SidebarServices.get_sidebar_data(self.profile)
+        self.assertEqual(sidebar_data['folders'][0]['pdf_count'], 1)
+
+        pdf.folder = None
+        pdf.save()
+        sidebar_data = service.SidebarServices.get_sidebar_data(self.profile)
+        self.assertEqual(sidebar_data['folders'][0]['pdf_count'], 0)
+        self.assertEqual(sidebar_data['root_pdf_count'], 1)
+
+        tag.delete()
+        folder.delete()
+        sidebar_data = service.SidebarServices.get_sidebar_data(self.profile)
+        self.assertEqual(sidebar_data['tag_info_dict'], {})
+        self.assertEqual(sidebar_data['folders'], [])
+
+    def test_get_sidebar_data_tree_mode_changed(self):
+        Tag.objects.create(name='programming/python', owner=self.profile)
+        self.profile.tag_tree_mode = False
+        self.profile.save()
+
+        sidebar_data = service.SidebarServices.get_sidebar_data(self.profile)
+        self.assertEqual(list(sidebar_data['tag_info_dict']), ['programming/python'])
+
+        self.profile.tag_tree_mode = True
+        self.profile.save()
+
+        sidebar_data = service.SidebarServices.get_sidebar_data(self.profile)
+        self.assertEqual(list(sidebar_data['tag_info_dict']), ['programming', 'programming/python'])
+
+
 class TestPdfProcessingServices(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(username='username', password='password', email='a@a.com')
@@ -258,15 +409,35 @@ class TestPdfProcessingServices(TestCase):
         self.assertEqual(pdf.description, description)
         self.assertEqual(pdf.file_directory, file_directory)
         self.assertEqual(pdf.notes, '')
+        self.assertEqual(pdf.file_hash, service.get_file_hash(Path(pdf.file.path)))
+        # the returned pdf is not processed yet, the processing is done by the huey tasks
+        self.assertEqual(pdf.processing_state, Pdf.ProcessingState.PENDING)
+
+        pdf.refresh_from_db()
+        self.assertEqual(pdf.processing_state, Pdf.ProcessingState.READY)
         self.assertEqual(pdf.number_of_pages, 5)
         self.assertTrue(pdf.preview)
         self.assertTrue(pdf.thumbnail)
         self.assertEqual(pdf.pdfcomment_set.count(), 2)
         self.assertEqual(pdf.pdfhighlight_set.count(), 2)
+        self.assertEqual(pdf.pdfpagetext_set.count(), 5)
 
         for tag, expected_tag_name in zip(pdf.tags.all().order_by('name'), tag_string.split(' ')):
             self.assertEqual(tag.name, expected_tag_name)
 
+    @mock.patch('pdf.tasks.extract_pdf_annotations_task')
+    @mock.patch('pdf.tasks.extract_pdf_text_task')
+    @mock.patch('pdf.tasks.render_pdf_task')
+    def test_create_pdf_enqueues_tasks(self, mock_render_task, mock_text_task, mock_annotations_task):
+        pdf = service.PdfProcessingServices.create_pdf(name='pdf', owner=self.user.profile, pdf_file=get_demo_pdf())
+
+        for mock_task in [mock_render_task, mock_text_task, mock_annotations_task]:
+            mock_task.assert_called_once_with(pdf.id)
+
+        pdf.refresh_from_db()
+        self.assertEqual(pdf.processing_state, Pdf.ProcessingState.PENDING)
+        self.assertEqual(pdf.number_of_pages, -1)
+
     @mock.patch('pdf.service.PdfProcessingServices.set_thumbnail_and_preview')
     def test_set_process_with_pypdfium_no_images(self, mock_set_thumbnail_and_preview):
         pdf = Pdf.objects.create(owner=self.user.profile, name='pdf_1')
@@ -313,6 +484,42 @@ class TestPdfProcessingServices(TestCase):
         pdf = self.user.profile.pdf_set.get(name=pdf.name)
         self.assertEqual(pdf.number_of_pages, -1)
 
+    @mock.patch('pdf.service.PdfProcessingServices.set_page_texts')
+    def test_set_process_with_pypdfium_extract_text(self, mock_set_page_texts):
+        dummy_path = Path(__file__).parent / 'data' / 'dummy.pdf'
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf_1')
+        with dummy_path.open(mode="rb") as f:
+            pdf.file = File(f, name=dummy_path.name)
+            pdf.save()
+
+        service.PdfProcessingServices.process_with_pypdfium(pdf, False)
+        mock_set_page_texts.assert_not_called()
+
+        service.PdfProcessingServices.process_with_pypdfium(pdf, False, extract_text=True)
+        mock_set_page_texts.assert_called_once()
+
+    def test_set_page_texts(self):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf', file=get_demo_pdf())
+        PdfPageText.objects.create(pdf=pdf, page=1, text='outdated')
+        pdf_document = PdfDocument(pdf.file.path, autoclose=True)
+
+        service.PdfProcessingServices.set_page_texts(pdf, pdf_document)
+        pdf_document.close()
+
+        page_texts = pdf.pdfpagetext_set.order_by('page')
+        self.assertEqual([page_text.page for page_text in page_texts], [1, 2, 3, 4, 5])
+        self.assertTrue(page_texts[0].text.startswith('Lorem Ipsum'))
+        self.assertFalse(pdf.pdfpagetext_set.filter(text='outdated').exists())
+
+    def test_set_page_texts_exception(self):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf')
+        PdfPageText.objects.create(pdf=pdf, page=1, text='existing')
+
+        # check that exception is caught and the existing page texts are kept
+        service.PdfProcessingServices.set_page_texts(pdf, None)
+
+        self.assertEqual(pdf.pdfpagetext_set.count(), 1)
+
     def test_set_thumbnail_and_preview(self):
         dummy_path = Path(__file__).parent / 'data' / 'dummy.pdf'
         pdf = Pdf.objects.create(owner=self.user.profile, name='pdf')
@@ -331,6 +538,19 @@ class TestPdfProcessingServices(TestCase):
 
         pdf_document.close()
 
+    @mock.patch('pdf.service.THUMBNAIL_FORMAT', 'WEBP')
+    def test_set_thumbnail_and_preview_image_format(self):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf', file=get_demo_pdf())
+        pdf_document = PdfDocument(pdf.file.path, autoclose=True)
+
+        pdf = service.PdfProcessingServices.set_thumbnail_and_preview(pdf, pdf_document)
+        pdf.save()
+        pdf_document.close()
+
+        self.assertEqual(pdf.thumbnail.name, f'{self.user.id}/thumbnails/{pdf.id}.webp')
+        self.assertEqual(pdf.preview.name, f'{self.user.id}/previews/{pdf.id}.webp')
+        self.assertEqual(Image.open(pdf.thumbnail.path).format, 'WEBP')
+
     def test_set_thumbnail_and_preview_exception(self):
         pdf = Pdf.objects.create(owner=self.user.profile, name='pdf')
 
@@ -339,20 +559,6 @@ class TestPdfProcessingServices(TestCase):
 
         self.assertFalse(pdf.thumbnail)
 
-    def test_get_pdf_info_list(self):
-        dummy_path = Path(__file__).parent / 'data' / 'dummy.pdf'
-
-        for i in range(3):
-            pdf = Pdf.objects.create(owner=self.user.profile, name=f'pdf_{i}')
-            with dummy_path.open(mode="rb") as f:
-                pdf.file = File(f, name=dummy_path.name)
-                pdf.save()
-
-        generated_info_list = service.get_pdf_info_list(self.user.profile)
-        expected_info_list = [(f'pdf_{i}', 8885) for i in range(3)]
-
-        self.assertEqual(generated_info_list, expected_info_list)
-
     def test_set_highlights_and_comments(self):
         creation_date = datetime.strptime('20250311081649-+00:00', '%Y%m%d%H%M%S-%z')
 
@@ -403,6 +609,51 @@ class TestPdfProcessingServices(TestCase):
         self.assertFalse(pdf.pdfcomment_set.count())
         self.assertFalse(pdf.pdfhighlight_set.count())
 
+    def test_sync_highlights_and_comments_initial(self):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf_with_annotations', file=get_demo_pdf())
+        PdfComment.objects.create(text='outdated', page=1, creation_date=datetime.now(tz=timezone.utc), pdf=pdf)
+
+        service.PdfProcessingServices.sync_highlights_and_comments(pdf)
+
+        # without fingerprints all highlights and comments are replaced
+        self.assertEqual(
+            sorted(pdf.pdfcomment_set.values_list('page', 'text')), [(2, 'demo comment page 2'), (5, 'last page')]
+        )
+        self.assertEqual(sorted(pdf.pdfhighlight_set.values_list('page', flat=True)), [2, 3])
+        self.assertEqual(set(Pdf.objects.get(id=pdf.id).annotation_fingerprints.keys()), {'2', '3', '5'})
+
+    def test_sync_highlights_and_comments_changed_pages(self):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf_with_annotations', file=get_demo_pdf())
+        service.PdfProcessingServices.sync_highlights_and_comments(pdf)
+        fingerprints = pdf.annotation_fingerprints
+
+        unchanged_ids = set(pdf.pdfcomment_set.values_list('id', flat=True))
+        highlight_page_2 = pdf.pdfhighlight_set.get(page=2)
+        pdf.pdfhighlight_set.filter(page=3).delete()
+        PdfComment.objects.create(text='outdated', page=2, creation_date=datetime.now(tz=timezone.utc), pdf=pdf)
+        # comments of unchanged pages are not touched
+        PdfComment.objects.create(text='not synced', page=5, creation_date=datetime.now(tz=timezone.utc), pdf=pdf)
+
+        pdf.annotation_fingerprints = fingerprints | {'2': 'outdated', '3': 'outdated'}
+        service.PdfProcessingServices.sync_highlights_and_comments(pdf)
+
+        self.assertEqual(
+            sorted(pdf.pdfcomment_set.values_list('page', 'text')),
+            [(2, 'demo comment page 2'), (5, 'last page'), (5, 'not synced')],
+        )
+        self.assertTrue(unchanged_ids < set(pdf.pdfcomment_set.values_list('id', flat=True)))
+        # unchanged highlights of changed pages are kept
+        self.assertEqual(pdf.pdfhighlight_set.get(page=2).id, highlight_page_2.id)
+        self.assertEqual(pdf.pdfhighlight_set.filter(page=3).count(), 1)
+        self.assertEqual(Pdf.objects.get(id=pdf.id).annotation_fingerprints, fingerprints)
+
+    def test_sync_highlights_and_comments_exception(self):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf_with_annotations', file='dummy_file')
+
+        service.PdfProcessingServices.sync_highlights_and_comments(pdf)
+
+        self.assertIsNone(Pdf.objects.get(id=pdf.id).annotation_fingerprints)
+
     @mock.patch('pdf.service.PdfProcessingServices.export_annotations_to_yaml')
     def test_export_annotations(self, mock_export_annotation_to_yaml):
         pdf_1 = Pdf.objects.create(owner=self.user.profile, name='pdf_1')
@@ -541,6 +792,92 @@ class TestPdfProcessingServices(TestCase):
         mock_delete_empty_dirs_after_rename_or_delete.assert_not_called()
 
 
+class TestBulkIngestServices(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='username', password='password', email='a@a.com')
+
+    def create_pdfs(self, number: int) -> list[Pdf]:
+        pdfs = []
+
+        for i in range(number):
+            pdf = Pdf.objects.create(
+                owner=self.user.profile,
+                name=f'pdf_{i}',
+                file=get_demo_pdf(),
+                processing_state=Pdf.ProcessingState.PENDING,
+            )
+            pdfs.append(pdf)
+
+        return pdfs
+
+    def assert_processed(self, pdf: Pdf):
+        pdf.refresh_from_db()
+
+        self.assertEqual(pdf.processing_state, Pdf.ProcessingState.READY)
+        self.assertEqual(pdf.number_of_pages, 5)
+        self.assertTrue(pdf.thumbnail)
+        self.assertTrue(pdf.preview)
+        self.assertEqual(pdf.pdfpagetext_set.count(), 5)
+        self.assertEqual(pdf.pdfcomment_set.count(), 2)
+        self.assertEqual(pdf.pdfhighlight_set.count(), 2)
+
+    def test_ingest_single_worker(self):
+        pdfs = self.create_pdfs(2)
+        progress_callback = mock.Mock()
+
+        service.BulkIngestServices.process_pdfs(pdfs, workers=1, progress_callback=progress_callback)
+
+        for pdf in pdfs:
+            self.assert_processed(pdf)
+
+        self.assertEqual(progress_callback.call_args_list, [mock.call(1, 2), mock.call(2, 2)])
+
+    def test_ingest_process_pool(self):
+        pdfs = self.create_pdfs(3)
+        progress_callback = mock.Mock()
+
+        service.BulkIngestServices.process_pdfs(pdfs, workers=2, progress_callback=progress_callback)
+
+        for pdf in pdfs:
+            self.assert_processed(pdf)
+
+        self.assertEqual(progress_callback.call_args_list, [mock.call(i, 3) for i in range(1, 4)])
+
+    @mock.patch('pdf.service.INGEST_WORKERS', 1)
+    @mock.patch('pdf.service.BulkIngestServices.log_progress')
+    def test_ingest_defaults(self, mock_log_progress):
+        pdfs = self.create_pdfs(1)
+
+        service.BulkIngestServices.process_pdfs(pdfs)
+
+        self.assert_processed(pdfs[0])
+        mock_log_progress.assert_called_once_with(1, 1)
+
+    def test_ingest_deleted_pdf(self):
+        pdfs = self.create_pdfs(2)
+        Pdf.objects.filter(id=pdfs[0].id).delete()
+
+        service.BulkIngestServices.process_pdfs(pdfs, workers=1)
+
+        self.assertFalse(Pdf.objects.filter(id=pdfs[0].id).exists())
+        self.assert_processed(pdfs[1])
+
+    def test_apply_processing_result_failed(self):
+        pdf = self.create_pdfs(1)[0]
+        PdfPageText.objects.create(pdf=pdf, page=1, text='existing')
+
+        service.PdfProcessingServices.apply_processing_result(
+            pdf, ingest.ProcessingResult(pdf_id=str(pdf.id), errors=['some error'])
+        )
+        pdf.refresh_from_db()
+
+        self.assertEqual(pdf.processing_state, Pdf.ProcessingState.FAILED)
+        self.assertEqual(pdf.number_of_pages, -1)
+        self.assertFalse(pdf.thumbnail)
+        # the existing page texts are kept, as no page texts were extracted
+        self.assertEqual(pdf.pdfpagetext_set.count(), 1)
+
+
 class TestOtherServices(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(username='username', password='password', email='a@a.com')
@@ -658,3 +995,32 @@ class TestOtherServices(TestCase):
         expected_url = f'{reverse("pdf_overview")}?tags=another'
 
         self.assertEqual(expected_url, adjusted_url)
+
+    def test_get_file_hash(self):
+        dummy_path = Path(__file__).parent / 'data' / 'dummy.pdf'
+        expected_hash = sha256(dummy_path.read_bytes()).hexdigest()
+
+        self.assertEqual(service.get_file_hash(dummy_path), expected_hash)
+
+        with dummy_path.open(mode='rb') as f:
+            file = File(f, name=dummy_path.name)
+            self.assertEqual(service.get_file_hash(file), expected_hash)
+            # the file can still be saved afterwards
+            self.assertEqual(file.read(4), b'%PDF')
+
+    def test_pdf_with_same_content_exists(self):
+        other_user = User.objects.create_user(username='other', password='password', email='b@a.com')
+        Pdf.objects.create(owner=self.user.profile, name='pdf', file_hash='a' * 64)
+
+        self.assertTrue(service.pdf_with_same_content_exists(self.user.profile, 'a' * 64, 'other', 1))
+        self.assertFalse(service.pdf_with_same_content_exists(self.user.profile, 'b' * 64, 'other', 1))
+        self.assertFalse(service.pdf_with_same_content_exists(other_user.profile, 'a' * 64, 'other', 1))
+
+    def test_pdf_with_same_content_exists_without_hash(self):
+        # pdfs without a hash are matched by name and file size
+        Pdf.objects.create(owner=self.user.profile, name='demo', file=get_demo_pdf())
+        size = (settings.BASE_DIR / 'users' / 'demo_data' / 'demo.pdf').stat().st_size
+
+        self.assertTrue(service.pdf_with_same_content_exists(self.user.profile, 'a' * 64, 'demo', size))
+        self.assertFalse(service.pdf_with_same_content_exists(self.user.profile, 'a' * 64, 'demo', size + 1))
+        self.assertFalse(service.pdf_with_same_content_exists(self.user.profile, 'a' * 64, 'other', size))
@@ -1,7 +1,8 @@
 from django.contrib.auth.models import User
 from django.test import TestCase
 
-from pdf.models import Pdf, Tag
+from pdf.models import Folder, LibraryVersion, Pdf, Tag
+from pdf.search import PdfNameIndex
 
 
 class TestSignals(TestCase):
@@ -23,3 +24,73 @@ class TestSignals(TestCase):
 
         # check that tag 1 was deleted
         self.assertFalse(user.profile.tag_set.filter(name='tag_1').exists())
+
+    def test_pdf_library_changed(self):
+        user = User.objects.create_user(username='test_user', password='12345')
+        LibraryVersion.get_version(user.profile.id)
+        PdfNameIndex._indexes[user.profile.id] = 'index'
+
+        pdf = Pdf.objects.create(owner=user.profile, name='pdf_1')
+
+        self.assertEqual(LibraryVersion.get_version(user.profile.id), 1)
+        self.assertNotIn(user.profile.id, PdfNameIndex._indexes)
+
+        pdf.delete()
+
+        self.assertEqual(LibraryVersion.get_version(user.profile.id), 2)
+
+    def test_pdf_library_changed_reading_state(self):
+        user = User.objects.create_user(username='test_user', password='12345')
+        pdf = Pdf.objects.create(owner=user.profile, name='pdf_1')
+        LibraryVersion.get_version(user.profile.id)
+
+        pdf.current_page = 5
+        pdf.views = 3
+        pdf.save(update_fields=['current_page', 'views'])
+
+        self.assertEqual(LibraryVersion.get_version(user.profile.id), 0)
+
+    def test_tag_or_folder_changed(self):
+        user = User.objects.create_user(username='test_user', password='12345')
+        LibraryVersion.get_version(user.profile.id)
+
+        tag = Tag.objects.create(name='tag', owner=user.profile)
+        tag.name = 'renamed'
+        tag.save()
+        tag.delete()
+
+        self.assertEqual(LibraryVersion.get_version(user.profile.id), 3)
+
+        folder = Folder.objects.create(name='folder', owner=user.profile)
+        folder.delete()
+
+        self.assertEqual(LibraryVersion.get_version(user.profile.id), 5)
+
+    def test_update_folder_pdf_counts(self):
+        user = User.objects.create_user(username='test_user', password='12345')
+        parent = Folder.objects.create(name='parent', owner=user.profile)
+        folder = Folder.objects.create(name='folder', owner=user.profile, parent=parent)
+        other_folder = Folder.objects.create(name='other', owner=user.profile)
+
+        pdf = Pdf.objects.create(owner=user.profile, name='pdf_1', folder=folder)
+        self.assertEqual(Folder.objects.get(id=parent.id).pdf_count, 1)
+
+        pdf.folder = other_folder
+        pdf.save()
+        self.assertEqual(Folder.objects.get(id=parent.id).pdf_count, 0)
+        self.assertEqual(Folder.objects.get(id=other_folder.id).pdf_count, 1)
+
+        pdf.delete()
+        self.assertEqual(Folder.objects.get(id=other_folder.id).pdf_count, 0)
+
+    def test_update_ancestor_pdf_counts(self):
+        user = User.objects.create_user(username='test_user', password='12345')
+        parent = Folder.objects.create(name='parent', owner=user.profile)
+        folder = Folder.objects.create(name='folder', owner=user.profile, parent=parent)
+        Pdf.objects.create(owner=user.profile, name='pdf_1', folder=folder)
+
+        folder.delete()
+
+        parent = Folder.objects.get(id=parent.id)
+        self.assertEqual((parent.direct_pdf_count, parent.pdf_count), (0, 0))
+        self.assertEqual(Pdf.objects.get(name='pdf_1').folder, None)
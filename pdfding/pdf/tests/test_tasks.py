@@ -1,22 +1,27 @@
+import filecmp
 from pathlib import Path
 from shutil import copy
 from unittest import mock
 
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.files import File
 from django.test import TestCase, override_settings
-from pdf import tasks
-from pdf.models import Pdf
+from pdf import service, tasks
+from pdf.models import ConsumeJournalEntry, Pdf
 
 
 class TestTasks(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(username='username', password='password', email='a@a.com')
 
-    @override_settings(CONSUME_DIR=Path(__file__).parent / 'data' / 'consume')
-    @mock.patch('pdf.service.PdfProcessingServices.set_highlights_and_comments')
+    @override_settings(
+        CONSUME_DIR=Path(__file__).parent / 'data' / 'consume',
+        CONSUME_QUARANTINE_DIR=Path(__file__).parent / 'data' / 'consume' / 'quarantine',
+    )
+    @mock.patch('pdf.service.BulkIngestServices.process_pdfs', wraps=service.BulkIngestServices.process_pdfs)
     @mock.patch('pdf.service.uuid4', return_value='12345678')
-    def test_consume_function(self, mock_uuid4, mock_set_highlights_and_comments):
+    def test_consume_function(self, mock_uuid4, mock_process_pdfs):
         # prepare data
         dummy_path = Path(__file__).parent / 'data' / 'dummy.pdf'
         pdf = Pdf.objects.create(owner=self.user.profile, name='dummy_1')
@@ -34,7 +39,7 @@ class TestTasks(TestCase):
         pdf_path_2 = user_consume_path / 'dummy_2.pdf'
         pdf_path_3 = user_consume_path / 'dummy_3.pdf'
         wrong_pdf_path = consume_path / 'wrong_path.pdf'
-        # add a non pdf file. This file should just be ignored
+        # add a non pdf file. This file should be moved to the quarantine folder
         txt_path = user_consume_path / 'dummy_text.txt'
         txt_path.touch(exist_ok=True)
 
@@ -55,9 +60,9 @@ class TestTasks(TestCase):
         self.assertEqual(len(list(user_consume_path.iterdir())), 0)
 
         # test with skip existing set to true
-        # only dummy_3 should be created as dummy_1 already exists
-        for target_path in [pdf_path_1, pdf_path_3]:
-            copy(dummy_path, target_path)
+        # only dummy_3 should be created as a pdf with the same content as dummy_1 already exists
+        copy(dummy_path, pdf_path_1)
+        copy(settings.BASE_DIR / 'users' / 'demo_data' / 'demo.pdf', pdf_path_3)
 
         tasks.consume_function(True)
         pdfs = Pdf.objects.filter(owner=self.user.profile).all()
@@ -70,31 +75,268 @@ class TestTasks(TestCase):
         self.assertEqual(sorted(['consumed', 'file']), sorted([tag.name for tag in dummy_3.tags.all()]))
 
         # test number_of_pages and thumbnail were created
-        self.assertEqual(dummy_3.number_of_pages, 2)
+        self.assertEqual(dummy_3.number_of_pages, 5)
         self.assertTrue(dummy_3.thumbnail)
 
-        self.assertEqual(mock_set_highlights_and_comments.call_count, 3)
+        # the created pdfs are processed together by the bulk ingest
+        self.assertEqual([len(call.args[0]) for call in mock_process_pdfs.call_args_list], [2, 1])
+        self.assertEqual(dummy_3.processing_state, Pdf.ProcessingState.READY)
+        self.assertFalse(ConsumeJournalEntry.objects.exists())
+
+        quarantined_txt_path = consume_path / 'quarantine' / str(self.user.id) / 'dummy_text.txt'
+        self.assertTrue(quarantined_txt_path.exists())
 
         # clean up
+        quarantined_txt_path.unlink()
+        quarantined_txt_path.parent.rmdir()
+        quarantined_txt_path.parent.parent.rmdir()
         wrong_pdf_path.unlink()
         user_consume_path.rmdir()
         consume_path.rmdir()
 
-    def test_passes_consume_condition_fail_not_pdf(self):
-        # wrong file type
-        self.assertFalse(tasks.passes_consume_condition(Path(__file__), skip_existing=False, pdf_info_list=[]))
+    @override_settings(CONSUME_DIR=Path(__file__).parent / 'data' / 'consume', CONSUME_BATCH_SIZE=2)
+    @mock.patch('pdf.service.BulkIngestServices.process_pdfs', wraps=service.BulkIngestServices.process_pdfs)
+    def test_consume_function_batches(self, mock_process_pdfs):
+        user_consume_path = Path(__file__).parent / 'data' / 'consume' / str(self.user.id)
+        user_consume_path.mkdir(parents=True, exist_ok=True)
+        dummy_path = Path(__file__).parent / 'data' / 'dummy.pdf'
+
+        for i in range(5):
+            copy(dummy_path, user_consume_path / f'dummy_{i}.pdf')
+
+        tasks.consume_function(False)
+
+        self.assertEqual(Pdf.objects.filter(owner=self.user.profile).count(), 5)
+        self.assertEqual([len(call.args[0]) for call in mock_process_pdfs.call_args_list], [2, 2, 1])
+
+        # clean up
+        user_consume_path.rmdir()
+        user_consume_path.parent.rmdir()
+
+    @override_settings(CONSUME_DIR=Path(__file__).parent / 'data' / 'consume')
+    def test_consume_function_resume(self):
+        user_consume_path = Path(__file__).parent / 'data' / 'consume' / str(self.user.id)
+        user_consume_path.mkdir(parents=True, exist_ok=True)
+        pdf_path = user_consume_path / 'demo.pdf'
+        copy(settings.BASE_DIR / 'users' / 'demo_data' / 'demo.pdf', pdf_path)
+
+        # simulate a consume run that was interrupted after the pdf was created
+        with pdf_path.open('rb') as f:
+            pdf = service.PdfProcessingServices.create_pdf(
+                name='demo', owner=self.user.profile, pdf_file=File(f, name='demo.pdf'), process_in_background=False
+            )
+        ConsumeJournalEntry.objects.create(file_path=str(pdf_path), file_hash=pdf.file_hash, pdf=pdf)
+
+        tasks.consume_function(False)
+
+        # the file is not consumed again, but the pdf is processed
+        pdf = Pdf.objects.get(owner=self.user.profile)
+        self.assertEqual(pdf.processing_state, Pdf.ProcessingState.READY)
+        self.assertFalse(pdf_path.exists())
+        self.assertFalse(ConsumeJournalEntry.objects.exists())
+
+        # clean up
+        user_consume_path.rmdir()
+        user_consume_path.parent.rmdir()
+
+    @override_settings(
+        CONSUME_DIR=Path(__file__).parent / 'data' / 'consume',
+        CONSUME_QUARANTINE_DIR=Path(__file__).parent / 'data' / 'consume' / 'quarantine',
+    )
+    @mock.patch('pdf.service.PdfProcessingServices.create_pdf', side_effect=ValueError)
+    def test_consume_file_quarantine(self, mock_create_pdf):
+        user_consume_path = Path(__file__).parent / 'data' / 'consume' / str(self.user.id)
+        user_consume_path.mkdir(parents=True, exist_ok=True)
+        quarantine_path = Path(__file__).parent / 'data' / 'consume' / 'quarantine' / str(self.user.id)
+        dummy_path = Path(__file__).parent / 'data' / 'dummy.pdf'
+
+        # files with the same name do not overwrite each other in the quarantine folder
+        for _ in range(2):
+            copy(dummy_path, user_consume_path / 'dummy.pdf')
+            self.assertIsNone(tasks.consume_file(user_consume_path / 'dummy.pdf', self.user, False))
+
+        quarantined_paths = sorted(quarantine_path.iterdir())
+        self.assertEqual(len(quarantined_paths), 2)
+        self.assertTrue(filecmp.cmp(quarantined_paths[0], dummy_path, shallow=False))
+        self.assertFalse(ConsumeJournalEntry.objects.exists())
+
+        # clean up
+        for path in quarantined_paths:
+            path.unlink()
+        quarantine_path.rmdir()
+        quarantine_path.parent.rmdir()
+        user_consume_path.rmdir()
+        user_consume_path.parent.rmdir()
+
+    @mock.patch('pdf.tasks.quarantine_file', side_effect=PermissionError)
+    @mock.patch('pdf.service.PdfProcessingServices.create_pdf', side_effect=ValueError)
+    def test_consume_file_quarantine_failed(self, mock_create_pdf, mock_quarantine_file):
+        dummy_path = Path(__file__).parent / 'data' / 'dummy.pdf'
+
+        # the error of the quarantine folder does not abort consuming the other files
+        self.assertIsNone(tasks.consume_file(dummy_path, self.user, False))
+        mock_quarantine_file.assert_called_once_with(dummy_path, self.user)
+        self.assertTrue(dummy_path.exists())
 
-        # existing pdf
+    @override_settings(CONSUME_DIR=Path(__file__).parent / 'data' / 'consume')
+    @mock.patch('pdf.service.BulkIngestServices.process_pdfs', wraps=service.BulkIngestServices.process_pdfs)
+    def test_consume_file_task(self, mock_process_pdfs):
+        user_consume_path = Path(__file__).parent / 'data' / 'consume' / str(self.user.id)
+        user_consume_path.mkdir(parents=True, exist_ok=True)
+        pdf_path = user_consume_path / 'demo.pdf'
+        copy(settings.BASE_DIR / 'users' / 'demo_data' / 'demo.pdf', pdf_path)
+
+        tasks.consume_file_task(self.user.id, str(pdf_path))
+        # the file was already consumed
+        tasks.consume_file_task(self.user.id, str(pdf_path))
+
+        pdf = Pdf.objects.get(owner=self.user.profile)
+        self.assertEqual(pdf.name, 'demo')
+        self.assertEqual(pdf.number_of_pages, 5)
+        self.assertEqual(pdf.processing_state, Pdf.ProcessingState.READY)
+        self.assertFalse(pdf_path.exists())
+        mock_process_pdfs.assert_called_once_with([pdf], workers=1)
+        self.assertFalse(ConsumeJournalEntry.objects.exists())
+
+        # clean up
+        user_consume_path.rmdir()
+        user_consume_path.parent.rmdir()
+
+    def test_passes_consume_condition_fail_existing(self):
+        profile = self.user.profile
         dummy_path = Path(__file__).parent / 'data' / 'dummy.pdf'
-        pdf_info_list = [('some_pdf', 123456789), ('dummy', 8885)]
-        self.assertFalse(tasks.passes_consume_condition(dummy_path, skip_existing=True, pdf_info_list=pdf_info_list))
+        file_hash = service.get_file_hash(dummy_path)
+        Pdf.objects.create(owner=profile, name='other_name', file_hash=file_hash)
+
+        self.assertFalse(tasks.passes_consume_condition(dummy_path, True, profile, file_hash))
 
-    def test_consume_condition_fail_not_pdf(self):
+    def test_is_pdf_file(self):
+        self.assertTrue(tasks.is_pdf_file(Path(__file__).parent / 'data' / 'dummy.pdf'))
+        self.assertFalse(tasks.is_pdf_file(Path(__file__)))
+
+    def test_passes_consume_condition(self):
+        profile = self.user.profile
         dummy_path = Path(__file__).parent / 'data' / 'dummy.pdf'
+        file_hash = service.get_file_hash(dummy_path)
 
         # pdf file, not skipping
-        self.assertTrue(tasks.passes_consume_condition(dummy_path, skip_existing=False, pdf_info_list=[]))
+        self.assertTrue(tasks.passes_consume_condition(dummy_path, False, profile, file_hash))
 
         # pdf file, skipping but not existing
-        pdf_info_list = [('some_pdf', 123456789), ('other', 8885)]
-        self.assertTrue(tasks.passes_consume_condition(dummy_path, skip_existing=True, pdf_info_list=pdf_info_list))
+        Pdf.objects.create(owner=profile, name='dummy', file_hash='a' * 64)
+        self.assertTrue(tasks.passes_consume_condition(dummy_path, True, profile, file_hash))
+
+        # pdf file, skipping but only existing for another user
+        other_user = User.objects.create_user(username='other', password='password', email='b@a.com')
+        Pdf.objects.create(owner=other_user.profile, name='dummy', file_hash=file_hash)
+        self.assertTrue(tasks.passes_consume_condition(dummy_path, True, profile, file_hash))
+
+    @mock.patch('pdf.service.PdfProcessingServices.process_with_pypdfium', return_value=True)
+    def test_render_pdf_task(self, mock_process_with_pypdfium):
+        pdf = Pdf.objects.create(
+            owner=self.user.profile, name='pdf', processing_state=Pdf.ProcessingState.PENDING, number_of_pages=3
+        )
+
+        tasks.render_pdf_task(pdf.id)
+        pdf.refresh_from_db()
+
+        mock_process_with_pypdfium.assert_called_once()
+        self.assertEqual(pdf.processing_state, Pdf.ProcessingState.READY)
+
+    @mock.patch('pdf.service.PdfProcessingServices.process_with_pypdfium', return_value=False)
+    def test_render_pdf_task_failed(self, mock_process_with_pypdfium):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf', processing_state=Pdf.ProcessingState.PENDING)
+
+        tasks.render_pdf_task(pdf.id)
+        pdf.refresh_from_db()
+
+        self.assertEqual(pdf.processing_state, Pdf.ProcessingState.FAILED)
+
+    @mock.patch('pdf.service.PdfProcessingServices.process_with_pypdfium')
+    def test_render_pdf_task_deleted_pdf(self, mock_process_with_pypdfium):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf', processing_state=Pdf.ProcessingState.PENDING)
+        pdf_id = pdf.id
+        pdf.delete()
+
+        tasks.render_pdf_task(pdf_id)
+
+        mock_process_with_pypdfium.assert_not_called()
+
+    def test_render_pdf_task_does_not_overwrite_changes(self):
+        dummy_path = Path(__file__).parent / 'data' / 'dummy.pdf'
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf', processing_state=Pdf.ProcessingState.PENDING)
+        with dummy_path.open(mode='rb') as f:
+            pdf.file = File(f, name=dummy_path.name)
+            pdf.save()
+
+        # the pdf is renamed while the task is waiting in the queue
+        Pdf.objects.filter(id=pdf.id).update(name='renamed')
+
+        tasks.render_pdf_task(pdf.id)
+        pdf.refresh_from_db()
+
+        self.assertEqual(pdf.name, 'renamed')
+        self.assertEqual(pdf.number_of_pages, 2)
+        self.assertEqual(pdf.processing_state, Pdf.ProcessingState.READY)
+
+        # clean up
+        for file_field in [pdf.file, pdf.thumbnail, pdf.preview]:
+            Path(file_field.path).unlink()
+
+    @mock.patch('pdf.service.PdfProcessingServices.set_page_texts')
+    def test_extract_pdf_text_task(self, mock_set_page_texts):
+        dummy_path = Path(__file__).parent / 'data' / 'dummy.pdf'
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf')
+        with dummy_path.open(mode='rb') as f:
+            pdf.file = File(f, name=dummy_path.name)
+            pdf.save()
+
+        tasks.extract_pdf_text_task(pdf.id)
+
+        mock_set_page_texts.assert_called_once()
+        self.assertEqual(mock_set_page_texts.call_args.args[0], pdf)
+
+        # clean up
+        Path(pdf.file.path).unlink()
+
+    @mock.patch('pdf.service.PdfProcessingServices.set_page_texts')
+    def test_extract_pdf_text_task_deleted_pdf(self, mock_set_page_texts):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf')
+        pdf_id = pdf.id
+        pdf.delete()
+
+        tasks.extract_pdf_text_task(pdf_id)
+
+        mock_set_page_texts.assert_not_called()
+
+    @mock.patch('pdf.service.get_file_hash', return_value='a' * 64)
+    def test_backfill_file_hashes_task(self, mock_get_file_hash):
+        pdfs = [Pdf.objects.create(owner=self.user.profile, name=f'pdf_{i}') for i in range(3)]
+
+        with mock.patch('pdf.tasks.backfill_file_hashes', wraps=tasks.backfill_file_hashes) as mock_backfill:
+            tasks.backfill_file_hashes_task(batch_size=2)
+
+        # every batch is processed by its own task, the last task finds no pdfs without a hash
+        self.assertEqual(mock_backfill.call_count, 3)
+        self.assertEqual(mock_get_file_hash.call_count, 3)
+
+        for pdf in pdfs:
+            pdf.refresh_from_db()
+            self.assertEqual(pdf.file_hash, 'a' * 64)
+
+    @mock.patch('pdf.service.PdfProcessingServices.sync_highlights_and_comments')
+    def test_extract_pdf_annotations_task(self, mock_sync_highlights_and_comments):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf')
+
+        tasks.extract_pdf_annotations_task(pdf.id)
+        tasks.extract_pdf_annotations_task('00000000-0000-0000-0000-000000000000')
+
+        mock_sync_highlights_and_comments.assert_called_once_with(pdf)
+
+    @mock.patch('pdf.service.BulkIngestServices.process_pdfs')
+    def test_bulk_ingest_task(self, mock_process_pdfs):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf')
+
+        tasks.bulk_ingest_task([pdf.id, '00000000-0000-0000-0000-000000000000'])
+
+        mock_process_pdfs.assert_called_once_with([pdf])
@@ -0,0 +1,126 @@
+import re
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.test import Client, TestCase
+from django.urls import reverse
+from pdf.models import Pdf
+
+
+class BrowserCache:
+    """
+    Minimal browser cache for files served by the serve views. Fresh immutable responses are used without a request,
+    all others are revalidated with their ETag. The number of transferred bytes is counted.
+    """
+
+    def __init__(self, client: Client):
+        self.client = client
+        self.entries = dict()
+        self.transferred_bytes = 0
+        self.number_of_requests = 0
+
+    def get(self, url: str) -> bytes:
+        entry = self.entries.get(url)
+
+        if entry and 'immutable' in entry['cache_control']:
+            return entry['content']
+
+        headers = {'HTTP_IF_NONE_MATCH': entry['etag']} if entry else {}
+        response = self.client.get(url, **headers)
+        self.number_of_requests += 1
+
+        if response.status_code == 304:
+            return entry['content']
+
+        content = b''.join(response.streaming_content)
+        self.transferred_bytes += len(content)
+        self.entries[url] = {
+            'content': content,
+            'etag': response.headers['ETag'],
+            'cache_control': response.headers['Cache-Control'],
+        }
+
+        return content
+
+
+class TestCaching(TestCase):
+    username = 'user'
+    password = '12345'
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username=self.username, password=self.password, email='a@a.com')
+        self.client.login(username=self.username, password=self.password)
+
+        profile = self.user.profile
+        profile.layout = 'Grid'
+        profile.save()
+
+        self.pdfs = []
+
+        for i in range(5):
+            pdf = Pdf.objects.create(owner=profile, name=f'pdf_{i}')
+            pdf.file.save(f'pdf_{i}.pdf', ContentFile(b'%PDF-1.7 pdf content'))
+            pdf.thumbnail.save('thumbnail', ContentFile(b'thumbnail' * 1000))
+            self.pdfs.append(pdf)
+
+            for file_field in [pdf.file, pdf.thumbnail]:
+                self.addCleanup(Path(file_field.path).unlink)
+
+    def test_serve_pdf_revisioned(self):
+        pdf = self.pdfs[0]
+        pdf.revision = 3
+        pdf.save()
+
+        response = self.client.get(reverse('serve_pdf', kwargs={'identifier': pdf.id, 'revision': 3}))
+        self.assertEqual(response.headers['Cache-Control'], 'private, max-age=31536000, immutable')
+        self.assertIn('ETag', response.headers)
+
+        # the content of an outdated revision url changed, so it may not be cached
+        response = self.client.get(reverse('serve_pdf', kwargs={'identifier': pdf.id, 'revision': 2}))
+        self.assertEqual(response.headers['Cache-Control'], 'private, no-cache')
+
+    def test_overview_thumbnail_urls(self):
+        pdf = self.pdfs[0]
+        pdf.revision = 2
+        pdf.save()
+
+        response = self.client.get(reverse('pdf_overview'))
+
+        self.assertContains(response, reverse('serve_thumbnail', kwargs={'identifier': pdf.id, 'revision': 2}))
+
+    def test_overview_reload_warm_cache(self):
+        browser_cache = BrowserCache(self.client)
+
+        def load_overview():
+            response = self.client.get(reverse('pdf_overview'))
+            thumbnail_urls = re.findall(r'src="([^"]*/get_thumbnail/[^"]*)"', response.content.decode())
+
+            self.assertEqual(len(thumbnail_urls), len(self.pdfs))
+
+            for url in thumbnail_urls:
+                browser_cache.get(url)
+
+        # cold cache: all thumbnails are transferred
+        load_overview()
+        self.assertEqual(browser_cache.number_of_requests, len(self.pdfs))
+        self.assertEqual(browser_cache.transferred_bytes, len(self.pdfs) * len(b'thumbnail' * 1000))
+
+        # warm cache: the thumbnails are neither requested nor transferred
+        browser_cache.transferred_bytes, browser_cache.number_of_requests = 0, 0
+        load_overview()
+        self.assertEqual(browser_cache.number_of_requests, 0)
+        self.assertEqual(browser_cache.transferred_bytes, 0)
+
+    def test_thumbnail_revalidation(self):
+        browser_cache = BrowserCache(self.client)
+        url = reverse('serve_thumbnail', kwargs={'identifier': self.pdfs[0].id})
+
+        browser_cache.get(url)
+        browser_cache.transferred_bytes = 0
+
+        # without a revision the thumbnail is revalidated, but not transferred again
+        self.assertEqual(browser_cache.get(url), b'thumbnail' * 1000)
+        self.assertEqual(browser_cache.number_of_requests, 2)
+        self.assertEqual(browser_cache.transferred_bytes, 0)
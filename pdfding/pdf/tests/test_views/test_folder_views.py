@@ -0,0 +1,131 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from pdf.models import Folder, Pdf
+
+
+class TestFolderTree(TestCase):
+    username = 'user'
+    password = '12345'
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username=self.username, password=self.password, email='a@a.com')
+        self.client.login(username=self.username, password=self.password)
+        self.profile = self.user.profile
+
+        # the child is named so that it is fetched before its parent
+        self.parent = Folder.objects.create(name='z_parent', owner=self.profile)
+        self.child = Folder.objects.create(name='a_child', owner=self.profile, parent=self.parent)
+        self.other = Folder.objects.create(name='other', owner=self.profile)
+        Pdf.objects.create(owner=self.profile, name='pdf_1', folder=self.child)
+        Pdf.objects.create(owner=self.profile, name='pdf_2', folder=self.parent)
+        Pdf.objects.create(owner=self.profile, name='pdf_3')
+
+    def test_get(self):
+        response = self.client.get(reverse('folder_tree'))
+
+        expected_child = {
+            'id': str(self.child.id),
+            'name': 'a_child',
+            'description': None,
+            'parent_id': str(self.parent.id),
+            'pdf_count': 1,
+            'total_pdf_count': 1,
+            'children': [],
+        }
+        expected_root_folders = [
+            {
+                'id': str(self.other.id),
+                'name': 'other',
+                'description': None,
+                'parent_id': None,
+                'pdf_count': 0,
+                'total_pdf_count': 0,
+                'children': [],
+            },
+            {
+                'id': str(self.parent.id),
+                'name': 'z_parent',
+                'description': None,
+                'parent_id': None,
+                'pdf_count': 1,
+                'total_pdf_count': 2,
+                'children': [expected_child],
+            },
+        ]
+
+        self.assertEqual(response.json(), {'root_folders': expected_root_folders, 'root_pdf_count': 1})
+        self.assertIn('ETag', response.headers)
+        self.assertIn('no-cache', response.headers['Cache-Control'])
+
+    def test_get_number_of_queries(self):
+        def get_query_count() -> int:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(reverse('folder_tree'))
+
+            self.assertEqual(response.status_code, 200)
+
+            return len(context.captured_queries)
+
+        # the first request creates the library version entry
+        get_query_count()
+        query_count = get_query_count()
+        Folder.objects.bulk_create(
+            [Folder(name=f'folder_{i}', owner=self.profile, path=f'/{i}/') for i in range(1000)], batch_size=500
+        )
+
+        self.assertEqual(get_query_count(), query_count)
+
+    def test_get_not_modified(self):
+        response = self.client.get(reverse('folder_tree'))
+        etag = response.headers['ETag']
+
+        response = self.client.get(reverse('folder_tree'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # the tree is sent again after a change
+        Folder.objects.create(name='new', owner=self.profile)
+        response = self.client.get(reverse('folder_tree'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_get_subtree_root(self):
+        response = self.client.get(reverse('folder_tree'), {'parent': 'root'})
+        response_json = response.json()
+
+        self.assertEqual(response_json['parent_id'], None)
+        self.assertEqual(response_json['root_pdf_count'], 1)
+        self.assertEqual(
+            [(folder['name'], folder['has_children']) for folder in response_json['folders']],
+            [('other', False), ('z_parent', True)],
+        )
+
+    def test_get_subtree(self):
+        response = self.client.get(reverse('folder_tree'), {'parent': str(self.parent.id)})
+        response_json = response.json()
+
+        self.assertEqual(response_json['parent_id'], str(self.parent.id))
+        self.assertNotIn('root_pdf_count', response_json)
+        self.assertEqual(len(response_json['folders']), 1)
+        self.assertEqual(response_json['folders'][0]['id'], str(self.child.id))
+        self.assertFalse(response_json['folders'][0]['has_children'])
+
+        # the subtrees have different etags
+        self.assertNotEqual(response.headers['ETag'], self.client.get(reverse('folder_tree')).headers['ETag'])
+
+    def test_get_subtree_invalid_parent(self):
+        for parent in ['\n', 'no-uuid']:
+            response = self.client.get(reverse('folder_tree'), {'parent': parent})
+
+            self.assertEqual(response.status_code, 404)
+
+    def test_get_subtree_other_user(self):
+        other_user = User.objects.create_user(username='other', password='password', email='b@a.com')
+        folder = Folder.objects.create(name='folder', owner=other_user.profile)
+
+        response = self.client.get(reverse('folder_tree'), {'parent': str(folder.id)})
+
+        self.assertEqual(response.status_code, 404)
@@ -10,8 +10,8 @@ from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 from django.utils.datastructures import MultiValueDict
-from pdf import forms
-from pdf.models import Pdf, PdfComment, PdfHighlight, Tag
+from pdf import forms, service
+from pdf.models import Pdf, PdfComment, PdfHighlight, PdfPageText, Tag
 from pdf.service import PdfProcessingServices
 from pdf.views import pdf_views
 
@@ -38,10 +38,10 @@ class TestAddPDFMixin(TestCase):
 
         self.assertEqual({'form': forms.AddForm}, generated_context)
 
-    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.set_highlights_and_comments')
+    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.sync_highlights_and_comments')
     @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.process_with_pypdfium')
     @mock.patch('pdf.forms.magic.from_buffer', return_value='application/pdf')
-    def test_obj_save(self, mock_from_buffer, mock_process_with_pypdfium, mock_set_highlights_and_comments):
+    def test_obj_save(self, mock_from_buffer, mock_process_with_pypdfium, mock_sync_highlights_and_comments):
         # do a dummy request so we can get a request object
         response = self.client.get(reverse('pdf_overview'))
         file_mock = mock.MagicMock(spec=File, name='FileMock')
@@ -69,13 +69,13 @@ class TestAddPDFMixin(TestCase):
         self.assertEqual(pdf.owner, self.user.profile)
         self.assertEqual(pdf.file.size, 0)  # mock file has size 0
         mock_process_with_pypdfium.assert_called_once_with(pdf)
-        mock_set_highlights_and_comments.assert_called_once_with(pdf)
+        mock_sync_highlights_and_comments.assert_called_once_with(pdf)
 
-    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.set_highlights_and_comments')
+    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.sync_highlights_and_comments')
     @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.process_with_pypdfium')
     @mock.patch('pdf.forms.magic.from_buffer', return_value='application/pdf')
     def test_obj_save_use_file_name(
-        self, mock_from_buffer, mock_process_with_pypdfium, mock_set_highlights_and_comments
+        self, mock_from_buffer, mock_process_with_pypdfium, mock_sync_highlights_and_comments
     ):
         # do a dummy request so we can get a request object
         response = self.client.get(reverse('pdf_overview'))
@@ -95,12 +95,12 @@ class TestAddPDFMixin(TestCase):
         self.assertEqual(pdf.owner, self.user.profile)
 
         mock_process_with_pypdfium.assert_called_once_with(pdf)
-        mock_set_highlights_and_comments.assert_called_once_with(pdf)
+        mock_sync_highlights_and_comments.assert_called_once_with(pdf)
 
-    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.set_highlights_and_comments')
+    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.sync_highlights_and_comments')
     @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.process_with_pypdfium')
     @override_settings(DEMO_MODE=True)
-    def test_obj_save_demo_mode(self, mock_process_with_pypdfium, mock_set_highlights_and_comments):
+    def test_obj_save_demo_mode(self, mock_process_with_pypdfium, mock_sync_highlights_and_comments):
         # do a dummy request so we can get a request object
         response = self.client.get(reverse('pdf_overview'))
         form = forms.AddFormNoFile(data={'name': 'some_pdf', 'tag_string': 'tag_a tag_2'}, owner=self.user.profile)
@@ -114,7 +114,7 @@ class TestAddPDFMixin(TestCase):
         self.assertEqual(pdf.file.size, DEMO_FILE_SIZE)
 
         mock_process_with_pypdfium.assert_called_once_with(pdf)
-        mock_set_highlights_and_comments.assert_called_once_with(pdf)
+        mock_sync_highlights_and_comments.assert_called_once_with(pdf)
 
 
 class TestBulkAddPDFMixin(TestCase):
@@ -131,12 +131,9 @@ class TestBulkAddPDFMixin(TestCase):
 
         self.assertEqual({'form': forms.BulkAddForm}, generated_context)
 
-    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.set_highlights_and_comments')
-    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.process_with_pypdfium')
+    @mock.patch('pdf.views.pdf_views.tasks.bulk_ingest_task')
     @mock.patch('pdf.forms.magic.from_buffer', return_value='application/pdf')
-    def test_obj_save_single_file_no_skipping(
-        self, mock_from_buffer, mock_process_with_pypdfium, mock_set_highlights_and_comments
-    ):
+    def test_obj_save_single_file_no_skipping(self, mock_from_buffer, mock_bulk_ingest_task):
         # do a dummy request so we can get a request object
         response = self.client.get(reverse('pdf_overview'))
         file_mock = mock.MagicMock(spec=File, name='FileMock')
@@ -155,15 +152,11 @@ class TestBulkAddPDFMixin(TestCase):
         self.assertEqual(pdf.owner, self.user.profile)
         self.assertEqual(pdf.file_directory, 'some/dir')
         self.assertEqual(pdf.file.size, 0)  # mock file has size 0
-        mock_process_with_pypdfium.assert_called_once_with(pdf)
-        mock_set_highlights_and_comments.assert_called_once_with(pdf)
+        self.assertEqual(pdf.processing_state, Pdf.ProcessingState.PENDING)
+        mock_bulk_ingest_task.assert_called_once_with([pdf.id])
 
-    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.set_highlights_and_comments')
-    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.process_with_pypdfium')
     @mock.patch('pdf.forms.magic.from_buffer', return_value='application/pdf')
-    def test_obj_save_multiple_files_no_skipping(
-        self, mock_from_buffer, mock_process_with_pypdfium, mock_set_highlights_and_comments
-    ):
+    def test_obj_save_multiple_files_no_skipping(self, mock_from_buffer):
         # do a dummy request so we can get a request object
         response = self.client.get(reverse('pdf_overview'))
         file_mock_1 = mock.MagicMock(spec=File, name='FileMock1')
@@ -188,14 +181,12 @@ class TestBulkAddPDFMixin(TestCase):
             # check that pdf pages are set to -1 in case of exception.
             # in this test there should be an exception as a mock file is used.
             self.assertEqual(pdf.number_of_pages, -1)
+            self.assertEqual(pdf.processing_state, Pdf.ProcessingState.FAILED)
 
-    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.set_highlights_and_comments')
-    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.process_with_pypdfium')
+    @mock.patch('pdf.views.pdf_views.tasks.bulk_ingest_task')
     @mock.patch('pdf.service.uuid4', return_value='123456789')
     @mock.patch('pdf.forms.magic.from_buffer', return_value='application/pdf')
-    def test_obj_save_multiple_files_skipping(
-        self, mock_from_buffer, mock_uuid4, mock_process_with_pypdfium, mock_set_highlights_and_comments
-    ):
+    def test_obj_save_multiple_files_skipping(self, mock_from_buffer, mock_uuid4, mock_bulk_ingest_task):
         # do a dummy request so we can get a request object
         response = self.client.get(reverse('pdf_overview'))
 
@@ -204,18 +195,21 @@ class TestBulkAddPDFMixin(TestCase):
         for i in range(1, 3):
             file_contents = bytes('contents' * i, encoding='utf-8')
             simple_file = SimpleUploadedFile(f'test{i}.pdf', file_contents)
-            old_pdf = Pdf.objects.create(owner=self.user.profile, name=f'test{i}', file=simple_file)
+            old_pdf = Pdf.objects.create(
+                owner=self.user.profile, name=f'test{i}', file=simple_file, file_hash=service.get_file_hash(simple_file)
+            )
             old_pdfs.append(old_pdf)
 
-        files = []
-
-        # file1: same name and size -> should not be created
-        # file2: same name, different size -> should be created with different name
-        # file3: different name, same size -> should be created with original name
-        for i in range(1, 4):
-            file_contents = bytes('contents', encoding='utf-8')
-            simple_file = SimpleUploadedFile(f'test{i}.pdf', file_contents)
-            files.append(simple_file)
+        # file1: same name and content -> should not be created
+        # file2: same name, different content -> should be created with different name
+        # file3: different name, same content -> should not be created
+        # file4: different name and content -> should be created with original name
+        files = [
+            SimpleUploadedFile('test1.pdf', b'contents'),
+            SimpleUploadedFile('test2.pdf', b'other contents'),
+            SimpleUploadedFile('test3.pdf', b'contentscontents'),
+            SimpleUploadedFile('test4.pdf', b'new contents'),
+        ]
 
         form = forms.BulkAddForm(
             data={'tag_string': 'tag_a tag_2', 'description': 'description', 'skip_existing': 'on'},
@@ -225,7 +219,7 @@ class TestBulkAddPDFMixin(TestCase):
 
         pdf_views.BulkAddPdfMixin.obj_save(form, response.wsgi_request, None)
 
-        expected_pdf_names = ['test1', 'test2', 'test2_12345678', 'test3']
+        expected_pdf_names = ['test1', 'test2', 'test2_12345678', 'test4']
         generated_pdf_names = [pdf.name for pdf in self.user.profile.pdf_set.all()]
         self.assertEqual(expected_pdf_names, generated_pdf_names)
 
@@ -233,10 +227,9 @@ class TestBulkAddPDFMixin(TestCase):
         for i in range(2):
             self.assertEqual(old_pdfs[i], self.user.profile.pdf_set.get(name=f'test{i + 1}'))
 
-    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.set_highlights_and_comments')
-    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.process_with_pypdfium')
+    @mock.patch('pdf.views.pdf_views.tasks.bulk_ingest_task')
     @override_settings(DEMO_MODE=True)
-    def test_obj_save_demo_mode(self, mock_process_with_pypdfium, mock_set_highlights_and_comments):
+    def test_obj_save_demo_mode(self, mock_bulk_ingest_task):
         # do a dummy request so we can get a request object
         response = self.client.get(reverse('pdf_overview'))
         form = forms.BulkAddFormNoFile(
@@ -252,8 +245,7 @@ class TestBulkAddPDFMixin(TestCase):
         self.assertEqual(pdf.owner, self.user.profile)
         self.assertEqual(pdf.file.size, DEMO_FILE_SIZE)
 
-        mock_process_with_pypdfium.assert_called_once_with(pdf)
-        mock_set_highlights_and_comments.assert_called_once_with(pdf)
+        mock_bulk_ingest_task.assert_called_once_with([pdf.id])
 
 
 class TestOverviewMixin(TestCase):
@@ -293,6 +285,53 @@ class TestOverviewMixin(TestCase):
 
         self.assertEqual(sorted(list(filtered_pdfs), key=lambda a: a.name), [pdf_1, pdf_2])
 
+    def test_filter_objects_multiple_tags(self):
+        tags = {
+            name: Tag.objects.create(name=name, owner=self.user.profile)
+            for name in ['programming', 'programming/python', 'programming/python/django', 'news', 'news/tech']
+        }
+        pdf_1 = Pdf.objects.create(owner=self.user.profile, name='pdf_1')
+        pdf_1.tags.set([tags['programming/python/django'], tags['news/tech']])
+        pdf_2 = Pdf.objects.create(owner=self.user.profile, name='pdf_2')
+        pdf_2.tags.set([tags['programming'], tags['news'], tags['news/tech']])
+        pdf_3 = Pdf.objects.create(owner=self.user.profile, name='pdf_3')
+        pdf_3.tags.set([tags['programming/python'], tags['programming/python/django']])
+
+        for tag_query, expected_pdfs in [
+            ('programming+news', [pdf_1, pdf_2]),
+            ('programming/python+news', [pdf_1]),
+            ('programming+programming/python', [pdf_1, pdf_3]),
+            ('programming/python/django', [pdf_1, pdf_3]),
+            ('programming+missing', []),
+        ]:
+            response = self.client.get(f'{reverse('pdf_overview')}?tags={tag_query}')
+
+            filtered_pdfs = pdf_views.OverviewMixin.filter_objects(response.wsgi_request)
+
+            self.assertEqual(sorted(list(filtered_pdfs), key=lambda a: a.name), expected_pdfs)
+
+    def test_filter_objects_empty_tags(self):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf')
+
+        # a tag query without any tag names does not filter the pdfs
+        response = self.client.get(f'{reverse('pdf_overview')}?tags=+')
+        filtered_pdfs = pdf_views.OverviewMixin.filter_objects(response.wsgi_request)
+
+        self.assertEqual(list(filtered_pdfs), [pdf])
+
+    def test_filter_objects_multiple_tags_single_query(self):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf')
+        pdf.tags.set([Tag.objects.create(name=f'tag_{i}', owner=self.user.profile) for i in range(5)])
+
+        response = self.client.get(f'{reverse('pdf_overview')}?tags=tag_0+tag_1+tag_2+tag_3+tag_4')
+        request = response.wsgi_request
+
+        # resolving the tags, filtering the pdfs and prefetching their tags
+        with self.assertNumQueries(3):
+            filtered_pdfs = list(pdf_views.OverviewMixin.filter_objects(request))
+
+        self.assertEqual(filtered_pdfs, [pdf])
+
     def test_filter_objects_starred(self):
         pdf_1 = Pdf.objects.create(owner=self.user.profile, name='pdf_to_be_found_1', starred=True)
         pdf_2 = Pdf.objects.create(owner=self.user.profile, name='pdf_to_be_found_2', starred=True)
@@ -326,14 +365,76 @@ class TestOverviewMixin(TestCase):
 
         self.assertEqual(list(filtered_pdfs), [pdf_1])
 
-    def test_fuzzy_filter_pdfs(self):
+    def test_search_pdfs(self):
         Pdf.objects.create(owner=self.user.profile, name='pdf_not_to_be_found')
         pdf_self_hosted = Pdf.objects.create(owner=self.user.profile, name='The best self-hosted applications ')
         pdf_self_hosting = Pdf.objects.create(owner=self.user.profile, name='Self-hosting Guide')
         Pdf.objects.create(owner=self.user.profile, name='self sufficiency')
+        pdf_content = Pdf.objects.create(owner=self.user.profile, name='Some book')
+        PdfPageText.objects.create(pdf=pdf_content, page=1, text='A guide for self-hosted services')
+
+        searched_pdfs = pdf_views.OverviewMixin.search_pdfs(Pdf.objects.all(), 'self hosted', self.user.profile)
+
+        # the name matches are ranked by score, the content matches come after them
+        self.assertEqual(list(searched_pdfs.order_by('search_rank')), [pdf_self_hosted, pdf_self_hosting, pdf_content])
+
+    @mock.patch('pdf.views.pdf_views.MAX_NAME_MATCHES', 1)
+    def test_search_pdfs_limited(self):
+        pdf_self_hosted = Pdf.objects.create(owner=self.user.profile, name='The best self-hosted applications ')
+        Pdf.objects.create(owner=self.user.profile, name='Self-hosting Guide')
+
+        searched_pdfs = pdf_views.OverviewMixin.search_pdfs(Pdf.objects.all(), 'self hosted', self.user.profile)
 
-        filtered_pdfs = pdf_views.OverviewMixin.fuzzy_filter_pdfs(Pdf.objects.all(), 'self hosted')
-        self.assertEqual(sorted(list(filtered_pdfs), key=lambda a: a.name), [pdf_self_hosting, pdf_self_hosted])
+        self.assertEqual(list(searched_pdfs), [pdf_self_hosted])
+
+    def test_overview_search_ranked(self):
+        # the sorting of the user is oldest first, but search results are ordered by their rank
+        self.user.profile.pdf_sorting = 'Oldest'
+        self.user.profile.save()
+        pdf_self_hosting = Pdf.objects.create(owner=self.user.profile, name='Self-hosting Guide')
+        pdf_self_hosted = Pdf.objects.create(owner=self.user.profile, name='The best self-hosted applications ')
+
+        response = self.client.get(f'{reverse('pdf_overview')}?search=self+hosted')
+
+        self.assertEqual(list(response.context['page_obj']), [pdf_self_hosted, pdf_self_hosting])
+
+    def test_filter_objects_content(self):
+        pdf_1 = Pdf.objects.create(owner=self.user.profile, name='The best self-hosted applications')
+        pdf_2 = Pdf.objects.create(owner=self.user.profile, name='Some book')
+        pdf_3 = Pdf.objects.create(owner=self.user.profile, name='Other book')
+        PdfPageText.objects.create(pdf=pdf_2, page=4, text='A guide for self-hosted services')
+        PdfPageText.objects.create(pdf=pdf_3, page=1, text='Nothing to see')
+
+        response = self.client.get(f'{reverse('pdf_overview')}?search=self+hosted')
+
+        filtered_pdfs = pdf_views.OverviewMixin.filter_objects(response.wsgi_request)
+
+        self.assertEqual(sorted(list(filtered_pdfs), key=lambda a: a.name), [pdf_2, pdf_1])
+
+    def test_overview_content_hit_pages(self):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='Some book')
+        PdfPageText.objects.create(pdf=pdf, page=4, text='A guide for self-hosted services')
+        PdfPageText.objects.create(pdf=pdf, page=9, text='Self-hosted it is')
+
+        response = self.client.get(f'{reverse('pdf_overview')}?search=self+hosted')
+
+        self.assertEqual(response.context['page_obj'][0].content_hit_pages, [4, 9])
+        self.assertContains(response, f'{reverse('view_pdf', kwargs={'identifier': pdf.id})}?page=9')
+
+    def test_overview_processing_placeholder(self):
+        # thumbnails are only displayed in the spacious layouts
+        profile = self.user.profile
+        profile.layout = 'Grid'
+        profile.save()
+        Pdf.objects.create(owner=self.user.profile, name='pdf', processing_state=Pdf.ProcessingState.PENDING)
+
+        response = self.client.get(reverse('pdf_overview'))
+        self.assertContains(response, 'Processing')
+
+        Pdf.objects.filter(owner=self.user.profile).update(processing_state=Pdf.ProcessingState.READY)
+
+        response = self.client.get(reverse('pdf_overview'))
+        self.assertNotContains(response, 'Processing')
 
     @override_settings(SUPPORTER_EDITION=True)
     @patch('pdf.service.TagServices.get_tag_info_dict', return_value='tag_info_dict')
@@ -349,6 +450,10 @@ class TestOverviewMixin(TestCase):
             'page': 'pdf_overview',
             'layout': 'Compact',
             'needs_nagging': False,
+            'current_folder': None,
+            'current_folder_id': '',
+            'folders': [],
+            'root_pdf_count': 0,
         }
 
         self.assertEqual(generated_extra_context, expected_extra_context)
@@ -367,6 +472,10 @@ class TestOverviewMixin(TestCase):
             'page': 'pdf_overview_starred',
             'layout': 'Compact',
             'needs_nagging': False,
+            'current_folder': None,
+            'current_folder_id': '',
+            'folders': [],
+            'root_pdf_count': 0,
         }
 
         self.assertEqual(generated_extra_context, expected_extra_context)
@@ -385,6 +494,10 @@ class TestOverviewMixin(TestCase):
             'page': 'pdf_overview',
             'layout': 'Compact',
             'needs_nagging': False,
+            'current_folder': None,
+            'current_folder_id': '',
+            'folders': [],
+            'root_pdf_count': 0,
         }
 
         self.assertEqual(generated_extra_context, expected_extra_context)
@@ -403,10 +516,23 @@ class TestOverviewMixin(TestCase):
             'page': 'pdf_overview',
             'layout': 'Compact',
             'needs_nagging': False,
+            'current_folder': None,
+            'current_folder_id': '',
+            'folders': [],
+            'root_pdf_count': 0,
         }
 
         self.assertEqual(generated_extra_context, expected_extra_context)
 
+    def test_get_extra_context_htmx(self):
+        response = self.client.get(reverse('pdf_overview'), HTTP_HX_REQUEST='true')
+
+        generated_extra_context = pdf_views.OverviewMixin.get_extra_context(response.wsgi_request)
+
+        # the sidebar is not part of the htmx page
+        for key in ['tag_info_dict', 'folders', 'root_pdf_count']:
+            self.assertNotIn(key, generated_extra_context)
+
     @override_settings(SUPPORTER_EDITION=False)
     def test_do_extra_action_reset(self):
         self.user.profile.last_time_nagged = datetime.now(tz=timezone.utc) - timedelta(weeks=9)
@@ -648,8 +774,9 @@ class TestViews(TestCase):
 
         self.assertEqual(response.status_code, 422)
 
-    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.set_highlights_and_comments')
-    def test_update_pdf_post_correct(self, mock_set_highlights_and_comments):
+    @mock.patch('pdf.views.pdf_views.tasks.extract_pdf_text_task')
+    @mock.patch('pdf.views.pdf_views.tasks.extract_pdf_annotations_task')
+    def test_update_pdf_post_correct(self, mock_extract_pdf_annotations_task, mock_extract_pdf_text_task):
         pdf = Pdf.objects.create(owner=self.user.profile, name='pdf')
 
         # assign empty file and check size
@@ -673,11 +800,29 @@ class TestViews(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(pdf.file.size, 8885)
         self.assertEqual(pdf.revision, 1)
-        mock_set_highlights_and_comments.assert_called_once_with(pdf)
+        mock_extract_pdf_text_task.assert_called_once_with(pdf.id)
+        mock_extract_pdf_annotations_task.assert_called_once_with(pdf.id)
+
+    @mock.patch('pdf.views.pdf_views.tasks.extract_pdf_annotations_task')
+    def test_update_pdf_post_page_texts_replaced(self, mock_extract_pdf_annotations_task):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf')
+        PdfPageText.objects.create(pdf=pdf, page=1, text='old content')
+
+        dummy_path = Path(__file__).parents[1] / 'data' / 'dummy.pdf'
+        with dummy_path.open(mode="rb") as f:
+            file = File(f, name='dummy')
+            self.client.post(reverse('update_pdf'), data={'pdf_id': pdf.id, 'updated_pdf': file})
+
+        page_texts = list(pdf.pdfpagetext_set.order_by('page').values_list('text', flat=True))
+
+        # the full-text search matches the content of the new file
+        self.assertEqual(len(page_texts), 2)
+        self.assertNotIn('old content', page_texts)
 
-    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.set_highlights_and_comments')
+    @mock.patch('pdf.views.pdf_views.tasks.extract_pdf_text_task')
+    @mock.patch('pdf.views.pdf_views.tasks.extract_pdf_annotations_task')
     @override_settings(DEMO_MODE=True)
-    def test_update_pdf_post_demo_mode(self, mock_set_highlights_and_comments):
+    def test_update_pdf_post_demo_mode(self, mock_extract_pdf_annotations_task, mock_extract_pdf_text_task):
         pdf = Pdf.objects.create(owner=self.user.profile, name='pdf')
 
         # assign empty file and check size
@@ -695,7 +840,8 @@ class TestViews(TestCase):
 
         self.assertEqual(response.status_code, 200)
         self.assertEqual(pdf.file.size, DEMO_FILE_SIZE)
-        mock_set_highlights_and_comments.assert_called_once_with(pdf)
+        mock_extract_pdf_text_task.assert_called_once_with(pdf.id)
+        mock_extract_pdf_annotations_task.assert_called_once_with(pdf.id)
 
     def test_star(self):
         headers = {'HTTP_HX-Request': 'true'}
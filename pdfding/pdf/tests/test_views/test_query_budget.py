@@ -0,0 +1,169 @@
+from datetime import datetime, timezone
+
+from admin import views as admin_views
+from core.urls import urlpatterns as base_patterns
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path, reverse
+from pdf.models import LibraryVersion, Pdf, PdfComment, PdfHighlight, SharedPdf, Tag
+from pdf.views import pdf_views, share_views
+
+test_patterns = [
+    path('budget/pdfs/<int:page>/<int:items_per_page>', pdf_views.Overview.as_view(), name='budget_pdfs'),
+    path(
+        'budget/highlights/<int:page>/<int:items_per_page>',
+        pdf_views.HighlightOverview.as_view(),
+        name='budget_highlights',
+    ),
+    path(
+        'budget/comments/<int:page>/<int:items_per_page>', pdf_views.CommentOverview.as_view(), name='budget_comments'
+    ),
+    path(
+        'budget/details/<identifier>/highlights/<int:page>/<int:items_per_page>',
+        pdf_views.DetailsHighlightOverview.as_view(),
+        name='budget_details_highlights',
+    ),
+    path(
+        'budget/details/<identifier>/comments/<int:page>/<int:items_per_page>',
+        pdf_views.DetailsCommentOverview.as_view(),
+        name='budget_details_comments',
+    ),
+    path('budget/shared/<int:page>/<int:items_per_page>', share_views.Overview.as_view(), name='budget_shared'),
+    path('budget/users/<int:page>/<int:items_per_page>', admin_views.Overview.as_view(), name='budget_users'),
+]
+
+urlpatterns = base_patterns + test_patterns
+
+ITEM_COUNTS = [5, 50, 100]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class TestQueryBudget(TestCase):
+    """
+    Test that the number of queries of the overview and details pages does not depend on the number of displayed
+    items. Each page has a fixed budget which is checked for 5, 50 and 100 items per page.
+    """
+
+    username = 'user'
+    password = '12345'
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username=self.username, password=self.password, email='a@a.com')
+        self.user.is_superuser = True
+        self.user.is_staff = True
+        self.user.save()
+        self.client.login(username=self.username, password=self.password)
+
+        # the library version entry is created on the first visit of the overview
+        LibraryVersion.get_version(self.user.profile.id)
+        self.tags = [Tag.objects.create(name=f'tag_{i}', owner=self.user.profile) for i in range(3)]
+        self.pdf = self.create_pdf('main_pdf')
+
+    def create_pdf(self, name: str) -> Pdf:
+        pdf = Pdf.objects.create(owner=self.user.profile, name=name, notes='some notes', number_of_pages=10, views=1)
+        pdf.tags.set(self.tags)
+
+        return pdf
+
+    def create_pdfs(self, start: int, stop: int):
+        for i in range(start, stop):
+            self.create_pdf(f'pdf_{i}')
+
+    def create_annotations(self, start: int, stop: int):
+        creation_date = datetime.now(timezone.utc)
+
+        for annotation_class in [PdfHighlight, PdfComment]:
+            annotation_class.objects.bulk_create(
+                [
+                    annotation_class(pdf=self.pdf, text=f'text_{i}', page=i, creation_date=creation_date)
+                    for i in range(start, stop)
+                ]
+            )
+
+    def create_shared_pdfs(self, start: int, stop: int):
+        for i in range(start, stop):
+            pdf = self.create_pdf(f'shared_{i}')
+            SharedPdf.objects.create(owner=self.user.profile, pdf=pdf, name=f'shared_{i}')
+
+    def create_users(self, start: int, stop: int):
+        for i in range(start, stop):
+            user = User.objects.create_user(username=f'user_{i}', password='12345', email=f'{i}@a.com')
+            Pdf.objects.create(owner=user.profile, name=f'pdf_{i}')
+
+    def get_query_count(self, url: str, htmx: bool) -> int:
+        """Get the number of queries needed for displaying the page."""
+
+        headers = {'HTTP_HX-Request': 'true'} if htmx else {}
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, **headers)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertGreaterEqual(len(response.context['page_obj']), ITEM_COUNTS[0])
+
+        return len(context.captured_queries)
+
+    def assert_query_budget(self, budget: int, create_items, url_name: str, url_kwargs: dict = None):
+        """
+        Assert that the full page and the htmx page stay within the query budget for all item counts and that the
+        number of queries does not depend on the number of items.
+        """
+
+        query_counts = {False: [], True: []}
+        created_items = 0
+
+        for item_count in ITEM_COUNTS:
+            create_items(created_items, item_count)
+            created_items = item_count
+
+            url = reverse(url_name, kwargs={'page': 1, 'items_per_page': item_count} | (url_kwargs or {}))
+
+            for htmx, counts in query_counts.items():
+                counts.append(self.get_query_count(url, htmx))
+
+        for htmx, counts in query_counts.items():
+            self.assertEqual(len(set(counts)), 1, f'{url_name}: number of queries depends on the items: {counts}')
+            self.assertLessEqual(counts[0], budget, f'{url_name}: query budget of {budget} exceeded')
+
+    def test_pdf_overview(self):
+        self.assert_query_budget(9, self.create_pdfs, 'budget_pdfs')
+
+    def test_highlight_overview(self):
+        self.assert_query_budget(4, self.create_annotations, 'budget_highlights')
+
+    def test_comment_overview(self):
+        self.assert_query_budget(4, self.create_annotations, 'budget_comments')
+
+    def test_details_highlight_overview(self):
+        self.assert_query_budget(6, self.create_annotations, 'budget_details_highlights', {'identifier': self.pdf.id})
+
+    def test_details_comment_overview(self):
+        self.assert_query_budget(6, self.create_annotations, 'budget_details_comments', {'identifier': self.pdf.id})
+
+    def test_details(self):
+        query_counts = []
+        created_tags = 3
+
+        for item_count in ITEM_COUNTS:
+            tags = [Tag(name=f'tag_{i}', owner=self.user.profile) for i in range(created_tags, item_count)]
+            Tag.objects.bulk_create(tags)
+            self.pdf.tags.add(*tags)
+            created_tags = item_count
+
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(reverse('pdf_details', kwargs={'identifier': self.pdf.id}))
+
+            self.assertEqual(response.status_code, 200)
+            query_counts.append(len(context.captured_queries))
+
+        self.assertEqual(len(set(query_counts)), 1, f'number of queries depends on the items: {query_counts}')
+        self.assertLessEqual(query_counts[0], 6)
+
+    def test_shared_overview(self):
+        self.assert_query_budget(4, self.create_shared_pdfs, 'budget_shared')
+
+    def test_user_overview(self):
+        self.assert_query_budget(4, self.create_users, 'budget_users')
@@ -0,0 +1,162 @@
+import io
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.test import Client, TestCase
+from django.urls import reverse
+from pdf.models import Pdf
+from pypdfium2 import PdfDocument
+
+NUMBER_OF_PAGES = 100
+PAGE_PADDING = 50_000
+CHUNK_SIZE = 65536
+
+
+def write_large_pdf(file, number_of_pages: int, page_padding: int):
+    """
+    Write a valid pdf with large pages. Each page contains a short text and is padded with comments to the specified
+    size, similar to a scanned book.
+    """
+
+    offsets = []
+
+    def write_object(content: bytes):
+        offsets.append(file.tell())
+        file.write(f'{len(offsets)} 0 obj\n'.encode() + content + b'\nendobj\n')
+
+    file.write(b'%PDF-1.7\n')
+    # object 1: catalog, object 2: page tree, object 3: font, then content stream and page for every page
+    page_ids = [5 + 2 * i for i in range(number_of_pages)]
+    write_object(b'<< /Type /Catalog /Pages 2 0 R >>')
+    kids = ' '.join(f'{page_id} 0 R' for page_id in page_ids)
+    write_object(f'<< /Type /Pages /Kids [{kids}] /Count {number_of_pages} >>'.encode())
+    write_object(b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>')
+
+    for i in range(number_of_pages):
+        text = f'BT /F1 24 Tf 72 720 Td (Page {i + 1}) Tj ET\n'.encode()
+        padding = b'%' + b'x' * 98 + b'\n'
+        stream = text + padding * (page_padding // len(padding))
+        write_object(f'<< /Length {len(stream)} >>\nstream\n'.encode() + stream + b'\nendstream')
+        write_object(
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R '
+            '/Resources << /Font << /F1 3 0 R >> >> >>'.encode()
+        )
+
+    xref_offset = file.tell()
+    file.write(f'xref\n0 {len(offsets) + 1}\n0000000000 65535 f \n'.encode())
+    file.write(b''.join(f'{offset:010d} 00000 n \n'.encode() for offset in offsets))
+    file.write(f'trailer\n<< /Size {len(offsets) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n'.encode())
+
+
+class RangeReader(io.RawIOBase):
+    """
+    File like object loading the pdf from the serve view via range requests, similar to the range loading of pdf.js.
+    Each chunk is only requested once.
+    """
+
+    def __init__(self, client: Client, url: str):
+        self.client = client
+        self.url = url
+        self.position = 0
+        self.chunks = dict()
+        self.transferred_bytes = 0
+        self.number_of_requests = 0
+
+        response = self.client.head(url)
+        assert response.headers['Accept-Ranges'] == 'bytes'
+        self.size = int(response.headers['Content-Length'])
+
+    def get_chunk(self, index: int) -> bytes:
+        if index not in self.chunks:
+            start = index * CHUNK_SIZE
+            end = min(start + CHUNK_SIZE, self.size) - 1
+            response = self.client.get(self.url, HTTP_RANGE=f'bytes={start}-{end}')
+            assert response.status_code == 206
+
+            self.chunks[index] = b''.join(response.streaming_content)
+            self.transferred_bytes += len(self.chunks[index])
+            self.number_of_requests += 1
+
+        return self.chunks[index]
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        self.position = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: self.size}[whence] + offset
+
+        return self.position
+
+    def tell(self) -> int:
+        return self.position
+
+    def readinto(self, buffer) -> int:
+        end = min(self.position + len(buffer), self.size)
+        data = b''.join(
+            self.get_chunk(index) for index in range(self.position // CHUNK_SIZE, (end - 1) // CHUNK_SIZE + 1)
+        )
+        offset = self.position % CHUNK_SIZE
+        data = data[offset:][: end - self.position]
+
+        buffer[: len(data)] = data
+        self.position += len(data)
+
+        return len(data)
+
+
+class TestRangeLoading(TestCase):
+    """Test that the first page of a large pdf can be displayed without downloading the whole file."""
+
+    username = 'user'
+    password = '12345'
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username=self.username, password=self.password, email='a@a.com')
+        self.client.login(username=self.username, password=self.password)
+
+        self.pdf = Pdf.objects.create(owner=self.user.profile, name='large_pdf')
+        self.pdf.file.name = f'{self.user.id}/large_pdf.pdf'
+        self.pdf.save()
+
+        file_path = Path(self.pdf.file.path)
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+
+        with file_path.open('wb') as file:
+            write_large_pdf(file, NUMBER_OF_PAGES, PAGE_PADDING)
+
+        self.addCleanup(file_path.unlink)
+        self.url = reverse('serve_pdf', kwargs={'identifier': self.pdf.id, 'revision': self.pdf.revision})
+
+    @staticmethod
+    def render_first_page(pdf_input) -> tuple[int, int]:
+        """Render the first page of the pdf and return the number of pages and the width of the rendered image."""
+
+        pdf_document = PdfDocument(pdf_input)
+        number_of_pages = len(pdf_document)
+        bitmap = pdf_document[0].render(scale=0.5)
+        width = bitmap.width
+        pdf_document.close()
+
+        return number_of_pages, width
+
+    def load_full_pdf(self) -> tuple[int, int]:
+        response = self.client.get(self.url)
+
+        return self.render_first_page(b''.join(response.streaming_content))
+
+    def test_first_page_without_full_download(self):
+        file_size = Path(self.pdf.file.path).stat().st_size
+
+        range_reader = RangeReader(self.client, self.url)
+        ranged_result = self.render_first_page(range_reader)
+        full_result = self.load_full_pdf()
+
+        self.assertEqual(ranged_result, (NUMBER_OF_PAGES, 306))
+        self.assertEqual(ranged_result, full_result)
+
+        # only the trailer, the page tree and the first page are needed
+        self.assertLess(range_reader.transferred_bytes, file_size / 20)
@@ -15,7 +15,9 @@ urlpatterns = [
     path('edit/<identifier>/<field_name>', pdf_views.Edit.as_view(), name='edit_pdf'),
     path('get/<identifier>/<revision>', pdf_views.Serve.as_view(), name='serve_pdf'),
     path('get_thumbnail/<identifier>', pdf_views.ServeThumbnail.as_view(), name='serve_thumbnail'),
+    path('get_thumbnail/<identifier>/<revision>', pdf_views.ServeThumbnail.as_view(), name='serve_thumbnail'),
     path('get_preview/<identifier>', pdf_views.ServePreview.as_view(), name='serve_preview'),
+    path('get_preview/<identifier>/<revision>', pdf_views.ServePreview.as_view(), name='serve_preview'),
     path('get_notes/<identifier>', pdf_views.GetNotes.as_view(), name='get_notes'),
     path('show_preview/<identifier>', pdf_views.ShowPreview.as_view(), name='show_preview'),
     path('update_page', pdf_views.UpdatePage.as_view(), name='update_page'),
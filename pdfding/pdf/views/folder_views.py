@@ -1,9 +1,15 @@
+from uuid import UUID
+
 from django.contrib import messages
-from django.http import HttpRequest, JsonResponse
+from django.db.models import Exists, OuterRef, QuerySet
+from django.http import Http404, HttpRequest, JsonResponse
 from django.shortcuts import get_object_or_404, render
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
 from django.views import View
+from django.views.decorators.http import condition
 from django_htmx.http import HttpResponseClientRefresh
-from pdf.models import Folder, Pdf
+from pdf.models import Folder, LibraryVersion, Pdf
 from users.models import Profile
 
 
@@ -108,7 +114,7 @@ class DeleteFolder(View):
             # Move all PDFs and subfolders to parent folder
             parent_folder = folder.parent
             folder.pdfs.update(folder=parent_folder)
-            folder.subfolders.update(parent=parent_folder)
+            self._move_subfolders(folder, parent_folder)
             folder_name = folder.name
             folder.delete()
             messages.success(request, f'Folder "{folder_name}" deleted and contents moved to parent folder.')
@@ -116,7 +122,7 @@ class DeleteFolder(View):
         elif action == 'move_to_root':
             # Move all PDFs and subfolders to root (no folder)
             folder.pdfs.update(folder=None)
-            folder.subfolders.update(parent=None)
+            self._move_subfolders(folder, None)
             folder_name = folder.name
             folder.delete()
             messages.success(request, f'Folder "{folder_name}" deleted and contents moved to root.')
@@ -129,6 +135,13 @@ class DeleteFolder(View):
         
         return HttpResponseClientRefresh()
 
+    @staticmethod
+    def _move_subfolders(folder, new_parent):
+        """Move the subfolders of a folder. They are saved one by one, so that their paths are updated."""
+        for subfolder in folder.subfolders.all():
+            subfolder.parent = new_parent
+            subfolder.save()
+
     def _delete_folder_recursive(self, folder):
         """Recursively delete a folder and all its contents."""
         # Delete all PDFs in this folder
@@ -216,38 +229,122 @@ class MovePdfToFolder(View):
         })
 
 
+def get_parent_query(request: HttpRequest) -> str:
+    """Get the 'parent' query parameter of the folder tree. It is either empty, 'root' or the id of a folder."""
+
+    parent_id = request.GET.get('parent', '')
+
+    if parent_id and parent_id != 'root':
+        try:
+            parent_id = str(UUID(parent_id))
+        except ValueError:
+            raise Http404('Folder not found')
+
+    return parent_id
+
+
+def get_folder_tree_etag(request: HttpRequest, **kwargs) -> str:
+    """
+    Get the ETag of the folder tree. It is based on the library version of the user, which is bumped whenever folders
+    or PDFs change, so the tree only needs to be rebuilt and transferred if something changed.
+    """
+
+    profile_id = request.user.profile.id
+    version = LibraryVersion.get_version(profile_id)
+
+    return f'folder-tree-{profile_id}-{version}-{get_parent_query(request) or "all"}'
+
+
 class FolderTree(View):
-    """Get folder tree structure for navigation."""
+    """
+    Get the folder tree structure for navigation. By default the whole tree is returned. If the 'parent' query
+    parameter is set, only the direct subfolders of this folder ('root' for the root folders) are returned, so that
+    very large trees can be expanded on demand.
+    """
 
+    @method_decorator(condition(etag_func=get_folder_tree_etag))
     def get(self, request: HttpRequest):
-        """Return folder tree as JSON."""
-        folders = Folder.objects.filter(owner=request.user.profile).select_related('parent')
-        
-        # Build tree structure
-        folder_dict = {}
-        root_folders = []
-        
-        for folder in folders:
-            folder_data = {
-                'id': str(folder.id),
-                'name': folder.name,
-                'description': folder.description,
-                'pdf_count': folder.pdfs.count(),
-                'children': []
+        """Return the folder tree as JSON."""
+
+        profile = request.user.profile
+        parent_id = get_parent_query(request)
+
+        if parent_id:
+            response = JsonResponse(self.get_subtree(profile, parent_id))
+        else:
+            root_folders = self.build_tree(self.get_folder_values(Folder.objects.filter(owner=profile)))
+            response = JsonResponse({'root_folders': root_folders, 'root_pdf_count': self.get_root_pdf_count(profile)})
+
+        # the browser needs to revalidate the tree with the ETag before using it
+        patch_cache_control(response, private=True, no_cache=True)
+
+        return response
+
+    @classmethod
+    def get_subtree(cls, profile: Profile, parent_id: str) -> dict:
+        """Get the direct subfolders of a folder. Each folder indicates whether it has subfolders itself."""
+
+        if parent_id == 'root':
+            folders = Folder.objects.filter(owner=profile, parent__isnull=True)
+            parent_id = None
+        else:
+            parent = get_object_or_404(Folder, id=parent_id, owner=profile)
+            folders = parent.subfolders.all()
+
+        folders = folders.annotate(has_children=Exists(Folder.objects.filter(parent=OuterRef('pk'))))
+        subtree = {'parent_id': parent_id, 'folders': cls.get_folder_values(folders, 'has_children')}
+
+        if parent_id is None:
+            subtree['root_pdf_count'] = cls.get_root_pdf_count(profile)
+
+        return subtree
+
+    @staticmethod
+    def get_folder_values(folders: QuerySet, *extra_fields: str) -> list[dict]:
+        """
+        Get the JSON data of the folders in a single query. The PDF counts are stored in the folders, 'pdf_count' is
+        the number of PDFs directly inside the folder, 'total_pdf_count' includes the PDFs of the subfolders.
+        """
+
+        folder_values = folders.order_by('name').values(
+            'id', 'name', 'description', 'parent_id', 'direct_pdf_count', 'pdf_count', *extra_fields
+        )
+
+        return [
+            {
+                'id': str(folder['id']),
+                'name': folder['name'],
+                'description': folder['description'],
+                'parent_id': str(folder['parent_id']) if folder['parent_id'] else None,
+                'pdf_count': folder['direct_pdf_count'],
+                'total_pdf_count': folder['pdf_count'],
             }
-            folder_dict[str(folder.id)] = folder_data
-            
-            if folder.parent_id:
-                parent_data = folder_dict.get(str(folder.parent_id))
-                if parent_data:
-                    parent_data['children'].append(folder_data)
+            | {field: folder[field] for field in extra_fields}
+            for folder in folder_values
+        ]
+
+    @staticmethod
+    def build_tree(folders: list[dict]) -> list[dict]:
+        """
+        Build the folder tree from the flat list of folders and return the root folders. The folders are indexed in a
+        first pass, so children are attached in the second pass regardless of the order they were fetched in.
+        """
+
+        folders_by_id = {folder['id']: folder | {'children': []} for folder in folders}
+        root_folders = []
+
+        for folder in folders_by_id.values():
+            parent = folders_by_id.get(folder['parent_id'])
+
+            if parent is None:
+                root_folders.append(folder)
             else:
-                root_folders.append(folder_data)
-        
-        # Add root PDFs count
-        root_pdf_count = Pdf.objects.filter(owner=request.user.profile, folder__isnull=True).count()
-        
-        return JsonResponse({
-            'root_folders': root_folders,
-            'root_pdf_count': root_pdf_count
-        })
\ No newline at end of file
+                parent['children'].append(folder)
+
+        return root_folders
+
+    @staticmethod
+    def get_root_pdf_count(profile: Profile) -> int:
+        """Get the number of PDFs that are not inside a folder."""
+
+        return Pdf.objects.filter(owner=profile, folder__isnull=True).count()
@@ -4,17 +4,28 @@ from base import base_views
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_not_required
-from django.db.models import Q, QuerySet
+from django.db.models import (
+    BooleanField,
+    Case,
+    Count,
+    ExpressionWrapper,
+    IntegerField,
+    Prefetch,
+    Q,
+    QuerySet,
+    Value,
+    When,
+)
 from django.db.models.functions import Lower
 from django.forms import ValidationError
 from django.http import FileResponse, HttpRequest, HttpResponse
 from django.shortcuts import redirect, render
 from django.views import View
 from django_htmx.http import HttpResponseClientRedirect, HttpResponseClientRefresh
-from pdf import forms, service
+from pdf import forms, service, tasks
 from pdf.models import Pdf, PdfComment, PdfHighlight, Tag, Folder
+from pdf.search import MAX_NAME_MATCHES, PdfContentIndex, PdfNameIndex
 from pdf.service import PdfProcessingServices
-from rapidfuzz import fuzz, utils
 from users.models import Profile
 from users.service import get_demo_pdf, get_viewer_theme_and_color
 
@@ -93,24 +104,26 @@ class BulkAddPdfMixin(BasePdfMixin):
         tag_string = form.data.get('tag_string', '')
         file_directory = form.data.get('file_directory', '')
 
-        if form.data.get('skip_existing'):
-            pdf_info_list = service.get_pdf_info_list(profile)
-        else:
-            pdf_info_list = []
-
         if settings.DEMO_MODE:
             files = [get_demo_pdf()]
         else:
             files = form.files.getlist('file')
 
+        pdf_ids = []
+
         for file in files:
-            # add file unless skipping existing is set and a PDF with the same name and file size already exists
+            file_hash = service.get_file_hash(file)
+
+            # add file unless skipping existing is set and a PDF with the same content already exists
             if not (
-                form.data.get('skip_existing') and (service.create_name_from_file(file), file.size) in pdf_info_list
+                form.data.get('skip_existing')
+                and service.pdf_with_same_content_exists(
+                    profile, file_hash, service.create_name_from_file(file), file.size
+                )
             ):
                 pdf_name = service.create_unique_name_from_file(file, profile)
 
-                service.PdfProcessingServices.create_pdf(
+                pdf = service.PdfProcessingServices.create_pdf(
                     name=pdf_name,
                     owner=profile,
                     pdf_file=file,
@@ -118,7 +131,14 @@ class BulkAddPdfMixin(BasePdfMixin):
                     notes=notes,
                     file_directory=file_directory,
                     tag_string=tag_string,
+                    process_in_background=False,
+                    file_hash=file_hash,
                 )
+                pdf_ids.append(pdf.id)
+
+        # the files are processed together in the background, so that the processing can be spread over multiple cores
+        if pdf_ids:
+            tasks.bulk_ingest_task(pdf_ids)
 
 
 class OverviewMixin(BasePdfMixin):
@@ -163,10 +183,7 @@ class OverviewMixin(BasePdfMixin):
                 pdfs = pdfs.filter(starred=True)
 
         if tags:
-            tags = tags.split(' ')
-
-        for tag in tags:
-            pdfs = pdfs.filter(Q(tags__name=tag) | Q(tags__name__startswith=f'{tag}/')).distinct()
+            pdfs = cls.tag_filter_pdfs(pdfs, tags.split(' '), request.user.profile)
 
         # Filter by folder
         if folder_id == 'root':
@@ -179,25 +196,99 @@ class OverviewMixin(BasePdfMixin):
                 pass  # Invalid folder ID, ignore filter
 
         if search:
-            pdfs = cls.fuzzy_filter_pdfs(pdfs, search)
+            pdfs = cls.search_pdfs(pdfs, search, request.user.profile)
+
+        return cls.prepare_overview_rows(pdfs)
+
+    @staticmethod
+    def prepare_overview_rows(pdfs: QuerySet) -> QuerySet:
+        """
+        Prepare the PDFs for being displayed in the overview. The tags of all PDFs of a page are fetched in a single
+        query and the notes, which are only loaded on demand, are replaced by a flag. This way the number of queries
+        does not depend on the number of displayed PDFs.
+        """
+
+        return (
+            pdfs.defer('notes')
+            .annotate(has_notes=ExpressionWrapper(Q(notes__isnull=False) & ~Q(notes=''), output_field=BooleanField()))
+            .prefetch_related(Prefetch('tags', queryset=Tag.objects.order_by('name')))
+        )
+
+    @staticmethod
+    def tag_filter_pdfs(pdfs: QuerySet, tag_names: list[str], profile: Profile) -> QuerySet:
+        """
+        Filter the PDFs having all specified tags, where a tag also matches its children. The tags are first resolved
+        to groups of tag ids. The matching is then done by a single grouped subquery on the pdf-tag table: a PDF
+        matches if its tags hit every group, so no join per tag is needed.
+        """
+
+        tag_id_groups = service.TagServices.get_tag_id_groups(profile, tag_names)
+
+        if not tag_id_groups:
+            return pdfs
+        elif not all(tag_id_groups):
+            return pdfs.none()
+
+        tag_group = Case(*[When(tag_id__in=tag_ids, then=Value(i)) for i, tag_ids in enumerate(tag_id_groups)])
+        matching_pdf_ids = (
+            Pdf.tags.through.objects.filter(tag_id__in=set().union(*tag_id_groups))
+            .values('pdf_id')
+            .annotate(matched_groups=Count(tag_group, distinct=True))
+            .filter(matched_groups=len(tag_id_groups))
+            .values('pdf_id')
+        )
+
+        return pdfs.filter(id__in=matching_pdf_ids)
 
-        return pdfs
+    @classmethod
+    def search_pdfs(cls, pdfs: QuerySet, search: str, profile: Profile) -> QuerySet:
+        """
+        Filter the PDFs whose names fuzzy match the search or whose content matches the search. The names are matched by
+        the user's in-process name index, of which only the best matches are used. The PDFs are annotated with their
+        search rank: the name matches are ranked by their score, the PDFs only matching by content come after them.
+        """
+
+        ranked_ids = [pdf_id for pdf_id, _ in PdfNameIndex.search(profile, search, limit=MAX_NAME_MATCHES)]
+        pdfs = pdfs.filter(id__in=ranked_ids) | cls.content_filter_pdfs(pdfs, search)
+        search_rank = Case(
+            *[When(id=pdf_id, then=Value(rank)) for rank, pdf_id in enumerate(ranked_ids)],
+            default=Value(len(ranked_ids)),
+            output_field=IntegerField(),
+        )
+
+        return pdfs.annotate(search_rank=search_rank)
 
     @staticmethod
-    def fuzzy_filter_pdfs(pdfs: QuerySet, search: str) -> QuerySet:
-        fuzzy_result = []
+    def content_filter_pdfs(pdfs: QuerySet, search: str) -> QuerySet:
+        """Filter the PDFs by searching their extracted page texts with the full-text index."""
 
-        for pdf in pdfs:
-            w_ratio = fuzz.WRatio(search, pdf.name, processor=utils.default_process)
-            partial_ratio = fuzz.partial_ratio(search, pdf.name, processor=utils.default_process)
+        matching_pdf_ids = PdfContentIndex.matching_pdf_ids(search)
 
-            # better to be a bit more strict regarding this so we avoid false positives
-            if (w_ratio + partial_ratio) / 2 > 85 or partial_ratio > 95:
-                fuzzy_result.append(pdf.id)
+        if matching_pdf_ids is None:
+            return pdfs.none()
 
-        pdfs = pdfs.filter(id__in=fuzzy_result)
+        return pdfs.filter(id__in=matching_pdf_ids)
 
-        return pdfs
+    def get_page_objects(self, request: HttpRequest, sorting: str, page: int, items_per_page: int, **kwargs):
+        """
+        Get the PDFs of the current page. When searching, the PDFs are ordered by their search rank instead of the
+        sorting of the user and the pages matching the search are added to each PDF, so the overview can link to them.
+        """
+
+        search = request.GET.get('search', '')
+
+        if search:
+            sorting = 'search_rank'
+
+        page_object, next_page_available = super().get_page_objects(request, sorting, page, items_per_page, **kwargs)
+
+        if search:
+            hit_pages = PdfContentIndex.get_hit_pages(search, [pdf.id for pdf in page_object])
+
+            for pdf in page_object:
+                pdf.content_hit_pages = hit_pages.get(str(pdf.id), [])
+
+        return page_object, next_page_available
 
     @staticmethod
     def get_extra_context(request: HttpRequest) -> dict:
@@ -224,25 +315,21 @@ class OverviewMixin(BasePdfMixin):
             except Folder.DoesNotExist:
                 pass
 
-        folders = Folder.objects.filter(owner=request.user.profile).select_related('parent')
-
-        # Count PDFs without a folder (root PDFs)
-        root_pdf_count = request.user.profile.pdf_set.filter(folder__isnull=True).count()
-
         extra_context = {
             'layout': request.user.profile.layout,
             'needs_nagging': request.user.profile.needs_nagging,
             'page': page,
             'search_query': request.GET.get('search', ''),
             'special_pdf_selection': special_pdf_selection,
-            'tag_info_dict': service.TagServices.get_tag_info_dict(request.user.profile),
             'tag_query': tag_query,
             'current_folder': current_folder,
             'current_folder_id': current_folder_id,
-            'folders': folders,
-            'root_pdf_count': root_pdf_count,
         }
 
+        # the tags and folders of the sidebar are only needed when rendering the full page
+        if not request.htmx:
+            extra_context |= service.SidebarServices.get_sidebar_data(request.user.profile)
+
         return extra_context
 
 
@@ -379,7 +466,7 @@ class HighlightOverviewMixin(AnnotationOverviewMixin):
         Filter the PDF highlights in the overview. As there is no filtering needed this is just a dummy function.
         """
 
-        highlights = PdfHighlight.objects.filter(pdf__owner=request.user.profile)
+        highlights = PdfHighlight.objects.filter(pdf__owner=request.user.profile).select_related('pdf')
 
         return highlights
 
@@ -401,7 +488,7 @@ class CommentOverviewMixin(AnnotationOverviewMixin):
         Filter the PDF comments in the overview. As there is no filtering needed this is just a dummy function.
         """
 
-        comments = PdfComment.objects.filter(pdf__owner=request.user.profile)
+        comments = PdfComment.objects.filter(pdf__owner=request.user.profile).select_related('pdf')
 
         return comments
 
@@ -495,7 +582,7 @@ class ViewerView(PdfMixin, View):
         pdf = self.get_object(request, identifier)
         pdf.views += 1
         pdf.last_viewed_date = datetime.now(timezone.utc)
-        pdf.save()
+        pdf.save(update_fields=['views', 'last_viewed_date'])
 
         theme, theme_color = get_viewer_theme_and_color(request.user.profile)
 
@@ -532,7 +619,7 @@ class MobileViewerView(PdfMixin, View):
         pdf = self.get_object(request, identifier)
         pdf.views += 1
         pdf.last_viewed_date = datetime.now(timezone.utc)
-        pdf.save()
+        pdf.save(update_fields=['views', 'last_viewed_date'])
 
         theme, theme_color = get_viewer_theme_and_color(request.user.profile)
 
@@ -588,7 +675,7 @@ class UpdatePage(PdfMixin, View):
         # update current page
         current_page = request.POST.get('current_page')
         pdf.current_page = current_page
-        pdf.save()
+        pdf.save(update_fields=['current_page'])
 
         return HttpResponse(status=200)
 
@@ -612,10 +699,13 @@ class UpdatePdf(PdfMixin, View):
             # make sure a valid pdf is sent
             updated_pdf = forms.CleanHelpers.clean_file(updated_pdf)
             pdf.file = updated_pdf
+            pdf.file_hash = service.get_file_hash(updated_pdf)
             pdf.revision += 1
             pdf.save()
 
-            PdfProcessingServices.set_highlights_and_comments(pdf)
+            # the page texts and annotations are updated in the background, so that saving in the viewer does not block
+            tasks.extract_pdf_text_task(pdf.id)
+            tasks.extract_pdf_annotations_task(pdf.id)
 
             return HttpResponse(status=200)
         except ValidationError:
@@ -744,7 +834,11 @@ class ShowPreview(PdfMixin, View):
                 preview_available = True
             else:
                 preview_available = False
-            return render(request, 'partials/preview.html', {'pdf_id': pdf.id, 'preview_available': preview_available})
+            return render(
+                request,
+                'partials/preview.html',
+                {'pdf_id': pdf.id, 'revision': pdf.revision, 'preview_available': preview_available},
+            )
 
         return redirect('pdf_overview')
 
@@ -124,7 +124,7 @@ class OverviewMixin(BaseShareMixin):
         just a dummy function
         """
 
-        shared_pdfs = SharedPdf.objects.filter(owner=request.user.profile).all()
+        shared_pdfs = SharedPdf.objects.filter(owner=request.user.profile).select_related('pdf')
         shared_pdfs = shared_pdfs.filter(
             Q(deletion_date__isnull=True) | Q(deletion_date__gt=datetime.now(timezone.utc))
         )
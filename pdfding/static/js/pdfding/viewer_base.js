@@ -17,5 +17,10 @@ function start_viewer(page_number, pdf_url, tab_title) {
     PDFViewerApplicationOptions.set('enableSignatureEditor', true); // disable browsing history, clicking on chapters does not open new page
     PDFViewerApplicationOptions.set('viewOnLoad', 1  ); // disable remembering page
     PDFViewerApplicationOptions.set("workerSrc", "../../static/pdfjs/build/pdf.worker.mjs");
+    // load the pdf progressively via range requests, so that the first pages are shown before the whole file is loaded
+    PDFViewerApplicationOptions.set('disableRange', false);
+    PDFViewerApplicationOptions.set('disableStream', true); // otherwise the whole file is streamed in parallel
+    PDFViewerApplicationOptions.set('disableAutoFetch', true); // only fetch the parts needed for the displayed pages
+    PDFViewerApplicationOptions.set('rangeChunkSize', 262144);
   });
 }